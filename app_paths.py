@@ -0,0 +1,26 @@
+# app_paths.py
+
+import os
+
+APP_NAME = "pd_music_player"
+
+def get_cache_dir(*parts):
+    """
+    Returns (and creates if needed) the application's per-user cache directory.
+
+    Honours the PD_MUSIC_CACHE_DIR environment variable, otherwise uses
+    $XDG_CACHE_HOME/pd_music_player or ~/.cache/pd_music_player.
+
+    Args:
+        *parts (str): Optional sub-directory components inside the cache directory.
+
+    Returns:
+        str: The absolute path of the cache directory.
+    """
+    base = os.environ.get("PD_MUSIC_CACHE_DIR")
+    if not base:
+        xdg = os.environ.get("XDG_CACHE_HOME") or os.path.join(os.path.expanduser("~"), ".cache")
+        base = os.path.join(xdg, APP_NAME)
+    path = os.path.join(base, *parts)
+    os.makedirs(path, exist_ok=True)
+    return path
@@ -0,0 +1,213 @@
+# async_api.py
+
+import asyncio
+import functools
+import threading
+import weakref
+from concurrent.futures import ThreadPoolExecutor
+
+from lazy_import import LazyModule
+
+yt_dlp = LazyModule('yt_dlp')
+
+from youtube_search import search_youtube_music
+from music_player import download_media, get_stream_cache, resolve_playback
+
+DEFAULT_CONCURRENCY = 16 # Blocking operations allowed in flight at once
+DEFAULT_TIMEOUT = 120    # Seconds before an operation is abandoned
+
+class AsyncMusicAPI:
+    """
+    asyncio facade over the blocking search, stream resolution and download functions.
+
+    yt_dlp and FFmpeg are blocking, so each call runs on a bounded executor shared
+    by the whole process. A global semaphore caps how many operations are in
+    flight, so hundreds of coroutines can be awaiting results without a thread
+    each. Every call accepts a timeout. A timed-out or cancelled download is
+    aborted at its next progress tick. A search or resolve keeps running to
+    completion in the background and its result is discarded.
+    """
+
+    def __init__(self, max_concurrency=DEFAULT_CONCURRENCY, default_timeout=DEFAULT_TIMEOUT):
+        """
+        Args:
+            max_concurrency (int): Maximum number of blocking operations running at once.
+            default_timeout (float or None): Timeout applied when a call does not pass one.
+        """
+        self.max_concurrency = max_concurrency
+        self.default_timeout = default_timeout
+        self._executor = ThreadPoolExecutor(max_workers=max_concurrency, thread_name_prefix="async-api")
+        # One semaphore per event loop, created lazily. The executor's worker count caps
+        # the blocking calls across loops (e.g. the GUI's loop and an asyncio.run() batch).
+        self._limiters = weakref.WeakKeyDictionary()
+        self._limiters_lock = threading.Lock()
+
+    def _get_limiter(self):
+        loop = asyncio.get_running_loop()
+        with self._limiters_lock:
+            limiter = self._limiters.get(loop)
+            if limiter is None:
+                limiter = self._limiters[loop] = asyncio.Semaphore(self.max_concurrency)
+            return limiter
+
+    async def _run(self, func, *args, timeout=None, **kwargs):
+        """Runs a blocking call on the executor under the concurrency limit and a timeout."""
+        timeout = self.default_timeout if timeout is None else timeout
+        loop = asyncio.get_running_loop()
+        async with self._get_limiter():
+            call = functools.partial(func, *args, **kwargs)
+            return await asyncio.wait_for(loop.run_in_executor(self._executor, call), timeout)
+
+    async def search(self, query, max_results=5, timeout=None):
+        """
+        Searches YouTube (through the shared search cache).
+
+        Returns:
+            list: Result dictionaries with 'title', 'id' and 'url'.
+        """
+        return await self._run(search_youtube_music, query, max_results=max_results, timeout=timeout)
+
+    async def search_page(self, session, on_result=None, on_finished=None, timeout=None):
+        """
+        Fetches the next page of a youtube_search.SearchSession.
+
+        `on_result` is called from the executor thread with each result as it arrives.
+        `on_finished` is called exactly once when the page call has really returned (from
+        the executor thread), or when it is certain never to run. For a timed-out task
+        that can be later than the task itself. To stop a page early, close the session;
+        a task cancelled before it first runs does not report on_finished.
+
+        Returns:
+            list: The new results.
+        """
+        lock = threading.Lock()
+        state = {'started': False, 'finished': False}
+
+        def finish():
+            with lock:
+                if state['finished']:
+                    return
+                state['finished'] = True
+            if on_finished:
+                on_finished()
+
+        def next_page():
+            with lock:
+                if state['finished']:
+                    return [] # The awaiting task gave up before the executor got to it
+                state['started'] = True
+            try:
+                return session.next_page(on_result=on_result)
+            finally:
+                finish()
+
+        try:
+            return await self._run(next_page, timeout=timeout)
+        finally:
+            with lock:
+                started = state['started']
+            if not started:
+                finish()
+
+    async def search_many(self, queries, max_results=5, timeout=None):
+        """
+        Runs several searches concurrently. If one fails, the others are cancelled.
+
+        Returns:
+            list: One result list per query, in the same order.
+        """
+        async with asyncio.TaskGroup() as group:
+            tasks = [group.create_task(self.search(q, max_results=max_results, timeout=timeout)) for q in queries]
+        return [task.result() for task in tasks]
+
+    async def resolve_stream(self, video_url, force_refresh=False, timeout=None):
+        """
+        Resolves a video to a direct audio stream URL (through the shared stream cache).
+
+        Returns:
+            dict: Stream info with 'url', 'expires' and 'cached'.
+        """
+        return await self._run(get_stream_cache().resolve, video_url, force_refresh=force_refresh, timeout=timeout)
+
+    async def resolve_playback(self, video_url, timeout=None):
+        """
+        Works out what mpv should open for a video: a cached track, or the audio cache proxy.
+
+        Returns:
+            dict: 'url' and 'source' (see music_player.resolve_playback).
+        """
+        return await self._run(resolve_playback, video_url, timeout=timeout)
+
+    async def download(self, video_url, format_type, output_path="downloads", progress_callback=None, timeout=None):
+        """
+        Downloads a video as 'mp3' or 'mp4'.
+
+        Cancelling the awaiting task (or hitting the timeout) aborts the transfer at
+        the next progress update.
+
+        Returns:
+            str or None: The path of the finished file, or None if the download failed.
+        """
+        cancelled = threading.Event()
+
+        def hook(d):
+            if cancelled.is_set() and d.get('status') == 'downloading':
+                raise yt_dlp.utils.DownloadCancelled("Cancelled by caller")
+            if progress_callback:
+                progress_callback(d)
+
+        try:
+            return await self._run(download_media, video_url, format_type, output_path=output_path,
+                                   progress_callback=hook, timeout=timeout)
+        except (asyncio.CancelledError, asyncio.TimeoutError):
+            cancelled.set()
+            raise
+
+    def close(self):
+        """Stops the executor without waiting for running operations."""
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+class EventLoopThread:
+    """
+    Runs one asyncio event loop on a background thread for synchronous front ends.
+
+    Tk's mainloop owns the main thread, so the GUI submits coroutines here and gets
+    concurrent.futures.Future objects back.
+    """
+
+    def __init__(self):
+        self.loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self._run, name="asyncio-loop", daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        asyncio.set_event_loop(self.loop)
+        self.loop.run_forever()
+
+    def submit(self, coro):
+        """
+        Schedules a coroutine on the loop.
+
+        Returns:
+            concurrent.futures.Future: Resolves with the coroutine's result; cancel() cancels the task.
+        """
+        return asyncio.run_coroutine_threadsafe(coro, self.loop)
+
+    def stop(self):
+        """Stops the loop and waits for its thread to exit."""
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self._thread.join(timeout=5)
+
+_default_api = None
+_default_api_lock = threading.Lock()
+
+def get_async_api():
+    """
+    Returns:
+        AsyncMusicAPI: The process-wide async API (one executor and limiter for all callers).
+    """
+    global _default_api
+    with _default_api_lock:
+        if _default_api is None:
+            _default_api = AsyncMusicAPI()
+        return _default_api
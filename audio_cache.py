@@ -0,0 +1,457 @@
+# audio_cache.py
+
+import mmap
+import os
+import re
+import sys
+import threading
+import urllib.error
+import urllib.request
+from collections import OrderedDict
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from app_paths import get_cache_dir
+from bandwidth import PLAYBACK, get_bandwidth_scheduler
+from telemetry import telemetry
+
+DEFAULT_MAX_BYTES = 1024 * 1024 * 1024 # 1 GiB; PD_MUSIC_AUDIO_CACHE_MB overrides it
+BLOCK_SIZE = 64 * 1024 # Bytes per read/write while relaying or serving
+UPSTREAM_TIMEOUT = 30 # Socket timeout in seconds for upstream streams, as for chunked downloads
+PART_SUFFIX = ".part"
+
+# Content types of audio streams -> file extension of the cached copy
+_EXTENSIONS = {'audio/webm': 'webm', 'audio/mp4': 'm4a', 'audio/mpeg': 'mp3', 'audio/ogg': 'ogg',
+               'audio/opus': 'opus', 'audio/aac': 'aac'}
+_RANGE = re.compile(r'^bytes=(\d+)-(\d*)$')
+_VIDEO_ID = re.compile(r'^[A-Za-z0-9_-]{1,64}$')
+
+def _default_max_bytes():
+    try:
+        megabytes = int(os.environ.get("PD_MUSIC_AUDIO_CACHE_MB") or 0)
+    except ValueError:
+        print("Ignoring invalid PD_MUSIC_AUDIO_CACHE_MB; using the default audio cache size.")
+        megabytes = 0
+    return megabytes * 1024 * 1024 if megabytes > 0 else DEFAULT_MAX_BYTES
+
+class AudioCache:
+    """
+    Size-bounded on-disk cache of played audio streams, keyed by video id.
+
+    The cache directory is its own index: each track is '<video id>.<ext>' and
+    its modification time is the last use, so the LRU order survives restarts.
+    Files are only added complete and non-empty (see begin_fill); when the
+    total size goes over `max_bytes` the least recently played tracks are deleted.
+    """
+
+    def __init__(self, directory=None, max_bytes=None):
+        """
+        Args:
+            directory (str, optional): Where tracks are stored. Defaults to 'audio' in the
+                                       application cache directory.
+            max_bytes (int, optional): Size limit. Defaults to PD_MUSIC_AUDIO_CACHE_MB or 1 GiB.
+        """
+        self.directory = directory or get_cache_dir("audio")
+        os.makedirs(self.directory, exist_ok=True)
+        self.max_bytes = max_bytes or _default_max_bytes()
+        self.hits = 0
+        self.misses = 0
+        self.bytes_saved = 0 # Sizes of the tracks played from disk instead of the network
+        self.evictions = 0
+        self._lock = threading.Lock()
+        self._entries = OrderedDict() # Video id -> (filename, size), least recently used first
+        self._filling = set() # Video ids with a fill in progress
+        self._total = 0
+        self._scan()
+
+    def lookup(self, video_id, record=True):
+        """
+        Returns the cached file for a video, marking it as recently used.
+
+        Args:
+            video_id (str): The YouTube video id.
+            record (bool): Count the lookup as a play in the hit/miss statistics.
+
+        Returns:
+            str or None: The file path, or None if the track is not cached.
+        """
+        with self._lock:
+            entry = self._entries.get(video_id)
+            if entry is not None:
+                self._entries.move_to_end(video_id)
+        path = os.path.join(self.directory, entry[0]) if entry else None
+        if path is not None:
+            try:
+                os.utime(path) # Persist the LRU order
+            except OSError:
+                # Deleted behind our back: forget it and treat the lookup as a miss
+                with self._lock:
+                    if self._entries.pop(video_id, None) is not None:
+                        self._total -= entry[1]
+                path = None
+        if record:
+            with self._lock:
+                if path is not None:
+                    self.hits += 1
+                    self.bytes_saved += entry[1]
+                else:
+                    self.misses += 1
+            telemetry.count('cache_requests_total', cache='audio', result='hit' if path else 'miss')
+            if path is not None:
+                telemetry.count('audio_cache_bytes_saved_total', entry[1])
+        return path
+
+    def begin_fill(self, video_id, content_type=None):
+        """
+        Starts writing a track into the cache.
+
+        Returns:
+            CacheFill or None: The fill, or None if the track is cached or already being filled.
+        """
+        ext = _EXTENSIONS.get((content_type or '').split(';')[0].strip().lower(), 'audio')
+        with self._lock:
+            if video_id in self._entries or video_id in self._filling:
+                return None
+            self._filling.add(video_id)
+        part_path = os.path.join(self.directory, f"{video_id}.{ext}{PART_SUFFIX}")
+        try:
+            return CacheFill(self, video_id, part_path)
+        except OSError as e:
+            print(f"Could not start caching {video_id}: {e}")
+            with self._lock:
+                self._filling.discard(video_id)
+            return None
+
+    def clear(self):
+        """Deletes every cached track."""
+        with self._lock:
+            entries = list(self._entries.values())
+            self._entries.clear()
+            self._total = 0
+        for filename, _ in entries:
+            self._remove(filename)
+
+    def stats(self):
+        """
+        Returns:
+            dict: 'hits', 'misses', 'hit_ratio', 'bytes_saved', 'evictions', 'entries',
+                  'bytes' (cached) and 'max_bytes'.
+        """
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_ratio': self.hits / total if total else 0.0,
+                'bytes_saved': self.bytes_saved,
+                'evictions': self.evictions,
+                'entries': len(self._entries),
+                'bytes': self._total,
+                'max_bytes': self.max_bytes,
+            }
+
+    def _commit(self, video_id, part_path, size):
+        """Moves a complete fill into place and evicts down to max_bytes."""
+        filename = os.path.basename(part_path)[:-len(PART_SUFFIX)]
+        if size == 0 or size > self.max_bytes:
+            # Nothing to replay, or it would evict everything else and still not fit
+            self._abort(video_id, part_path)
+            return False
+        os.replace(part_path, os.path.join(self.directory, filename))
+        with self._lock:
+            self._filling.discard(video_id)
+            self._entries[video_id] = (filename, size)
+            self._total += size
+            evicted = self._evict_locked()
+        for name in evicted:
+            self._remove(name)
+        return True
+
+    def _abort(self, video_id, part_path):
+        with self._lock:
+            self._filling.discard(video_id)
+        self._remove(os.path.basename(part_path))
+
+    def _evict_locked(self):
+        """Drops least recently used entries until the cache fits. Must be called with the lock held."""
+        evicted = []
+        while self._total > self.max_bytes and self._entries:
+            _, (filename, size) = self._entries.popitem(last=False)
+            self._total -= size
+            self.evictions += 1
+            evicted.append(filename)
+        return evicted
+
+    def _remove(self, filename):
+        try:
+            os.remove(os.path.join(self.directory, filename))
+        except FileNotFoundError:
+            pass
+        except OSError as e:
+            print(f"Could not remove cached audio '{filename}': {e}")
+
+    def _scan(self):
+        """Rebuilds the index from the directory; leftover partial and empty files are deleted."""
+        found = []
+        for entry in os.scandir(self.directory):
+            if not entry.is_file():
+                continue
+            st = entry.stat()
+            if entry.name.endswith(PART_SUFFIX) or st.st_size == 0:
+                self._remove(entry.name)
+                continue
+            found.append((st.st_mtime, entry.name.split('.', 1)[0], entry.name, st.st_size))
+        for _, video_id, filename, size in sorted(found):
+            self._entries[video_id] = (filename, size)
+            self._total += size
+        for filename in self._evict_locked():
+            self._remove(filename)
+
+class CacheFill:
+    """A track being written into the cache; either commit() it when complete or abort() it."""
+
+    def __init__(self, cache, video_id, part_path):
+        self.cache = cache
+        self.video_id = video_id
+        self.part_path = part_path
+        self.size = 0
+        self._file = open(part_path, "wb")
+
+    def write(self, data):
+        self._file.write(data)
+        self.size += len(data)
+
+    def commit(self):
+        """Adds the track to the cache. Returns False if it was too large to keep."""
+        self._file.close()
+        try:
+            return self.cache._commit(self.video_id, self.part_path, self.size)
+        except OSError as e:
+            print(f"Could not cache {self.video_id}: {e}")
+            self.cache._abort(self.video_id, self.part_path)
+            return False
+
+    def abort(self):
+        self._file.close()
+        self.cache._abort(self.video_id, self.part_path)
+
+class AudioCacheProxy(ThreadingHTTPServer):
+    """
+    Local HTTP proxy between mpv and the stream server that fills an AudioCache.
+
+    mpv is given http://127.0.0.1:<port>/audio/<video id>. A cached track is
+    served from disk through a memory map (with Range support for seeking),
+    with no network access. Otherwise the stream URL is resolved on demand, so
+    queued tracks never hold an expired URL, and the response is relayed to mpv
+    while being written to the cache. Only a request for the whole stream is
+    teed; seeks beyond what mpv has buffered are passed through uncached.
+    Relayed bytes count as PLAYBACK traffic in the bandwidth scheduler.
+    """
+
+    daemon_threads = True
+
+    def __init__(self, resolve, cache=None, host='127.0.0.1', port=0):
+        """
+        Args:
+            resolve (callable): resolve(video_id, force_refresh) -> stream info dict with 'url'
+                                and optionally the 'http_headers' to request it with.
+            cache (AudioCache, optional): The cache to serve from and fill. Defaults to
+                                          the process-wide one, looked up per request.
+        """
+        super().__init__((host, port), _AudioProxyHandler)
+        self._cache = cache
+        self.resolve = resolve
+        self.streams = 0
+        self.fills_completed = 0
+        self.fills_aborted = 0
+        self.bytes_from_network = 0
+        self.bytes_from_disk = 0
+        self._lock = threading.Lock()
+        self._thread = None
+
+    @property
+    def cache(self):
+        return self._cache or get_audio_cache()
+
+    @property
+    def base_url(self):
+        return f"http://{self.server_address[0]}:{self.server_address[1]}"
+
+    def url_for(self, video_id):
+        """Returns the URL mpv should play for a video."""
+        return f"{self.base_url}/audio/{video_id}"
+
+    def start(self):
+        """Serves on a background thread. Returns self."""
+        self._thread = threading.Thread(target=self.serve_forever, name="audio-cache-proxy", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+    def handle_error(self, request, client_address):
+        # mpv hangs up whenever it seeks, skips or stops; that is not an error
+        if not isinstance(sys.exc_info()[1], ConnectionError):
+            super().handle_error(request, client_address)
+
+    def _add(self, **counters):
+        with self._lock:
+            for name, value in counters.items():
+                setattr(self, name, getattr(self, name) + value)
+
+    def stats(self):
+        """
+        Returns:
+            dict: 'streams', 'fills_completed', 'fills_aborted', 'bytes_from_network' and 'bytes_from_disk'.
+        """
+        with self._lock:
+            return {'streams': self.streams, 'fills_completed': self.fills_completed,
+                    'fills_aborted': self.fills_aborted, 'bytes_from_network': self.bytes_from_network,
+                    'bytes_from_disk': self.bytes_from_disk}
+
+class _AudioProxyHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        parts = [p for p in self.path.split('?', 1)[0].split('/') if p]
+        if len(parts) != 2 or parts[0] != 'audio' or not _VIDEO_ID.match(parts[1]):
+            return self._empty(404)
+        video_id = parts[1]
+        self.server._add(streams=1)
+        match = _RANGE.match(self.headers.get('Range', '').strip())
+        byte_range = (int(match.group(1)), int(match.group(2)) if match.group(2) else None) if match else None
+
+        path = self.server.cache.lookup(video_id, record=False)
+        if path is not None:
+            return self._send_file(path, byte_range)
+        self._relay(video_id, byte_range)
+
+    def _empty(self, status, headers=None):
+        self.send_response(status)
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.send_header('Content-Length', '0')
+        self.end_headers()
+
+    def _send_file(self, path, byte_range):
+        """Serves a cached track from a memory map; the bytes go from the page cache to the socket."""
+        with open(path, "rb") as f:
+            # The size of the open file, so a file truncated meanwhile cannot break the map
+            size = os.fstat(f.fileno()).st_size
+            start, end = byte_range or (0, None)
+            end = size - 1 if end is None else min(end, size - 1)
+            if start >= size:
+                # Also covers an empty file, which mmap cannot map
+                return self._empty(416, {'Content-Range': f'bytes */{size}'})
+            self.send_response(206 if byte_range else 200)
+            self.send_header('Content-Type', 'application/octet-stream')
+            self.send_header('Accept-Ranges', 'bytes')
+            self.send_header('Content-Length', str(end - start + 1))
+            if byte_range:
+                self.send_header('Content-Range', f'bytes {start}-{end}/{size}')
+            self.end_headers()
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped, memoryview(mapped) as view:
+                for offset in range(start, end + 1, BLOCK_SIZE):
+                    self.wfile.write(view[offset:min(end + 1, offset + BLOCK_SIZE)])
+        self.server._add(bytes_from_disk=end - start + 1)
+
+    def _open_upstream(self, video_id, byte_range):
+        def request(force_refresh):
+            stream = self.server.resolve(video_id, force_refresh)
+            # yt_dlp's headers (User-Agent etc.); googlevideo may reject requests without them
+            headers = dict(stream.get('http_headers') or {})
+            if byte_range:
+                headers['Range'] = self.headers['Range']
+            return urllib.request.urlopen(urllib.request.Request(stream['url'], headers=headers),
+                                          timeout=UPSTREAM_TIMEOUT)
+        try:
+            return request(False)
+        except urllib.error.HTTPError as e:
+            if e.code not in (403, 404, 410):
+                raise
+            # The cached stream URL has expired; resolve it again once
+            return request(True)
+
+    def _relay(self, video_id, byte_range):
+        try:
+            upstream = self._open_upstream(video_id, byte_range)
+        except urllib.error.HTTPError as e:
+            return self._empty(e.code)
+        except Exception as e:
+            print(f"Audio proxy could not open the stream for {video_id}: {e}")
+            return self._empty(502)
+
+        with upstream:
+            length = upstream.headers.get('Content-Length')
+            length = int(length) if length and length.isdigit() else None
+            whole = byte_range is None or (byte_range[0] == 0 and byte_range[1] is None)
+            fill = self.server.cache.begin_fill(video_id, upstream.headers.get('Content-Type')) if whole else None
+            self.send_response(upstream.status)
+            for name in ('Content-Type', 'Content-Length', 'Content-Range'):
+                if upstream.headers.get(name):
+                    self.send_header(name, upstream.headers[name])
+            self.send_header('Accept-Ranges', 'bytes')
+            if length is None:
+                self.send_header('Connection', 'close')
+                self.close_connection = True
+            self.end_headers()
+
+            relayed = 0
+            transfer = get_bandwidth_scheduler().open_transfer(f"playback:{video_id}", priority=PLAYBACK)
+            try:
+                with transfer:
+                    while True:
+                        data = upstream.read(BLOCK_SIZE)
+                        if not data:
+                            break
+                        transfer.consume(len(data))
+                        if fill is not None:
+                            fill.write(data)
+                        relayed += len(data)
+                        self.wfile.write(data)
+            except BaseException:
+                self.close_connection = True
+                if fill is not None:
+                    fill.abort()
+                    self.server._add(fills_aborted=1)
+                raise
+            finally:
+                self.server._add(bytes_from_network=relayed)
+                telemetry.count('transfer_bytes_total', relayed, downloader='audio_proxy')
+
+        if fill is not None:
+            if length is not None and relayed != length:
+                fill.abort() # Upstream ended early
+                self.server._add(fills_aborted=1)
+            elif fill.commit():
+                self.server._add(fills_completed=1)
+
+_default_cache = None
+_default_cache_lock = threading.Lock()
+
+def get_audio_cache():
+    """
+    Returns:
+        AudioCache: The process-wide audio cache.
+    """
+    global _default_cache
+    with _default_cache_lock:
+        if _default_cache is None:
+            _default_cache = AudioCache()
+        return _default_cache
+
+def set_audio_cache(cache):
+    """
+    Replaces the process-wide audio cache (e.g. with one in a temporary directory).
+
+    Returns:
+        AudioCache or None: The previous cache.
+    """
+    global _default_cache
+    with _default_cache_lock:
+        previous, _default_cache = _default_cache, cache
+        return previous
@@ -0,0 +1,355 @@
+# bandwidth.py
+
+import heapq
+import itertools
+import os
+import re
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
+PLAYBACK = 'playback' # Served before any download; never held back for playback protection
+DOWNLOAD = 'download'
+PRIORITIES = (PLAYBACK, DOWNLOAD)
+
+DEFAULT_MAX_PER_HOST = 6 # Concurrent connections to one host, across all transfers
+DEFAULT_PLAYBACK_RESERVE = 512 * 1024 # Bytes/s kept free for playback when a global rate is set
+MIN_BURST = 256 * 1024 # Smallest token bucket; one read block must fit
+THROUGHPUT_WINDOW = 2.0 # Seconds of history behind Transfer.throughput()
+
+_UNITS = {'': 1, 'K': 1024, 'M': 1024 ** 2, 'G': 1024 ** 3}
+_RATE = re.compile(r'^(\d+(?:\.\d+)?)\s*([KMG]?)(?:I?B)?(?:/S)?$')
+
+def parse_rate(text):
+    """
+    Parses a rate such as '750K', '2M' or '1.5M' (bytes per second, binary units).
+
+    Returns:
+        float or None: Bytes per second, or None for '', '0' or 'none' (unlimited).
+
+    Raises:
+        ValueError: If the text is not a rate.
+    """
+    text = (text or '').strip().upper()
+    if text in ('', 'NONE', 'UNLIMITED'):
+        return None
+    match = _RATE.match(text)
+    if not match:
+        raise ValueError(f"Not a rate: {text!r} (expected e.g. 750K or 2M)")
+    value = float(match.group(1)) * _UNITS[match.group(2)]
+    return value or None
+
+class _Bucket:
+    """Token bucket; tokens may go negative so a read larger than the burst still passes (as debt)."""
+
+    __slots__ = ('rate', 'burst', 'tokens', 'updated')
+
+    def __init__(self, rate):
+        self.rate = rate
+        self.burst = max(MIN_BURST, rate / 4)
+        self.tokens = self.burst
+        self.updated = time.monotonic()
+
+    def refill(self, now):
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def delay(self):
+        """Seconds until the bucket is out of debt (0 if tokens are available now)."""
+        return 0.0 if self.tokens > 0 else -self.tokens / self.rate
+
+class Transfer:
+    """
+    One job's share of the scheduler, obtained from BandwidthScheduler.open_transfer().
+
+    Download code calls consume(n) after reading n bytes; the call blocks while
+    the job is over its share. The handle also keeps the job's live throughput,
+    which progress_fields() adds to yt-dlp style progress dictionaries.
+    """
+
+    def __init__(self, scheduler, name, weight, priority):
+        self.scheduler = scheduler
+        self.name = name
+        self.weight = weight
+        self.priority = priority
+        self.bytes = 0
+        self.throttled = 0.0 # Seconds spent waiting for tokens
+        self.finish_tag = 0.0 # Virtual finish time of the job's last grant (fair queuing)
+        self._window = deque() # (monotonic time, bytes) within THROUGHPUT_WINDOW
+        self._window_bytes = 0
+        self._lock = threading.Lock()
+        self._progress_seen = {} # filename -> downloaded_bytes already charged (throttle_hook)
+
+    def consume(self, nbytes):
+        """Charges nbytes to the job, waiting first if the job is over its share."""
+        if nbytes <= 0:
+            return
+        waited = self.scheduler._acquire(self, nbytes)
+        now = time.monotonic()
+        with self._lock:
+            self.bytes += nbytes
+            self.throttled += waited
+            self._window.append((now, nbytes))
+            self._window_bytes += nbytes
+            self._trim(now)
+
+    def throughput(self):
+        """
+        Returns:
+            float: Bytes per second over the last THROUGHPUT_WINDOW seconds.
+        """
+        now = time.monotonic()
+        with self._lock:
+            self._trim(now)
+            if len(self._window) < 2:
+                return 0.0
+            # The oldest sample's bytes arrived before the window opened
+            first_time, first_bytes = self._window[0]
+            return (self._window_bytes - first_bytes) / max(now - first_time, 1e-3)
+
+    def _trim(self, now):
+        while self._window and now - self._window[0][0] > THROUGHPUT_WINDOW:
+            self._window_bytes -= self._window.popleft()[1]
+
+    def progress_fields(self):
+        """Returns the keys merged into this job's progress dictionaries."""
+        return {'throughput': self.throughput(), 'throttled': self.throttled,
+                'bandwidth_weight': self.weight, 'bandwidth_priority': self.priority}
+
+    def throttle_hook(self, progress_callback=None):
+        """
+        Wraps a yt-dlp progress hook so the transfer it reports is shaped.
+
+        yt-dlp calls its hooks from the downloading thread after every block, so
+        blocking in the hook paces the download. Newly reported bytes (per file)
+        are charged before the wrapped callback sees the dictionary, extended by
+        progress_fields().
+        """
+        def hook(d):
+            if d.get('status') == 'downloading':
+                key = d.get('filename')
+                downloaded = d.get('downloaded_bytes') or 0
+                with self._lock:
+                    delta = downloaded - self._progress_seen.get(key, 0)
+                    self._progress_seen[key] = downloaded
+                self.consume(delta)
+                d = dict(d, **self.progress_fields())
+            if progress_callback:
+                progress_callback(d)
+        return hook
+
+    def close(self):
+        """Removes the job from the scheduler."""
+        self.scheduler._close(self)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+class BandwidthScheduler:
+    """
+    Shares the network between concurrent transfers.
+
+    A global token bucket caps the total rate. Jobs waiting for tokens are
+    served in order of their virtual start time (start-time fair queuing), so
+    while they compete each job receives bandwidth in proportion to its weight.
+    PLAYBACK transfers always go first. While playback is active (see
+    playback_started) DOWNLOAD transfers are additionally held to the global
+    rate minus `playback_reserve`, or to `background_rate` if set; mpv fetches
+    its stream itself, so that headroom is the only way to keep a large
+    download from starving it.
+
+    Per-host connection caps are enforced with host_slot(), which downloaders
+    hold for as long as a connection is open.
+    """
+
+    def __init__(self, rate=None, playback_reserve=DEFAULT_PLAYBACK_RESERVE, background_rate=None,
+                 max_per_host=DEFAULT_MAX_PER_HOST):
+        """
+        Args:
+            rate (float, optional): Global cap in bytes per second (None for unlimited).
+            playback_reserve (float): Bytes per second kept free for playback when `rate` is set.
+            background_rate (float, optional): Cap for downloads while playback is active;
+                                               overrides rate - playback_reserve.
+            max_per_host (int): Concurrent connections per host (0 or None for no cap).
+        """
+        self.playback_reserve = playback_reserve
+        self.max_per_host = max_per_host
+        self._cond = threading.Condition()
+        self._seq = itertools.count()
+        self._waiting = [] # Heap of (class rank, start tag, sequence)
+        self._virtual_time = 0.0
+        self._transfers = set()
+        self._playback = set() # Tokens of active playbacks
+        self._hosts = {} # Host -> open connections
+        self._bucket = None
+        self._background = None
+        self._background_rate = background_rate
+        self.set_rate(rate)
+
+    def set_rate(self, rate, background_rate=None):
+        """
+        Changes the global cap (None for unlimited) and, optionally, the playback-time download cap
+        (0 removes an explicit background_rate). Waiting transfers pick up the new rate immediately.
+        """
+        with self._cond:
+            self._bucket = _Bucket(rate) if rate else None
+            if background_rate is not None:
+                self._background_rate = background_rate or None
+            background = self._background_rate
+            if background is None and rate:
+                background = max(rate - self.playback_reserve, rate / 10)
+            self._background = _Bucket(background) if background else None
+            self._cond.notify_all()
+
+    @property
+    def rate(self):
+        """The global cap in bytes per second, or None."""
+        return self._bucket.rate if self._bucket else None
+
+    def open_transfer(self, name, weight=1.0, priority=DOWNLOAD):
+        """
+        Registers a job.
+
+        Args:
+            name (str): Shown in stats().
+            weight (float): Relative share against other jobs of the same priority.
+            priority (str): PLAYBACK or DOWNLOAD.
+
+        Returns:
+            Transfer: The job's handle; close it (or use it as a context manager) when done.
+        """
+        if priority not in PRIORITIES:
+            raise ValueError(f"Unknown bandwidth priority: {priority}")
+        if weight <= 0:
+            raise ValueError("Bandwidth weight must be positive.")
+        transfer = Transfer(self, name, float(weight), priority)
+        with self._cond:
+            transfer.finish_tag = self._virtual_time
+            self._transfers.add(transfer)
+        return transfer
+
+    def playback_started(self, token):
+        """Marks a playback (identified by any hashable token) as active."""
+        with self._cond:
+            self._playback.add(token)
+            self._cond.notify_all()
+
+    def playback_stopped(self, token):
+        """Marks a playback as finished; unknown tokens are ignored."""
+        with self._cond:
+            self._playback.discard(token)
+            self._cond.notify_all()
+
+    def playback_active(self):
+        with self._cond:
+            return bool(self._playback)
+
+    def track_playback(self, process):
+        """Treats playback as active until a player subprocess exits (watched on a daemon thread)."""
+        self.playback_started(process)
+        def watch():
+            try:
+                process.wait()
+            finally:
+                self.playback_stopped(process)
+        threading.Thread(target=watch, name="playback-watch", daemon=True).start()
+
+    @contextmanager
+    def host_slot(self, host):
+        """Holds one of the host's connection slots, waiting for a free one first."""
+        with self._cond:
+            while self.max_per_host and self._hosts.get(host, 0) >= self.max_per_host:
+                self._cond.wait()
+            self._hosts[host] = self._hosts.get(host, 0) + 1
+        try:
+            yield
+        finally:
+            with self._cond:
+                self._hosts[host] -= 1
+                if not self._hosts[host]:
+                    del self._hosts[host]
+                self._cond.notify_all()
+
+    def stats(self):
+        """
+        Returns:
+            dict: 'rate', 'playback_active', 'connections' (host -> open connections) and
+                  'transfers' (name, priority, weight, bytes, throughput, throttled per job).
+        """
+        with self._cond:
+            transfers = list(self._transfers)
+            result = {'rate': self.rate, 'playback_active': bool(self._playback), 'connections': dict(self._hosts)}
+        result['transfers'] = [dict(name=t.name, bytes=t.bytes, **t.progress_fields()) for t in transfers]
+        return result
+
+    def _limits(self, transfer):
+        """Buckets the transfer must draw from right now. Must be called with the lock held."""
+        buckets = [self._bucket] if self._bucket else []
+        if transfer.priority == DOWNLOAD and self._playback and self._background:
+            buckets.append(self._background)
+        return buckets
+
+    def _acquire(self, transfer, nbytes):
+        """Blocks until nbytes may be transferred. Returns the seconds spent waiting."""
+        with self._cond:
+            if not self._limits(transfer) and not self._waiting:
+                return 0.0 # Nothing to shape; skip the queue
+            start_tag = max(self._virtual_time, transfer.finish_tag)
+            transfer.finish_tag = start_tag + nbytes / transfer.weight
+            ticket = (PRIORITIES.index(transfer.priority), start_tag, next(self._seq))
+            heapq.heappush(self._waiting, ticket)
+            started = time.monotonic()
+            try:
+                while True:
+                    if self._waiting[0] is ticket:
+                        now = time.monotonic()
+                        buckets = self._limits(transfer)
+                        for bucket in buckets:
+                            bucket.refill(now)
+                        delay = max([bucket.delay() for bucket in buckets], default=0.0)
+                        if delay == 0.0:
+                            for bucket in buckets:
+                                bucket.tokens -= nbytes
+                            self._virtual_time = start_tag
+                            return time.monotonic() - started
+                        self._cond.wait(delay)
+                    else:
+                        self._cond.wait()
+            finally:
+                # Leave the queue whether tokens were granted or the wait was interrupted
+                self._waiting.remove(ticket)
+                heapq.heapify(self._waiting)
+                self._cond.notify_all()
+
+    def _close(self, transfer):
+        with self._cond:
+            self._transfers.discard(transfer)
+
+def _from_environment():
+    """
+    Builds the process-wide scheduler from the environment:
+        PD_MUSIC_MAX_RATE=2M            global cap (bytes per second; K/M/G suffixes)
+        PD_MUSIC_BACKGROUND_RATE=500K   download cap while playback is active
+        PD_MUSIC_MAX_PER_HOST=6         concurrent connections per host
+    """
+    try:
+        rate = parse_rate(os.environ.get("PD_MUSIC_MAX_RATE"))
+        background = parse_rate(os.environ.get("PD_MUSIC_BACKGROUND_RATE"))
+        max_per_host = int(os.environ.get("PD_MUSIC_MAX_PER_HOST") or DEFAULT_MAX_PER_HOST)
+    except ValueError as e:
+        print(f"Ignoring invalid bandwidth settings: {e}")
+        rate, background, max_per_host = None, None, DEFAULT_MAX_PER_HOST
+    return BandwidthScheduler(rate=rate, background_rate=background, max_per_host=max_per_host)
+
+_default_scheduler = _from_environment()
+
+def get_bandwidth_scheduler():
+    """
+    Returns:
+        BandwidthScheduler: The process-wide scheduler shared by every download.
+    """
+    return _default_scheduler
@@ -0,0 +1,918 @@
+# benchmark.py
+
+import argparse
+import json
+import os
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import textwrap
+import time
+from contextlib import contextmanager
+
+DEFAULT_BASELINE = "benchmark_baseline.json"
+DEFAULT_TOLERANCE = 0.25 # Relative slowdown allowed before a metric counts as a regression
+NOISE_FLOOR_MS = 0.5     # Latency differences below this are never regressions
+
+def _time_calls(func, iterations):
+    """Calls `func` `iterations` times and returns the per-call durations in milliseconds."""
+    durations = []
+    for _ in range(iterations):
+        start = time.perf_counter()
+        func()
+        durations.append((time.perf_counter() - start) * 1000)
+    return durations
+
+def _percentile(sorted_values, fraction):
+    """Nearest-rank percentile of an already sorted list."""
+    index = max(0, min(len(sorted_values) - 1, int(round(fraction * len(sorted_values) + 0.5)) - 1))
+    return sorted_values[index]
+
+def _summary(durations):
+    """Returns mean/median/p95/p99/max of a list of millisecond durations."""
+    ordered = sorted(durations)
+    return {
+        'mean_ms': statistics.mean(durations),
+        'median_ms': statistics.median(durations),
+        'p50_ms': _percentile(ordered, 0.50),
+        'p95_ms': _percentile(ordered, 0.95),
+        'p99_ms': _percentile(ordered, 0.99),
+        'max_ms': ordered[-1],
+    }
+
+def bench_ydl_construction(iterations=20):
+    """
+    Compares building a fresh YoutubeDL per operation (cold) with checking one
+    out of the shared YDLPool (warm). No network access is needed.
+
+    Args:
+        iterations (int): Number of operations to time for each variant.
+
+    Returns:
+        dict: 'cold' and 'warm' timing summaries plus the 'speedup' factor.
+    """
+    import yt_dlp
+    from ydl_pool import YDLPool
+
+    ydl_opts = {
+        'format': 'bestaudio/best',
+        'quiet': True,
+        'noplaylist': True,
+        'no_warnings': True,
+    }
+
+    def cold():
+        # YoutubeDL adds keys to the params dict it is given, so hand it a copy
+        with yt_dlp.YoutubeDL(dict(ydl_opts)) as ydl:
+            pass
+
+    pool = YDLPool()
+    def warm():
+        with pool.checkout(ydl_opts) as ydl:
+            pass
+
+    warm() # Populate the pool so only warm checkouts are timed
+    cold_summary = _summary(_time_calls(cold, iterations))
+    warm_summary = _summary(_time_calls(warm, iterations))
+    pool.close_all()
+    return {
+        'cold': cold_summary,
+        'warm': warm_summary,
+        'speedup': cold_summary['median_ms'] / max(warm_summary['median_ms'], 1e-6),
+    }
+
+def bench_library_search(tracks=50000, queries=200):
+    """
+    Builds a throw-away media library with `tracks` synthetic entries and times
+    full-text prefix searches against it.
+
+    Args:
+        tracks (int): Number of indexed tracks.
+        queries (int): Number of searches to time.
+
+    Returns:
+        dict: Timing summary of the searches plus the 'build_s' time to populate the index.
+    """
+    import os
+    import random
+    import tempfile
+    from media_library import MediaLibrary, _UPSERT
+
+    rng = random.Random(42)
+    # A few thousand pseudo-words gives word frequencies closer to real titles than a tiny vocabulary
+    letters = "abcdefghijklmnopqrstuvwxyz"
+    words = ["".join(rng.choice(letters) for _ in range(rng.randint(3, 9))) for _ in range(5000)]
+    with tempfile.TemporaryDirectory() as tmp:
+        library = MediaLibrary(os.path.join(tmp, "library.sqlite3"))
+        start = time.perf_counter()
+        rows = []
+        for i in range(tracks):
+            title = " ".join(rng.choice(words) for _ in range(4)) + f" {i}"
+            rows.append((f"/music/{i}.mp3", f"{i:011d}", title, "mp3", 200.0, 4_000_000, 0.0, 0.0))
+        with library._conn:
+            library._conn.executemany(_UPSERT, rows)
+        build_s = time.perf_counter() - start
+
+        terms = [f"{rng.choice(words)} {rng.choice(words)[:3]}" for _ in range(queries)]
+        it = iter(terms)
+        summary = _summary(_time_calls(lambda: library.search(next(it), limit=50), queries))
+        library.close()
+    summary['build_s'] = build_s
+    return summary
+
+def bench_progress_updates(jobs=20, tick_hz=200, duration=2.0, fps=10, render_cost_ms=1.0):
+    """
+    Simulates a Tk main loop receiving download progress from `jobs` concurrent
+    transfers and measures how long a user event waits before it is handled.
+
+    'per_tick' schedules one render callback per progress tick (the old
+    master.after(0, ...) per hook call). 'coalesced' feeds the ticks to a
+    ProgressAggregator and renders from a fixed-rate timer. Each render busy-waits
+    `render_cost_ms` to stand in for the widget update. No display is needed.
+
+    Args:
+        jobs (int): Number of simulated concurrent downloads.
+        tick_hz (int): Progress ticks per second per download.
+        duration (float): Seconds each variant runs.
+        fps (int): Render rate of the coalesced variant.
+        render_cost_ms (float): Simulated cost of one render on the main loop.
+
+    Returns:
+        dict: Per variant, the latency summary of user events plus 'renders' and 'backlog'
+              (callbacks still queued when the run stopped).
+    """
+    import queue
+    import threading
+    from progress import ProgressAggregator
+
+    def render():
+        end = time.perf_counter() + render_cost_ms / 1000
+        while time.perf_counter() < end:
+            pass
+
+    def run(coalesced):
+        events = queue.Queue() # The main loop's callback queue
+        stop = threading.Event()
+        aggregator = ProgressAggregator()
+        latencies = []
+        renders = [0]
+
+        def do_render(lines=None):
+            render()
+            renders[0] += 1
+
+        def worker(job_id):
+            downloaded = 0
+            while not stop.is_set():
+                downloaded += 64 * 1024
+                d = {'status': 'downloading', 'downloaded_bytes': downloaded, 'total_bytes': 100 * 1024 * 1024,
+                     'speed': 3e6, 'eta': 30}
+                if coalesced:
+                    aggregator.update(job_id, f"Track {job_id}", d)
+                else:
+                    events.put(do_render)
+                time.sleep(1 / tick_hz)
+
+        def user_events():
+            while not stop.is_set():
+                sent = time.perf_counter()
+                events.put(lambda sent=sent: latencies.append((time.perf_counter() - sent) * 1000))
+                time.sleep(0.02)
+
+        def frame_timer():
+            while not stop.is_set():
+                events.put(lambda: (lambda lines: lines is not None and do_render(lines))(aggregator.drain()))
+                time.sleep(1 / fps)
+
+        threads = [threading.Thread(target=worker, args=(i,), daemon=True) for i in range(jobs)]
+        threads.append(threading.Thread(target=user_events, daemon=True))
+        if coalesced:
+            threads.append(threading.Thread(target=frame_timer, daemon=True))
+        for thread in threads:
+            thread.start()
+        deadline = time.perf_counter() + duration
+        while time.perf_counter() < deadline:
+            try:
+                events.get(timeout=0.01)()
+            except queue.Empty:
+                pass
+        stop.set()
+        for thread in threads:
+            thread.join()
+        summary = _summary(latencies) if latencies else {'mean_ms': 0.0, 'median_ms': 0.0, 'max_ms': 0.0}
+        summary['renders'] = renders[0]
+        summary['backlog'] = events.qsize()
+        return summary
+
+    return {'per_tick': run(coalesced=False), 'coalesced': run(coalesced=True)}
+
+def bench_result_store(sizes=(20, 1000, 100000), typed="love song"):
+    """
+    Measures the memory of the GUI's ResultStore against a list of result
+    dictionaries, and the per-keystroke cost of incremental filtering, for
+    growing result counts. Runs without a display; drawing cost is bounded by
+    the visible rows and does not depend on these sizes.
+
+    Args:
+        sizes (tuple): Result counts to measure.
+        typed (str): Filter text, applied one keystroke at a time.
+
+    Returns:
+        dict: Per size, 'dicts_kib' and 'store_kib' (traced allocations) and the
+              'filter' timing summary over all keystrokes.
+    """
+    import random
+    import tracemalloc
+    from virtual_list import ResultStore
+
+    rng = random.Random(7)
+    vocabulary = [''.join(rng.choice('abcdefghijklmnopqrstuvwxyz') for _ in range(rng.randint(3, 8)))
+                  for _ in range(5000)] + ['love', 'song']
+
+    report = {}
+    for size in sizes:
+        results = [{'title': ' '.join(rng.choice(vocabulary) for _ in range(5)), 'id': f"{i:011d}"}
+                   for i in range(size)]
+        # Build both from the same strings so only the container overhead is compared
+        tracemalloc.start()
+        dicts = [{'title': r['title'], 'id': r['id'], 'url': f"https://www.youtube.com/watch?v={r['id']}"}
+                 for r in results]
+        dicts_kib = tracemalloc.get_traced_memory()[0] / 1024
+        tracemalloc.stop()
+        tracemalloc.start()
+        store = ResultStore(results)
+        store_kib = tracemalloc.get_traced_memory()[0] / 1024
+        tracemalloc.stop()
+        del dicts
+
+        durations = []
+        for i in range(1, len(typed) + 1):
+            start = time.perf_counter()
+            store.filter(typed[:i])
+            durations.append((time.perf_counter() - start) * 1000)
+        report[size] = {'dicts_kib': dicts_kib, 'store_kib': store_kib, 'filter': _summary(durations)}
+    return report
+
+def bench_server_search(clients=50, requests_per_client=5, distinct_queries=5, search_ms=50):
+    """
+    Load-tests the HTTP server's /search endpoint against an in-process fake
+    extractor that sleeps `search_ms` per call, so no network is needed.
+
+    Args:
+        clients (int): Concurrent client threads.
+        requests_per_client (int): Sequential requests per client.
+        distinct_queries (int): Number of different queries the clients pick from.
+        search_ms (float): Simulated extractor latency.
+
+    Returns:
+        dict: Request latency summary plus 'requests_per_s', 'extractor_calls' and 'coalesced'.
+    """
+    import threading
+    import urllib.request
+    from server import MusicServer, MusicService
+
+    calls = []
+    def fake_search(query, max_results=5):
+        calls.append(query)
+        time.sleep(search_ms / 1000)
+        return [{'title': f"{query} {i}", 'id': f"{i:011d}", 'url': ''} for i in range(max_results)]
+
+    server = MusicServer(('127.0.0.1', 0), MusicService(search=fake_search, resolve=lambda url: {'url': url},
+                                                        download_workers=1))
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    base = f"http://127.0.0.1:{server.server_address[1]}"
+    latencies = []
+    lock = threading.Lock()
+
+    def client(n):
+        for i in range(requests_per_client):
+            start = time.perf_counter()
+            with urllib.request.urlopen(f"{base}/search?q=query{(n + i) % distinct_queries}") as response:
+                response.read()
+            with lock:
+                latencies.append((time.perf_counter() - start) * 1000)
+
+    started = time.perf_counter()
+    threads = [threading.Thread(target=client, args=(n,)) for n in range(clients)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+    summary = _summary(latencies)
+    summary.update({
+        'requests_per_s': len(latencies) / elapsed,
+        'extractor_calls': len(calls),
+        'coalesced': server.service.flights.shared,
+    })
+    server.shutdown()
+    server.service.close()
+    server.server_close()
+    return summary
+
+# --- Offline suite: the main user-facing paths against local stand-ins -------
+
+_STAND_IN_MPV = """
+import os, sys, urllib.request
+url = next(arg for arg in sys.argv[1:] if not arg.startswith('-'))
+with (open(url, 'rb') if os.path.isfile(url) else urllib.request.urlopen(url)) as source:
+    source.read(64 * 1024) # First audio buffer
+    print("first-audio", flush=True)
+    while source.read(64 * 1024): # Read ahead to the end, as mpv's demuxer cache does
+        pass
+print("end-of-stream", flush=True)
+sys.stdin.read() if not sys.stdin.isatty() else None
+"""
+
+_STAND_IN_FFMPEG = """
+import shutil, sys
+args = sys.argv[1:]
+inputs = [args[i + 1] for i, arg in enumerate(args) if arg == '-i']
+shutil.copyfile(inputs[0], args[-1])
+"""
+
+_STAND_IN_FFPROBE = """
+import json
+print(json.dumps({'streams': [{'codec_type': 'audio', 'codec_name': 'opus'}]}))
+"""
+
+@contextmanager
+def offline_environment(latency=0.005, bandwidth=None, error_rate=0.0, media_size=2 * 1024 * 1024):
+    """
+    Runs the enclosed benchmarks without network access or external programs.
+
+    Installs a FakeExtractor backed by a local FakeMediaServer. It also puts
+    stand-in 'mpv', 'ffmpeg' and 'ffprobe' scripts first on PATH and points the
+    application cache at a temporary directory. Everything is restored
+    afterwards.
+
+    Yields:
+        dict: 'extractor' (the FakeExtractor), 'server' and 'workdir' (temporary directory).
+    """
+    from audio_cache import AudioCache, set_audio_cache
+    from extractor import FakeExtractor, set_extractor
+    from search_cache import SearchCache, set_search_cache
+
+    workdir = tempfile.mkdtemp(prefix="pd_bench_")
+    bin_dir = os.path.join(workdir, "bin")
+    os.makedirs(bin_dir)
+    for name, source in (('mpv', _STAND_IN_MPV), ('ffmpeg', _STAND_IN_FFMPEG), ('ffprobe', _STAND_IN_FFPROBE)):
+        path = os.path.join(bin_dir, name)
+        with open(path, "w", encoding="utf-8") as f:
+            f.write(f"#!{sys.executable}\n" + textwrap.dedent(source))
+        os.chmod(path, 0o755)
+
+    saved_env = {key: os.environ.get(key) for key in ('PATH', 'PD_MUSIC_CACHE_DIR')}
+    os.environ['PATH'] = bin_dir + os.pathsep + os.environ.get('PATH', '')
+    os.environ['PD_MUSIC_CACHE_DIR'] = os.path.join(workdir, "cache")
+    extractor = FakeExtractor(latency=latency, bandwidth=bandwidth, error_rate=error_rate, media_size=media_size)
+    previous = set_extractor(extractor)
+    previous_audio_cache = set_audio_cache(AudioCache(os.path.join(workdir, "audio")))
+    previous_search_cache = set_search_cache(SearchCache(path=False))
+    try:
+        yield {'extractor': extractor, 'server': extractor.server, 'workdir': workdir}
+    finally:
+        set_extractor(previous)
+        set_audio_cache(previous_audio_cache)
+        set_search_cache(previous_search_cache)
+        extractor.server.stop()
+        for key, value in saved_env.items():
+            if value is None:
+                os.environ.pop(key, None)
+            else:
+                os.environ[key] = value
+        shutil.rmtree(workdir, ignore_errors=True)
+
+def _video_urls(count, query='benchmark'):
+    from extractor import fake_video_id
+    return [f"https://www.youtube.com/watch?v={fake_video_id(query, i)}" for i in range(count)]
+
+def bench_search(iterations=50):
+    """Uncached search_youtube_music calls (distinct queries) against the fake extractor."""
+    from youtube_search import search_youtube_music
+    queries = iter(f"benchmark query {i}" for i in range(iterations))
+    summary = _summary(_time_calls(lambda: search_youtube_music(next(queries), max_results=20, use_cache=False),
+                                   iterations))
+    summary['ops_per_s'] = 1000 / summary['mean_ms']
+    return summary
+
+def bench_resolve(iterations=50):
+    """
+    Stream resolution as play_music does it: through the stream cache, once
+    forcing a fresh resolve ('cold') and once answered from the cache ('warm').
+    """
+    from music_player import get_stream_cache
+    cache = get_stream_cache()
+    urls = _video_urls(iterations)
+    cold_urls, warm_urls = iter(urls), iter(urls)
+    cold = _summary(_time_calls(lambda: cache.resolve(next(cold_urls), force_refresh=True), iterations))
+    warm = _summary(_time_calls(lambda: cache.resolve(next(warm_urls)), iterations))
+    return {'cold': cold, 'warm': warm}
+
+def bench_search_as_you_type(phrases=("love song acoustic", "daft punk live", "lofi hip hop beats"),
+                             keystroke_ms=60, timeout=10.0):
+    """
+    Search-as-you-type: the GUI's IncrementalSearch wiring, with an asyncio loop standing in for Tk.
+
+    Every phrase is typed one character per `keystroke_ms`, then the box is
+    cleared. All phrases are typed twice; the second round should be answered
+    from the search cache without any live search.
+
+    Returns:
+        dict: 'keystroke' (time spent handling one key, i.e. UI-thread cost),
+              'first_result' (last keystroke to first result, first round), 'retyped' (the same,
+              second round) and 'upstream' with 'keystrokes', 'searches' and 'searches_per_keystroke'.
+
+    Raises:
+        RuntimeError: If a phrase produced no results within `timeout` seconds.
+    """
+    import asyncio
+    from async_api import get_async_api
+    from incremental_search import IncrementalSearch
+    from youtube_search import SearchSession
+
+    async def run():
+        loop = asyncio.get_running_loop()
+        api = get_async_api()
+        current = {'session': None, 'query': None}
+        arrived = {} # Query -> time of its first result
+
+        def start(query, ticket, explicit):
+            previous, session = current['session'], SearchSession(query, page_size=20)
+            current.update(session=session, query=query)
+            if previous is not None:
+                loop.run_in_executor(None, previous.close)
+            def on_result(result):
+                loop.call_soon_threadsafe(arrived.setdefault, query, time.perf_counter())
+            on_finished = (lambda: loop.call_soon_threadsafe(search.finished, ticket)) if ticket else None
+            loop.create_task(api.search_page(session, on_result=on_result, on_finished=on_finished))
+
+        search = IncrementalSearch(start, lambda ms, func: loop.call_later(ms / 1000, func),
+                                   lambda handle: handle.cancel())
+        keystrokes, rounds = [], []
+        for _ in range(2):
+            latencies = []
+            for phrase in phrases:
+                arrived.clear()
+                for i in range(1, len(phrase) + 1):
+                    started = time.perf_counter()
+                    search.text_changed(phrase[:i])
+                    keystrokes.append((time.perf_counter() - started) * 1000)
+                    await asyncio.sleep(keystroke_ms / 1000)
+                last_key = started
+                deadline = time.monotonic() + timeout
+                while phrase not in arrived:
+                    if time.monotonic() > deadline:
+                        raise RuntimeError(f"No results for '{phrase}' while typing.")
+                    await asyncio.sleep(0.002)
+                latencies.append((arrived[phrase] - last_key) * 1000)
+                search.text_changed("")
+            rounds.append(latencies)
+            if len(rounds) == 1:
+                first_round_searches = search.searches
+        if current['session'] is not None:
+            current['session'].close()
+        stats = search.stats()
+        return {
+            'keystroke': _summary(keystrokes),
+            'first_result': _summary(rounds[0]),
+            'retyped': _summary(rounds[1]),
+            'upstream': {'keystrokes': stats['keystrokes'], 'searches': stats['searches'],
+                         'first_round_searches': first_round_searches,
+                         'searches_per_keystroke': stats['searches_per_keystroke']},
+        }
+
+    return asyncio.run(run())
+
+def bench_playback_start(iterations=10):
+    """
+    Time from play_music() to the player having its first audio buffer.
+
+    The stand-in mpv fetches the first 64 KiB of the stream and reports it on
+    stdout, so this covers resolve, process spawn and the first media request
+    (through the audio cache proxy, as every track is new).
+    """
+    from music_player import play_music
+    urls = iter(_video_urls(iterations))
+
+    def play():
+        process = play_music(next(urls), use_cache=False)
+        process.stdout.readline()
+        process.kill()
+        process.wait()
+
+    return _summary(_time_calls(play, iterations))
+
+def bench_audio_cache(tracks=5):
+    """
+    First play versus replay of the same tracks through play_music.
+
+    The first play streams through the audio cache proxy, which fills the
+    cache; the stand-in mpv reads each stream to the end. Replays must open
+    the cached file without a single byte from the media server.
+
+    Returns:
+        dict: 'first_play' and 'replay' (time to the first audio buffer) plus 'cache'
+              with the replays' 'hit_ratio', 'bytes_saved' and 'network_bytes'.
+
+    Raises:
+        RuntimeError: If a track was not cached after its first play or a replay used the network.
+    """
+    from audio_cache import get_audio_cache
+    from extractor import get_extractor
+    from music_player import play_music
+    from youtube_search import extract_video_id
+
+    cache = get_audio_cache()
+    server = get_extractor().server
+    urls = _video_urls(tracks, query='audio cache benchmark')
+
+    def play(url, wait_for_end):
+        start = time.perf_counter()
+        process = play_music(url)
+        process.stdout.readline() # first-audio
+        elapsed = (time.perf_counter() - start) * 1000
+        if wait_for_end:
+            process.stdout.readline() # end-of-stream
+        process.kill()
+        process.wait()
+        return elapsed
+
+    first = [play(url, True) for url in urls]
+    for url in urls:
+        deadline = time.monotonic() + 2.0 # The proxy commits right after the last byte
+        while cache.lookup(extract_video_id(url), record=False) is None:
+            if time.monotonic() > deadline:
+                raise RuntimeError(f"{url} was not cached by its first play.")
+            time.sleep(0.01)
+
+    before, sent_before = cache.stats(), server.stats()['bytes_sent']
+    replay = [play(url, False) for url in urls]
+    after, network_bytes = cache.stats(), server.stats()['bytes_sent'] - sent_before
+    if network_bytes:
+        raise RuntimeError(f"Replays fetched {network_bytes} bytes from the network.")
+    hits, misses = after['hits'] - before['hits'], after['misses'] - before['misses']
+    return {
+        'first_play': _summary(first),
+        'replay': _summary(replay),
+        'cache': {'hit_ratio': hits / (hits + misses), 'bytes_saved': after['bytes_saved'] - before['bytes_saved'],
+                  'network_bytes': network_bytes},
+    }
+
+def bench_download(iterations=8, postprocess=False, resumable=True, output_path=None):
+    """
+    download_media throughput against the fake media server.
+
+    Args:
+        iterations (int): Number of distinct videos downloaded one after another.
+        postprocess (bool): Include the (stand-in) FFmpeg conversion step.
+        resumable (bool): Use the chunked downloader rather than the extractor's own.
+        output_path (str, optional): Download directory (a temporary one by default).
+
+    Returns:
+        dict: Latency summary plus 'ops_per_s' and 'mib_per_s'.
+    """
+    from music_player import download_media
+    temporary = output_path is None
+    output_path = output_path or tempfile.mkdtemp(prefix="pd_bench_dl_")
+    urls = iter(_video_urls(iterations))
+    sizes = []
+
+    def download():
+        path = download_media(next(urls), 'mp3', output_path=output_path, skip_existing=False,
+                              postprocess=postprocess, resumable=resumable)
+        if path is None:
+            raise RuntimeError("Download failed during benchmark.")
+        sizes.append(os.path.getsize(path))
+        os.remove(path)
+
+    try:
+        durations = _time_calls(download, iterations)
+    finally:
+        if temporary:
+            shutil.rmtree(output_path, ignore_errors=True)
+    summary = _summary(durations)
+    seconds = sum(durations) / 1000
+    summary['ops_per_s'] = iterations / seconds
+    summary['mib_per_s'] = sum(sizes) / 1024 / 1024 / seconds
+    return summary
+
+def bench_bandwidth(rate=6 * 1024 * 1024, duration=2.0, server_bandwidth=8 * 1024 * 1024, playback_rate=2 * 1024 * 1024,
+                    max_per_host=3):
+    """
+    Bandwidth shaping of concurrent chunked downloads against a throttled local server.
+
+    Each scenario starts its downloads together, samples the bytes every job
+    moved during `duration` seconds and then aborts them. The server limits
+    every connection to `server_bandwidth`, so the scheduler is what divides
+    `rate` between the jobs.
+
+    Scenarios:
+        cap: one job alone; 'achieved_mib_per_s' should match `rate`.
+        weights: jobs of weight 1 and 3; 'weight_ratio' should be close to 3.
+        playback: a PLAYBACK stream served at `playback_rate` next to a download while
+                  playback is active; the stream should keep its full speed.
+
+    Raises:
+        RuntimeError: If the cap is missed by more than 15%, the weight ratio is off by more
+                      than 25%, the stream loses more than 10% of its speed, or a host ever
+                      has more than `max_per_host` connections.
+    """
+    import threading
+    from bandwidth import BandwidthScheduler, PLAYBACK, DOWNLOAD
+    from chunked_download import ChunkedDownloader
+    from extractor import FakeMediaServer
+
+    class _Stop(Exception):
+        pass
+
+    mib = 1024 * 1024
+    server = FakeMediaServer(bandwidth=server_bandwidth, media_size=int(rate * duration * 4)).start()
+    stream_server = FakeMediaServer(bandwidth=playback_rate, media_size=int(rate * duration * 4)).start()
+    workdir = tempfile.mkdtemp(prefix="pd_bench_bw_")
+    peak = [0]
+
+    def run(scheduler, jobs):
+        """jobs: (name, weight, priority, connections). Returns bytes per second per job."""
+        stop = threading.Event()
+
+        def check(d):
+            peak[0] = max([peak[0]] + list(scheduler.stats()['connections'].values()))
+            if stop.is_set():
+                raise _Stop()
+
+        transfers, threads = [], []
+        for name, weight, priority, connections in jobs:
+            transfer = scheduler.open_transfer(name, weight=weight, priority=priority)
+            base_url = (stream_server if priority == PLAYBACK else server).base_url
+            downloader = ChunkedDownloader(f"{base_url}/media/{name}.m4a", os.path.join(workdir, name),
+                                           connections=connections, chunk_size=512 * 1024, progress_callback=check,
+                                           transfer=transfer)
+            transfers.append(transfer)
+            threads.append(threading.Thread(target=lambda d=downloader: _ignore(d.run, _Stop), daemon=True))
+        for thread in threads:
+            thread.start()
+        time.sleep(duration / 4) # Let connections open and the buckets settle
+        before = [t.bytes for t in transfers]
+        time.sleep(duration)
+        rates = [(t.bytes - b) / duration for t, b in zip(transfers, before)]
+        stop.set()
+        for thread in threads:
+            thread.join()
+        for transfer in transfers:
+            transfer.close()
+        return rates
+
+    try:
+        cap, = run(BandwidthScheduler(rate=rate, max_per_host=max_per_host), [('cap', 1, DOWNLOAD, 2)])
+        light, heavy = run(BandwidthScheduler(rate=rate, max_per_host=max_per_host),
+                           [('light', 1, DOWNLOAD, 2), ('heavy', 3, DOWNLOAD, 2)])
+        scheduler = BandwidthScheduler(rate=rate, max_per_host=max_per_host)
+        scheduler.playback_started('benchmark')
+        playback, background = run(scheduler, [('playback', 1, PLAYBACK, 1), ('background', 1, DOWNLOAD, 2)])
+    finally:
+        server.stop()
+        stream_server.stop()
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    report = {
+        'cap': {'achieved_mib_per_s': cap / mib, 'target_mib_per_s': rate / mib},
+        'weights': {'light_mib_per_s': light / mib, 'heavy_mib_per_s': heavy / mib, 'weight_ratio': heavy / light},
+        'playback': {'playback_mib_per_s': playback / mib, 'download_mib_per_s': background / mib,
+                     'peak_host_connections': peak[0]},
+    }
+    if abs(cap - rate) / rate > 0.15:
+        raise RuntimeError(f"Bandwidth cap missed: {cap / mib:.2f} MiB/s for a {rate / mib:.2f} MiB/s limit.")
+    if abs(heavy / light - 3) / 3 > 0.25:
+        raise RuntimeError(f"Weighted sharing is off: ratio {heavy / light:.2f} instead of 3.")
+    if playback < playback_rate * 0.9:
+        raise RuntimeError(f"Playback starved: {playback / mib:.2f} of {playback_rate / mib:.2f} MiB/s.")
+    if peak[0] > max_per_host:
+        raise RuntimeError(f"{peak[0]} connections to one host; the cap is {max_per_host}.")
+    return report
+
+def _ignore(func, exception):
+    try:
+        func()
+    except exception:
+        pass
+
+_COLD_START = """
+import json, os, sys, time
+started = time.perf_counter()
+import {module}
+imported = time.perf_counter()
+result = {{'import_ms': (imported - started) * 1000, 'window_ms': None, 'yt_dlp_loaded': 'yt_dlp' in sys.modules}}
+if {window}:
+    try:
+        import tkinter as tk
+        root = tk.Tk()
+    except Exception:
+        root = None
+    if root is not None:
+        app = {module}.MusicAppGUI(root)
+        root.update()
+        result['window_ms'] = (time.perf_counter() - started) * 1000
+print(json.dumps(result), flush=True)
+os._exit(0)
+"""
+
+def _cold_start(module, window, iterations):
+    root = os.path.dirname(os.path.abspath(__file__))
+    script = _COLD_START.format(module=module, window=window)
+    process, imports, windows = [], [], []
+    for _ in range(iterations):
+        start = time.perf_counter()
+        output = subprocess.run([sys.executable, "-c", script], cwd=root, capture_output=True, text=True,
+                                env=dict(os.environ, PD_MUSIC_EXTRACTOR='fake'), timeout=120)
+        process.append((time.perf_counter() - start) * 1000)
+        lines = output.stdout.strip().splitlines()
+        if output.returncode != 0 or not lines:
+            raise RuntimeError(f"{module} cold start failed: {output.stderr.strip()[-500:]}")
+        result = json.loads(lines[-1])
+        if result['yt_dlp_loaded']:
+            # Startup must not pay for the extractor; it is imported on first use
+            raise RuntimeError(f"Importing {module} imported yt_dlp eagerly.")
+        imports.append(result['import_ms'])
+        if result['window_ms'] is not None:
+            windows.append(result['window_ms'])
+    report = {'process': _summary(process), 'import': _summary(imports)}
+    if windows:
+        report['window'] = _summary(windows)
+    return report
+
+def bench_gui_cold_start(iterations=5):
+    """
+    Cold start of gui_app.py in a fresh interpreter: 'process' (spawn to ready),
+    'import' (importing gui_app) and, when a display is available, 'window'
+    (until the main window has been drawn once). Fails if the import pulled in yt_dlp.
+    """
+    return _cold_start('gui_app', True, iterations)
+
+def bench_cli_cold_start(iterations=5):
+    """Cold start of main.py (the CLI) in a fresh interpreter: 'process' and 'import'."""
+    return _cold_start('main', False, iterations)
+
+def bench_dependency_probe(iterations=5):
+    """
+    Probing mpv and ffmpeg as gui_app.py does at start-up: 'cold' (both
+    '--version' runs, concurrently) and 'cached' (answered from the probe cache).
+    """
+    from dependency_probe import DependencyProbe
+    cache_path = os.path.join(tempfile.mkdtemp(prefix="pd_bench_probe_"), "probe.json")
+    try:
+        def cold():
+            if os.path.exists(cache_path):
+                os.remove(cache_path)
+            DependencyProbe(path=cache_path).probe_all()
+        cold_times = _time_calls(cold, iterations)
+        cached_times = _time_calls(lambda: DependencyProbe(path=cache_path).probe_all(), iterations)
+    finally:
+        shutil.rmtree(os.path.dirname(cache_path), ignore_errors=True)
+    return {'cold': _summary(cold_times), 'cached': _summary(cached_times)}
+
+def run_suite(quick=False, startup_only=False):
+    """
+    Runs every benchmark offline.
+
+    Args:
+        quick (bool): Fewer iterations, for a fast smoke run.
+        startup_only (bool): Only the cold-start and dependency-probe benchmarks.
+
+    Returns:
+        dict: Flat mapping of benchmark name to its metrics (e.g. 'download.raw' -> {'p50_ms': ...}).
+    """
+    n = 5 if quick else 1
+    results = {}
+
+    def add(name, value):
+        # Nested reports become 'name.variant' entries so every entry is one metrics dict
+        if isinstance(value, dict) and value and all(isinstance(v, dict) for v in value.values()):
+            for key, sub in value.items():
+                add(f"{name}.{key}", sub)
+        else:
+            results[name] = value
+
+    with offline_environment() as env:
+        add('gui_cold_start', bench_gui_cold_start(max(1, 5 // n)))
+        add('cli_cold_start', bench_cli_cold_start(max(1, 5 // n)))
+        add('dependency_probe', bench_dependency_probe(max(2, 10 // n)))
+        if startup_only:
+            results['_meta'] = {'python': sys.version.split()[0], 'quick': quick, 'startup_only': True,
+                                'timestamp': time.time()}
+            return results
+        add('search', bench_search(50 // n))
+        add('resolve', bench_resolve(50 // n))
+        add('search_as_you_type', bench_search_as_you_type())
+        add('playback_start', bench_playback_start(max(2, 10 // n)))
+        add('audio_cache', bench_audio_cache(max(2, 5 // n)))
+        add('download.raw', bench_download(max(2, 8 // n), postprocess=False))
+        add('download.postprocessed', bench_download(max(2, 8 // n), postprocess=True))
+        add('download.extractor', bench_download(max(2, 8 // n), postprocess=True, resumable=False))
+        add('bandwidth', bench_bandwidth(duration=max(1.0, 2.0 / n))) # Shorter runs measure the burst
+        server_stats = env['server'].stats()
+    ydl = bench_ydl_construction(max(2, 20 // n))
+    add('ydl_construction', {'cold': ydl['cold'], 'warm': ydl['warm']})
+    add('library_search', bench_library_search(tracks=50000 // n, queries=200 // n))
+    # Only the coalesced path is gated; the per-tick variant is the unbounded "before" picture
+    coalesced = bench_progress_updates(duration=2.0 / n)['coalesced']
+    add('progress_updates', {m: v for m, v in coalesced.items() if m.endswith('_ms')})
+    add('server_search', bench_server_search(clients=50 // n))
+    results['_meta'] = {'fake_server': server_stats, 'python': sys.version.split()[0], 'quick': quick,
+                        'timestamp': time.time()}
+    return results
+
+def compare_to_baseline(results, baseline, tolerance=DEFAULT_TOLERANCE):
+    """
+    Compares results with a stored baseline.
+
+    Latency metrics ('*_ms', except 'max_ms') regress when they grow by more than
+    `tolerance` (and by at least NOISE_FLOOR_MS). Throughput metrics ('*_per_s')
+    regress when they shrink by more than `tolerance`.
+
+    Returns:
+        list: One dict per regression with 'benchmark', 'metric', 'baseline', 'current' and 'change'.
+    """
+    regressions = []
+    for name, metrics in results.items():
+        reference = baseline.get(name)
+        if name.startswith('_') or not isinstance(reference, dict):
+            continue
+        for metric, value in metrics.items():
+            old = reference.get(metric)
+            if not isinstance(old, (int, float)) or not isinstance(value, (int, float)) or old <= 0:
+                continue
+            change = (value - old) / old
+            if metric.endswith('_ms') and metric != 'max_ms':
+                regressed = change > tolerance and value - old > NOISE_FLOOR_MS
+            elif metric.endswith('_per_s'):
+                regressed = change < -tolerance
+            else:
+                continue
+            if regressed:
+                regressions.append({'benchmark': name, 'metric': metric, 'baseline': old, 'current': value,
+                                    'change': change})
+    return regressions
+
+def _print_summary(name, summary):
+    print(f"{name:<12} mean {summary['mean_ms']:8.3f} ms   median {summary['median_ms']:8.3f} ms   max {summary['max_ms']:8.3f} ms")
+
+def _print_suite(results):
+    for name, metrics in results.items():
+        if name.startswith('_'):
+            continue
+        if 'p50_ms' in metrics:
+            line = (f"{name:<28} p50 {metrics['p50_ms']:9.2f} ms  p95 {metrics['p95_ms']:9.2f} ms  "
+                    f"p99 {metrics['p99_ms']:9.2f} ms")
+        else:
+            line = f"{name:<28} " + "  ".join(f"{k} {v:.2f}" for k, v in metrics.items() if isinstance(v, (int, float)))
+        for key in ('ops_per_s', 'mib_per_s', 'requests_per_s'):
+            if key in metrics:
+                line += f"  {key} {metrics[key]:.1f}"
+        print(line)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Run the offline benchmark suite and compare it with a baseline.")
+    parser.add_argument('--quick', action='store_true', help="Fewer iterations for a fast smoke run.")
+    parser.add_argument('--startup', action='store_true',
+                        help="Only the start-up benchmarks (cold start and dependency probing).")
+    parser.add_argument('--json', metavar='PATH', help="Write the results as JSON to PATH ('-' for stdout).")
+    parser.add_argument('--baseline', metavar='PATH', default=None,
+                        help=f"Compare against this baseline (default: {DEFAULT_BASELINE} if it exists).")
+    parser.add_argument('--save-baseline', action='store_true', help="Store these results as the new baseline.")
+    parser.add_argument('--tolerance', type=float, default=DEFAULT_TOLERANCE,
+                        help="Allowed relative slowdown before failing (default: %(default)s).")
+    args = parser.parse_args(argv)
+
+    results = run_suite(quick=args.quick, startup_only=args.startup)
+    _print_suite(results)
+    if args.json == '-':
+        print(json.dumps(results, indent=2))
+    elif args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+
+    baseline_path = args.baseline or DEFAULT_BASELINE
+    if args.save_baseline:
+        with open(baseline_path, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+        print(f"Saved baseline to {baseline_path}.")
+        return 0
+    if not os.path.exists(baseline_path):
+        if args.baseline:
+            print(f"Baseline {baseline_path} not found.")
+            return 1
+        return 0
+    with open(baseline_path, "r", encoding="utf-8") as f:
+        baseline = json.load(f)
+    regressions = compare_to_baseline(results, baseline, tolerance=args.tolerance)
+    for r in regressions:
+        print(f"REGRESSION {r['benchmark']} {r['metric']}: {r['baseline']:.2f} -> {r['current']:.2f} "
+              f"({r['change']:+.0%})")
+    print(f"{len(regressions)} regression(s) against {baseline_path}.")
+    return 1 if regressions else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,216 @@
+# bulk_download.py
+
+import argparse
+import asyncio
+import csv
+import json
+import os
+import sys
+import time
+
+from async_api import get_async_api
+from youtube_search import extract_video_id
+from pipeline import DownloadPipeline
+from download_manager import COMPLETED
+from transcoder import PROFILES
+from bandwidth import get_bandwidth_scheduler, parse_rate
+
+def read_manifest(path, default_format='mp3'):
+    """
+    Reads a bulk download manifest.
+
+    A plain text manifest has one query or URL per line; blank lines and lines
+    starting with '#' are ignored. A CSV manifest (.csv) needs a 'query' or 'url'
+    column and may have a 'format' column ('mp3', 'm4a', 'opus' or 'mp4') per row.
+
+    Args:
+        path (str): Path of the manifest file.
+        default_format (str): Format used for items that do not specify one.
+
+    Returns:
+        list: A list of dictionaries with 'source' and 'format' keys, in file order.
+    """
+    items = []
+    with open(path, "r", encoding="utf-8", newline="") as f:
+        if path.lower().endswith('.csv'):
+            for row in csv.DictReader(f):
+                row = {(k or '').strip().lower(): (v or '').strip() for k, v in row.items()}
+                source = row.get('url') or row.get('query')
+                if source:
+                    items.append({'source': source, 'format': row.get('format') or default_format})
+        else:
+            for line in f:
+                line = line.strip()
+                if line and not line.startswith('#'):
+                    items.append({'source': line, 'format': default_format})
+    return items
+
+def _looks_like_url(source):
+    return '://' in source or source.startswith(('www.', 'youtube.', 'youtu.be', 'm.youtube.'))
+
+async def resolve_item(api, item):
+    """
+    Resolves a manifest item to a video id, URL and title.
+
+    URLs are parsed locally; queries are searched and take the top result.
+
+    Args:
+        api (AsyncMusicAPI): The API used for searches.
+        item (dict): A manifest item from read_manifest().
+
+    Returns:
+        dict: The item extended with 'id', 'url', 'title', 'resolve_ms' and, on failure, 'error'.
+    """
+    start = time.perf_counter()
+    resolved = dict(item)
+    source = item['source']
+    if _looks_like_url(source):
+        video_id = extract_video_id(source)
+        if video_id:
+            resolved.update({'id': video_id, 'url': f"https://www.youtube.com/watch?v={video_id}", 'title': source})
+        else:
+            resolved['error'] = "Could not determine a video id from the URL."
+    else:
+        try:
+            results = await api.search(source, max_results=1)
+        except asyncio.TimeoutError:
+            results, resolved['error'] = [], "Search timed out."
+        if results:
+            resolved.update({'id': results[0]['id'], 'url': results[0]['url'], 'title': results[0]['title']})
+        else:
+            resolved.setdefault('error', "No search results.")
+    resolved['resolve_ms'] = round((time.perf_counter() - start) * 1000, 1)
+    return resolved
+
+async def resolve_items(items, concurrency=8):
+    """
+    Resolves every manifest item concurrently on one event loop.
+
+    Searches run on the shared async API, so they also count against its
+    process-wide concurrency limit.
+
+    Args:
+        items (list): Manifest items from read_manifest().
+        concurrency (int): Maximum number of this batch's searches in flight.
+
+    Returns:
+        list: The resolved items, in manifest order.
+    """
+    api = get_async_api()
+    limiter = asyncio.Semaphore(concurrency)
+
+    async def resolve(item):
+        async with limiter:
+            return await resolve_item(api, item)
+
+    return await asyncio.gather(*(resolve(item) for item in items))
+
+def run_bulk_download(items, output_path="downloads", resolve_workers=8, download_workers=4, max_attempts=2,
+                      transcode_workers=None, profile=None):
+    """
+    Resolves all items concurrently, removes duplicate videos and downloads the rest in parallel.
+
+    Downloads go through the staged DownloadPipeline, so network fetches overlap
+    with FFmpeg conversion.
+
+    Args:
+        items (list): Manifest items from read_manifest().
+        output_path (str): Directory for downloaded files.
+        resolve_workers (int): Number of concurrent searches/URL resolutions.
+        download_workers (int): Number of concurrent network fetches.
+        max_attempts (int): How many times a failing download is attempted.
+        transcode_workers (int, optional): Number of concurrent FFmpeg processes (default: CPU count).
+        profile (dict, optional): Output profile overrides, e.g. {'audio_bitrate': '256k', 'max_height': 720}.
+
+    Returns:
+        dict: A report with a 'summary' and one entry per manifest item under 'items'.
+    """
+    started = time.time()
+    resolved = asyncio.run(resolve_items(items, concurrency=resolve_workers))
+
+    def progress(job, d):
+        if d['status'] in ('completed', 'failed', 'cancelled'):
+            print(f"[{job.status}] {job.title}" + (f": {job.error}" if job.error else ""))
+
+    pipeline = DownloadPipeline(fetch_workers=download_workers, transcode_workers=transcode_workers,
+                                output_path=output_path, progress_callback=progress, max_attempts=max_attempts,
+                                profile=profile)
+    jobs = {} # (video id, format) -> PipelineJob
+    for entry in resolved:
+        if 'error' in entry:
+            continue
+        key = (entry['id'], entry['format'])
+        if key in jobs:
+            entry['duplicate_of'] = jobs[key].title
+            continue
+        jobs[key] = pipeline.submit(entry['url'], entry['format'], title=entry['title'])
+    print(f"Resolved {len(resolved)} items into {len(jobs)} unique downloads.")
+    pipeline.wait()
+    pipeline.shutdown()
+
+    for entry in resolved:
+        job = jobs.get((entry.get('id'), entry['format']))
+        if job is None or 'duplicate_of' in entry:
+            continue
+        entry['status'] = job.status
+        entry['attempts'] = job.attempts
+        entry['skipped'] = job.skipped
+        entry['stage_ms'] = {stage: round(seconds * 1000, 1) for stage, seconds in job.timings.items()}
+        entry['download_ms'] = round(sum(job.timings.get(s, 0.0) for s in ('fetch', 'transcode')) * 1000, 1)
+        if job.status == COMPLETED:
+            entry['path'] = job.filepath
+            entry['bytes'] = os.path.getsize(job.filepath) if job.filepath and os.path.exists(job.filepath) else None
+        else:
+            entry['error'] = job.error or job.status
+
+    completed = [e for e in resolved if e.get('status') == COMPLETED]
+    return {
+        'summary': {
+            'items': len(resolved),
+            'unique_downloads': len(jobs),
+            'duplicates': sum(1 for e in resolved if 'duplicate_of' in e),
+            'completed': len(completed),
+            'failed': sum(1 for e in resolved if 'error' in e),
+            'bytes': sum(e.get('bytes') or 0 for e in completed),
+            'elapsed_s': round(time.time() - started, 2),
+            'stages': pipeline.stats()['stages'],
+        },
+        'items': resolved,
+    }
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Download every query or URL listed in a manifest file.")
+    parser.add_argument('manifest', help="Text file (one query/URL per line) or CSV with a 'query' or 'url' column.")
+    parser.add_argument('-f', '--format', choices=tuple(PROFILES), default='mp3', help="Default download format.")
+    parser.add_argument('-o', '--output', default='downloads', help="Download directory.")
+    parser.add_argument('-j', '--workers', type=int, default=4, help="Number of parallel network fetches.")
+    parser.add_argument('--transcode-workers', type=int, default=None, help="Number of parallel FFmpeg processes (default: CPU count).")
+    parser.add_argument('--resolve-workers', type=int, default=8, help="Number of parallel searches.")
+    parser.add_argument('--attempts', type=int, default=2, help="Attempts per download before giving up.")
+    parser.add_argument('--bitrate', default=None, help="Audio bitrate when re-encoding, e.g. 256k (default depends on the format).")
+    parser.add_argument('--max-height', type=int, default=None, help="Maximum video height for mp4 downloads, e.g. 720.")
+    parser.add_argument('-r', '--report', default='bulk_report.json', help="Where to write the JSON report.")
+    parser.add_argument('--limit-rate', type=parse_rate, default=None, metavar='RATE',
+                        help="Cap the total download rate, e.g. 2M or 750K bytes per second.")
+    args = parser.parse_args(argv)
+    if args.limit_rate:
+        get_bandwidth_scheduler().set_rate(args.limit_rate)
+
+    items = read_manifest(args.manifest, default_format=args.format)
+    if not items:
+        print("The manifest is empty. Nothing to do.")
+        return 1
+    print(f"Processing {len(items)} manifest items...")
+    report = run_bulk_download(items, output_path=args.output, resolve_workers=args.resolve_workers,
+                               download_workers=args.workers, max_attempts=args.attempts,
+                               transcode_workers=args.transcode_workers,
+                               profile={'audio_bitrate': args.bitrate, 'max_height': args.max_height})
+    with open(args.report, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2)
+    summary = report['summary']
+    print(f"Done: {summary['completed']} downloaded, {summary['failed']} failed, "
+          f"{summary['duplicates']} duplicates skipped in {summary['elapsed_s']}s. Report: {args.report}")
+    return 0 if summary['failed'] == 0 else 2
+
+if __name__ == "__main__":
+    sys.exit(main())
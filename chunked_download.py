@@ -0,0 +1,387 @@
+# chunked_download.py
+
+import http.client
+import json
+import os
+import random
+import threading
+import time
+from urllib.parse import urlparse, urljoin
+
+from bandwidth import get_bandwidth_scheduler
+from telemetry import telemetry
+
+DEFAULT_CHUNK_SIZE = 4 * 1024 * 1024 # Bytes per range request
+DEFAULT_CONNECTIONS = 4
+READ_BLOCK = 256 * 1024 # Bytes per read; also the granularity of bandwidth shaping
+MAX_REDIRECTS = 5
+EXPIRED_STATUSES = (403, 410) # What googlevideo answers for an expired signed URL
+
+class ChunkedDownloadError(Exception):
+    """Raised when a chunked download cannot be completed."""
+
+class _Connection:
+    """A keep-alive HTTP(S) connection owned by one worker, re-opened on errors or redirects."""
+
+    def __init__(self, url, timeout):
+        self.timeout = timeout
+        self.conn = None
+        self.netloc = None
+        self.origin = url # The URL before any redirects
+        self.set_url(url)
+
+    def set_url(self, url):
+        parsed = urlparse(url)
+        if parsed.scheme not in ('http', 'https'):
+            raise ChunkedDownloadError(f"Unsupported URL scheme: {parsed.scheme!r}")
+        self.url = url
+        target = (parsed.scheme, parsed.netloc)
+        if self.netloc != target:
+            self.close()
+            cls = http.client.HTTPSConnection if parsed.scheme == 'https' else http.client.HTTPConnection
+            self.conn = cls(parsed.netloc, timeout=self.timeout)
+            self.netloc = target
+        self.path = parsed.path + (f"?{parsed.query}" if parsed.query else "") or "/"
+
+    def close(self):
+        if self.conn is not None:
+            self.conn.close()
+
+    def reset(self, url):
+        """Drops the current connection so the next request opens a fresh one to `url`."""
+        self.close()
+        self.netloc = None
+        self.origin = url
+        self.set_url(url)
+
+    def request(self, method, headers):
+        """Sends a request, following redirects. Returns the response (body unread)."""
+        for _ in range(MAX_REDIRECTS + 1):
+            self.conn.request(method, self.path, headers=headers)
+            response = self.conn.getresponse()
+            if response.status in (301, 302, 303, 307, 308):
+                location = response.getheader('Location')
+                response.read()
+                if not location:
+                    break
+                self.set_url(urljoin(self.url, location))
+                continue
+            return response
+        raise ChunkedDownloadError("Too many redirects.")
+
+class ChunkedDownloader:
+    """
+    Downloads one HTTP resource as byte ranges over several pooled connections,
+    persisting progress so an interrupted download resumes where it stopped.
+
+    The file is written to '<dest>.part'. The set of finished ranges is kept in
+    '<dest>.state.json' next to it. Each range is retried with exponential
+    backoff. After a crash or restart, only missing ranges are fetched again.
+    The state is discarded if the resource size or `resume_key` changed. Signed
+    stream URLs change on every resolve, so callers pass a stable resume_key
+    (e.g. video id and format id) rather than relying on the URL.
+    Servers without Range support are fetched in one stream, which cannot resume.
+    When the server rejects the URL as expired (403/410), a `refresh_url`
+    callback can supply a freshly resolved one; this is tried once per download.
+
+    Progress is reported in the same dictionary shape as yt-dlp's progress hooks,
+    with 'downloading' status only: a file is often one of several streams, so
+    the caller reports when the whole download has finished.
+    Every connection holds one of its host's slots in the bandwidth scheduler,
+    and with a `transfer` each block read is charged to that job's share.
+    """
+
+    def __init__(self, url, dest_path, connections=DEFAULT_CONNECTIONS, chunk_size=DEFAULT_CHUNK_SIZE,
+                 max_retries=5, backoff=0.5, headers=None, progress_callback=None, resume_key=None, timeout=30,
+                 transfer=None, refresh_url=None):
+        """
+        Args:
+            url (str): The HTTP(S) URL to download.
+            dest_path (str): Final path of the file.
+            connections (int): Number of ranges fetched in parallel (one keep-alive connection each).
+            chunk_size (int): Size of each byte range.
+            max_retries (int): Retries per range before giving up.
+            backoff (float): Base delay in seconds; attempt n waits backoff * 2**n (plus jitter).
+            headers (dict, optional): Extra request headers (e.g. yt-dlp's 'http_headers').
+            progress_callback (callable, optional): Receives yt-dlp style progress dictionaries.
+                                                    Exceptions it raises abort the download.
+            resume_key (str, optional): Identifies the resource across URL changes (defaults to the URL).
+            timeout (float): Socket timeout in seconds.
+            transfer (bandwidth.Transfer, optional): The job's bandwidth share; progress dictionaries
+                                                     then also carry its live 'throughput'.
+            refresh_url (callable, optional): refresh_url() -> (url, headers) of a freshly resolved
+                                              URL for the same resource, used once if the server
+                                              rejects the current one as expired.
+        """
+        self.url = url
+        self.dest_path = dest_path
+        self.part_path = dest_path + ".part"
+        self.state_path = dest_path + ".state.json"
+        self.connections = max(1, connections)
+        self.chunk_size = chunk_size
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.headers = dict(headers or {})
+        self.progress_callback = progress_callback
+        self.resume_key = resume_key or url
+        self.timeout = timeout
+        self.transfer = transfer
+        self.refresh_url = refresh_url
+        self.refreshed = False # Whether refresh_url has been used
+        self.scheduler = transfer.scheduler if transfer else get_bandwidth_scheduler()
+        self.host = urlparse(url).netloc
+        self.retries = 0 # Total range retries performed
+        self._lock = threading.Lock()
+        self._abort = None # First exception raised by a worker or the progress callback
+        self._downloaded = 0
+        self._started = None
+
+    def run(self):
+        """
+        Downloads (or resumes) the file.
+
+        Returns:
+            str: The final file path.
+
+        Raises:
+            ChunkedDownloadError: If a range keeps failing or the server misbehaves.
+            Exception: Anything raised by the progress callback (e.g. a cancellation).
+        """
+        size, ranges_supported = self._probe()
+        if size is None or not ranges_supported:
+            return self._download_single_stream()
+
+        chunk_count = (size + self.chunk_size - 1) // self.chunk_size
+        done = self._load_state(size)
+        if not os.path.exists(self.part_path) or os.path.getsize(self.part_path) != size:
+            done = set()
+            with open(self.part_path, "wb") as f:
+                f.truncate(size) # Preallocate so ranges can be written at their offsets
+        self._save_state(size, done)
+
+        pending = [i for i in range(chunk_count) if i not in done]
+        self._downloaded = sum(min(self.chunk_size, size - i * self.chunk_size) for i in done)
+        self._started = time.monotonic()
+        start_bytes = self._downloaded
+        self._report(size, start_bytes)
+
+        pending_lock = threading.Lock()
+
+        def worker():
+            conn = _Connection(self.url, self.timeout)
+            try:
+                with open(self.part_path, "r+b") as f:
+                    while self._abort is None:
+                        with pending_lock:
+                            if not pending:
+                                return
+                            index = pending.pop(0)
+                        start = index * self.chunk_size
+                        end = min(size, start + self.chunk_size) - 1
+                        # The slot is taken per range, so it follows the host of a refreshed URL
+                        with self.scheduler.host_slot(self.host):
+                            self._fetch_range(conn, f, start, end, size, start_bytes)
+                        # The range must be on disk before the state file says it is done
+                        f.flush()
+                        os.fsync(f.fileno())
+                        with self._lock:
+                            done.add(index)
+                            self._save_state(size, done)
+            except BaseException as e:
+                with self._lock:
+                    if self._abort is None:
+                        self._abort = e
+            finally:
+                conn.close()
+
+        threads = [threading.Thread(target=worker, daemon=True) for _ in range(min(self.connections, len(pending)))]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        if self._abort is not None:
+            raise self._abort # Partial state stays on disk for the next attempt
+
+        os.replace(self.part_path, self.dest_path)
+        os.remove(self.state_path)
+        self._report(size, start_bytes)
+        return self.dest_path
+
+    def _probe(self):
+        """Returns (size, ranges_supported) using a one-byte range request."""
+        conn = _Connection(self.url, self.timeout)
+        try:
+            for attempt in range(self.max_retries + 1):
+                try:
+                    with self.scheduler.host_slot(self.host):
+                        response = conn.request('GET', dict(self.headers, Range='bytes=0-0'))
+                        response.read()
+                    if response.status == 206:
+                        content_range = response.getheader('Content-Range', '')
+                        total = content_range.rsplit('/', 1)[-1]
+                        return (int(total) if total.isdigit() else None), True
+                    if response.status == 200:
+                        length = response.getheader('Content-Length')
+                        return (int(length) if length and length.isdigit() else None), False
+                    if response.status in EXPIRED_STATUSES and self._refresh(conn.origin):
+                        conn.reset(self.url)
+                        continue
+                    if response.status < 500:
+                        raise ChunkedDownloadError(f"HTTP {response.status} for {self.url}")
+                except (OSError, http.client.HTTPException) as e:
+                    if attempt == self.max_retries:
+                        raise ChunkedDownloadError(f"Could not reach server: {e}")
+                    telemetry.count('retries_total', operation='probe')
+                    conn.reset(self.url)
+                self._sleep_backoff(attempt)
+            raise ChunkedDownloadError("Server kept failing while probing the download.")
+        finally:
+            conn.close()
+
+    def _fetch_range(self, conn, f, start, end, size, start_bytes):
+        """Fetches bytes start..end (inclusive) into the part file, retrying with backoff."""
+        expected = end - start + 1
+        for attempt in range(self.max_retries + 1):
+            written = 0
+            try:
+                response = conn.request('GET', dict(self.headers, Range=f'bytes={start}-{end}'))
+                if response.status != 206:
+                    response.read()
+                    if response.status in EXPIRED_STATUSES and self._refresh(conn.origin):
+                        conn.reset(self.url)
+                        raise OSError(f"HTTP {response.status} (stream URL refreshed)")
+                    if 400 <= response.status < 500 and response.status not in (408, 429):
+                        raise ChunkedDownloadError(f"HTTP {response.status} for range {start}-{end}")
+                    raise OSError(f"HTTP {response.status}")
+                f.seek(start)
+                while written < expected:
+                    data = response.read(min(READ_BLOCK, expected - written))
+                    if not data:
+                        raise OSError("Connection closed mid-range")
+                    self._throttle(len(data))
+                    f.write(data)
+                    written += len(data)
+                    self._add_progress(len(data), size, start_bytes)
+                response.read() # Drain so the connection can be reused
+                telemetry.count('transfer_bytes_total', written, downloader='chunked')
+                return
+            except (OSError, http.client.HTTPException) as e:
+                self._add_progress(-written, size, start_bytes, report=False)
+                if attempt == self.max_retries:
+                    raise ChunkedDownloadError(f"Range {start}-{end} failed after {attempt + 1} attempts: {e}")
+                with self._lock:
+                    self.retries += 1
+                telemetry.count('retries_total', operation='range')
+                conn.reset(self.url) # Fresh connection for the retry
+                self._sleep_backoff(attempt)
+
+    def _download_single_stream(self):
+        """Fallback for servers without Range support: one plain GET, no resume."""
+        conn = _Connection(self.url, self.timeout)
+        try:
+            with self.scheduler.host_slot(self.host):
+                response = conn.request('GET', self.headers)
+                if response.status != 200:
+                    raise ChunkedDownloadError(f"HTTP {response.status} for {self.url}")
+                length = response.getheader('Content-Length')
+                size = int(length) if length and length.isdigit() else None
+                self._started = time.monotonic()
+                with open(self.part_path, "wb") as f:
+                    while True:
+                        data = response.read(READ_BLOCK)
+                        if not data:
+                            break
+                        self._throttle(len(data))
+                        f.write(data)
+                        self._add_progress(len(data), size, 0)
+        except (OSError, http.client.HTTPException) as e:
+            raise ChunkedDownloadError(f"Download failed: {e}")
+        finally:
+            conn.close()
+        telemetry.count('transfer_bytes_total', self._downloaded, downloader='single')
+        os.replace(self.part_path, self.dest_path)
+        self._report(size or self._downloaded, 0)
+        return self.dest_path
+
+    def _refresh(self, rejected_url):
+        """
+        Replaces an expired URL through refresh_url, at most once per download.
+
+        Returns:
+            bool: True if self.url is now a different URL to retry with.
+        """
+        with self._lock:
+            if self.url != rejected_url:
+                return True # Another connection has refreshed it already
+            if self.refresh_url is None or self.refreshed:
+                return False
+            self.refreshed = True
+            print("Stream URL expired during the download; resolving it again.")
+            telemetry.count('retries_total', operation='refresh_url')
+            try:
+                url, headers = self.refresh_url()
+            except Exception as e:
+                print(f"Could not resolve the stream URL again: {e}")
+                return False
+            self.url = url
+            self.host = urlparse(url).netloc
+            self.headers = dict(headers or {})
+            return True
+
+    def _sleep_backoff(self, attempt):
+        time.sleep(self.backoff * (2 ** attempt) * (1 + random.random() * 0.25))
+
+    def _load_state(self, size):
+        try:
+            with open(self.state_path, "r", encoding="utf-8") as f:
+                state = json.load(f)
+        except (OSError, ValueError):
+            return set()
+        if (state.get('resume_key') != self.resume_key or state.get('size') != size
+                or state.get('chunk_size') != self.chunk_size):
+            return set() # Different resource or layout: start over
+        return set(state.get('done', []))
+
+    def _save_state(self, size, done):
+        tmp_path = self.state_path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({'resume_key': self.resume_key, 'size': size, 'chunk_size': self.chunk_size,
+                       'done': sorted(done)}, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.state_path)
+
+    def _throttle(self, nbytes):
+        """Charges a block just read to the job's bandwidth share (may block)."""
+        if self.transfer is not None:
+            self.transfer.consume(nbytes)
+
+    def _add_progress(self, delta, size, start_bytes, report=True):
+        with self._lock:
+            self._downloaded += delta
+            downloaded = self._downloaded
+        if report:
+            self._report(size, start_bytes, downloaded=downloaded)
+
+    def _report(self, size, start_bytes, status='downloading', downloaded=None):
+        if not self.progress_callback:
+            return
+        downloaded = self._downloaded if downloaded is None else downloaded
+        elapsed = time.monotonic() - (self._started or time.monotonic())
+        speed = (downloaded - start_bytes) / elapsed if elapsed > 0 else None
+        eta = (size - downloaded) / speed if speed and size else None
+        percent = downloaded * 100 / size if size else None
+        extra = self.transfer.progress_fields() if self.transfer is not None else {}
+        self.progress_callback({
+            'status': status,
+            'filename': self.dest_path,
+            'downloaded_bytes': downloaded,
+            'total_bytes': size,
+            'elapsed': elapsed,
+            'speed': speed,
+            'eta': eta,
+            '_percent_str': f"{percent:5.1f}%" if percent is not None else 'N/A',
+            '_speed_str': f"{speed / 1024 / 1024:.2f}MiB/s" if speed else 'N/A',
+            '_eta_str': f"{int(eta) // 60:02d}:{int(eta) % 60:02d}" if eta is not None else 'N/A',
+            **extra,
+        })
@@ -0,0 +1,153 @@
+# dependency_probe.py
+
+import json
+import os
+import shutil
+import subprocess
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from app_paths import get_cache_dir
+
+PROBE_TIMEOUT = 5 # Seconds allowed for '<program> --version'
+
+# Programs the application shells out to, with the message shown when one is missing
+DEPENDENCIES = {
+    'mpv': "MPV player not found. Playback functionality may not work.\n"
+           "Please install MPV (e.g., 'sudo apt install mpv' or 'brew install mpv').",
+    'ffmpeg': "FFmpeg not found. MP3/MP4 download conversion may not work.\n"
+              "Please install FFmpeg (e.g., 'sudo apt install ffmpeg' or 'brew install ffmpeg').",
+}
+
+class DependencyProbe:
+    """
+    Checks that external programs are installed, remembering the answers on disk.
+
+    A program is looked up on PATH first; a missing program costs no subprocess
+    at all. A found program is run once with '--version', and the result is
+    cached keyed by its resolved path, size and modification time, so later
+    starts skip the subprocess until the binary is replaced or upgraded. Several
+    programs are probed concurrently.
+    """
+
+    def __init__(self, path=None, timeout=PROBE_TIMEOUT):
+        """
+        Args:
+            path (str, optional): JSON file for the cache. Defaults to 'dependency_probe.json'
+                                  in the application cache directory. Pass False to keep it in memory only.
+            timeout (float): Seconds a '--version' run may take before the program counts as broken.
+        """
+        if path is None:
+            path = os.path.join(get_cache_dir(), "dependency_probe.json")
+        self.path = path or None
+        self.timeout = timeout
+        self.runs = 0 # Subprocesses actually started
+        self._lock = threading.Lock()
+        self._entries = self._load()
+
+    def probe(self, command):
+        """
+        Checks one program.
+
+        Args:
+            command (str): The program name, e.g. 'mpv'.
+
+        Returns:
+            dict: 'available' (bool), 'path' (resolved path or None), 'version' (first
+                  line of its version output, or None) and 'cached' (bool).
+        """
+        path = shutil.which(command)
+        if path is None:
+            return {'available': False, 'path': None, 'version': None, 'cached': False}
+        real_path = os.path.realpath(path)
+        try:
+            st = os.stat(real_path)
+        except OSError:
+            return {'available': False, 'path': path, 'version': None, 'cached': False}
+        key = f"{real_path}:{st.st_size}:{st.st_mtime_ns}"
+        with self._lock:
+            entry = self._entries.get(key)
+        if entry is not None:
+            return dict(entry, path=path, cached=True)
+
+        with self._lock:
+            self.runs += 1
+        try:
+            result = subprocess.run([path, '--version'], capture_output=True, text=True, timeout=self.timeout)
+            available = result.returncode == 0
+            lines = (result.stdout or result.stderr).strip().splitlines()
+            version = lines[0] if lines else None
+        except (OSError, subprocess.TimeoutExpired):
+            available, version = False, None
+        entry = {'available': available, 'version': version}
+        with self._lock:
+            # Drop stale entries for this binary (an upgrade changes size or mtime)
+            for stale in [k for k in self._entries if k.rsplit(':', 2)[0] == real_path]:
+                del self._entries[stale]
+            self._entries[key] = entry
+            self._save_locked()
+        return dict(entry, path=path, cached=False)
+
+    def probe_all(self, commands=tuple(DEPENDENCIES)):
+        """
+        Checks several programs at the same time.
+
+        Returns:
+            dict: Program name -> probe() result.
+        """
+        commands = list(commands)
+        if not commands:
+            return {}
+        with ThreadPoolExecutor(max_workers=len(commands), thread_name_prefix="dependency-probe") as pool:
+            return dict(zip(commands, pool.map(self.probe, commands)))
+
+    def probe_in_background(self, callback, commands=tuple(DEPENDENCIES)):
+        """
+        Runs probe_all() on a daemon thread and calls callback(results) from that thread.
+
+        GUI callers should hand the results back to their event loop (e.g. with after()).
+
+        Returns:
+            threading.Thread: The started thread.
+        """
+        thread = threading.Thread(target=lambda: callback(self.probe_all(commands)), name="dependency-probe",
+                                  daemon=True)
+        thread.start()
+        return thread
+
+    def clear(self):
+        """Forgets every cached result."""
+        with self._lock:
+            self._entries.clear()
+            self._save_locked()
+
+    def _load(self):
+        if not self.path or not os.path.exists(self.path):
+            return {}
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+        except (OSError, ValueError) as e:
+            print(f"Ignoring unreadable dependency cache '{self.path}': {e}")
+            return {}
+        return data.get('entries', {}) if isinstance(data, dict) else {}
+
+    def _save_locked(self):
+        """Writes the cache to disk atomically. Must be called with the lock held."""
+        if not self.path:
+            return
+        tmp_path = f"{self.path}.tmp"
+        try:
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump({'entries': self._entries}, f)
+            os.replace(tmp_path, self.path)
+        except OSError as e:
+            print(f"Could not write dependency cache '{self.path}': {e}")
+
+def missing_dependency_messages(results):
+    """
+    Returns:
+        list: The DEPENDENCIES message of every probed program that is not available.
+    """
+    return [DEPENDENCIES.get(name, f"{name} not found.") for name, result in results.items()
+            if not result['available']]
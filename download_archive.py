@@ -0,0 +1,174 @@
+# download_archive.py
+
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+
+from app_paths import get_cache_dir
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS archive (
+    video_id TEXT NOT NULL,
+    format TEXT NOT NULL,
+    path TEXT NOT NULL,
+    size INTEGER,
+    sha256 TEXT,
+    completed_at REAL,
+    PRIMARY KEY (video_id, format)
+);
+"""
+
+def file_sha256(path, chunk_size=1024 * 1024):
+    """
+    Returns the hex SHA-256 digest of a file.
+
+    Args:
+        path (str): Path of the file.
+        chunk_size (int): Bytes read per iteration.
+
+    Returns:
+        str: The hex digest.
+    """
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+class DownloadArchive:
+    """
+    Record of finished downloads keyed by (video id, format).
+
+    download_media checks the archive before touching the network, so a video
+    that is already on disk in the requested format is never fetched or
+    transcoded again. claim() serialises work on the same key, so two workers
+    asked for the same video run it once and the second one sees the archived
+    file. Each entry stores the file's size, plus its SHA-256 when verification
+    is on. A lookup always checks that the file still exists with the recorded
+    size. With verify=True it also re-hashes the file.
+    """
+
+    def __init__(self, db_path=None, verify=False):
+        """
+        Args:
+            db_path (str, optional): SQLite database file. Defaults to 'download_archive.sqlite3'
+                                     in the application cache directory.
+            verify (bool): Re-hash archived files on lookup and discard entries that do not match.
+        """
+        self.db_path = db_path or os.path.join(get_cache_dir(), "download_archive.sqlite3")
+        self.verify = verify
+        self._conn = sqlite3.connect(self.db_path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.executescript(_SCHEMA)
+        self._lock = threading.Lock()
+        self._key_locks = {} # (video_id, format) -> [Lock, number of holders/waiters]
+
+    @contextmanager
+    def claim(self, video_id, format_type):
+        """
+        Context manager that holds an exclusive, per-key lock while a video is downloaded.
+        """
+        self.acquire(video_id, format_type)
+        try:
+            yield
+        finally:
+            self.release(video_id, format_type)
+
+    def acquire(self, video_id, format_type):
+        """
+        Takes the per-key lock of claim() without a with-block, for work that spans
+        threads (e.g. a pipeline's fetch and transcode stages). Pair it with release(),
+        which may be called from another thread.
+        """
+        key = (video_id, format_type)
+        with self._lock:
+            entry = self._key_locks.setdefault(key, [threading.Lock(), 0])
+            entry[1] += 1
+        entry[0].acquire()
+
+    def release(self, video_id, format_type):
+        """Releases a key taken with acquire()."""
+        key = (video_id, format_type)
+        with self._lock:
+            entry = self._key_locks[key]
+            entry[1] -= 1
+            if entry[1] == 0:
+                del self._key_locks[key]
+        entry[0].release()
+
+    def lookup(self, video_id, format_type, verify=None):
+        """
+        Returns the path of an archived download if it is still intact.
+
+        Args:
+            video_id (str): The YouTube video id.
+            format_type (str): 'mp3' or 'mp4'.
+            verify (bool, optional): Override the archive's hash verification setting.
+
+        Returns:
+            str or None: The file path, or None if the video is not archived (or the file is gone/changed).
+        """
+        with self._lock:
+            row = self._conn.execute("SELECT path, size, sha256 FROM archive WHERE video_id = ? AND format = ?",
+                                     (video_id, format_type)).fetchone()
+        if row is None:
+            return None
+        path, size, sha256 = row
+        verify = self.verify if verify is None else verify
+        try:
+            intact = os.path.getsize(path) == size
+            if intact and verify and sha256:
+                intact = file_sha256(path) == sha256
+        except OSError:
+            intact = False
+        if not intact:
+            print(f"Archived file for {video_id} ({format_type}) is missing or changed; it will be downloaded again.")
+            self.forget(video_id, format_type)
+            return None
+        return path
+
+    def record(self, video_id, format_type, path, compute_hash=None):
+        """
+        Adds (or replaces) the archive entry for a finished download.
+
+        Args:
+            video_id (str): The YouTube video id.
+            format_type (str): 'mp3' or 'mp4'.
+            path (str): Path of the finished file.
+            compute_hash (bool, optional): Store the file's SHA-256 for later verification.
+                                           Defaults to the archive's verify setting, so
+                                           downloads are not re-read when nothing checks the hash.
+        """
+        compute_hash = self.verify if compute_hash is None else compute_hash
+        sha256 = file_sha256(path) if compute_hash else None
+        with self._lock, self._conn:
+            self._conn.execute("INSERT OR REPLACE INTO archive (video_id, format, path, size, sha256, completed_at) "
+                               "VALUES (?, ?, ?, ?, ?, ?)",
+                               (video_id, format_type, os.path.abspath(path), os.path.getsize(path), sha256, time.time()))
+
+    def forget(self, video_id, format_type):
+        """Removes the archive entry for a video and format."""
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM archive WHERE video_id = ? AND format = ?", (video_id, format_type))
+
+    def close(self):
+        """Closes the database connection."""
+        with self._lock:
+            self._conn.close()
+
+_default_archive = None
+_default_archive_lock = threading.Lock()
+
+def get_download_archive():
+    """
+    Returns:
+        DownloadArchive: The process-wide download archive.
+    """
+    global _default_archive
+    with _default_archive_lock:
+        if _default_archive is None:
+            _default_archive = DownloadArchive()
+        return _default_archive
@@ -0,0 +1,378 @@
+# download_manager.py
+
+import itertools
+import queue
+import threading
+import time
+
+from lazy_import import LazyModule
+
+yt_dlp = LazyModule('yt_dlp')
+
+from music_player import download_media
+from telemetry import telemetry
+
+# Job states
+PENDING = 'pending'
+RUNNING = 'running'
+PAUSED = 'paused'
+COMPLETED = 'completed'
+FAILED = 'failed'
+CANCELLED = 'cancelled'
+
+FINAL_STATES = (COMPLETED, FAILED, CANCELLED)
+
+class DownloadJob:
+    """
+    A single queued download and its current state.
+
+    Attributes:
+        job_id (int): Unique id assigned by the manager.
+        url (str): The YouTube video URL.
+        format_type (str): 'mp3' or 'mp4'.
+        title (str): Display title (defaults to the URL).
+        priority (int): Lower values are started first; ties run in FIFO order.
+        weight (float): Bandwidth share relative to the other running downloads.
+        status (str): One of PENDING, RUNNING, PAUSED, COMPLETED, FAILED, CANCELLED.
+        progress (dict): The latest progress dictionary reported for this job.
+        filepath (str or None): Path of the finished file once COMPLETED.
+        error (str or None): Error message once FAILED.
+        attempts (int): Number of times the download has been started.
+    """
+
+    def __init__(self, job_id, url, format_type, title=None, priority=0, output_path="downloads", weight=1.0):
+        self.job_id = job_id
+        self.url = url
+        self.format_type = format_type
+        self.title = title or url
+        self.priority = priority
+        self.weight = weight
+        self.output_path = output_path
+        self.status = PENDING
+        self.progress = {}
+        self.filepath = None
+        self.error = None
+        self.attempts = 0
+        self.started_at = None
+        self.finished_at = None
+        self._cancel_event = threading.Event()
+        self._resume_event = threading.Event()
+        self._resume_event.set() # Set while the job is allowed to run
+        self._done_event = threading.Event()
+        # Both guarded by the manager's lock
+        self._in_worker = False # True while a worker thread is executing the job
+        self._queued = False # True while the job has an entry in the manager's queue
+
+    def wait(self, timeout=None):
+        """
+        Blocks until the job reaches a final state.
+
+        Returns:
+            bool: True if the job finished, False if the timeout expired.
+        """
+        return self._done_event.wait(timeout)
+
+    def __repr__(self):
+        return f"<DownloadJob {self.job_id} {self.format_type} {self.status} {self.title!r}>"
+
+class DownloadManager:
+    """
+    Runs downloads from a priority queue on a bounded pool of worker threads.
+
+    Every job goes through music_player.download_media. Its progress dictionaries
+    are recorded on the job and forwarded to `progress_callback(job, d)`. Jobs can
+    be cancelled, paused, resumed and retried individually. The manager has no
+    Tk dependency and can drive batch downloads on its own.
+
+    Status changes happen under the manager's lock: a worker claims a job by
+    moving it from PENDING to RUNNING, a job is queued at most once at a time,
+    and a job reaches a final state (and is reported) exactly once per run.
+    """
+
+    def __init__(self, max_workers=3, output_path="downloads", progress_callback=None, max_attempts=1):
+        """
+        Args:
+            max_workers (int): Number of downloads that may run at the same time.
+            output_path (str): Default directory for downloaded files.
+            progress_callback (callable, optional): Called as progress_callback(job, d) from
+                                                    worker threads for every progress update.
+            max_attempts (int): How many times a failing job is started before it is marked FAILED.
+        """
+        self.max_workers = max_workers
+        self.output_path = output_path
+        self.progress_callback = progress_callback
+        self.max_attempts = max_attempts
+        self._queue = queue.PriorityQueue()
+        self._jobs = {}
+        self._ids = itertools.count(1)
+        self._seq = itertools.count() # FIFO tie-breaker for equal priorities
+        self._lock = threading.Lock()
+        self._shutdown = False
+        self._workers = []
+        for i in range(max_workers):
+            worker = threading.Thread(target=self._worker, name=f"download-worker-{i + 1}", daemon=True)
+            worker.start()
+            self._workers.append(worker)
+
+    def submit(self, url, format_type, title=None, priority=0, output_path=None, weight=1.0):
+        """
+        Queues a download.
+
+        Args:
+            url (str): The YouTube video URL.
+            format_type (str): 'mp3' or 'mp4'.
+            title (str, optional): Display title for progress reporting.
+            priority (int): Lower values start first.
+            output_path (str, optional): Directory for this download; defaults to the manager's.
+            weight (float): Bandwidth share while it runs alongside other downloads
+                            (see bandwidth.BandwidthScheduler).
+
+        Returns:
+            DownloadJob: The queued job.
+        """
+        if self._shutdown:
+            raise RuntimeError("DownloadManager has been shut down.")
+        job = DownloadJob(next(self._ids), url, format_type, title=title, priority=priority,
+                          output_path=output_path or self.output_path, weight=weight)
+        with self._lock:
+            self._jobs[job.job_id] = job
+            self._enqueue_locked(job)
+        return job
+
+    def get(self, job_id):
+        """Returns the job with the given id, or None."""
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def jobs(self):
+        """Returns a list of all jobs known to the manager, oldest first."""
+        with self._lock:
+            return list(self._jobs.values())
+
+    def active_count(self):
+        """Returns the number of jobs that are pending, running or paused."""
+        return sum(1 for job in self.jobs() if job.status not in FINAL_STATES)
+
+    def cancel(self, job_id):
+        """
+        Cancels a pending, paused or running job.
+
+        Returns:
+            bool: True if the job was cancelled, False if it had already finished.
+        """
+        job = self.get(job_id)
+        if job is None:
+            return False
+        with self._lock:
+            if job.status in FINAL_STATES:
+                return False
+            job._cancel_event.set()
+            job._resume_event.set() # Wake a paused transfer so it can abort
+            if job._in_worker:
+                return True # The worker reports the cancellation when the transfer stops
+            self._set_final_locked(job, CANCELLED)
+        self._report_final(job)
+        return True
+
+    def pause(self, job_id):
+        """
+        Pauses a job. A running transfer stalls at its next progress update;
+        a pending job stays queued but is not started until resumed.
+
+        Returns:
+            bool: True if the job was paused.
+        """
+        job = self.get(job_id)
+        if job is None:
+            return False
+        with self._lock:
+            if job.status not in (PENDING, RUNNING):
+                return False
+            job._resume_event.clear()
+            job.status = PAUSED
+        self._notify(job, {'status': 'paused', 'message': 'Paused.'})
+        return True
+
+    def resume(self, job_id):
+        """
+        Resumes a paused job.
+
+        Returns:
+            bool: True if the job was paused and is now resumed.
+        """
+        job = self.get(job_id)
+        if job is None:
+            return False
+        with self._lock:
+            if job.status != PAUSED:
+                return False
+            job._resume_event.set()
+            if job._in_worker:
+                job.status = RUNNING
+            else:
+                job.status = PENDING
+                self._enqueue_locked(job)
+        self._notify(job, {'status': 'resumed', 'message': 'Resumed.'})
+        return True
+
+    def retry(self, job_id):
+        """
+        Re-queues a failed or cancelled job.
+
+        Returns:
+            bool: True if the job was queued again.
+        """
+        job = self.get(job_id)
+        if job is None:
+            return False
+        with self._lock:
+            if job.status not in (FAILED, CANCELLED):
+                return False
+            job._cancel_event.clear()
+            job._resume_event.set()
+            job._done_event.clear()
+            job.error = None
+            job.finished_at = None
+            job.attempts = 0
+            job.status = PENDING
+            self._enqueue_locked(job)
+        return True
+
+    def wait(self, timeout=None):
+        """
+        Blocks until every submitted job has reached a final state or is paused.
+
+        Returns:
+            bool: True if all jobs finished, False if the timeout expired.
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        for job in self.jobs():
+            while job.status not in FINAL_STATES:
+                if job.status == PAUSED:
+                    break
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    return False
+                job.wait(0.2 if remaining is None else min(0.2, remaining))
+        return True
+
+    def shutdown(self, wait=True, cancel_pending=False):
+        """
+        Stops the worker threads.
+
+        Args:
+            wait (bool): Block until the workers have exited.
+            cancel_pending (bool): Cancel every job that has not finished yet.
+        """
+        if cancel_pending:
+            for job in self.jobs():
+                self.cancel(job.job_id)
+        self._shutdown = True
+        for _ in self._workers:
+            self._queue.put((float('inf'), next(self._seq), None)) # Wake each worker
+        if wait:
+            for worker in self._workers:
+                worker.join()
+
+    def _enqueue_locked(self, job):
+        """Queues a job unless it is still queued (e.g. paused and resumed before a worker got to it)."""
+        if not job._queued:
+            job._queued = True
+            self._queue.put((job.priority, next(self._seq), job))
+
+    def _worker(self):
+        while True:
+            _, _, job = self._queue.get()
+            if job is None:
+                return
+            with self._lock:
+                job._queued = False
+                if job.status != PENDING:
+                    continue # Cancelled or paused while it was waiting in the queue
+                job.status = RUNNING
+                job.started_at = time.time()
+                job._in_worker = True
+            self._run(job)
+
+    def _run(self, job):
+        try:
+            self._run_attempts(job)
+        except Exception as e:
+            print(f"Unexpected error in download job {job.job_id}: {e}")
+            job.error = str(e)
+            self._finish(job, FAILED)
+
+    def _run_attempts(self, job):
+        hook = self._make_hook(job)
+        while True:
+            if job._cancel_event.is_set():
+                self._finish(job, CANCELLED)
+                return
+            job.attempts += 1
+            job.error = None
+            filepath = download_media(job.url, job.format_type, output_path=job.output_path,
+                                      progress_callback=hook, weight=job.weight)
+            if job._cancel_event.is_set():
+                self._finish(job, CANCELLED)
+                return
+            if filepath:
+                job.filepath = filepath
+                self._finish(job, COMPLETED)
+                return
+            if job.attempts >= self.max_attempts:
+                self._finish(job, FAILED)
+                return
+            print(f"Retrying download of '{job.title}' (attempt {job.attempts + 1} of {self.max_attempts})...")
+            telemetry.count('retries_total', operation='download_job')
+
+    def _make_hook(self, job):
+        """Builds the progress hook used for one job's transfers."""
+        def hook(d):
+            # Only yt-dlp's own transfer ticks may raise: download_media also reports its
+            # final 'finished'/'error' status through this hook from outside yt-dlp.
+            if d.get('status') == 'downloading':
+                if not job._resume_event.is_set():
+                    job._resume_event.wait() # Paused: stall the transfer until resumed or cancelled
+                if job._cancel_event.is_set():
+                    raise yt_dlp.utils.DownloadCancelled(f"Job {job.job_id} cancelled")
+            if job._cancel_event.is_set():
+                return # The manager reports the cancellation itself
+            if d.get('status') == 'error':
+                job.error = d.get('message', 'Unknown download error')
+            self._notify(job, d)
+        return hook
+
+    def _finish(self, job, status):
+        with self._lock:
+            if not self._set_final_locked(job, status):
+                return
+        self._report_final(job)
+
+    def _set_final_locked(self, job, status):
+        """Moves a job to a final state. Returns False if it already was in one."""
+        if job.status in FINAL_STATES:
+            return False
+        job.status = status
+        job.finished_at = time.time()
+        job._in_worker = False
+        if status == FAILED and not job.error:
+            job.error = 'Download failed.'
+        return True
+
+    def _report_final(self, job):
+        job._done_event.set()
+        status = job.status
+        if status == CANCELLED:
+            self._notify(job, {'status': 'cancelled', 'message': 'Download cancelled.'})
+        elif status == FAILED:
+            self._notify(job, {'status': 'failed', 'message': job.error})
+        elif status == COMPLETED:
+            self._notify(job, {'status': 'completed', 'message': 'Download complete!', 'filename': job.filepath})
+
+    def _notify(self, job, d):
+        job.progress = d
+        if self.progress_callback:
+            try:
+                self.progress_callback(job, d)
+            except Exception as e:
+                print(f"Error in download progress callback: {e}")
@@ -0,0 +1,440 @@
+# extractor.py
+
+import hashlib
+import json
+import os
+import random
+import sys
+import threading
+import time
+import urllib.request
+from contextlib import closing
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs, quote
+
+from lazy_import import LazyModule
+
+yt_dlp = LazyModule('yt_dlp')
+
+from ydl_pool import get_ydl_pool
+
+MAX_PLAYLIST_NESTING = 2 # Channel -> tab -> videos
+
+class Extractor:
+    """
+    What search, playback and downloads need from a video site.
+
+    Info dictionaries and progress dictionaries use yt_dlp's shapes, so the rest
+    of the code does not care which backend produced them. Backends raise
+    yt_dlp.utils.DownloadError when extraction fails, and let exceptions raised
+    by a progress callback (e.g. DownloadCancelled) propagate.
+    """
+
+    name = 'abstract'
+
+    def iter_search(self, query, limit, ydl_opts):
+        """Yields flat search entries ('id', 'title', ...) lazily, page by page."""
+        raise NotImplementedError
+
+    def search(self, query, max_results, ydl_opts):
+        """Returns up to `max_results` flat search entries."""
+        # Closing the generator returns a pooled YoutubeDL it may hold right away, not at garbage collection
+        with closing(self.iter_search(query, max_results, ydl_opts)) as entries:
+            return [entry for entry, _ in zip(entries, range(max_results))]
+
+    def iter_playlist(self, playlist_url, ydl_opts):
+        """
+        Yields the flat video entries ('id', 'title', 'url', ...) of a playlist or
+        channel lazily, page by page, each with 'playlist_id' and 'playlist_title' added.
+        """
+        raise NotImplementedError
+
+    def extract_info(self, video_url, ydl_opts):
+        """Returns the info dictionary of a video (with the selected format(s)) without downloading."""
+        raise NotImplementedError
+
+    def prepare_filename(self, info, ydl_opts):
+        """Returns the path the output template in `ydl_opts` gives for `info`."""
+        raise NotImplementedError
+
+    def download(self, video_url, ydl_opts, progress_callback=None):
+        """
+        Downloads (and post-processes) a video.
+
+        Returns:
+            tuple: (path of the finished file, info dictionary).
+        """
+        raise NotImplementedError
+
+class YtDlpExtractor(Extractor):
+    """The real backend: yt_dlp through the shared YoutubeDL pool."""
+
+    name = 'yt-dlp'
+
+    def iter_search(self, query, limit, ydl_opts):
+        # With process=False the entries are a lazy generator that fetches
+        # the next results page only when the previous one is used up
+        with get_ydl_pool().checkout(ydl_opts) as ydl:
+            info = ydl.extract_info(f"ytsearch{limit}:{query}", download=False, process=False)
+            for entry in info.get('entries') or []:
+                if entry: # Ensure entry is not None
+                    yield entry
+
+    def search(self, query, max_results, ydl_opts):
+        with get_ydl_pool().checkout(ydl_opts) as ydl:
+            info = ydl.extract_info(f"ytsearch{max_results}:{query}", download=False)
+        return [entry for entry in info.get('entries') or [] if entry]
+
+    def iter_playlist(self, playlist_url, ydl_opts):
+        # As in iter_search, process=False leaves the entries as a lazy generator
+        # that requests the next page of the playlist only when it is reached
+        with get_ydl_pool().checkout(ydl_opts) as ydl:
+            yield from self._flat_entries(ydl, playlist_url, 0)
+
+    def _flat_entries(self, ydl, url, depth):
+        info = ydl.extract_info(url, download=False, process=False)
+        if info.get('_type') == 'url' and depth < MAX_PLAYLIST_NESTING:
+            yield from self._flat_entries(ydl, info['url'], depth + 1) # Redirect, e.g. a channel to its videos
+            return
+        if info.get('entries') is None:
+            yield info # A single video
+            return
+        playlist = {'playlist_id': info.get('id'), 'playlist_title': info.get('title')}
+        for entry in info['entries']:
+            if not entry:
+                continue
+            nested = entry.get('_type') == 'playlist' or entry.get('ie_key') == 'YoutubeTab'
+            if nested and depth < MAX_PLAYLIST_NESTING:
+                # A channel lists its tabs (videos, shorts, live) as playlists of their own
+                yield from self._flat_entries(ydl, entry.get('url') or entry.get('webpage_url'), depth + 1)
+            elif not nested:
+                yield dict(entry, **playlist)
+
+    def extract_info(self, video_url, ydl_opts):
+        with get_ydl_pool().checkout(ydl_opts) as ydl:
+            return ydl.extract_info(video_url, download=False)
+
+    def prepare_filename(self, info, ydl_opts):
+        with get_ydl_pool().checkout(ydl_opts) as ydl:
+            return ydl.prepare_filename(info)
+
+    def download(self, video_url, ydl_opts, progress_callback=None):
+        # The progress callback is handed to the pool rather than put in ydl_opts,
+        # so every download with the same options can share one YoutubeDL instance.
+        with get_ydl_pool().checkout(ydl_opts, progress_callback=progress_callback) as ydl:
+            info = ydl.extract_info(video_url, download=True)
+            downloads = info.get('requested_downloads') or []
+            if downloads and downloads[-1].get('filepath'):
+                return downloads[-1]['filepath'], info
+            return info.get('filepath') or ydl.prepare_filename(info), info
+
+# --- Offline fake -------------------------------------------------------------
+
+_WORDS = ("love", "night", "dream", "fire", "heart", "summer", "blue", "river", "gold", "rain", "city",
+          "dance", "light", "storm", "echo", "shadow", "wild", "ocean", "star", "home")
+_ID_CHARS = "ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz0123456789-_"
+
+def fake_video_id(query, index):
+    """Deterministic 11-character video id for the `index`-th result of `query`."""
+    digest = hashlib.sha256(f"{query}\0{index}".encode('utf-8')).digest()
+    return ''.join(_ID_CHARS[b % 64] for b in digest[:11])
+
+def fake_title(video_id):
+    rng = random.Random(video_id)
+    return ' '.join(rng.choice(_WORDS) for _ in range(rng.randint(2, 5))).title()
+
+def _fake_bytes(video_id, start, length):
+    """Deterministic media content: a 4 KiB block derived from the id, repeated."""
+    block = hashlib.sha256(video_id.encode('utf-8')).digest() * 128
+    offset = start % len(block)
+    data = (block[offset:] + block * (length // len(block) + 2))[:length]
+    return data
+
+class FakeMediaServer(ThreadingHTTPServer):
+    """
+    Local HTTP server that plays the part of the video site for offline runs.
+
+    It serves synthetic search pages (/search), playlist pages (/playlist/<id>),
+    video info (/info/<id>) and media bytes with Range support (/media/<id>.<ext>). Every request waits `latency`
+    seconds and fails with HTTP 503 with probability `error_rate`. Media bodies
+    are throttled to `bandwidth` bytes per second per connection. Everything is
+    derived from the query and video id, so runs are reproducible.
+    """
+
+    daemon_threads = True
+    request_queue_size = 128
+
+    def __init__(self, host='127.0.0.1', port=0, latency=0.0, bandwidth=None, error_rate=0.0, media_size=1024 * 1024,
+                 seed=0, playlist_size=200):
+        """
+        Args:
+            latency (float): Seconds added to every request.
+            bandwidth (float, optional): Media bytes per second per connection (unlimited if None).
+            error_rate (float): Probability (0..1) that a request fails with 503.
+            media_size (int): Size in bytes of every media file.
+            seed (int): Seed of the error injection.
+            playlist_size (int): Number of videos in every playlist; raise it to simulate new uploads.
+        """
+        super().__init__((host, port), _FakeMediaHandler)
+        self.latency = latency
+        self.bandwidth = bandwidth
+        self.error_rate = error_rate
+        self.media_size = media_size
+        self.playlist_size = playlist_size
+        self.requests = 0
+        self.errors = 0
+        self.bytes_sent = 0
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+        self._thread = None
+
+    @property
+    def base_url(self):
+        return f"http://{self.server_address[0]}:{self.server_address[1]}"
+
+    def start(self):
+        """Serves on a background thread. Returns self."""
+        self._thread = threading.Thread(target=self.serve_forever, name="fake-media-server", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+    def _should_fail(self):
+        with self._lock:
+            self.requests += 1
+            fail = self._rng.random() < self.error_rate
+            if fail:
+                self.errors += 1
+            return fail
+
+    def stats(self):
+        with self._lock:
+            return {'requests': self.requests, 'errors': self.errors, 'bytes_sent': self.bytes_sent}
+
+    def handle_error(self, request, client_address):
+        # Clients hanging up mid-body (cancelled or aborted downloads) are expected
+        if not isinstance(sys.exc_info()[1], ConnectionError):
+            super().handle_error(request, client_address)
+
+class _FakeMediaHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send_json(self, body):
+        payload = json.dumps(body).encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def do_GET(self):
+        server = self.server
+        if server.latency:
+            time.sleep(server.latency)
+        if server._should_fail():
+            self.send_response(503)
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+            return
+        parsed = urlparse(self.path)
+        parts = [p for p in parsed.path.split('/') if p]
+        params = {k: v[0] for k, v in parse_qs(parsed.query).items()}
+        if parts == ['search']:
+            query, offset, count = params.get('q', ''), int(params.get('offset', 0)), int(params.get('n', 20))
+            ids = [fake_video_id(query, i) for i in range(offset, offset + count)]
+            return self._send_json({'entries': [{'id': i, 'title': fake_title(i), 'duration': 180 + sum(map(ord, i)) % 240}
+                                                for i in ids]})
+        if len(parts) == 2 and parts[0] == 'playlist':
+            playlist_id, offset, count = parts[1], int(params.get('offset', 0)), int(params.get('n', 100))
+            ids = [fake_video_id(playlist_id, i) for i in range(offset, min(offset + count, server.playlist_size))]
+            return self._send_json({'id': playlist_id, 'title': f"Playlist {fake_title(playlist_id)}",
+                                    'entries': [{'id': i, 'title': fake_title(i)} for i in ids]})
+        if len(parts) == 2 and parts[0] == 'info':
+            video_id = parts[1]
+            return self._send_json({'id': video_id, 'title': fake_title(video_id),
+                                    'duration': 180 + sum(map(ord, video_id)) % 240})
+        if len(parts) == 2 and parts[0] == 'media':
+            return self._send_media(os.path.splitext(parts[1])[0])
+        self.send_response(404)
+        self.send_header('Content-Length', '0')
+        self.end_headers()
+
+    def _send_media(self, video_id):
+        size = self.server.media_size
+        start, end = 0, size - 1
+        header = self.headers.get('Range')
+        if header and header.startswith('bytes='):
+            first, _, last = header[6:].partition('-')
+            start = int(first or 0)
+            end = min(int(last), size - 1) if last else size - 1
+            self.send_response(206)
+            self.send_header('Content-Range', f"bytes {start}-{end}/{size}")
+        else:
+            self.send_response(200)
+        self.send_header('Accept-Ranges', 'bytes')
+        self.send_header('Content-Type', 'application/octet-stream')
+        self.send_header('Content-Length', str(end - start + 1))
+        self.end_headers()
+        position = start
+        block = 64 * 1024
+        started = time.monotonic()
+        try:
+            while position <= end:
+                length = min(block, end - position + 1)
+                self.wfile.write(_fake_bytes(video_id, position, length))
+                position += length
+                with self.server._lock:
+                    self.server.bytes_sent += length
+                if self.server.bandwidth:
+                    ahead = (position - start) / self.server.bandwidth - (time.monotonic() - started)
+                    if ahead > 0:
+                        time.sleep(ahead)
+        except (BrokenPipeError, ConnectionResetError):
+            pass
+
+class FakeExtractor(Extractor):
+    """
+    Offline backend that talks to a FakeMediaServer instead of YouTube.
+
+    Search results, info dictionaries and media all come from the local server,
+    so its latency, bandwidth and error settings shape every operation. Videos
+    have a single plain-HTTP audio format, so downloads also work through
+    chunked_download. Post-processing is not run. The file keeps the name the
+    post-processor would give it, so downloads can be timed without FFmpeg.
+    """
+
+    name = 'fake'
+    PAGE_SIZE = 20
+    PLAYLIST_PAGE_SIZE = 100 # YouTube pages playlists 100 entries at a time
+
+    def __init__(self, server=None, **server_options):
+        """
+        Args:
+            server (FakeMediaServer, optional): Server to use; one is started with `server_options` if omitted.
+        """
+        self.server = server or FakeMediaServer(**server_options).start()
+
+    def _get(self, path):
+        try:
+            with urllib.request.urlopen(self.server.base_url + path, timeout=30) as response:
+                return json.load(response)
+        except OSError as e:
+            raise yt_dlp.utils.DownloadError(f"Fake extractor request failed: {e}")
+
+    def iter_search(self, query, limit, ydl_opts):
+        offset = 0
+        while offset < limit:
+            count = min(self.PAGE_SIZE, limit - offset)
+            entries = self._get(f"/search?q={quote(query)}&offset={offset}&n={count}")['entries']
+            for entry in entries:
+                entry['url'] = f"https://www.youtube.com/watch?v={entry['id']}"
+                yield entry
+            offset += count
+
+    def iter_playlist(self, playlist_url, ydl_opts):
+        parsed = urlparse(playlist_url)
+        playlist_id = parse_qs(parsed.query).get('list', [None])[0] or parsed.path.rstrip('/').rsplit('/', 1)[-1]
+        offset = 0
+        while True:
+            page = self._get(f"/playlist/{quote(playlist_id)}?offset={offset}&n={self.PLAYLIST_PAGE_SIZE}")
+            for entry in page['entries']:
+                entry.update({'url': f"https://www.youtube.com/watch?v={entry['id']}",
+                              'playlist_id': page['id'], 'playlist_title': page['title']})
+                yield entry
+            if len(page['entries']) < self.PLAYLIST_PAGE_SIZE:
+                return
+            offset += self.PLAYLIST_PAGE_SIZE
+
+    def extract_info(self, video_url, ydl_opts):
+        from youtube_search import extract_video_id
+        video_id = extract_video_id(video_url)
+        if not video_id:
+            raise yt_dlp.utils.DownloadError(f"Fake extractor: not a video URL: {video_url}")
+        info = self._get(f"/info/{video_id}")
+        info.update({
+            'ext': 'webm',
+            'format_id': '251',
+            'protocol': 'http',
+            'acodec': 'opus',
+            'url': f"{self.server.base_url}/media/{video_id}.webm",
+            'filesize': self.server.media_size,
+            'http_headers': {},
+            'webpage_url': f"https://www.youtube.com/watch?v={video_id}",
+        })
+        return info
+
+    def prepare_filename(self, info, ydl_opts):
+        template = ydl_opts.get('outtmpl', '%(title)s [%(id)s].%(ext)s')
+        if isinstance(template, dict):
+            template = template.get('default')
+        return template % {'title': info['title'], 'id': info['id'], 'ext': info['ext']}
+
+    def download(self, video_url, ydl_opts, progress_callback=None):
+        info = self.extract_info(video_url, ydl_opts)
+        path = self.prepare_filename(info, ydl_opts)
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        size = info['filesize']
+        started = time.monotonic()
+        downloaded = 0
+        try:
+            with urllib.request.urlopen(info['url'], timeout=30) as response, open(path + ".part", "wb") as f:
+                while True:
+                    data = response.read(256 * 1024)
+                    if not data:
+                        break
+                    f.write(data)
+                    downloaded += len(data)
+                    if progress_callback:
+                        elapsed = time.monotonic() - started
+                        speed = downloaded / elapsed if elapsed > 0 else None
+                        progress_callback({'status': 'downloading', 'downloaded_bytes': downloaded,
+                                           'total_bytes': size, 'elapsed': elapsed, 'speed': speed,
+                                           'eta': (size - downloaded) / speed if speed else None,
+                                           'filename': path})
+        except OSError as e:
+            raise yt_dlp.utils.DownloadError(f"Fake extractor download failed: {e}")
+        os.replace(path + ".part", path)
+        if progress_callback:
+            progress_callback({'status': 'finished', 'downloaded_bytes': downloaded, 'total_bytes': size,
+                               'filename': path})
+        for postprocessor in ydl_opts.get('postprocessors') or []:
+            target = postprocessor.get('preferredcodec') or postprocessor.get('preferedformat')
+            if target:
+                renamed = os.path.splitext(path)[0] + f".{target}"
+                os.replace(path, renamed)
+                path = renamed
+        info['filepath'] = path
+        return path, info
+
+_extractor = None
+_extractor_lock = threading.Lock()
+
+def get_extractor():
+    """
+    Returns:
+        Extractor: The process-wide backend; yt_dlp unless PD_MUSIC_EXTRACTOR=fake
+                   or set_extractor() chose another.
+    """
+    global _extractor
+    with _extractor_lock:
+        if _extractor is None:
+            _extractor = FakeExtractor() if os.environ.get('PD_MUSIC_EXTRACTOR') == 'fake' else YtDlpExtractor()
+        return _extractor
+
+def set_extractor(extractor):
+    """
+    Replaces the process-wide backend (e.g. with a FakeExtractor for benchmarks).
+
+    Returns:
+        Extractor: The previous backend (None if none had been created yet).
+    """
+    global _extractor
+    with _extractor_lock:
+        previous, _extractor = _extractor, extractor
+        return previous
@@ -3,13 +3,26 @@
 import tkinter as tk
 from tkinter import messagebox, scrolledtext
 import threading
+import asyncio
 import os
 import sys
-import subprocess # Added for dependency check
 
 # Assume youtube_search.py and music_player.py are in the same directory
-from youtube_search import search_youtube_music
-from music_player import play_music, download_media
+from async_api import get_async_api, EventLoopThread
+from music_player import play_music, get_stream_cache
+from download_manager import DownloadManager
+from prefetch import StreamPrefetcher
+from mpv_controller import MpvController, MpvError
+from media_library import get_media_library
+from youtube_search import SearchSession
+from progress import ProgressAggregator
+from virtual_list import ResultStore, VirtualListView
+from dependency_probe import DependencyProbe, missing_dependency_messages
+from bandwidth import get_bandwidth_scheduler
+from playlist_import import PlaylistImport, PlaylistSession, is_playlist_url
+from incremental_search import IncrementalSearch
+
+PROGRESS_FPS = 10 # Download table redraws per second, however fast progress ticks arrive
 
 class MusicAppGUI:
     def __init__(self, master):
@@ -18,11 +31,28 @@ class MusicAppGUI:
         master.geometry("800x600") # Set a default window size
         master.resizable(True, True) # Allow resizing
 
-        self.current_results = []
+        self.current_results = ResultStore() # Compact store behind the virtualized results list
+        self.local_results = [] # Library hits for the current query, shown before online results
+        self.library = get_media_library()
+        # Bring the index up to date with the downloads folder without blocking start-up
+        threading.Thread(target=self.library.scan, args=("downloads",), daemon=True).start()
         self.playing_thread = None
-        self.downloading_thread = None
-        self.download_progress_var = tk.StringVar() # To display download progress
-        self.mpv_process = None # To store the MPV subprocess
+        self.api = get_async_api() # Search/resolve run as tasks on one background event loop
+        self.async_runner = EventLoopThread()
+        self.search_future = None # Future of the in-flight search page, if any
+        self.search_session = None # Paginated online search for the current query
+        # Decides when typed text becomes a live search (debounced, budgeted, cache-aware)
+        self.incremental = IncrementalSearch(self._start_search, master.after, master.after_cancel)
+        self._typed_text = "" # Search box text at the last key release
+        self.playlist_import = None # Running PlaylistImport, if any
+        self.download_manager = DownloadManager(max_workers=3, progress_callback=self._download_progress_hook)
+        self.prefetcher = StreamPrefetcher(get_stream_cache(), top_k=5) # Pre-resolves the top results
+        self.download_progress_var = tk.StringVar() # Summary line above the download table
+        self.progress = ProgressAggregator() # Coalesces progress ticks from the download workers
+        self.mpv_process = None # To store the MPV subprocess (fallback playback path)
+        self.player = None # Long-lived MpvController, started on first play
+        self.player_unavailable = not MpvController.is_supported()
+        self.player_active = False # True while the controller has something loaded
 
         # --- Styling ---
         self.master.tk_setPalette(background='#e0f7fa', foreground='#004d40',
@@ -45,30 +75,47 @@ class MusicAppGUI:
         self.search_entry = tk.Entry(self.search_frame, width=50, font=self.font_medium, bg=self.entry_bg, fg='#212121', relief=tk.FLAT)
         self.search_entry.pack(side=tk.LEFT, expand=True, fill=tk.X)
         self.search_entry.bind("<Return>", self.perform_search_event) # Bind Enter key
+        self.search_entry.bind("<KeyRelease>", self._on_search_typed) # Search as you type
 
         self.search_button = tk.Button(self.search_frame, text="Search", command=self.perform_search,
                                        font=self.font_medium, bg=self.button_bg, fg=self.button_fg,
                                        activebackground='#004d40', activeforeground='white', relief=tk.RAISED, bd=2)
         self.search_button.pack(side=tk.LEFT, padx=(10, 0))
 
+        self.load_more_button = tk.Button(self.search_frame, text="Load More", command=self.load_more_results,
+                                          font=self.font_medium, bg=self.button_bg, fg=self.button_fg,
+                                          activebackground='#004d40', activeforeground='white', relief=tk.RAISED, bd=2)
+        self.load_more_button.pack(side=tk.LEFT, padx=(10, 0))
+        self.load_more_button.config(state=tk.DISABLED) # Enabled once a search has more pages
+
+        self.download_playlist_button = tk.Button(self.search_frame, text="Download Playlist", command=self.download_playlist,
+                                                  font=self.font_medium, bg=self.button_bg, fg=self.button_fg,
+                                                  activebackground='#004d40', activeforeground='white', relief=tk.RAISED, bd=2)
+        self.download_playlist_button.pack(side=tk.LEFT, padx=(10, 0))
+        self.download_playlist_button.config(state=tk.DISABLED) # Enabled while a playlist or channel is listed
+
         # --- Results Frame ---
         self.results_frame = tk.Frame(master, padx=10, pady=5, bg='#e0f7fa')
         self.results_frame.pack(fill=tk.BOTH, expand=True)
 
-        self.results_label = tk.Label(self.results_frame, text="Search Results:", font=self.font_large, bg='#e0f7fa', fg='#004d40')
-        self.results_label.pack(anchor=tk.NW, pady=(0, 5))
+        self.results_header = tk.Frame(self.results_frame, bg='#e0f7fa')
+        self.results_header.pack(fill=tk.X, pady=(0, 5))
 
-        self.listbox_frame = tk.Frame(self.results_frame)
-        self.listbox_frame.pack(fill=tk.BOTH, expand=True)
+        self.results_label = tk.Label(self.results_header, text="Search Results:", font=self.font_large, bg='#e0f7fa', fg='#004d40')
+        self.results_label.pack(side=tk.LEFT)
 
-        self.results_listbox = tk.Listbox(self.listbox_frame, font=self.font_medium, bg=self.listbox_bg, fg=self.listbox_fg,
-                                          selectbackground='#b2ebf2', selectforeground='#004d40', relief=tk.FLAT, bd=2,
-                                          exportselection=False) # Important for single selection
-        self.results_listbox.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
+        # Narrows the shown results as the user types, without searching again
+        self.filter_entry = tk.Entry(self.results_header, width=30, font=self.font_medium, bg=self.entry_bg, fg='#212121', relief=tk.FLAT)
+        self.filter_entry.pack(side=tk.RIGHT)
+        self.filter_entry.bind("<KeyRelease>", lambda e: self._apply_filter())
+        self.filter_label = tk.Label(self.results_header, text="Filter:", font=self.font_medium, bg='#e0f7fa', fg='#004d40')
+        self.filter_label.pack(side=tk.RIGHT, padx=(0, 5))
 
-        self.scrollbar = tk.Scrollbar(self.listbox_frame, orient="vertical", command=self.results_listbox.yview)
-        self.scrollbar.pack(side=tk.RIGHT, fill=tk.Y)
-        self.results_listbox.config(yscrollcommand=self.scrollbar.set)
+        # Only the rows on screen are drawn, so thousands of results scroll as fast as twenty
+        self.results_listbox = VirtualListView(self.results_frame, font=self.font_medium, bg=self.listbox_bg, fg=self.listbox_fg,
+                                               select_bg='#b2ebf2', select_fg='#004d40',
+                                               on_activate=lambda index: self.play_selected())
+        self.results_listbox.pack(fill=tk.BOTH, expand=True)
 
         # --- Control Buttons Frame ---
         self.control_frame = tk.Frame(master, padx=10, pady=10, bg='#e0f7fa')
@@ -99,74 +146,201 @@ class MusicAppGUI:
                                          activebackground='#004d40', activeforeground='white', relief=tk.RAISED, bd=2)
         self.download_mp4_button.pack(side=tk.LEFT, expand=True, padx=5)
 
+        # Cancel Downloads button
+        self.cancel_downloads_button = tk.Button(self.control_frame, text="Cancel Downloads", command=self.cancel_downloads,
+                                                 font=self.font_medium, bg='#ff5722', fg='white',
+                                                 activebackground='#bf360c', activeforeground='white', relief=tk.RAISED, bd=2)
+        self.cancel_downloads_button.pack(side=tk.LEFT, expand=True, padx=5)
 
         self.clear_button = tk.Button(self.control_frame, text="Clear Results", command=self.clear_results,
                                       font=self.font_medium, bg='#d32f2f', fg='white',
                                       activebackground='#b71c1c', activeforeground='white', relief=tk.RAISED, bd=2)
         self.clear_button.pack(side=tk.LEFT, expand=True, padx=5)
 
+        # --- Player Queue Frame ---
+        self.player_frame = tk.Frame(master, padx=10, pady=0, bg='#e0f7fa')
+        self.player_frame.pack(fill=tk.X)
+
+        self.player_buttons = []
+        for text, command in (("Add to Queue", self.enqueue_selected),
+                              ("Previous", lambda: self._player_command('previous')),
+                              ("Next", lambda: self._player_command('next')),
+                              ("Pause/Resume", lambda: self._player_command('toggle_pause')),
+                              ("Seek -10s", lambda: self._player_command('seek', -10)),
+                              ("Seek +10s", lambda: self._player_command('seek', 10)),
+                              ("Volume -", lambda: self._change_volume(-10)),
+                              ("Volume +", lambda: self._change_volume(10))):
+            button = tk.Button(self.player_frame, text=text, command=command,
+                               font=self.font_medium, bg=self.button_bg, fg=self.button_fg,
+                               activebackground='#004d40', activeforeground='white', relief=tk.RAISED, bd=2)
+            button.pack(side=tk.LEFT, expand=True, padx=5)
+            self.player_buttons.append(button)
+
         # --- Status Bar ---
         self.status_label = tk.Label(master, text="Ready", bd=1, relief=tk.SUNKEN, anchor=tk.W, font=("Inter", 9), bg='#e0f7fa', fg='#004d40')
         self.status_label.pack(side=tk.BOTTOM, fill=tk.X)
 
-        # --- Download Progress Label (new) ---
+        # --- Download Progress Table ---
+        self.download_table = tk.Listbox(master, height=4, font=("Courier", 9), bg=self.listbox_bg, fg=self.listbox_fg,
+                                         relief=tk.FLAT, bd=1, activestyle='none', exportselection=False)
+        self.download_table.pack(side=tk.BOTTOM, fill=tk.X, padx=10)
         self.download_progress_label = tk.Label(master, textvariable=self.download_progress_var, bd=1, relief=tk.FLAT, anchor=tk.W, font=("Inter", 9), bg='#e0f7fa', fg='#004d40')
         self.download_progress_label.pack(side=tk.BOTTOM, fill=tk.X)
         self.download_progress_var.set("") # Initialize with empty text
+        self.master.after(1000 // PROGRESS_FPS, self._render_progress)
 
         # Initial instructions
-        self.update_status("Enter a search query and press Search or Enter.")
+        self.update_status("Type to search, or enter a query and press Search or Enter.")
 
     def update_status(self, message):
         """Updates the status bar with a given message."""
-        self.status_label.config(text=message)
-        self.master.update_idletasks() # Ensure the message is displayed immediately
+        self.status_label.config(text=message) # Drawn by the main loop; work no longer blocks it
 
     def perform_search_event(self, event):
         """Event handler for Enter key press in search entry."""
         self.perform_search()
 
     def perform_search(self):
-        """Performs a YouTube music search and displays results."""
+        """Performs a YouTube music search right away and displays results."""
         query = self.search_entry.get().strip()
         if not query:
             messagebox.showwarning("Input Error", "Please enter a search query.")
             return
+        self._typed_text = self.search_entry.get()
+        self.incremental.submit(query)
+
+    def _on_search_typed(self, event):
+        """Key release in the search box: refines cached results now, searches once typing pauses."""
+        text = self.search_entry.get()
+        if text == self._typed_text:
+            return # Enter, cursor keys, modifiers
+        self._typed_text = text
+        provisional = self.incremental.text_changed(text)
+        if provisional is not None:
+            self._supersede_search()
+            self.prefetcher.cancel()
+            self.local_results = []
+            self.current_results = ResultStore(provisional)
+            self.results_listbox.set_placeholder(None)
+            self.results_listbox.set_store(self.current_results, self.current_results.filter(self.filter_entry.get()))
+            self._set_buttons_state(tk.NORMAL) # Provisional results can be played right away
+            self.update_status(f"{len(provisional)} earlier results match '{text.strip()}'. "
+                               f"Searching when you pause typing...")
+
+    def _start_search(self, query, ticket, explicit):
+        """
+        Starts the online search for a query (called by IncrementalSearch).
 
+        `ticket` is passed back to IncrementalSearch.finished() once the page's worker has
+        returned; it is None for a query answered by the search cache. Only explicit
+        searches (Enter, the Search button) disable the buttons while they run.
+        """
         self.update_status(f"Searching for '{query}'...")
-        self._set_buttons_state(tk.DISABLED) # Disable all action buttons during search
-        self.download_progress_var.set("") # Clear any previous download progress
+        self.prefetcher.cancel() # Results of the previous search are no longer worth resolving
+        if explicit:
+            self._set_buttons_state(tk.DISABLED) # Disable all action buttons during search
+
+        # Local library hits are shown immediately and can be played offline
+        self.local_results = self.library.search(query, limit=20)
+        self._display_results(self.local_results, empty_message=None)
+        if self.local_results:
+            self.update_status(f"Found {len(self.local_results)} downloaded tracks. Searching online for '{query}'...")
+
+        self._supersede_search() # A newer query supersedes the previous one
+        if is_playlist_url(query):
+            # Playlists and channels are listed with flat extraction, 100 entries per page
+            self.search_session = PlaylistSession(query, page_size=100)
+        else:
+            self.search_session = SearchSession(query, page_size=20) # 20 results per page as requested
+        self._load_page(ticket)
 
-        # Run search in a separate thread to keep GUI responsive
-        threading.Thread(target=self._search_thread, args=(query,)).start()
+    def _supersede_search(self):
+        """
+        Abandons the current online search; its remaining results are discarded.
 
-    def _search_thread(self, query):
-        """Threaded function to perform the search."""
+        The session is closed rather than its task cancelled: a closed session stops
+        after the result in progress, which is what frees the worker (and the
+        IncrementalSearch slot). close() waits for that, so it runs on the event loop's
+        executor instead of the Tk thread.
+        """
+        session, self.search_session, self.search_future = self.search_session, None, None
+        if session is not None:
+            self.async_runner.submit(asyncio.to_thread(session.close))
+
+    def load_more_results(self):
+        """Fetches the next page of online results for the current query."""
+        if self.search_session is None or self.search_session.exhausted or self.search_future is not None:
+            return
+        self.load_more_button.config(state=tk.DISABLED)
+        self.update_status(f"Loading more results for '{self.search_session.query}'...")
+        self._load_page()
+
+    def _load_page(self, ticket=None):
+        """Runs the next search page on the event loop; results are appended as they arrive."""
+        session = self.search_session
+        on_result = lambda result: self.master.after(0, self._append_result, session, result)
+        on_finished = (lambda: self.master.after(0, self.incremental.finished, ticket)) if ticket else None
+        future = self.async_runner.submit(self.api.search_page(session, on_result=on_result,
+                                                               on_finished=on_finished))
+        self.search_future = future
+        future.add_done_callback(lambda f: self.master.after(0, self._on_page_done, session, f))
+
+    def _append_result(self, session, result):
+        """Adds one streamed search result to the listbox (main thread)."""
+        if session is not self.search_session:
+            return # Result of a superseded search
+        if result['id'] in {r['id'] for r in self.local_results if r['id']}:
+            return # Already listed as a downloaded track
+        self.current_results.append(result)
+        if self.filter_entry.get().strip():
+            self._apply_filter()
+        else:
+            self.results_listbox.rows_appended()
+        if len(session.results) == 0 and self.play_button['state'] == tk.DISABLED:
+            self._set_buttons_state(tk.NORMAL) # The first result can be used while the rest arrive
+
+    def _on_page_done(self, session, future):
+        """Finishes a search page on the main thread, ignoring superseded ones."""
+        if session is not self.search_session:
+            return
+        self.search_future = None
         try:
-            # Set max_results to 20 as requested
-            results = search_youtube_music(query, max_results=20)
-            self.master.after(0, self._display_results, results) # Update GUI on main thread
+            page = future.result()
         except Exception as e:
-            self.master.after(0, lambda: messagebox.showerror("Search Error", f"An error occurred during search: {e}"))
-            self.master.after(0, lambda: self.update_status("Search failed."))
+            messagebox.showerror("Search Error", f"An error occurred during search: {e}")
+            self.update_status("Search failed.")
+        else:
+            if not self.current_results:
+                self._display_results([])
+            else:
+                if len(session.results) == len(page):
+                    self.prefetcher.prefetch(self.current_results) # First page: warm the top results
+                more = "" if session.exhausted else " Press Load More for more."
+                self.update_status(f"Found {len(self.current_results)} results. Select a song to play or download.{more}")
         finally:
-            self.master.after(0, lambda: self._set_buttons_state(tk.NORMAL)) # Re-enable buttons
-
+            self._set_buttons_state(tk.NORMAL) # Re-enable buttons
 
-    def _display_results(self, results):
+    def _display_results(self, results, empty_message="No results found."):
         """Displays search results in the listbox."""
-        self.results_listbox.delete(0, tk.END) # Clear previous results
-        self.current_results = results
+        self.current_results = ResultStore(results)
+        self.results_listbox.set_placeholder(empty_message)
+        self.results_listbox.set_store(self.current_results, self.current_results.filter(self.filter_entry.get()))
 
         if not results:
-            self.results_listbox.insert(tk.END, "No results found.")
-            self.update_status("No results found.")
+            if empty_message:
+                self.update_status(empty_message)
             return
 
-        for i, result in enumerate(results):
-            self.results_listbox.insert(tk.END, f"{i+1}. {result['title']}")
+        self.prefetcher.prefetch(results)
         self.update_status(f"Found {len(results)} results. Select a song to play or download.")
 
+    def _apply_filter(self):
+        """Shows only the results whose title contains every word typed in the filter box."""
+        rows = self.current_results.filter(self.filter_entry.get())
+        self.results_listbox.set_rows(rows)
+        if self.filter_entry.get().strip():
+            self.update_status(f"Showing {len(rows)} of {len(self.current_results)} results.")
+
     def get_selected_song(self):
         """Helper to get the selected song's data."""
         selected_indices = self.results_listbox.curselection()
@@ -183,36 +357,155 @@ class MusicAppGUI:
         self.download_mp3_button.config(state=state)
         self.download_mp4_button.config(state=state)
         self.clear_button.config(state=state)
+        more = self.search_session is not None and not self.search_session.exhausted and self.search_future is None
+        self.load_more_button.config(state=tk.NORMAL if state == tk.NORMAL and more else tk.DISABLED)
+        playlist = isinstance(self.search_session, PlaylistSession) and self.playlist_import is None
+        self.download_playlist_button.config(state=tk.NORMAL if state == tk.NORMAL and playlist else tk.DISABLED)
         # Manage stop button state separately
         if state == tk.DISABLED:
             self.stop_button.config(state=tk.DISABLED)
         else:
-            # Only enable stop button if a playing thread is active
-            if self.playing_thread and self.playing_thread.is_alive():
+            # Only enable stop button if something is playing
+            if self.player_active or (self.playing_thread and self.playing_thread.is_alive()):
                 self.stop_button.config(state=tk.NORMAL)
             else:
                 self.stop_button.config(state=tk.DISABLED)
 
 
     def play_selected(self):
-        """Plays the selected song (audio only)."""
+        """Plays the selected song (audio only), replacing whatever is playing."""
         selected_song = self.get_selected_song()
         if not selected_song:
             return
 
+        if not selected_song.get('local'):
+            self.prefetcher.record_play(selected_song['url'])
+
+        if not self.player_unavailable:
+            # Hand the track to the persistent mpv; no process start-up per track
+            self.update_status(f"Loading: {selected_song['title']}...")
+            self.async_runner.submit(self._queue_track(selected_song, False))
+            return
+
         if self.playing_thread and self.playing_thread.is_alive():
             messagebox.showinfo("Playback Info", "A song is already playing. Please wait or stop the current playback manually (e.g., by closing mpv window).")
             return
 
         self.update_status(f"Playing audio: {selected_song['title']}...")
         self._set_buttons_state(tk.DISABLED) # Disable all action buttons during playback
-        self.download_progress_var.set("") # Clear any previous download progress
         self.stop_button.config(state=tk.NORMAL) # Enable stop button
 
         # Play in a separate thread
-        self.playing_thread = threading.Thread(target=self._play_thread, args=(selected_song['url'],))
+        self.playing_thread = threading.Thread(target=self._play_thread, args=(selected_song.get('path') or selected_song['url'],))
         self.playing_thread.start()
 
+    def enqueue_selected(self):
+        """Appends the selected song to the playback queue (plays it now if idle)."""
+        selected_song = self.get_selected_song()
+        if not selected_song:
+            return
+        if self.player_unavailable:
+            messagebox.showinfo("Playback Info", "The playback queue needs mpv with IPC support.")
+            return
+        self.update_status(f"Adding to queue: {selected_song['title']}...")
+        self.async_runner.submit(self._queue_track(selected_song, True))
+
+    def _ensure_player(self):
+        """Starts the persistent mpv controller on first use. Returns None if it cannot run."""
+        if self.player is not None and self.player.is_running():
+            return self.player
+        try:
+            player = MpvController(event_callback=self._on_player_event)
+            player.start()
+            player.observe('idle-active')
+            player.observe('media-title')
+        except (MpvError, OSError) as e:
+            print(f"Persistent mpv unavailable, falling back to one process per track: {e}")
+            self.player_unavailable = True
+            return None
+        self.player = player
+        return player
+
+    async def _queue_track(self, song, append):
+        """Event-loop task that resolves a track and loads it into the persistent mpv."""
+        player = await asyncio.to_thread(self._ensure_player)
+        if player is None:
+            if not append:
+                self.master.after(0, lambda: self._play_fallback(song))
+            return
+        try:
+            note = ""
+            if song.get('path'):
+                media = song['path'] # Downloaded track: play offline
+            else:
+                playback = await self.api.resolve_playback(song['url'])
+                media = playback['url']
+                if playback['source'] == 'audio_cache':
+                    note = " (from cache)"
+            if append:
+                player.enqueue(media, title=song['title'])
+                message = f"Queued: {song['title']}{note}"
+            else:
+                player.play(media, title=song['title'])
+                message = f"Playing audio: {song['title']}{note}"
+            self.master.after(0, lambda: self.update_status(message))
+        except Exception as e:
+            msg = str(e) # 'e' is unbound once the except block ends, before the callback runs
+            self.master.after(0, lambda msg=msg: messagebox.showerror("Playback Error",
+                                                                      f"An error occurred during playback: {msg}"))
+
+    def _play_fallback(self, song):
+        """Plays a song with a dedicated mpv process when the persistent player is unavailable."""
+        if self.playing_thread and self.playing_thread.is_alive():
+            return
+        self.update_status(f"Playing audio: {song['title']}...")
+        self._set_buttons_state(tk.DISABLED)
+        self.stop_button.config(state=tk.NORMAL)
+        self.playing_thread = threading.Thread(target=self._play_thread, args=(song.get('path') or song['url'],))
+        self.playing_thread.start()
+
+    def _on_player_event(self, event):
+        """Handles events from the persistent mpv (called on the controller's reader thread)."""
+        if event.get('event') == 'property-change':
+            if event.get('name') == 'idle-active':
+                self.player_active = not event.get('data', True)
+                self._update_playback_bandwidth()
+                self.master.after(0, lambda: self._set_buttons_state(tk.NORMAL))
+            elif event.get('name') == 'media-title' and event.get('data'):
+                title = event['data']
+                self.master.after(0, lambda: self.update_status(f"Now playing: {title}"))
+        elif event.get('event') == 'shutdown':
+            self.player_active = False
+            self._update_playback_bandwidth()
+
+    def _update_playback_bandwidth(self):
+        """Lets downloads yield bandwidth while the persistent mpv is playing."""
+        scheduler = get_bandwidth_scheduler()
+        if self.player_active:
+            scheduler.playback_started(self)
+        else:
+            scheduler.playback_stopped(self)
+
+    def _player_command(self, name, *args):
+        """Runs a playlist/transport command on the persistent mpv."""
+        if self.player is None or not self.player.is_running():
+            messagebox.showinfo("Playback Info", "Nothing is playing.")
+            return
+        try:
+            getattr(self.player, name)(*args)
+        except MpvError as e:
+            self.update_status(f"Player: {e}")
+
+    def _change_volume(self, delta):
+        """Raises or lowers the persistent mpv's volume by `delta`."""
+        if self.player is None or not self.player.is_running():
+            return
+        volume = self.player.get_volume()
+        if volume is not None:
+            volume = max(0, min(130, volume + delta))
+            self._player_command('set_volume', volume)
+            self.update_status(f"Volume: {int(volume)}")
+
     def _play_thread(self, url):
         """Threaded function to play music."""
         try:
@@ -220,15 +513,20 @@ class MusicAppGUI:
             if self.mpv_process:
                 self.mpv_process.wait() # Wait for MPV to finish
         except Exception as e:
-            self.master.after(0, lambda: messagebox.showerror("Playback Error", f"An error occurred during playback: {e}"))
+            msg = str(e) # 'e' is unbound once the except block ends, before the callback runs
+            self.master.after(0, lambda msg=msg: messagebox.showerror("Playback Error",
+                                                                      f"An error occurred during playback: {msg}"))
         finally:
             self.mpv_process = None # Clear the process reference
             self.master.after(0, lambda: self._set_buttons_state(tk.NORMAL)) # Re-enable buttons
             self.master.after(0, lambda: self.update_status("Playback finished or stopped."))
 
     def stop_playback(self):
-        """Stops the currently playing MPV process."""
-        if self.mpv_process and self.mpv_process.poll() is None: # Check if process is running
+        """Stops playback, clearing the queue of the persistent mpv or terminating the fallback process."""
+        if self.player is not None and self.player.is_running() and self.player_active:
+            self.update_status("Stopping playback...")
+            self._player_command('stop')
+        elif self.mpv_process and self.mpv_process.poll() is None: # Check if process is running
             self.update_status("Stopping playback...")
             self.mpv_process.terminate() # Request termination
             self.mpv_process = None # Clear the process reference immediately
@@ -238,79 +536,116 @@ class MusicAppGUI:
 
 
     def download_selected_format(self, format_type):
-        """Downloads the selected song in the specified format (MP3 or MP4)."""
+        """Queues the selected song for download in the specified format (MP3 or MP4)."""
         selected_song = self.get_selected_song()
         if not selected_song:
             return
-
-        if self.downloading_thread and self.downloading_thread.is_alive():
-            messagebox.showinfo("Download Info", "A download is already in progress. Please wait.")
+        if not selected_song.get('url'):
+            messagebox.showinfo("Download Info", f"'{selected_song['title']}' is already in your library:\n{selected_song['path']}")
             return
 
-        self.update_status(f"Downloading {format_type}: {selected_song['title']}...")
-        self.download_progress_var.set("Initializing download...")
-        self._set_buttons_state(tk.DISABLED) # Disable all action buttons during download
+        # Downloads run on the download manager's worker pool, so several can be queued at once
+        self.download_manager.submit(selected_song['url'], format_type, title=selected_song['title'])
+        self.update_status(f"Queued {format_type} download: {selected_song['title']} "
+                           f"({self.download_manager.active_count()} active)")
 
-        # Download in a separate thread, passing the progress callback
-        self.downloading_thread = threading.Thread(target=self._download_thread, args=(selected_song['url'], format_type, self._download_progress_hook))
-        self.downloading_thread.start()
+    def download_playlist(self):
+        """Downloads every new entry of the listed playlist or channel as MP3 in the background."""
+        session = self.search_session
+        if not isinstance(session, PlaylistSession) or self.playlist_import is not None:
+            return
 
-    def _download_thread(self, url, format_type, progress_callback):
-        """Threaded function to download media."""
-        try:
-            download_media(url, format_type, progress_callback=progress_callback)
-            self.master.after(0, lambda: self.update_status(f"Download complete! Check 'downloads' folder for {format_type} file."))
-        except Exception as e:
-            self.master.after(0, lambda: messagebox.showerror("Download Error", f"An error occurred during download: {e}"))
-            self.master.after(0, lambda: self.update_status("Download failed."))
-        finally:
-            self.master.after(0, lambda: self._set_buttons_state(tk.NORMAL)) # Re-enable buttons
-            self.master.after(0, lambda: self.download_progress_var.set("")) # Clear progress text
+        def on_result(entry, job):
+            self.master.after(0, self.update_status, f"Playlist: {job.status} {entry['title']}")
+
+        def progress(job, d):
+            # Pipeline job ids restart at 1, so keep their rows apart from the download manager's
+            self.progress.update(('playlist', job.job_id), job.title, d)
+
+        def run():
+            try:
+                summary = playlist.run()
+                message = (f"Playlist done: {summary['completed']} downloaded, {summary['known']} already imported, "
+                           f"{summary['failed']} failed.")
+            except Exception as e:
+                message = f"Playlist import failed: {e}"
+            self.master.after(0, self._on_playlist_done, message)
+
+        playlist = PlaylistImport(session.query, format_type='mp3', on_result=on_result, progress_callback=progress)
+        self.playlist_import = playlist
+        self.download_playlist_button.config(state=tk.DISABLED)
+        known = f" ({len(playlist.state.done)} imported before)" if playlist.state.done else ""
+        self.update_status(f"Downloading playlist {session.title or session.query}{known}...")
+        threading.Thread(target=run, name="playlist-import", daemon=True).start()
+
+    def _on_playlist_done(self, message):
+        self.playlist_import = None
+        self.update_status(message)
+        if isinstance(self.search_session, PlaylistSession) and self.search_future is None:
+            self.download_playlist_button.config(state=tk.NORMAL)
+
+    def cancel_downloads(self):
+        """Cancels every queued, paused or running download."""
+        cancelled = [job for job in self.download_manager.jobs() if self.download_manager.cancel(job.job_id)]
+        if self.playlist_import is not None:
+            self.playlist_import.stop() # Lists no further entries; queued ones still finish
+        if cancelled:
+            self.update_status(f"Cancelled {len(cancelled)} download(s).")
+        else:
+            messagebox.showinfo("Download Info", "No downloads are in progress.")
 
-    def _download_progress_hook(self, d):
-        """
-        Callback function for yt-dlp download progress.
-        Updates the GUI's download progress label.
+    def _download_progress_hook(self, job, d):
         """
-        if d['status'] == 'downloading':
-            p = d.get('_percent_str', 'N/A')
-            s = d.get('_speed_str', 'N/A')
-            e = d.get('_eta_str', 'N/A')
-            message = f"Downloading: {p} at {s} (ETA: {e})"
-            self.master.after(0, lambda: self.download_progress_var.set(message))
-        elif d['status'] == 'finished':
-            self.master.after(0, lambda: self.download_progress_var.set("Processing download..."))
-        elif d['status'] == 'error':
-            error_msg = d.get('message', 'Unknown download error')
-            self.master.after(0, lambda: self.download_progress_var.set(f"Download error: {error_msg}"))
+        Callback for download manager progress, called from worker threads.
 
+        Ticks only update the job's row in the progress aggregator; the table is
+        redrawn by _render_progress at a fixed rate. Only completion messages,
+        which arrive once per job, are scheduled on the main loop directly.
+        """
+        self.progress.update(job.job_id, job.title, d)
+        if d['status'] == 'completed':
+            self.master.after(0, lambda: self.update_status(
+                f"Download complete! Check '{job.output_path}' folder for {job.title} ({job.format_type})."))
+
+    def _render_progress(self):
+        """Redraws the download table if any job changed since the last frame (main thread)."""
+        lines = self.progress.drain()
+        if lines is not None:
+            self.download_table.delete(0, tk.END)
+            for line in lines:
+                self.download_table.insert(tk.END, line)
+            summary = self.progress.summary()
+            if summary['active']:
+                overall = f", {summary['percent']:.0f}% overall" if summary['percent'] is not None else ""
+                self.download_progress_var.set(f"{summary['active']} download(s) active{overall}")
+            else:
+                self.download_progress_var.set("")
+        self.master.after(1000 // PROGRESS_FPS, self._render_progress)
 
     def clear_results(self):
         """Clears the search results listbox."""
-        self.results_listbox.delete(0, tk.END)
-        self.current_results = []
+        self.current_results = ResultStore()
+        self.results_listbox.set_placeholder(None)
+        self.results_listbox.set_store(self.current_results)
+        self.local_results = []
+        self._supersede_search()
+        self.incremental.reset()
+        self.load_more_button.config(state=tk.DISABLED)
+        self.download_playlist_button.config(state=tk.DISABLED)
         self.update_status("Results cleared. Ready for new search.")
-        self.download_progress_var.set("") # Clear progress text
 
-if __name__ == "__main__":
-    # Check for mpv and ffmpeg installation (basic check)
-    def check_dependency(command, name):
-        try:
-            subprocess.run([command, '--version'], check=True, capture_output=True, timeout=5) # Added timeout
-            return True
-        except (subprocess.CalledProcessError, FileNotFoundError, subprocess.TimeoutExpired):
-            return False
-
-    # This check will only run if gui_app.py is executed directly
-    # It's a basic check and might not catch all installation issues.
-    # Full error handling for mpv/ffmpeg is in music_player.py
-    if not check_dependency('mpv', 'MPV'):
-        messagebox.showwarning("Dependency Warning", "MPV player not found. Playback functionality may not work.\n"
-                               "Please install MPV (e.g., 'sudo apt install mpv' or 'brew install mpv').")
-    if not check_dependency('ffmpeg', 'FFmpeg'):
-        messagebox.showwarning("Dependency Warning", "FFmpeg not found. MP3/MP4 download conversion may not work.\n"
-                               "Please install FFmpeg (e.g., 'sudo apt install ffmpeg' or 'brew install ffmpeg').")
+def warn_missing_dependencies(master, results):
+    """Shows one warning listing every missing external program (call on the Tk thread)."""
+    messages = missing_dependency_messages(results)
+    if messages:
+        messagebox.showwarning("Dependency Warning", "\n\n".join(messages), parent=master)
 
+if __name__ == "__main__":
+    # The window comes first. mpv and FFmpeg are probed concurrently in the
+    # background (answered from the on-disk cache after the first run), and
+    # yt_dlp is only imported once the first search or playback needs it.
     root = tk.Tk()
     app = MusicAppGUI(root)
+    DependencyProbe().probe_in_background(
+        lambda results: root.after(0, warn_missing_dependencies, root, results))
     root.mainloop()
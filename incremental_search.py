@@ -0,0 +1,160 @@
+# incremental_search.py
+
+import itertools
+
+from search_cache import get_search_cache, normalize_query
+
+DEFAULT_DEBOUNCE_MS = 300 # Pause in typing before a live search starts
+DEFAULT_MIN_CHARS = 3 # Shorter queries are not searched while typing
+DEFAULT_MAX_IN_FLIGHT = 2 # Live searches allowed to run at once, superseded ones included
+
+class IncrementalSearch:
+    """
+    Turns keystrokes into as few live searches as possible.
+
+    Every change of the search text restarts a debounce timer; only when typing
+    pauses for `debounce_ms` does the query go upstream. A query the search
+    cache already holds starts at once, since it costs no network. While the
+    timer runs, refine() offers the cached results of the longest query the
+    text extends, so the list can follow the typing without any search.
+
+    At most `max_in_flight` live searches run at once. A superseded search
+    still holds its slot until its worker has really stopped, because a
+    blocking extractor call cannot be interrupted; a new query that finds
+    every slot taken waits, and only the latest waiting query is kept.
+
+    The object is not thread-safe: call it from one thread (the GUI's), and
+    report finished() on that thread too.
+    """
+
+    def __init__(self, start, schedule, cancel, debounce_ms=DEFAULT_DEBOUNCE_MS, min_chars=DEFAULT_MIN_CHARS,
+                 max_in_flight=DEFAULT_MAX_IN_FLIGHT, page_size=20, cache=None):
+        """
+        Args:
+            start (callable): start(query, ticket, explicit) begins a search. The caller must
+                              call finished(ticket) once the search's worker has returned.
+            schedule (callable): schedule(delay_ms, func) -> handle, e.g. Tk's after().
+            cancel (callable): cancel(handle), e.g. Tk's after_cancel().
+            debounce_ms (int): Quiet period after the last keystroke.
+            min_chars (int): Minimum query length for searching while typing.
+            max_in_flight (int): Live searches allowed to run at once.
+            page_size (int): Results per first page (the search cache key of an exact hit).
+            cache (SearchCache, optional): Defaults to the shared search cache.
+        """
+        self._start = start
+        self._schedule = schedule
+        self._cancel = cancel
+        self.debounce_ms = debounce_ms
+        self.min_chars = min_chars
+        self.max_in_flight = max(1, max_in_flight)
+        self.page_size = page_size
+        self.cache = cache or get_search_cache()
+        self.keystrokes = 0
+        self.searches = 0 # Live searches started
+        self.cached = 0 # Searches answered by the search cache
+        self.refined = 0 # Provisional answers from a cached shorter query
+        self._tickets = itertools.count(1)
+        self._running = set() # Tickets of live searches whose workers have not returned
+        self._timer = None
+        self._waiting = None # (query, explicit) waiting for a free slot
+        self._current = None # Normalized query of the last search started
+
+    def text_changed(self, text):
+        """
+        Handles an edit of the search box.
+
+        Returns:
+            list or None: Provisional results for the text (see refine()), or None.
+        """
+        self.keystrokes += 1
+        self._cancel_timer()
+        query = text.strip()
+        if len(query) < self.min_chars:
+            self._waiting = None # Typed past (or deleted) it
+            return None
+        if normalize_query(query) == self._current:
+            return None
+        if self.cache.contains(query, self.page_size):
+            self._submit(query, explicit=False)
+            return None
+        self._timer = self._schedule(self.debounce_ms, lambda: self._fire(query))
+        return self.refine(query)
+
+    def submit(self, text):
+        """Searches for `text` right away (Enter or the Search button), skipping the debounce."""
+        self._cancel_timer()
+        query = text.strip()
+        if query:
+            self._submit(query, explicit=True)
+
+    def refine(self, text):
+        """
+        Returns cached results of the longest cached query that `text` extends, keeping only
+        those whose title contains every word typed (the last word may be incomplete).
+
+        Returns:
+            list or None: The matching results, or None when no shorter query is cached.
+        """
+        found = self.cache.refinement(text)
+        if found is None:
+            return None
+        self.refined += 1
+        words = normalize_query(text).split()
+        return [r for r in found[1] if all(w in r.get('title', '').casefold() for w in words)]
+
+    def finished(self, ticket):
+        """Releases a search's slot once its worker has returned, starting the waiting query if any."""
+        self._running.discard(ticket)
+        if self._waiting is not None and len(self._running) < self.max_in_flight:
+            query, explicit = self._waiting
+            self._waiting = None
+            self._launch(query, explicit)
+
+    def reset(self):
+        """Forgets the current query and drops any pending or waiting search."""
+        self._cancel_timer()
+        self._waiting = None
+        self._current = None
+
+    def stats(self):
+        """
+        Returns:
+            dict: 'keystrokes', 'searches' (live), 'cached', 'refined', 'running' and
+                  'searches_per_keystroke'.
+        """
+        return {
+            'keystrokes': self.keystrokes,
+            'searches': self.searches,
+            'cached': self.cached,
+            'refined': self.refined,
+            'running': len(self._running),
+            'searches_per_keystroke': self.searches / self.keystrokes if self.keystrokes else 0.0,
+        }
+
+    def _fire(self, query):
+        self._timer = None
+        self._submit(query, explicit=False)
+
+    def _cancel_timer(self):
+        if self._timer is not None:
+            self._cancel(self._timer)
+            self._timer = None
+
+    def _submit(self, query, explicit):
+        self._current = normalize_query(query)
+        if self.cache.contains(query, self.page_size):
+            # No network involved: never waits for (or takes) a slot
+            self._waiting = None
+            self.cached += 1
+            self._start(query, None, explicit)
+        elif len(self._running) < self.max_in_flight:
+            self._waiting = None
+            self._launch(query, explicit)
+        else:
+            self._waiting = (query, explicit) # Replaces an older waiting query
+
+    def _launch(self, query, explicit):
+        ticket = next(self._tickets)
+        self._running.add(ticket)
+        self.searches += 1
+        self._start(query, ticket, explicit)
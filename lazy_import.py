@@ -0,0 +1,47 @@
+# lazy_import.py
+
+import importlib
+import sys
+
+class LazyModule:
+    """
+    Stand-in for a module that is imported on first attribute access.
+
+    Writing `yt_dlp = LazyModule('yt_dlp')` at the top of a module keeps the
+    usual spellings such as `yt_dlp.YoutubeDL(...)` and `except
+    yt_dlp.utils.DownloadError`, but the real import (about a quarter of a
+    second for yt_dlp) only happens when one of them is evaluated. An except
+    clause is only evaluated when an exception reaches it, so merely importing
+    the application no longer pays for the extractor.
+    """
+
+    __slots__ = ('_name', '_module')
+
+    def __init__(self, name):
+        """
+        Args:
+            name (str): The module to import on first use.
+        """
+        self._name = name
+        self._module = None
+
+    def _load(self):
+        module = self._module
+        if module is None:
+            # import_module is thread-safe; concurrent first uses get the same module
+            module = self._module = importlib.import_module(self._name)
+        return module
+
+    def __getattr__(self, attribute):
+        return getattr(self._load(), attribute)
+
+    def __repr__(self):
+        state = "loaded" if is_loaded(self._name) else "not loaded"
+        return f"<LazyModule {self._name!r} ({state})>"
+
+def is_loaded(name):
+    """
+    Returns:
+        bool: True if the module `name` has actually been imported in this process.
+    """
+    return name in sys.modules
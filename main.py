@@ -1,16 +1,59 @@
 # main.py
 
-import sys
-import os
-from youtube_search import search_youtube_music
-from music_player import play_music, download_music_as_mp3 # Import new download function
+import asyncio
+import threading
+from async_api import get_async_api
+from music_player import play_music
 from interactive_mode import get_user_choice
 
+DOWNLOAD_TIMEOUT = 60 * 60 # Seconds; long mixes can take a while to download and convert
+
 def main():
     """
     Main function for the YouTube Music CLI application.
     Orchestrates search, interactive selection, and playback/download.
     """
+    try:
+        asyncio.run(run_cli())
+    except (KeyboardInterrupt, EOFError):
+        print("\nExiting YouTube Music CLI Player. Goodbye!")
+
+async def _in_terminal_thread(func, *args):
+    """
+    Runs a blocking terminal call (a prompt or a stream lookup) on a daemon thread.
+
+    Unlike asyncio.to_thread, a Ctrl+C does not have to wait for the call to return:
+    the default executor is joined when asyncio.run() exits, but a daemon thread is not.
+    """
+    loop = asyncio.get_running_loop()
+    future = loop.create_future()
+
+    def settle(result, error):
+        if not future.done():
+            future.set_exception(error) if error else future.set_result(result)
+
+    def run():
+        try:
+            result, error = func(*args), None
+        except BaseException as e:
+            result, error = None, e
+        try:
+            loop.call_soon_threadsafe(settle, result, error)
+        except RuntimeError:
+            pass # The loop has already closed (the CLI is exiting)
+
+    threading.Thread(target=run, name="cli-terminal", daemon=True).start()
+    return await future
+
+async def run_cli():
+    """
+    The interactive loop, running on one event loop.
+
+    Searches and downloads go through the shared async API (and its concurrency
+    limit). Prompts and mpv playback block on the terminal, so they run on
+    their own threads and the loop stays free while they wait.
+    """
+    api = get_async_api()
     print("Welcome to the YouTube Music CLI Player!")
     print("---------------------------------------")
     print("Note: This application requires 'yt-dlp' and 'mpv' (for playback) to be installed.")
@@ -21,14 +64,18 @@ def main():
     print("---------------------------------------")
 
     while True: # Main loop for search queries
-        search_query = input("\nEnter your music search query (or 'q' to quit): ").strip()
+        search_query = (await _in_terminal_thread(input, "\nEnter your music search query (or 'q' to quit): ")).strip()
 
         if search_query.lower() == 'q':
             print("Exiting YouTube Music CLI Player. Goodbye!")
             break
 
         print(f"Searching for '{search_query}'...")
-        results = search_youtube_music(search_query, max_results=10) # Get up to 10 results
+        try:
+            results = await api.search(search_query, max_results=10) # Get up to 10 results
+        except asyncio.TimeoutError:
+            print("The search timed out. Please try again.")
+            continue
 
         if not results:
             print("No music found for your query. Please try a different search term.")
@@ -36,12 +83,12 @@ def main():
 
         # Nested loop to handle actions for the current search results
         while True:
-            user_selection = get_user_choice(results)
+            user_selection = await _in_terminal_thread(get_user_choice, results)
 
             if user_selection is None:
                 # User chose to quit from the selection menu, exit the entire app
                 print("Exiting YouTube Music CLI Player. Goodbye!")
-                sys.exit() # Exit the program immediately
+                return # Exit the program
             elif user_selection[0] == 'back':
                 # User chose to go back to the main search prompt
                 break # Break out of the inner loop, return to outer loop
@@ -49,12 +96,15 @@ def main():
                 action, selected_song = user_selection
                 if action == 'play':
                     print(f"\nPlaying: {selected_song['title']}")
-                    play_music(selected_song['url'])
-                    # After play_music finishes (or is interrupted),
-                    # the inner loop continues, returning to the selection menu.
+                    # play_music blocks only while the stream URL is resolved; it then starts
+                    # mpv in the background and returns, so the menu is shown again during playback.
+                    await _in_terminal_thread(play_music, selected_song['url'])
                 elif action == 'download':
                     print(f"\nDownloading: {selected_song['title']}")
-                    download_music_as_mp3(selected_song['url'])
+                    try:
+                        await api.download(selected_song['url'], 'mp3', timeout=DOWNLOAD_TIMEOUT)
+                    except asyncio.TimeoutError:
+                        print("The download took too long and was cancelled.")
                     # After download, the inner loop continues, returning to the selection menu.
                 else:
                     print("Unknown action. Please try again.")
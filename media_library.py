@@ -0,0 +1,265 @@
+# media_library.py
+
+import os
+import re
+import sqlite3
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from app_paths import get_cache_dir
+
+MEDIA_EXTENSIONS = {'.mp3', '.mp4', '.m4a', '.webm', '.opus', '.ogg', '.mkv', '.flac', '.wav', '.aac'}
+
+# Downloads are saved as '<title> [<video id>].<ext>' (see music_player.download_media)
+_FILENAME_RE = re.compile(r'^(?P<title>.*) \[(?P<id>[A-Za-z0-9_-]{11})\]$')
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS tracks (
+    path TEXT PRIMARY KEY,
+    video_id TEXT,
+    title TEXT NOT NULL,
+    format TEXT,
+    duration REAL,
+    size INTEGER,
+    mtime REAL,
+    added_at REAL
+);
+CREATE INDEX IF NOT EXISTS tracks_video_id ON tracks(video_id, format);
+CREATE VIRTUAL TABLE IF NOT EXISTS tracks_fts USING fts5(
+    title, content='tracks', content_rowid='rowid', tokenize='unicode61 remove_diacritics 2'
+);
+CREATE TRIGGER IF NOT EXISTS tracks_ai AFTER INSERT ON tracks BEGIN
+    INSERT INTO tracks_fts(rowid, title) VALUES (new.rowid, new.title);
+END;
+CREATE TRIGGER IF NOT EXISTS tracks_ad AFTER DELETE ON tracks BEGIN
+    INSERT INTO tracks_fts(tracks_fts, rowid, title) VALUES ('delete', old.rowid, old.title);
+END;
+CREATE TRIGGER IF NOT EXISTS tracks_au AFTER UPDATE OF title ON tracks BEGIN
+    INSERT INTO tracks_fts(tracks_fts, rowid, title) VALUES ('delete', old.rowid, old.title);
+    INSERT INTO tracks_fts(rowid, title) VALUES (new.rowid, new.title);
+END;
+"""
+
+# Download-time metadata (e.g. the extractor's title) outranks what a file name implies:
+# _UPSERT replaces the title, _UPSERT_PARSED only fills it in when none is stored.
+_UPSERT_TEMPLATE = """
+INSERT INTO tracks (path, video_id, title, format, duration, size, mtime, added_at)
+VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+ON CONFLICT(path) DO UPDATE SET
+    video_id = COALESCE(excluded.video_id, tracks.video_id),
+    title = {title},
+    format = excluded.format,
+    duration = COALESCE(excluded.duration, tracks.duration),
+    size = excluded.size,
+    mtime = excluded.mtime
+"""
+_UPSERT = _UPSERT_TEMPLATE.format(title="excluded.title")
+_UPSERT_PARSED = _UPSERT_TEMPLATE.format(title="COALESCE(NULLIF(tracks.title, ''), excluded.title)")
+
+# Partial and intermediate download files: yt-dlp's and the transcoder's '.part'/'.ytdl'/'.temp.<ext>'
+# files, and the per-format raw streams ('<title> [<id>].f<format id>.<ext>') awaiting a merge or transcode
+_INTERMEDIATE_RE = re.compile(r'(\.(part|ytdl)|\.temp\.\w+|\.f[\w-]+\.\w+)$', re.IGNORECASE)
+
+def parse_media_filename(path):
+    """
+    Derives the title, video id and format of a downloaded file from its name.
+
+    Args:
+        path (str): Path of the media file.
+
+    Returns:
+        tuple: (title, video_id or None, format) where format is the extension without the dot.
+    """
+    stem, ext = os.path.splitext(os.path.basename(path))
+    match = _FILENAME_RE.match(stem)
+    if match:
+        return match.group('title'), match.group('id'), ext[1:].lower()
+    return stem, None, ext[1:].lower()
+
+def is_intermediate_file(name):
+    """Returns True for partial or raw-stage download files that are not finished media."""
+    return _INTERMEDIATE_RE.search(name) is not None
+
+def _fts_query(text):
+    """Turns free text into an FTS5 query matching every word as a prefix."""
+    words = re.findall(r'\w+', text.lower())
+    return ' '.join(f'"{w}"*' for w in words)
+
+def _row_to_result(row):
+    path, video_id, title, fmt, duration, size = row
+    return {
+        'title': title,
+        'id': video_id,
+        'url': f"https://www.youtube.com/watch?v={video_id}" if video_id else None,
+        'path': path,
+        'format': fmt,
+        'duration': duration,
+        'size': size,
+        'local': True,
+    }
+
+class MediaLibrary:
+    """
+    SQLite index of downloaded media with a full-text index over titles.
+
+    Downloads are added as they finish; existing folders are indexed with scan(),
+    which walks directories in parallel and only touches files whose size or
+    modification time changed. search() answers prefix queries from the FTS5 index.
+    """
+
+    def __init__(self, db_path=None):
+        """
+        Args:
+            db_path (str, optional): SQLite database file. Defaults to 'library.sqlite3'
+                                     in the application cache directory.
+        """
+        self.db_path = db_path or os.path.join(get_cache_dir(), "library.sqlite3")
+        self._conn = sqlite3.connect(self.db_path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(_SCHEMA)
+        self._lock = threading.Lock()
+
+    def add(self, path, title=None, video_id=None, format_type=None, duration=None):
+        """
+        Adds or updates one file in the index.
+
+        Args:
+            path (str): Path of the media file.
+            title (str, optional): Title; parsed from the file name if omitted (a stored
+                                   title is then kept).
+            video_id (str, optional): YouTube video id; parsed from the file name if omitted.
+            format_type (str, optional): 'mp3', 'mp4', ...; taken from the extension if omitted.
+            duration (float, optional): Duration in seconds.
+        """
+        parsed_title, parsed_id, parsed_format = parse_media_filename(path)
+        stat = os.stat(path)
+        with self._lock, self._conn:
+            self._conn.execute(_UPSERT if title else _UPSERT_PARSED, (os.path.abspath(path), video_id or parsed_id, title or parsed_title,
+                                         format_type or parsed_format, duration, stat.st_size,
+                                         stat.st_mtime, time.time()))
+
+    def search(self, text, limit=50):
+        """
+        Full-text search over titles; every word matches as a prefix.
+
+        Args:
+            text (str): The search text.
+            limit (int): Maximum number of results.
+
+        Returns:
+            list: Result dictionaries with 'title', 'id', 'url', 'path', 'format',
+                  'duration', 'size' and 'local' (always True), best match first.
+        """
+        query = _fts_query(text)
+        if not query:
+            return []
+        with self._lock:
+            # Rank and limit inside the FTS index first so only `limit` rows are joined
+            rows = self._conn.execute(
+                "SELECT t.path, t.video_id, t.title, t.format, t.duration, t.size "
+                "FROM (SELECT rowid, rank FROM tracks_fts WHERE tracks_fts MATCH ? ORDER BY rank LIMIT ?) AS hits "
+                "JOIN tracks t ON t.rowid = hits.rowid ORDER BY hits.rank", (query, limit)).fetchall()
+        return [_row_to_result(row) for row in rows]
+
+    def find(self, video_id, format_type=None):
+        """
+        Returns the indexed file for a video id (optionally in a given format), or None.
+        """
+        sql = "SELECT path, video_id, title, format, duration, size FROM tracks WHERE video_id = ?"
+        params = [video_id]
+        if format_type:
+            sql += " AND format = ?"
+            params.append(format_type)
+        with self._lock:
+            row = self._conn.execute(sql + " LIMIT 1", params).fetchone()
+        return _row_to_result(row) if row else None
+
+    def count(self):
+        """Returns the number of indexed files."""
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM tracks").fetchone()[0]
+
+    def scan(self, root, workers=8):
+        """
+        Indexes every media file under `root`, walking sub-directories in parallel.
+
+        Files whose size and modification time are unchanged are skipped, as are
+        partial and raw-stage download files, and index entries under `root` whose
+        file no longer exists are removed. Titles already in the index are kept.
+
+        Args:
+            root (str): Directory to scan.
+            workers (int): Number of directories listed concurrently.
+
+        Returns:
+            dict: 'scanned', 'added' (new or changed) and 'removed' counts.
+        """
+        root = os.path.abspath(root)
+        if not os.path.isdir(root):
+            return {'scanned': 0, 'added': 0, 'removed': 0}
+
+        found = [] # (path, size, mtime)
+        found_lock = threading.Lock()
+
+        def list_dir(path):
+            subdirs, files = [], []
+            try:
+                with os.scandir(path) as it:
+                    for entry in it:
+                        if entry.is_dir(follow_symlinks=False):
+                            if not entry.name.startswith('.'):
+                                subdirs.append(entry.path)
+                        elif (os.path.splitext(entry.name)[1].lower() in MEDIA_EXTENSIONS
+                              and not is_intermediate_file(entry.name)):
+                            stat = entry.stat()
+                            files.append((entry.path, stat.st_size, stat.st_mtime))
+            except OSError as e:
+                print(f"Could not scan '{path}': {e}")
+            with found_lock:
+                found.extend(files)
+            return subdirs
+
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            pending = [pool.submit(list_dir, root)]
+            while pending:
+                future = pending.pop()
+                pending.extend(pool.submit(list_dir, d) for d in future.result())
+
+        prefix = root.rstrip(os.sep) + os.sep
+        with self._lock:
+            known = {path: (size, mtime) for path, size, mtime in self._conn.execute(
+                "SELECT path, size, mtime FROM tracks WHERE path LIKE ? ESCAPE '\\'",
+                (prefix.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_') + '%',))}
+        now = time.time()
+        changed = []
+        for path, size, mtime in found:
+            if known.get(path) != (size, mtime):
+                title, video_id, fmt = parse_media_filename(path)
+                changed.append((path, video_id, title, fmt, None, size, mtime, now))
+        found_paths = {path for path, _, _ in found}
+        missing = [(path,) for path in known if path not in found_paths]
+        with self._lock, self._conn:
+            self._conn.executemany(_UPSERT_PARSED, changed)
+            self._conn.executemany("DELETE FROM tracks WHERE path = ?", missing)
+        return {'scanned': len(found), 'added': len(changed), 'removed': len(missing)}
+
+    def close(self):
+        """Closes the database connection."""
+        with self._lock:
+            self._conn.close()
+
+_default_library = None
+_default_library_lock = threading.Lock()
+
+def get_media_library():
+    """
+    Returns:
+        MediaLibrary: The process-wide media library.
+    """
+    global _default_library
+    with _default_library_lock:
+        if _default_library is None:
+            _default_library = MediaLibrary()
+        return _default_library
@@ -0,0 +1,351 @@
+# mpv_controller.py
+
+import atexit
+import itertools
+import json
+import os
+import shutil
+import socket
+import subprocess
+import tempfile
+import threading
+import time
+
+class MpvError(Exception):
+    """Raised when mpv rejects a command or the IPC connection fails."""
+
+class MpvController:
+    """
+    Controls one long-lived mpv process over its JSON IPC socket.
+
+    Instead of spawning mpv per track, the controller keeps a single idle mpv
+    running and drives its playlist: enqueue, next, previous, seek, volume and
+    position queries. mpv is started with gapless audio and playlist prefetching,
+    so the next queued stream is opened before the current one ends.
+
+    The IPC protocol is newline-delimited JSON: commands are sent as
+    {"command": [...], "request_id": n} (or, with named arguments, as
+    {"command": {"name": ..., ...}, "request_id": n}) and mpv replies with
+    {"request_id": n, "error": "success", "data": ...}. Lines without a
+    request_id are asynchronous events and are passed to `event_callback`.
+    Only Unix domain sockets are supported; on Windows callers should fall back
+    to music_player.play_music.
+    """
+
+    def __init__(self, mpv_path='mpv', extra_args=None, event_callback=None):
+        """
+        Args:
+            mpv_path (str): The mpv executable.
+            extra_args (list, optional): Additional mpv command-line arguments.
+            event_callback (callable, optional): Called with each mpv event dictionary,
+                                                 from the controller's reader thread.
+        """
+        self.mpv_path = mpv_path
+        self.extra_args = extra_args or []
+        self.event_callback = event_callback
+        self.process = None
+        self.socket_path = None
+        self._sock = None
+        self._reader = None
+        self._request_ids = itertools.count(1)
+        self._pending = {} # request_id -> [threading.Event, response]
+        self._send_lock = threading.Lock()
+        self._pending_lock = threading.Lock()
+        self._tempdir = None # Holds the socket of an mpv we started
+        self._closed = False # The IPC connection is gone (closed here, or mpv hung up)
+        self._released = False # close() has run: mpv quit or reaped, socket and temp dir removed
+
+    @staticmethod
+    def is_supported():
+        """Returns True if the platform has Unix domain sockets for mpv's IPC server."""
+        return hasattr(socket, 'AF_UNIX')
+
+    def start(self, timeout=5):
+        """
+        Launches an idle mpv with an IPC server and connects to it.
+
+        Args:
+            timeout (float): Seconds to wait for mpv to create its socket.
+
+        Raises:
+            FileNotFoundError: If mpv is not installed.
+            MpvError: If the IPC socket did not become available.
+        """
+        if not self.is_supported():
+            raise MpvError("mpv IPC control requires Unix domain sockets.")
+        self._tempdir = tempfile.mkdtemp(prefix="pd_mpv_")
+        self.socket_path = os.path.join(self._tempdir, "mpv.sock")
+        command = [
+            self.mpv_path,
+            '--idle=yes',               # Stay alive with an empty playlist
+            '--no-video',
+            '--force-window=no',
+            '--no-terminal',
+            '--gapless-audio=yes',      # No gap between consecutive tracks
+            '--prefetch-playlist=yes',  # Open the next entry's stream before the current one ends
+            f'--input-ipc-server={self.socket_path}',
+        ] + self.extra_args
+        self.process = subprocess.Popen(command, stdin=subprocess.DEVNULL,
+                                        stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        atexit.register(self.close)
+
+        deadline = time.monotonic() + timeout
+        while True:
+            try:
+                self.connect(self.socket_path)
+                return
+            except OSError:
+                if self.process.poll() is not None:
+                    self.close()
+                    raise MpvError(f"mpv exited with code {self.process.returncode} during startup.")
+                if time.monotonic() > deadline:
+                    self.close()
+                    raise MpvError("Timed out waiting for the mpv IPC socket.")
+                time.sleep(0.05)
+
+    def connect(self, socket_path):
+        """
+        Connects to an existing mpv IPC socket (for example one started elsewhere).
+
+        Args:
+            socket_path (str): Path of the Unix domain socket.
+        """
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        sock.connect(socket_path)
+        self.socket_path = socket_path
+        self._sock = sock
+        self._closed = False
+        self._released = False
+        self._reader = threading.Thread(target=self._read_loop, name="mpv-ipc-reader", daemon=True)
+        self._reader.start()
+
+    def is_running(self):
+        """Returns True while the IPC connection is open (and mpv, if we started it, is alive)."""
+        if self._sock is None or self._closed:
+            return False
+        return self.process is None or self.process.poll() is None
+
+    def command(self, *args, timeout=5):
+        """
+        Sends a command and waits for its reply.
+
+        Args:
+            *args: The mpv command and its arguments, e.g. ('loadfile', url, 'append-play').
+            timeout (float): Seconds to wait for the reply.
+
+        Returns:
+            The reply's 'data' field (None for commands without a result).
+
+        Raises:
+            MpvError: If mpv reports an error, the connection is closed, or the reply times out.
+        """
+        return self._send(list(args), args[0], timeout)
+
+    def command_named(self, name, timeout=5, **arguments):
+        """
+        Sends a command with named arguments and waits for its reply.
+
+        Named arguments do not depend on their position, which changes between
+        mpv versions (mpv 0.38 inserted 'index' before the options of 'loadfile').
+
+        Args:
+            name (str): The mpv command, e.g. 'loadfile'.
+            timeout (float): Seconds to wait for the reply.
+            **arguments: The command's arguments by name, e.g. url=..., flags='append-play'.
+
+        Returns:
+            The reply's 'data' field (None for commands without a result).
+
+        Raises:
+            MpvError: If mpv reports an error, the connection is closed, or the reply times out.
+        """
+        return self._send(dict(arguments, name=name), name, timeout)
+
+    def _send(self, command, name, timeout):
+        if not self.is_running():
+            raise MpvError("mpv is not running.")
+        request_id = next(self._request_ids)
+        slot = [threading.Event(), None]
+        with self._pending_lock:
+            self._pending[request_id] = slot
+        payload = json.dumps({'command': command, 'request_id': request_id}) + '\n'
+        try:
+            with self._send_lock:
+                self._sock.sendall(payload.encode('utf-8'))
+            if not slot[0].wait(timeout):
+                raise MpvError(f"Timed out waiting for mpv to answer {name!r}.")
+        except OSError as e:
+            raise MpvError(f"Lost connection to mpv: {e}")
+        finally:
+            with self._pending_lock:
+                self._pending.pop(request_id, None)
+        response = slot[1]
+        if response is None:
+            raise MpvError("Connection to mpv closed.")
+        if response.get('error') != 'success':
+            raise MpvError(f"mpv command {name!r} failed: {response.get('error')}")
+        return response.get('data')
+
+    def get_property(self, name, default=None):
+        """Returns an mpv property, or `default` if it is unavailable (e.g. nothing playing)."""
+        try:
+            return self.command('get_property', name)
+        except MpvError:
+            return default
+
+    def set_property(self, name, value):
+        """Sets an mpv property."""
+        self.command('set_property', name, value)
+
+    # --- Playlist control ---
+
+    def play(self, url, title=None):
+        """Replaces the playlist with `url` and starts playing it immediately."""
+        self._loadfile(url, 'replace', title)
+
+    def enqueue(self, url, title=None):
+        """Appends `url` to the playlist, starting playback if the player is idle."""
+        self._loadfile(url, 'append-play', title)
+
+    def _loadfile(self, url, mode, title):
+        if title:
+            # Per-file options make the title show up in 'media-title' and the playlist
+            self.command_named('loadfile', url=url, flags=mode, options={'force-media-title': title})
+        else:
+            self.command_named('loadfile', url=url, flags=mode)
+
+    def next(self):
+        """Skips to the next playlist entry."""
+        self.command('playlist-next', 'force')
+
+    def previous(self):
+        """Goes back to the previous playlist entry."""
+        self.command('playlist-prev', 'force')
+
+    def stop(self):
+        """Stops playback and clears the playlist; mpv stays idle for the next track."""
+        self.command('stop')
+
+    def toggle_pause(self):
+        """Pauses or resumes playback."""
+        self.command('cycle', 'pause')
+
+    def seek(self, seconds, absolute=False):
+        """
+        Seeks within the current track.
+
+        Args:
+            seconds (float): Offset (relative) or position (absolute) in seconds.
+            absolute (bool): Seek to an absolute position instead of relative to the current one.
+        """
+        self.command('seek', seconds, 'absolute' if absolute else 'relative')
+
+    def set_volume(self, volume):
+        """Sets the volume (0-100, values above 100 amplify)."""
+        self.set_property('volume', volume)
+
+    def get_volume(self):
+        """Returns the current volume, or None."""
+        return self.get_property('volume')
+
+    def get_position(self):
+        """Returns the playback position of the current track in seconds, or None."""
+        return self.get_property('time-pos')
+
+    def get_duration(self):
+        """Returns the duration of the current track in seconds, or None."""
+        return self.get_property('duration')
+
+    def get_playlist(self):
+        """Returns mpv's playlist as a list of dictionaries ('filename', 'current', 'title', ...)."""
+        return self.get_property('playlist', [])
+
+    def is_idle(self):
+        """Returns True if nothing is loaded."""
+        return bool(self.get_property('idle-active', True))
+
+    def observe(self, name, observe_id=None):
+        """
+        Asks mpv to send 'property-change' events for a property to `event_callback`.
+
+        Returns:
+            int: The observer id.
+        """
+        observe_id = observe_id or next(self._request_ids)
+        self.command('observe_property', observe_id, name)
+        return observe_id
+
+    def close(self):
+        """
+        Quits mpv (if we started it), closes the IPC connection and removes the socket's temp dir.
+
+        Also needed after mpv exited on its own (the reader thread only notes the hang-up),
+        so the process is reaped and the temp dir does not outlive the controller.
+        """
+        if self._released:
+            return
+        self._released = True
+        if not self._closed and self.process is not None and self.process.poll() is None:
+            try:
+                self.command('quit', timeout=1)
+            except MpvError:
+                pass
+        self._closed = True
+        if self._sock is not None:
+            try:
+                self._sock.close()
+            except OSError:
+                pass
+        if self.process is not None:
+            try:
+                self.process.wait(timeout=2)
+            except subprocess.TimeoutExpired:
+                self.process.kill()
+                self.process.wait()
+        if self._tempdir is not None:
+            shutil.rmtree(self._tempdir, ignore_errors=True)
+            self._tempdir = None
+
+    def _read_loop(self):
+        buffer = b''
+        sock = self._sock
+        try:
+            while True:
+                chunk = sock.recv(65536)
+                if not chunk:
+                    break
+                buffer += chunk
+                while b'\n' in buffer:
+                    line, buffer = buffer.split(b'\n', 1)
+                    if line.strip():
+                        self._dispatch(line)
+        except OSError:
+            pass
+        finally:
+            self._closed = True
+            with self._pending_lock:
+                for slot in self._pending.values():
+                    slot[0].set() # Wake waiters; their response stays None
+            if self.event_callback:
+                self._safe_callback({'event': 'shutdown'})
+
+    def _dispatch(self, line):
+        try:
+            message = json.loads(line)
+        except ValueError:
+            return
+        request_id = message.get('request_id')
+        if 'event' not in message and request_id is not None:
+            with self._pending_lock:
+                slot = self._pending.get(request_id)
+            if slot is not None:
+                slot[1] = message
+                slot[0].set()
+        elif 'event' in message and self.event_callback:
+            self._safe_callback(message)
+
+    def _safe_callback(self, event):
+        try:
+            self.event_callback(event)
+        except Exception as e:
+            print(f"Error in mpv event callback: {e}")
@@ -1,16 +1,154 @@
 # music_player.py
 
-import yt_dlp
 import subprocess
 import sys
 import os
+import threading
 
-def play_music(video_url):
+from extractor import get_extractor
+from stream_cache import StreamURLCache
+from media_library import get_media_library
+from download_archive import get_download_archive
+from youtube_search import extract_video_id
+from chunked_download import ChunkedDownloader, ChunkedDownloadError
+from bandwidth import get_bandwidth_scheduler
+from audio_cache import AudioCacheProxy, get_audio_cache
+from transcoder import transcode, merge_streams, get_profile, profile_key, PROFILES, TranscodeError
+from telemetry import telemetry
+from lazy_import import LazyModule
+
+yt_dlp = LazyModule('yt_dlp')
+
+AUDIO_STREAM_OPTS = {
+    'format': 'bestaudio/best',  # Prioritize best audio quality
+    'quiet': True,               # Suppress yt_dlp's console output
+    'noplaylist': True,          # Do not extract playlist information
+    'no_warnings': True,         # Suppress warnings
+}
+
+def select_audio_url(info):
+    """
+    Picks a direct audio stream URL that mpv can handle from a yt_dlp info dictionary.
+
+    Args:
+        info (dict): The info dictionary returned by extract_info(download=False).
+
+    Returns:
+        str or None: The stream URL, or None if no suitable stream was found.
+    """
+    # yt_dlp puts the selected format's URL at the top level
+    if 'url' in info:
+        return info['url']
+    if 'formats' in info:
+        # Iterate through formats to find a suitable audio stream
+        for f in info['formats']:
+            if 'url' in f and 'acodec' in f and f['acodec'] != 'none':
+                return f['url']
+    return None
+
+def resolve_stream(video_url):
+    """
+    Resolves a YouTube video URL to a direct audio stream URL (uncached).
+
+    Args:
+        video_url (str): The URL of the YouTube video.
+
+    Returns:
+        dict: 'url' (the stream URL), 'http_headers' (the headers to request it with),
+              'title' and 'duration' of the video.
+
+    Raises:
+        yt_dlp.utils.DownloadError: If yt_dlp could not extract the video.
+        ValueError: If no suitable audio stream was found.
+    """
+    with telemetry.span('extract_info', purpose='stream'):
+        info = get_extractor().extract_info(video_url, AUDIO_STREAM_OPTS)
+    with telemetry.span('format_selection', purpose='stream'):
+        audio_url = select_audio_url(info)
+    if not audio_url:
+        raise ValueError("Could not find a suitable audio stream URL.")
+    # The selected format's headers (e.g. User-Agent) are copied to the top level as well
+    headers = info.get('http_headers')
+    if audio_url != info.get('url'):
+        headers = next((f.get('http_headers') for f in info.get('formats', []) if f.get('url') == audio_url), headers)
+    return {'url': audio_url, 'http_headers': dict(headers or {}), 'title': info.get('title'),
+            'duration': info.get('duration')}
+
+_stream_cache = StreamURLCache(resolve_stream)
+
+def get_stream_cache():
+    """
+    Returns:
+        StreamURLCache: The process-wide cache of resolved stream URLs.
+    """
+    return _stream_cache
+
+_audio_proxy = None
+_audio_proxy_lock = threading.Lock()
+
+def get_audio_proxy():
+    """
+    Returns:
+        AudioCacheProxy: The process-wide proxy that fills the audio cache (started on first use).
+    """
+    global _audio_proxy
+    with _audio_proxy_lock:
+        if _audio_proxy is None:
+            def resolve(video_id, force_refresh):
+                url = f"https://www.youtube.com/watch?v={video_id}"
+                return _stream_cache.resolve(url, force_refresh=force_refresh)
+            _audio_proxy = AudioCacheProxy(resolve).start()
+        return _audio_proxy
+
+def resolve_playback(video_url, use_cache=True, use_audio_cache=True):
+    """
+    Works out what mpv should open to play a video.
+
+    A track in the audio cache is played from disk without any network access.
+    With use_audio_cache, other YouTube videos are played through the local
+    proxy, which resolves the stream URL (through the stream cache) when mpv
+    connects and fills the audio cache while it plays; nothing is resolved
+    here. Otherwise the stream URL is resolved through the stream cache, and a
+    cached URL is probed first and resolved again if the server rejects it.
+
+    Args:
+        video_url (str): The YouTube video URL, or the path of a local media file.
+        use_cache (bool): Reuse a previously resolved, unexpired stream URL for this video.
+        use_audio_cache (bool): Play from and fill the on-disk audio cache.
+
+    Returns:
+        dict: 'url' (path or URL for mpv) and 'source' ('local', 'audio_cache', 'cached' or
+              'resolved', the last two telling whether the stream URL was already cached).
+
+    Raises:
+        yt_dlp.utils.DownloadError: If yt_dlp could not extract the video (not for proxied videos,
+                                    whose errors surface as a failed stream in mpv).
+        ValueError: If no suitable audio stream was found (idem).
+    """
+    if os.path.isfile(video_url):
+        return {'url': video_url, 'source': 'local'}
+    video_id = extract_video_id(video_url) if use_audio_cache else None
+    if video_id:
+        path = get_audio_cache().lookup(video_id)
+        if path:
+            return {'url': path, 'source': 'audio_cache'}
+    if video_id:
+        if not use_cache:
+            _stream_cache.invalidate(video_url) # The proxy resolves afresh
+        source = 'cached' if _stream_cache.get(video_url) is not None else 'resolved'
+        return {'url': get_audio_proxy().url_for(video_id), 'source': source}
+    # mpv gets the URL itself and cannot re-resolve it, so a cached one is checked first
+    stream = _stream_cache.resolve(video_url, force_refresh=not use_cache, verify=True)
+    return {'url': stream['url'], 'source': 'cached' if stream['cached'] else 'resolved'}
+
+def play_music(video_url, use_cache=True, use_audio_cache=True):
     """
     Plays the audio from a given YouTube video URL using an external player (MPV).
 
     Args:
-        video_url (str): The URL of the YouTube video to play.
+        video_url (str): The URL of the YouTube video to play, or the path of a local media file.
+        use_cache (bool): Reuse a previously resolved, unexpired stream URL for this video.
+        use_audio_cache (bool): Replay tracks from the on-disk audio cache and fill it on first play.
 
     Returns:
         subprocess.Popen or None: The Popen object for the MPV process if started,
@@ -18,125 +156,297 @@ def play_music(video_url):
     """
     print(f"Attempting to play: {video_url}")
 
-    # Options for yt_dlp to extract only audio stream information
-    ydl_opts = {
-        'format': 'bestaudio/best',  # Prioritize best audio quality
-        'quiet': True,               # Suppress yt_dlp's console output
-        'noplaylist': True,          # Do not extract playlist information
-        'no_warnings': True,         # Suppress warnings
-    }
+    try:
+        playback = resolve_playback(video_url, use_cache=use_cache, use_audio_cache=use_audio_cache)
+        audio_url, source = playback['url'], playback['source']
+        if source in ('local', 'audio_cache'):
+            # Library file or cached track: no network access needed
+            print(f"Playing local file: {audio_url}")
+        else:
+            print(f"Playing audio stream{' (cached)' if source == 'cached' else ''}: {audio_url}")
 
-    player_process = None # Initialize player_process
+        # Determine the MPV command based on the operating system
+        mpv_command = ['mpv', '--no-video', '--force-window=no', audio_url]
 
-    try:
-        # Extract information about the video, including the direct audio URL
-        with yt_dlp.YoutubeDL(ydl_opts) as ydl:
-            info = ydl.extract_info(video_url, download=False)
-            audio_url = None
-
-            # Find the direct audio URL. yt_dlp provides various formats.
-            # We look for a direct URL that mpv can handle.
-            if 'url' in info:
-                audio_url = info['url']
-            elif 'formats' in info:
-                # Iterate through formats to find a suitable audio stream
-                for f in info['formats']:
-                    if 'url' in f and 'acodec' in f and f['acodec'] != 'none':
-                        audio_url = f['url']
-                        break
-
-            if not audio_url:
-                print("Could not find a suitable audio stream URL.")
-                return None
-
-            print(f"Playing audio stream: {audio_url}")
-
-            # Determine the MPV command based on the operating system
-            mpv_command = ['mpv', '--no-video', '--force-window=no', audio_url]
-
-            # Start the MPV process and return it
+        # Start the MPV process and return it
+        with telemetry.span('mpv_spawn', source=source):
             player_process = subprocess.Popen(mpv_command, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
-            return player_process
+        telemetry.count('playback_starts_total', source=source)
+        if source not in ('local', 'audio_cache'):
+            # Downloads yield bandwidth to the stream until mpv exits
+            get_bandwidth_scheduler().track_playback(player_process)
+        return player_process
 
     except yt_dlp.utils.DownloadError as e:
         print(f"Error fetching video information: {e}")
         print("This might be due to geo-restrictions, video not found, or other YouTube issues.")
+        telemetry.count('errors_total', operation='play', error='DownloadError')
+        return None
+    except ValueError as e:
+        print(e)
+        telemetry.count('errors_total', operation='play', error='ValueError')
         return None
     except FileNotFoundError:
+        telemetry.count('errors_total', operation='play', error='FileNotFoundError')
         print("Error: MPV player not found.")
         print("Please ensure MPV is installed and accessible in your system's PATH.")
         print("You can usually install MPV via your system's package manager (e.g., 'sudo apt install mpv' on Debian/Ubuntu, 'brew install mpv' on macOS).")
         return None
     except Exception as e:
         print(f"An unexpected error occurred: {e}")
+        telemetry.count('errors_total', operation='play', error=type(e).__name__)
         return None
 
-def download_media(video_url, format_type, output_path="downloads", progress_callback=None):
+def download_media(video_url, format_type, output_path="downloads", progress_callback=None, skip_existing=True,
+                   postprocess=True, resumable=True, profile=None, weight=1.0):
     """
     Downloads media (audio as MP3 or video as MP4) from a given YouTube video URL.
 
     Args:
         video_url (str): The URL of the YouTube video to download.
-        format_type (str): 'mp3' for audio-only, 'mp4' for video.
+        format_type (str): 'mp3', 'm4a' or 'opus' for audio-only, 'mp4' for video.
         output_path (str): The directory where the downloaded file will be saved.
         progress_callback (callable, optional): A function to call with download progress information.
                                                 It receives a dictionary with 'status', 'total_bytes',
-                                                'downloaded_bytes', 'elapsed', 'speed', 'eta', etc.
+                                                'downloaded_bytes', 'elapsed', 'speed', 'eta', etc.,
+                                                and the live 'throughput' (bytes/s) while downloading.
+        skip_existing (bool): Return the archived file instead of downloading again if this
+                              video was already downloaded in this format and profile.
+        postprocess (bool): Run the FFmpeg conversion inline. With False the raw stream(s) are
+                            only fetched (and merged), and the caller converts them (see
+                            transcoder.transcode); nothing is archived or added to the library.
+        resumable (bool): Fetch plain HTTP(S) streams with the chunked, multi-connection
+                          downloader, which keeps partial state on disk so a failed or
+                          interrupted download resumes on the next attempt. Other
+                          protocols (e.g. HLS/DASH manifests) always go through yt_dlp.
+        profile (dict, optional): Overrides for the output profile, e.g. {'audio_bitrate': '256k'}
+                                  or {'max_height': 720} (see transcoder.get_profile).
+        weight (float): This download's share of the bandwidth relative to concurrent downloads
+                        (see bandwidth.BandwidthScheduler).
+
+    Returns:
+        str or None: The path of the finished file, or None if the download failed or was cancelled.
     """
     print(f"Attempting to download {format_type}: {video_url}")
 
+    video_id = extract_video_id(video_url) if skip_existing and postprocess else None
+    if not video_id:
+        return _download_media(video_url, format_type, output_path, progress_callback, postprocess, resumable,
+                               profile, weight)
+
+    archive = get_download_archive()
+    archive_format = profile_key(format_type, profile)
+    # Concurrent workers asked for the same video and format wait here for the first one
+    with archive.claim(video_id, archive_format):
+        existing = archive.lookup(video_id, archive_format)
+        if not existing and archive_format == format_type:
+            # The library does not record bitrate or height, so only default-profile files are adopted
+            existing = _find_in_library(archive, video_id, format_type)
+        if existing:
+            print(f"Already downloaded, skipping: {existing}")
+            telemetry.count('downloads_total', status='skipped')
+            if progress_callback:
+                progress_callback({'status': 'finished', 'message': 'Already downloaded.',
+                                   'filename': existing, 'skipped': True})
+            return existing
+
+        filepath = _download_media(video_url, format_type, output_path, progress_callback, postprocess, resumable,
+                                   profile, weight)
+        if filepath:
+            try:
+                archive.record(video_id, archive_format, filepath)
+            except OSError as e:
+                print(f"Could not record '{filepath}' in the download archive: {e}")
+        return filepath
+
+def _find_in_library(archive, video_id, format_type):
+    """Adopts a file the media library already knows about (e.g. from before the archive existed)."""
+    try:
+        track = get_media_library().find(video_id, format_type)
+        if track and os.path.isfile(track['path']):
+            archive.record(video_id, format_type, track['path'])
+            return track['path']
+    except Exception as e:
+        print(f"Could not check the media library for {video_id}: {e}")
+    return None
+
+def _format_opts(format_type, profile=None):
+    """
+    Returns the yt_dlp format selection and post-processors for a target format.
+
+    Streams are chosen so the post-processors can usually copy them instead of
+    re-encoding: MP4 prefers H.264/AAC streams and is only remuxed, M4A and Opus
+    prefer a source already in that codec. Only MP3 normally needs a transcode.
+
+    Raises:
+        ValueError: If the format is not supported.
+    """
+    profile = get_profile(format_type, profile)
+    quality = profile['audio_bitrate'].rstrip('k')
+    if format_type == 'mp4':
+        height = f"[height<={profile['max_height']}]" if profile.get('max_height') else ''
+        return {
+            # Select best MP4 video and M4A audio (within the height cap), merged into MP4
+            'format': f'bestvideo{height}[ext=mp4]+bestaudio[ext=m4a]/best{height}[ext=mp4]/best{height}/best',
+            'merge_output_format': 'mp4',
+            'postprocessors': [{
+                'key': 'FFmpegVideoRemuxer', # Change the container only; streams are copied
+                'preferedformat': 'mp4',
+            }],
+        }
+    preferred = {'mp3': 'bestaudio/best', 'm4a': 'bestaudio[ext=m4a]/bestaudio/best',
+                 'opus': 'bestaudio[acodec=opus]/bestaudio/best'}[format_type]
+    return {
+        'format': preferred,
+        'postprocessors': [{
+            'key': 'FFmpegExtractAudio',     # Extract audio; copied when already in the target codec
+            'preferredcodec': format_type,
+            'preferredquality': quality,     # Bitrate used when re-encoding (e.g. 192 kbps)
+        }],
+    }
+
+def _download_media(video_url, format_type, output_path, progress_callback, postprocess=True, resumable=True,
+                    profile=None, weight=1.0):
+    """Performs the actual download for download_media; see its docstring."""
     # Ensure the download directory exists
     if not os.path.exists(output_path):
         os.makedirs(output_path)
         print(f"Created download directory: {output_path}")
 
     ydl_opts = {
-        'outtmpl': os.path.join(output_path, '%(title)s.%(ext)s'), # Output template
+        # Output template; the video id lets the media library map files back to videos
+        'outtmpl': os.path.join(output_path, '%(title)s [%(id)s].%(ext)s'),
         'quiet': True,               # Suppress default yt_dlp progress output
         'noplaylist': True,          # Do not download playlists
         'no_warnings': True,         # Suppress warnings
     }
 
-    if progress_callback:
-        ydl_opts['progress_hooks'] = [progress_callback]
-
-    if format_type == 'mp3':
-        ydl_opts.update({
-            'format': 'bestaudio/best',  # Select the best audio format
-            'postprocessors': [{
-                'key': 'FFmpegExtractAudio', # Extract audio
-                'preferredcodec': 'mp3',     # Convert to MP3
-                'preferredquality': '192',   # Set quality (e.g., 192kbps)
-            }],
-        })
-    elif format_type == 'mp4':
-        ydl_opts.update({
-            'format': 'bestvideo[ext=mp4]+bestaudio[ext=m4a]/best[ext=mp4]/best', # Select best video and audio, then merge to mp4
-            'postprocessors': [{
-                'key': 'FFmpegVideoConvertor', # Convert video (if necessary)
-                'preferedformat': 'mp4',       # Preferred output format
-            }],
-        })
-    else:
-        print(f"Error: Unsupported format type '{format_type}'. Please choose 'mp3' or 'mp4'.")
+    try:
+        with telemetry.span('format_selection', purpose='download', format=format_type):
+            ydl_opts.update(_format_opts(format_type, profile))
+    except ValueError as e:
+        print(f"Error: {e} Please choose one of: {', '.join(PROFILES)}.")
         if progress_callback:
             progress_callback({'status': 'error', 'message': f"Unsupported format: {format_type}"})
-        return
+        return None
+
+    if not postprocess:
+        ydl_opts.pop('postprocessors')
+
+    transfer = get_bandwidth_scheduler().open_transfer(video_url, weight=weight)
+    with telemetry.span('download', format=format_type, resumable=resumable), transfer:
+        try:
+            if resumable:
+                result = _download_resumable(video_url, format_type, ydl_opts, progress_callback, postprocess, profile,
+                                             transfer)
+                if result:
+                    filepath, info = result
+                    if postprocess:
+                        _add_to_library(filepath, info, format_type)
+                    print(f"Download complete! Check '{output_path}' directory.")
+                    telemetry.count('downloads_total', status='completed')
+                    if progress_callback:
+                        progress_callback({'status': 'finished', 'message': 'Download complete!', 'filename': filepath,
+                                           'title': info.get('title'), 'duration': info.get('duration')})
+                    return filepath
+
+            # The progress callback is passed separately rather than put in ydl_opts,
+            # so every download with the same options can share one YoutubeDL instance.
+            # yt_dlp manages its own connection; the hook paces it against the other jobs.
+            with telemetry.span('transfer', downloader='extractor', format=format_type):
+                filepath, info = get_extractor().download(video_url, ydl_opts,
+                                                          progress_callback=transfer.throttle_hook(progress_callback))
+            if postprocess:
+                _add_to_library(filepath, info, format_type)
+            print(f"Download complete! Check '{output_path}' directory.")
+            telemetry.count('downloads_total', status='completed')
+            if progress_callback:
+                progress_callback({'status': 'finished', 'message': 'Download complete!', 'filename': filepath,
+                                   'title': info.get('title'), 'duration': info.get('duration')})
+            return filepath
+        except yt_dlp.utils.DownloadCancelled as e:
+            # Raised from a progress hook to abort the transfer (e.g. by the download manager)
+            print(f"Download cancelled: {e}")
+            telemetry.count('downloads_total', status='cancelled')
+            if progress_callback:
+                progress_callback({'status': 'cancelled', 'message': 'Download cancelled.'})
+        except (yt_dlp.utils.DownloadError, ChunkedDownloadError, TranscodeError) as e:
+            print(f"Error during download: {e}")
+            telemetry.count('downloads_total', status='error')
+            telemetry.count('errors_total', operation='download', error=type(e).__name__)
+            if progress_callback:
+                progress_callback({'status': 'error', 'message': f"Download error: {e}"})
+        except Exception as e:
+            print(f"An unexpected error occurred during download: {e}")
+            telemetry.count('downloads_total', status='error')
+            telemetry.count('errors_total', operation='download', error=type(e).__name__)
+            if progress_callback:
+                progress_callback({'status': 'error', 'message': f"Unexpected error: {e}"})
+    return None
+
+def _download_resumable(video_url, format_type, ydl_opts, progress_callback, postprocess, profile=None,
+                        transfer=None):
+    """
+    Downloads the selected format(s) with ChunkedDownloader instead of yt_dlp's downloader.
+
+    Each stream is saved as '<title> [<id>].f<format id>.<ext>' with its partial
+    state next to it, keyed by video id and format id so a retry resumes even
+    though the signed stream URL has changed. Separate video and audio streams
+    are merged with FFmpeg. With postprocess the result is converted to the
+    target format.
+
+    Returns:
+        tuple or None: (filepath, info), or None if a stream is not plain HTTP(S)
+                       and the caller should let yt_dlp download it.
+    """
+    resolve_opts = {k: v for k, v in ydl_opts.items() if k != 'postprocessors'}
+    extractor = get_extractor()
+    with telemetry.span('extract_info', purpose='download', format=format_type):
+        info = extractor.extract_info(video_url, resolve_opts)
+    base = os.path.splitext(extractor.prepare_filename(info, resolve_opts))[0]
 
+    formats = info.get('requested_formats') or [info]
+    if any(f.get('protocol') not in ('http', 'https') or not f.get('url') for f in formats):
+        return None
+
+    def refresher(format_id):
+        def refresh_url():
+            # Signed stream URLs expire; resolve the video again and pick the same format
+            with telemetry.span('extract_info', purpose='refresh', format=format_type):
+                fresh = extractor.extract_info(video_url, resolve_opts)
+            for f in fresh.get('requested_formats') or [fresh]:
+                if f.get('format_id') == format_id and f.get('url'):
+                    return f['url'], f.get('http_headers') or fresh.get('http_headers')
+            raise ChunkedDownloadError(f"Format {format_id} is no longer offered.")
+        return refresh_url
+
+    paths = []
+    for f in formats:
+        dest = f"{base}.f{f.get('format_id')}.{f.get('ext')}"
+        downloader = ChunkedDownloader(f['url'], dest, headers=f.get('http_headers') or info.get('http_headers'),
+                                       progress_callback=progress_callback,
+                                       resume_key=f"{info.get('id')}-{f.get('format_id')}", transfer=transfer,
+                                       refresh_url=refresher(f.get('format_id')))
+        with telemetry.span('transfer', downloader='chunked', format_id=f.get('format_id')) as span:
+            paths.append(downloader.run())
+            span.set(bytes=os.path.getsize(paths[-1]), retries=downloader.retries)
+
+    if len(paths) > 1:
+        filepath = merge_streams(paths, f"{base}.{info.get('ext') or 'mp4'}")
+    else:
+        filepath = f"{base}.{formats[0].get('ext')}"
+        os.replace(paths[0], filepath)
+    if postprocess:
+        filepath = transcode(filepath, format_type, profile=profile)
+    return filepath, info
+
+def _add_to_library(filepath, info, format_type):
+    """Records a finished download in the local media library (errors are only reported)."""
     try:
-        with yt_dlp.YoutubeDL(ydl_opts) as ydl:
-            ydl.download([video_url])
-        print(f"Download complete! Check '{output_path}' directory.")
-        if progress_callback:
-            progress_callback({'status': 'finished', 'message': 'Download complete!'})
-    except yt_dlp.utils.DownloadError as e:
-        print(f"Error during download: {e}")
-        if progress_callback:
-            progress_callback({'status': 'error', 'message': f"Download error: {e}"})
+        get_media_library().add(filepath, title=info.get('title'), video_id=info.get('id'),
+                                format_type=format_type, duration=info.get('duration'))
     except Exception as e:
-        print(f"An unexpected error occurred during download: {e}")
-        if progress_callback:
-            progress_callback({'status': 'error', 'message': f"Unexpected error: {e}"})
+        print(f"Could not add '{filepath}' to the media library: {e}")
 
 if __name__ == "__main__":
     # Example usage when run directly
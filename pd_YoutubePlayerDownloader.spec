@@ -6,7 +6,7 @@ a = Analysis(
     pathex=[],
     binaries=[],
     datas=[],
-    hiddenimports=[],
+    hiddenimports=['yt_dlp'], # Imported lazily through lazy_import.LazyModule
     hookspath=[],
     hooksconfig={},
     runtime_hooks=[],
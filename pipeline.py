@@ -0,0 +1,291 @@
+# pipeline.py
+
+import itertools
+import os
+import queue
+import threading
+import time
+
+from music_player import download_media
+from transcoder import transcode, profile_key, TranscodeError
+from download_archive import get_download_archive
+from media_library import get_media_library
+from youtube_search import extract_video_id
+from download_manager import PENDING, COMPLETED, FAILED
+
+FETCHING = 'fetching'
+TRANSCODING = 'transcoding'
+
+STAGES = ('queued', 'fetch', 'backpressure', 'transcode_wait', 'transcode')
+
+class PipelineJob:
+    """
+    A download travelling through the fetch and transcode stages.
+
+    Attributes:
+        job_id (int): Unique id assigned by the pipeline.
+        url (str): The YouTube video URL.
+        format_type (str): 'mp3', 'm4a', 'opus' or 'mp4'.
+        title (str): Display title (defaults to the URL).
+        status (str): PENDING, FETCHING, TRANSCODING, COMPLETED or FAILED.
+        filepath (str or None): The converted file once COMPLETED.
+        error (str or None): Error message once FAILED.
+        attempts (int): Number of fetch attempts.
+        skipped (bool): True if the file was already archived and nothing was fetched.
+        media_title (str or None): The video's title as reported by the extractor once fetched.
+        duration (float or None): The video's duration in seconds, once fetched.
+        timings (dict): Seconds spent per stage: 'queued' (waiting for a fetch worker),
+                        'fetch', 'backpressure' (blocked on a full transcode queue),
+                        'transcode_wait' and 'transcode'.
+    """
+
+    def __init__(self, job_id, url, format_type, title=None):
+        self.job_id = job_id
+        self.url = url
+        self.format_type = format_type
+        self.title = title or url
+        self.status = PENDING
+        self.raw_path = None
+        self.filepath = None
+        self.error = None
+        self.attempts = 0
+        self.skipped = False
+        self.media_title = None
+        self.duration = None
+        self.timings = {}
+        self.submitted_at = time.monotonic()
+        self._stage_started = self.submitted_at
+        self._done_event = threading.Event()
+        self._claim = None # (video id, archive key) held from the archive lookup until the job finishes
+
+    def _mark(self, stage):
+        """Closes the current stage, charging the elapsed time to `stage`."""
+        now = time.monotonic()
+        self.timings[stage] = self.timings.get(stage, 0.0) + now - self._stage_started
+        self._stage_started = now
+
+    def wait(self, timeout=None):
+        """Blocks until the job is COMPLETED or FAILED. Returns False on timeout."""
+        return self._done_event.wait(timeout)
+
+    def __repr__(self):
+        return f"<PipelineJob {self.job_id} {self.format_type} {self.status} {self.title!r}>"
+
+class DownloadPipeline:
+    """
+    Two-stage download pipeline that overlaps network transfers with FFmpeg work.
+
+    Fetch workers download raw streams with download_media(postprocess=False)
+    and hand them to the transcode stage through a bounded queue. When the queue
+    is full, fetchers block, so network work never runs ahead of what the CPU
+    can convert. Each transcode worker supervises one FFmpeg process, so the
+    transcode stage is a pool of FFmpeg processes sized to the CPU count.
+    Per-stage timings are kept on each job and aggregated by stats().
+    """
+
+    def __init__(self, fetch_workers=4, transcode_workers=None, queue_size=None, output_path="downloads",
+                 progress_callback=None, max_attempts=2, profile=None):
+        """
+        Args:
+            fetch_workers (int): Number of concurrent network fetches.
+            transcode_workers (int, optional): Number of concurrent FFmpeg processes (default: CPU count).
+            queue_size (int, optional): Capacity of the queue between the stages (default: 2 per transcoder).
+            output_path (str): Directory for downloaded files.
+            progress_callback (callable, optional): Called as progress_callback(job, d) from worker threads.
+            max_attempts (int): Fetch attempts per job before it is marked FAILED.
+            profile (dict, optional): Output profile overrides for every job (see transcoder.get_profile).
+        """
+        self.output_path = output_path
+        self.progress_callback = progress_callback
+        self.max_attempts = max_attempts
+        self.profile = profile
+        self._archive = get_download_archive()
+        transcode_workers = transcode_workers or os.cpu_count() or 2
+        self._fetch_queue = queue.Queue()
+        self._transcode_queue = queue.Queue(maxsize=queue_size or transcode_workers * 2)
+        self._jobs = {}
+        self._by_key = {} # (video id, format) -> job, to collapse duplicate submissions
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+        self._fetchers = [threading.Thread(target=self._fetch_worker, name=f"fetch-{i + 1}", daemon=True)
+                          for i in range(fetch_workers)]
+        self._transcoders = [threading.Thread(target=self._transcode_worker, name=f"transcode-{i + 1}", daemon=True)
+                             for i in range(transcode_workers)]
+        for worker in self._fetchers + self._transcoders:
+            worker.start()
+
+    def submit(self, url, format_type, title=None):
+        """
+        Queues a download. Submitting the same video and format twice returns the first job.
+
+        Returns:
+            PipelineJob: The job.
+        """
+        video_id = extract_video_id(url)
+        with self._lock:
+            key = (video_id, format_type)
+            if video_id and key in self._by_key:
+                return self._by_key[key]
+            job = PipelineJob(next(self._ids), url, format_type, title=title)
+            self._jobs[job.job_id] = job
+            if video_id:
+                self._by_key[key] = job
+        self._fetch_queue.put(job)
+        return job
+
+    def jobs(self):
+        """Returns all jobs, oldest first."""
+        with self._lock:
+            return list(self._jobs.values())
+
+    def wait(self, timeout=None):
+        """
+        Blocks until every submitted job has finished.
+
+        Returns:
+            bool: False if the timeout expired first.
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        for job in self.jobs():
+            remaining = None if deadline is None else max(0, deadline - time.monotonic())
+            if not job.wait(remaining):
+                return False
+        return True
+
+    def shutdown(self, wait=True):
+        """Stops the workers once the queued jobs are done (or immediately if wait is False)."""
+        for _ in self._fetchers:
+            self._fetch_queue.put(None)
+        if wait:
+            for worker in self._fetchers:
+                worker.join()
+        for _ in self._transcoders:
+            self._transcode_queue.put(None)
+        if wait:
+            for worker in self._transcoders:
+                worker.join()
+
+    def stats(self):
+        """
+        Returns:
+            dict: Job counts and, per stage, 'total_s' and 'mean_s' over the jobs that reached it.
+        """
+        jobs = self.jobs()
+        stages = {}
+        for stage in STAGES:
+            values = [job.timings[stage] for job in jobs if stage in job.timings]
+            stages[stage] = {
+                'total_s': round(sum(values), 3),
+                'mean_s': round(sum(values) / len(values), 3) if values else 0.0,
+            }
+        return {
+            'jobs': len(jobs),
+            'completed': sum(1 for job in jobs if job.status == COMPLETED),
+            'failed': sum(1 for job in jobs if job.status == FAILED),
+            'skipped': sum(1 for job in jobs if job.skipped),
+            'stages': stages,
+        }
+
+    def _fetch_worker(self):
+        while True:
+            job = self._fetch_queue.get()
+            if job is None:
+                return
+            self._run_stage(self._fetch, job)
+
+    def _transcode_worker(self):
+        while True:
+            job = self._transcode_queue.get()
+            if job is None:
+                return
+            self._run_stage(self._transcode, job)
+
+    def _run_stage(self, stage, job):
+        """Runs one stage for a job; an unexpected error fails the job instead of killing the worker."""
+        try:
+            stage(job)
+        except Exception as e:
+            print(f"Unexpected error in pipeline job {job.job_id}: {e}")
+            job.error = str(e) or type(e).__name__
+            self._finish(job, FAILED)
+
+    def _fetch(self, job):
+        job._mark('queued')
+        video_id = extract_video_id(job.url)
+        existing = None
+        if video_id:
+            # Like download_media's claim, but held across both stages: another pipeline or
+            # download_media call for the same key waits, then finds the archived file.
+            # _finish releases it, whichever stage the job ends in.
+            claim = (video_id, profile_key(job.format_type, self.profile))
+            self._archive.acquire(*claim)
+            job._claim = claim
+            existing = self._archive.lookup(*claim)
+        if existing:
+            job.skipped = True
+            job.filepath = existing
+            self._finish(job, COMPLETED)
+            return
+
+        job.status = FETCHING
+        hook = lambda d, job=job: self._notify(job, d)
+        while job.raw_path is None and job.attempts < self.max_attempts:
+            job.attempts += 1
+            job.raw_path = download_media(job.url, job.format_type, output_path=self.output_path,
+                                          progress_callback=hook, postprocess=False, profile=self.profile)
+        job._mark('fetch')
+        if job.raw_path is None:
+            job.error = job.error or "Download failed."
+            self._finish(job, FAILED)
+            return
+
+        # Blocks while the transcode stage is saturated (backpressure)
+        self._transcode_queue.put(job)
+        job._mark('backpressure')
+
+    def _transcode(self, job):
+        job._mark('transcode_wait')
+        job.status = TRANSCODING
+        self._notify(job, {'status': 'transcoding', 'message': 'Converting...'})
+        try:
+            job.filepath = transcode(job.raw_path, job.format_type, profile=self.profile)
+        except (TranscodeError, OSError) as e:
+            job._mark('transcode')
+            job.error = str(e)
+            self._finish(job, FAILED)
+            return
+        job._mark('transcode')
+        video_id = extract_video_id(job.url)
+        title = job.media_title or (job.title if job.title != job.url else None)
+        try:
+            if job._claim:
+                self._archive.record(*job._claim, job.filepath)
+            get_media_library().add(job.filepath, title=title, video_id=video_id, format_type=job.format_type,
+                                    duration=job.duration)
+        except Exception as e:
+            print(f"Could not index '{job.filepath}': {e}")
+        self._finish(job, COMPLETED)
+
+    def _finish(self, job, status):
+        if job._done_event.is_set():
+            return # Already finished; a later failure must not report it twice
+        if job._claim:
+            claim, job._claim = job._claim, None
+            self._archive.release(*claim)
+        job.status = status
+        job._done_event.set()
+        if status == COMPLETED:
+            self._notify(job, {'status': 'completed', 'message': 'Download complete!', 'filename': job.filepath})
+        else:
+            self._notify(job, {'status': 'failed', 'message': job.error})
+
+    def _notify(self, job, d):
+        if d.get('status') == 'error':
+            job.error = d.get('message')
+        elif d.get('status') == 'finished' and d.get('title'):
+            job.media_title, job.duration = d['title'], d.get('duration')
+        if self.progress_callback:
+            try:
+                self.progress_callback(job, d)
+            except Exception as e:
+                print(f"Error in pipeline progress callback: {e}")
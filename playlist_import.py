@@ -0,0 +1,415 @@
+# playlist_import.py
+
+import argparse
+import hashlib
+import json
+import os
+import sys
+import threading
+import time
+from contextlib import closing
+from urllib.parse import urlparse, parse_qs
+
+from app_paths import get_cache_dir
+from extractor import get_extractor
+from pipeline import DownloadPipeline
+from download_manager import COMPLETED
+from transcoder import PROFILES
+from bandwidth import get_bandwidth_scheduler, parse_rate
+from telemetry import telemetry
+
+PLAYLIST_OPTS = {
+    'quiet': True,               # Suppress console output
+    'no_warnings': True,         # Suppress warnings
+    'extract_flat': 'in_playlist', # Only list the entries; each video is resolved when it is downloaded
+    'lazy_playlist': True,       # Fetch playlist pages as they are consumed
+    'ignoreerrors': True,        # Skip private/deleted entries instead of failing the whole listing
+}
+
+SAVE_INTERVAL = 2.0 # Seconds between writes of the sync state while an import runs
+CHANNEL_STOP_AFTER_KNOWN = 50 # Known entries in a row after which a channel re-sync stops listing
+
+_CHANNEL_PREFIXES = ('@', 'channel', 'c', 'user')
+
+def is_playlist_url(url):
+    """
+    Returns True for YouTube playlist and channel URLs (including watch URLs with a 'list' parameter).
+    """
+    parsed = urlparse(url.strip())
+    host = (parsed.hostname or '').lower()
+    if 'youtube' not in host and not host.endswith('youtu.be'):
+        return False
+    if parse_qs(parsed.query).get('list'):
+        return True
+    parts = [p for p in parsed.path.split('/') if p]
+    return bool(parts) and (parts[0] == 'playlist' or parts[0].startswith('@') or parts[0] in _CHANNEL_PREFIXES)
+
+def is_channel_url(url):
+    """Returns True for channel URLs, whose newest uploads are listed first."""
+    parsed = urlparse(url.strip())
+    parts = [p for p in parsed.path.split('/') if p]
+    return (not parse_qs(parsed.query).get('list') and bool(parts)
+            and (parts[0].startswith('@') or parts[0] in _CHANNEL_PREFIXES))
+
+def playlist_key(url):
+    """
+    Returns a stable key for a playlist or channel: the playlist id, or the channel path.
+    """
+    parsed = urlparse(url.strip())
+    playlist_id = parse_qs(parsed.query).get('list', [None])[0]
+    if playlist_id:
+        return playlist_id
+    parts = [p for p in parsed.path.split('/') if p]
+    if parts and parts[-1] in ('videos', 'shorts', 'streams', 'featured'):
+        parts = parts[:-1] # All tabs of a channel share one sync state
+    return '/'.join(parts) or url.strip()
+
+def _entry_to_result(entry):
+    video_id = entry.get('id')
+    return {
+        'title': entry.get('title') or 'Unknown Title',
+        'id': video_id,
+        'url': f"https://www.youtube.com/watch?v={video_id}" if video_id else entry.get('url'),
+        'playlist_title': entry.get('playlist_title'),
+    }
+
+def iter_playlist_entries(url):
+    """
+    Lists a playlist or channel lazily with flat extraction (no per-video requests).
+
+    Yields:
+        dict: 'title', 'id', 'url' and 'playlist_title' of each video, in playlist order.
+    """
+    entries = get_extractor().iter_playlist(url, PLAYLIST_OPTS)
+    try:
+        for entry in entries:
+            if entry.get('id'):
+                yield _entry_to_result(entry)
+    finally:
+        entries.close() # Closing this generator releases the extractor's one as well
+
+class PlaylistState:
+    """
+    What has already been imported from one playlist, kept as a small JSON file.
+
+    Only completed downloads are recorded, so failed entries are tried again on
+    the next run. Writes are batched (at most one every SAVE_INTERVAL seconds)
+    because a playlist with thousands of entries would otherwise rewrite the
+    file thousands of times.
+    """
+
+    def __init__(self, url, format_type, path=None):
+        """
+        Args:
+            url (str): The playlist or channel URL.
+            format_type (str): The download format; each format is synced separately.
+            path (str, optional): State file. Defaults to a file under the cache directory's 'playlists' folder.
+        """
+        self.url = url
+        self.format_type = format_type
+        if path is None:
+            digest = hashlib.sha1(playlist_key(url).encode('utf-8')).hexdigest()[:16]
+            path = os.path.join(get_cache_dir("playlists"), f"{digest}-{format_type}.json")
+        self.path = path
+        self.title = None
+        self.done = {} # video id -> file path
+        self.last_sync = None
+        self._dirty = False
+        self._saved_at = 0.0
+        self._lock = threading.Lock()
+        self._load()
+
+    def is_done(self, video_id):
+        with self._lock:
+            return video_id in self.done
+
+    def mark_done(self, video_id, filepath):
+        with self._lock:
+            self.done[video_id] = filepath
+            self._dirty = True
+            if time.monotonic() - self._saved_at >= SAVE_INTERVAL:
+                self._save_locked()
+
+    def save(self, synced=False):
+        """Writes pending changes; with synced, also stamps the time of a completed sync."""
+        with self._lock:
+            if synced:
+                self.last_sync = time.time()
+                self._dirty = True
+            if self._dirty:
+                self._save_locked()
+
+    def _load(self):
+        if not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+        except (OSError, ValueError) as e:
+            print(f"Ignoring unreadable playlist state '{self.path}': {e}")
+            return
+        self.title = data.get('title')
+        self.done = data.get('done', {})
+        self.last_sync = data.get('last_sync')
+
+    def _save_locked(self):
+        """Writes the state atomically. Must be called with the lock held."""
+        tmp_path = f"{self.path}.tmp"
+        try:
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump({'url': self.url, 'format': self.format_type, 'title': self.title,
+                           'last_sync': self.last_sync, 'done': self.done}, f)
+            os.replace(tmp_path, self.path)
+            self._dirty = False
+            self._saved_at = time.monotonic()
+        except OSError as e:
+            print(f"Could not write playlist state '{self.path}': {e}")
+
+class PlaylistSession:
+    """
+    Pages through a playlist's entries like youtube_search.SearchSession pages
+    through search results, so the GUI can show a playlist with the same code.
+    """
+
+    def __init__(self, url, page_size=100):
+        """
+        Args:
+            url (str): The playlist or channel URL.
+            page_size (int): Entries per next_page() call.
+        """
+        self.query = url
+        self.page_size = page_size
+        self.results = []
+        self.exhausted = False
+        self.title = None
+        self._iterator = None
+        self._lock = threading.Lock()
+        self._closed = False
+
+    def next_page(self, on_result=None):
+        """
+        Lists the next page of entries.
+
+        Args:
+            on_result (callable, optional): Called with each entry as soon as it is listed.
+
+        Returns:
+            list: The new entries (empty once the playlist is exhausted).
+        """
+        with self._lock:
+            if self.exhausted or self._closed:
+                return []
+            if self._iterator is None:
+                self._iterator = iter_playlist_entries(self.query)
+            page = []
+            try:
+                for result in self._iterator:
+                    self.title = self.title or result.get('playlist_title')
+                    page.append(result)
+                    if on_result:
+                        on_result(result)
+                    if len(page) == self.page_size or self._closed:
+                        break
+                else:
+                    self.exhausted = True
+            except Exception as e:
+                print(f"Error while listing playlist: {e}")
+                telemetry.count('errors_total', operation='playlist', error=type(e).__name__)
+                self.exhausted = True
+            if self.exhausted:
+                self._release_iterator()
+            self.results.extend(page)
+            return page
+
+    def _release_iterator(self):
+        """Closes the live generator, returning its YoutubeDL instance to the pool (lock held)."""
+        if self._iterator is not None:
+            self._iterator.close()
+            self._iterator = None
+
+    def close(self):
+        """Stops listing and returns the extractor's YoutubeDL instance to the pool."""
+        self._closed = True
+        with self._lock:
+            self._release_iterator()
+
+class PlaylistImport:
+    """
+    Downloads every video of a playlist or channel, skipping what earlier runs imported.
+
+    The entry list is read with flat extraction, page by page. Entries are
+    handed to a DownloadPipeline while the listing continues. Its fetch workers
+    resolve and download videos concurrently, and its transcode workers convert
+    them. Results are reported through callbacks as each download finishes.
+    Completed videos are recorded in a PlaylistState. A later run with resync
+    only downloads entries that are new or failed before. Channels list their
+    newest uploads first, so a channel re-sync stops listing after
+    `stop_after_known` already imported entries in a row.
+    """
+
+    def __init__(self, url, format_type='mp3', output_path="downloads", fetch_workers=4, transcode_workers=None,
+                 max_attempts=2, profile=None, resync=True, limit=None, stop_after_known=None, state_path=None,
+                 on_entry=None, on_result=None, progress_callback=None):
+        """
+        Args:
+            url (str): The playlist or channel URL.
+            format_type (str): 'mp3', 'm4a', 'opus' or 'mp4'.
+            output_path (str): Directory for downloaded files.
+            fetch_workers (int): Number of concurrent resolves/downloads.
+            transcode_workers (int, optional): Number of concurrent FFmpeg processes (default: CPU count).
+            max_attempts (int): Attempts per video before it is counted as failed.
+            profile (dict, optional): Output profile overrides (see transcoder.get_profile).
+            resync (bool): Skip entries completed by earlier runs. With False everything is queued again
+                           (the download archive still skips files that exist).
+            limit (int, optional): Stop after listing this many entries.
+            stop_after_known (int, optional): Stop listing after this many already imported entries in a
+                                              row. Defaults to CHANNEL_STOP_AFTER_KNOWN for channels and to
+                                              listing everything for playlists, which grow at the end.
+            state_path (str, optional): Sync state file (see PlaylistState).
+            on_entry (callable, optional): on_entry(entry) when an entry is queued for download.
+            on_result (callable, optional): on_result(entry, job) when its download finished (any thread).
+            progress_callback (callable, optional): Receives every pipeline progress_callback(job, d) call.
+        """
+        self.url = url
+        self.format_type = format_type
+        self.resync = resync
+        self.limit = limit
+        if stop_after_known is None and resync and is_channel_url(url):
+            stop_after_known = CHANNEL_STOP_AFTER_KNOWN
+        self.stop_after_known = stop_after_known
+        self.on_entry = on_entry
+        self.on_result = on_result
+        self.progress_callback = progress_callback
+        self.state = PlaylistState(url, format_type, path=state_path)
+        self.pipeline_options = {'fetch_workers': fetch_workers, 'transcode_workers': transcode_workers,
+                                 'output_path': output_path, 'max_attempts': max_attempts, 'profile': profile}
+        self.listed = 0
+        self.known = 0
+        self.entries = {} # video URL -> entry, registered before its job can finish
+        self._stopped = False
+
+    def stop(self):
+        """Stops listing further entries; downloads already queued still finish."""
+        self._stopped = True
+
+    def run(self):
+        """
+        Lists the playlist, downloads the new entries and waits for them.
+
+        Returns:
+            dict: 'title', 'listed', 'known' (skipped as already imported), 'queued',
+                  'completed', 'failed', 'list_s' (time to list) and 'elapsed_s'.
+        """
+        started = time.monotonic()
+        pipeline = DownloadPipeline(progress_callback=self._on_progress, **self.pipeline_options)
+        known_in_row = 0
+        list_s = None
+        finished = False
+        with telemetry.span('playlist_import', channel=is_channel_url(self.url)) as span:
+            try:
+                # Closed as soon as listing stops, so the pooled YoutubeDL is not held while downloads finish
+                with closing(iter_playlist_entries(self.url)) as entries:
+                    for entry in entries:
+                        self.listed += 1
+                        self.state.title = self.state.title or entry.get('playlist_title')
+                        if self.resync and self.state.is_done(entry['id']):
+                            self.known += 1
+                            known_in_row += 1
+                            if self.stop_after_known and known_in_row >= self.stop_after_known:
+                                break # Everything older was imported by an earlier run
+                        else:
+                            known_in_row = 0
+                            # An archived video is finished by a fetch worker at once, possibly before
+                            # submit() returns, so the entry must already be findable by then
+                            self.entries[entry['url']] = entry
+                            pipeline.submit(entry['url'], self.format_type, title=entry['title'])
+                            if self.on_entry:
+                                self.on_entry(entry)
+                        if self._stopped or (self.limit and self.listed >= self.limit):
+                            break
+                list_s = time.monotonic() - started
+                pipeline.wait()
+                finished = not self._stopped
+            finally:
+                pipeline.shutdown(wait=False)
+                self.state.save(synced=finished)
+            stats = pipeline.stats()
+            span.set(listed=self.listed, known=self.known, queued=stats['jobs'])
+        return {
+            'title': self.state.title,
+            'listed': self.listed,
+            'known': self.known,
+            'queued': stats['jobs'],
+            'completed': stats['completed'],
+            'skipped': stats['skipped'],
+            'failed': stats['failed'],
+            'list_s': round(list_s if list_s is not None else time.monotonic() - started, 2),
+            'elapsed_s': round(time.monotonic() - started, 2),
+        }
+
+    def _on_progress(self, job, d):
+        if self.progress_callback:
+            self.progress_callback(job, d)
+        if d.get('status') not in ('completed', 'failed'):
+            return
+        entry = self.entries.get(job.url)
+        if entry is None:
+            return
+        if job.status == COMPLETED:
+            self.state.mark_done(entry['id'], job.filepath)
+        if self.on_result:
+            self.on_result(entry, job)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Download a YouTube playlist or channel, resuming where the last run stopped.")
+    parser.add_argument('url', help="Playlist or channel URL.")
+    parser.add_argument('-f', '--format', choices=tuple(PROFILES), default='mp3', help="Download format.")
+    parser.add_argument('-o', '--output', default='downloads', help="Download directory.")
+    parser.add_argument('-j', '--workers', type=int, default=4, help="Number of parallel resolves/downloads.")
+    parser.add_argument('--transcode-workers', type=int, default=None, help="Number of parallel FFmpeg processes (default: CPU count).")
+    parser.add_argument('--attempts', type=int, default=2, help="Attempts per video before giving up.")
+    parser.add_argument('--limit', type=int, default=None, help="Only look at the first N entries.")
+    parser.add_argument('--full', action='store_true', help="Queue every entry, not only those added since the last run.")
+    parser.add_argument('--list', action='store_true', help="Only list the entries (flat extraction), do not download.")
+    parser.add_argument('--limit-rate', type=parse_rate, default=None, metavar='RATE',
+                        help="Cap the total download rate, e.g. 2M or 750K bytes per second.")
+    args = parser.parse_args(argv)
+    if args.limit_rate:
+        get_bandwidth_scheduler().set_rate(args.limit_rate)
+
+    if not is_playlist_url(args.url):
+        print("That does not look like a YouTube playlist or channel URL.")
+        return 1
+
+    if args.list:
+        count = 0
+        with closing(iter_playlist_entries(args.url)) as entries:
+            for count, entry in enumerate(entries, 1):
+                print(f"{count}. {entry['title']}  {entry['url']}")
+                if args.limit and count >= args.limit:
+                    break
+        print(f"{count} entries.")
+        return 0
+
+    def on_result(entry, job):
+        note = " (already downloaded)" if job.skipped else ""
+        detail = job.filepath if job.status == COMPLETED else job.error
+        print(f"[{job.status}] {entry['title']}{note}: {detail}", flush=True)
+
+    playlist = PlaylistImport(args.url, format_type=args.format, output_path=args.output, fetch_workers=args.workers,
+                              transcode_workers=args.transcode_workers, max_attempts=args.attempts,
+                              resync=not args.full, limit=args.limit, on_result=on_result)
+    if playlist.state.last_sync and not args.full:
+        print(f"Re-syncing: {len(playlist.state.done)} entries were imported before.")
+    try:
+        summary = playlist.run()
+    except KeyboardInterrupt:
+        print("\nInterrupted. Completed entries are remembered for the next run.")
+        return 130
+    print(f"{summary['title'] or args.url}: listed {summary['listed']} entries in {summary['list_s']} s, "
+          f"{summary['known']} already imported, {summary['completed']} downloaded, {summary['failed']} failed "
+          f"({summary['elapsed_s']} s).")
+    return 1 if summary['failed'] else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,137 @@
+# prefetch.py
+
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+class StreamPrefetcher:
+    """
+    Speculatively resolves stream URLs for the top search results in the background.
+
+    Resolved URLs land in the shared StreamURLCache, so pressing play on one of
+    the prefetched results skips the extract_info round trip. Each call to
+    prefetch() supersedes the previous one: queued work for older results is
+    cancelled. Hit-rate metrics show how often a played track had been prefetched,
+    which helps tune `top_k`.
+    """
+
+    def __init__(self, stream_cache, top_k=5, max_workers=2, budget=10):
+        """
+        Args:
+            stream_cache (StreamURLCache): The cache to fill (see music_player.get_stream_cache()).
+            top_k (int): How many results from the top of each list to pre-resolve.
+            max_workers (int): Maximum number of resolves running at the same time.
+            budget (int): Maximum number of resolves started per prefetch() call.
+        """
+        self.stream_cache = stream_cache
+        self.top_k = top_k
+        self.budget = budget
+        self.resolved = 0  # Prefetch resolves that succeeded
+        self.failed = 0    # Prefetch resolves that raised
+        self.cancelled = 0 # Queued resolves dropped because a newer prefetch superseded them
+        self.hits = 0      # Plays of a track that had been prefetched
+        self.misses = 0    # Plays of a track that had not been prefetched
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="prefetch")
+        self._futures = []
+        # Cache keys filled by the prefetcher, oldest first; bounded like the cache they point into
+        self._prefetched = OrderedDict()
+        self._generation = 0
+        self._lock = threading.Lock()
+
+    def prefetch(self, results):
+        """
+        Cancels outstanding work and starts pre-resolving the top results.
+
+        Args:
+            results (list): Search result dictionaries with a 'url' key, best first.
+
+        Returns:
+            int: The number of resolves queued.
+        """
+        self.cancel()
+        with self._lock:
+            generation = self._generation
+        queued = 0
+        for result in results[:self.top_k]:
+            if queued >= self.budget:
+                break
+            url = result.get('url')
+            if not url or result.get('path') or self.stream_cache.get(url) is not None:
+                continue # Local file, already resolved, or not playable
+            future = self._executor.submit(self._resolve, url, generation)
+            with self._lock:
+                self._futures.append(future)
+            queued += 1
+        return queued
+
+    def cancel(self):
+        """Cancels every queued resolve; ones already running finish in the background."""
+        with self._lock:
+            self._generation += 1
+            futures, self._futures = self._futures, []
+        for future in futures:
+            if future.cancel():
+                with self._lock:
+                    self.cancelled += 1
+
+    def record_play(self, video_url):
+        """
+        Records that a track is about to be played, for the hit-rate metrics.
+
+        Args:
+            video_url (str): The URL of the video being played.
+
+        Returns:
+            bool: True if the track's stream URL had been prefetched and is still cached.
+        """
+        key = self.stream_cache.key_for(video_url)
+        with self._lock:
+            prefetched = self._prefetched.pop(key, None) is not None # Each prefetch counts once
+        hit = prefetched and self.stream_cache.get(video_url) is not None
+        with self._lock:
+            if hit:
+                self.hits += 1
+            else:
+                self.misses += 1
+        return hit
+
+    def stats(self):
+        """
+        Returns:
+            dict: Resolve counters plus 'hits', 'misses' and 'hit_rate' of plays.
+        """
+        with self._lock:
+            plays = self.hits + self.misses
+            return {
+                'resolved': self.resolved,
+                'failed': self.failed,
+                'cancelled': self.cancelled,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': self.hits / plays if plays else 0.0,
+            }
+
+    def shutdown(self):
+        """Cancels outstanding work and stops the worker threads."""
+        self.cancel()
+        self._executor.shutdown(wait=False)
+
+    def _resolve(self, video_url, generation):
+        with self._lock:
+            if generation != self._generation:
+                self.cancelled += 1
+                return # Superseded between being queued and starting
+        try:
+            self.stream_cache.resolve(video_url)
+        except Exception as e:
+            with self._lock:
+                self.failed += 1
+            print(f"Prefetch of {video_url} failed: {e}")
+            return
+        with self._lock:
+            self.resolved += 1
+            key = self.stream_cache.key_for(video_url)
+            self._prefetched[key] = True
+            self._prefetched.move_to_end(key)
+            while len(self._prefetched) > self.stream_cache.max_entries:
+                self._prefetched.popitem(last=False) # Evicted from the cache by now anyway
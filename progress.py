@@ -0,0 +1,123 @@
+# progress.py
+
+import threading
+import time
+
+ACTIVE_STATUSES = ('queued', 'downloading', 'finished', 'transcoding', 'paused')
+FINAL_STATUSES = ('completed', 'failed', 'error', 'cancelled')
+
+class JobProgress:
+    """Latest known progress of one download. One instance per job, overwritten in place."""
+
+    __slots__ = ('job_id', 'title', 'status', 'percent', 'speed', 'eta', 'downloaded', 'total',
+                 'message', 'updated_at', 'ticks')
+
+    def __init__(self, job_id, title):
+        self.job_id = job_id
+        self.title = title
+        self.status = 'queued'
+        self.percent = None
+        self.speed = None
+        self.eta = None
+        self.downloaded = 0
+        self.total = None
+        self.message = None
+        self.updated_at = time.monotonic()
+        self.ticks = 0 # Progress dictionaries folded into this row
+
+    def apply(self, d):
+        """Folds one yt_dlp-style progress dictionary into the row."""
+        self.status = d.get('status', self.status)
+        self.ticks += 1
+        self.updated_at = time.monotonic()
+        if self.status == 'downloading':
+            self.downloaded = d.get('downloaded_bytes') or self.downloaded
+            self.total = d.get('total_bytes') or d.get('total_bytes_estimate') or self.total
+            self.percent = self.downloaded * 100 / self.total if self.total else None
+            self.speed = d.get('throughput') or d.get('speed') # Live rate when the scheduler reports one
+            self.eta = d.get('eta')
+        elif self.status in ('completed', 'finished') and self.total:
+            self.percent = 100.0
+        if d.get('message'):
+            self.message = d['message']
+
+    def format(self, width=40):
+        """Returns the row as one line of text for the progress table."""
+        title = self.title if len(self.title) <= width else self.title[:width - 1] + "…"
+        percent = f"{self.percent:5.1f}%" if self.percent is not None else "  -   "
+        speed = f"{self.speed / 1024 / 1024:6.2f} MiB/s" if self.speed else "     -     "
+        eta = f"{int(self.eta) // 60:02d}:{int(self.eta) % 60:02d}" if self.eta is not None else "--:--"
+        line = f"{title:<{width}} {self.status:<11} {percent} {speed} {eta}"
+        if self.status in ('failed', 'error') and self.message:
+            line += f"  {self.message}"
+        return line
+
+class ProgressAggregator:
+    """
+    Coalesces progress ticks from worker threads for a fixed-rate renderer.
+
+    Workers call update() for every tick; it only overwrites the job's row and
+    marks the table dirty, so memory stays at one row per job however fast ticks
+    arrive. The GUI polls drain() on a timer (e.g. 10 times per second) and only
+    redraws when something changed, instead of scheduling one Tk callback per tick.
+    Finished jobs stay visible for `linger` seconds and are then dropped.
+    """
+
+    def __init__(self, linger=10.0):
+        """
+        Args:
+            linger (float): Seconds a completed, failed or cancelled job stays in the table.
+        """
+        self.linger = linger
+        self._rows = {} # job id -> JobProgress, in submission order
+        self._dirty = False
+        self._lock = threading.Lock()
+        self.ticks = 0 # Total ticks received
+        self.renders = 0 # drain() calls that returned changes
+
+    def update(self, job_id, title, d):
+        """Records a progress dictionary for a job (any thread)."""
+        with self._lock:
+            row = self._rows.get(job_id)
+            if row is None:
+                row = self._rows[job_id] = JobProgress(job_id, title)
+            row.apply(d)
+            self.ticks += 1
+            self._dirty = True
+
+    def remove(self, job_id):
+        """Drops a job from the table."""
+        with self._lock:
+            if self._rows.pop(job_id, None) is not None:
+                self._dirty = True
+
+    def drain(self):
+        """
+        Returns the table if it changed since the last call.
+
+        Returns:
+            list or None: Formatted lines, one per job (oldest first), or None if nothing changed.
+        """
+        now = time.monotonic()
+        with self._lock:
+            expired = [job_id for job_id, row in self._rows.items()
+                       if row.status in FINAL_STATUSES and now - row.updated_at > self.linger]
+            for job_id in expired:
+                del self._rows[job_id]
+            if not self._dirty and not expired:
+                return None
+            self._dirty = False
+            self.renders += 1
+            return [row.format() for row in self._rows.values()]
+
+    def summary(self):
+        """
+        Returns:
+            dict: 'active' and 'total' job counts and the overall 'percent' across active jobs with a known size.
+        """
+        with self._lock:
+            active = [row for row in self._rows.values() if row.status in ACTIVE_STATUSES]
+            sized = [row for row in active if row.total]
+            total = sum(row.total for row in sized)
+            percent = sum(row.downloaded for row in sized) * 100 / total if total else None
+            return {'active': len(active), 'total': len(self._rows), 'percent': percent}
@@ -0,0 +1,213 @@
+# search_cache.py
+
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+
+from app_paths import get_cache_dir
+from telemetry import telemetry
+
+DEFAULT_TTL = 6 * 60 * 60    # Search results are considered fresh for 6 hours
+DEFAULT_MAX_ENTRIES = 500    # Maximum number of cached queries before LRU eviction
+
+def normalize_query(query):
+    """
+    Normalizes a search query so that trivially different spellings share a cache entry.
+
+    Args:
+        query (str): The raw search query.
+
+    Returns:
+        str: The lower-cased query with collapsed whitespace.
+    """
+    return " ".join(query.lower().split())
+
+class SearchCache:
+    """
+    In-memory LRU cache of search results, backed by a JSON file on disk.
+
+    Entries are keyed by (normalized query, max_results) and expire after `ttl`
+    seconds. When more than `max_entries` queries are cached, the least
+    recently used ones are evicted. The cache is safe to use from several threads.
+    """
+
+    def __init__(self, path=None, ttl=DEFAULT_TTL, max_entries=DEFAULT_MAX_ENTRIES):
+        """
+        Args:
+            path (str, optional): JSON file used for persistence. Defaults to
+                                  'search_cache.json' in the application cache directory.
+                                  Pass False to keep the cache in memory only.
+            ttl (float): Time-to-live of an entry in seconds.
+            max_entries (int): Maximum number of entries kept before LRU eviction.
+        """
+        if path is None:
+            path = os.path.join(get_cache_dir(), "search_cache.json")
+        self.path = path or None
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict() # key -> (timestamp, results)
+        self._lock = threading.Lock()
+        self._load()
+
+    @staticmethod
+    def _key(query, max_results):
+        return f"{max_results}:{normalize_query(query)}"
+
+    def get(self, query, max_results):
+        """
+        Looks up cached results for a query.
+
+        Args:
+            query (str): The search term.
+            max_results (int): The number of results that was requested.
+
+        Returns:
+            list or None: A copy of the cached results, or None on a miss or expired entry.
+        """
+        key = self._key(query, max_results)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and time.time() - entry[0] <= self.ttl:
+                self._entries.move_to_end(key) # Mark as most recently used
+                self.hits += 1
+                telemetry.count('cache_requests_total', cache='search', result='hit')
+                return [dict(r) for r in entry[1]]
+            if entry is not None:
+                del self._entries[key] # Expired
+            self.misses += 1
+            telemetry.count('cache_requests_total', cache='search', result='miss')
+            return None
+
+    def contains(self, query, max_results):
+        """Returns True if get() would be a hit, without counting it or touching the LRU order."""
+        with self._lock:
+            entry = self._entries.get(self._key(query, max_results))
+            return entry is not None and time.time() - entry[0] <= self.ttl
+
+    def refinement(self, query):
+        """
+        Finds cached results for the longest shorter query that `query` extends.
+
+        Used while typing: the results for 'love so' are likely among those already
+        cached for 'love s' or 'love'. Neither counts as a hit or a miss.
+
+        Returns:
+            tuple or None: (cached query, copy of its deepest cached results), or None.
+        """
+        normalized = normalize_query(query)
+        best = None
+        now = time.time()
+        with self._lock:
+            for key, (timestamp, results) in self._entries.items():
+                cached = key.split(':', 1)[1]
+                if (not cached or len(cached) >= len(normalized) or not normalized.startswith(cached)
+                        or now - timestamp > self.ttl):
+                    continue
+                if best is None or (len(cached), len(results)) > (len(best[0]), len(best[1])):
+                    best = (cached, results)
+        if best is not None:
+            telemetry.count('cache_requests_total', cache='search', result='refinement')
+            return best[0], [dict(r) for r in best[1]]
+        return None
+
+    def put(self, query, max_results, results):
+        """
+        Stores results for a query, evicting least recently used entries if needed.
+
+        Args:
+            query (str): The search term.
+            max_results (int): The number of results that was requested.
+            results (list): The list of result dictionaries to cache.
+        """
+        key = self._key(query, max_results)
+        with self._lock:
+            self._entries[key] = (time.time(), [dict(r) for r in results])
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+            self._save_locked()
+
+    def clear(self):
+        """Removes every entry and resets the hit/miss counters."""
+        with self._lock:
+            self._entries.clear()
+            self.hits = 0
+            self.misses = 0
+            self._save_locked()
+
+    def stats(self):
+        """
+        Returns:
+            dict: 'hits', 'misses', 'entries' and 'hit_rate' for this cache.
+        """
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'entries': len(self._entries),
+                'hit_rate': self.hits / total if total else 0.0,
+            }
+
+    def _load(self):
+        """Loads non-expired entries from disk, ignoring a missing or corrupt file."""
+        if not self.path or not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+        except (OSError, ValueError) as e:
+            print(f"Ignoring unreadable search cache '{self.path}': {e}")
+            return
+        now = time.time()
+        # Entries are stored oldest first, so insertion order restores LRU order
+        for key, timestamp, results in data.get('entries', []):
+            if now - timestamp <= self.ttl:
+                self._entries[key] = (timestamp, results)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def _save_locked(self):
+        """Writes the cache to disk atomically. Must be called with the lock held."""
+        if not self.path:
+            return
+        data = {'entries': [[key, ts, results] for key, (ts, results) in self._entries.items()]}
+        tmp_path = f"{self.path}.tmp"
+        try:
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(data, f)
+            os.replace(tmp_path, self.path)
+        except OSError as e:
+            print(f"Could not write search cache '{self.path}': {e}")
+
+_default_cache = None
+_default_cache_lock = threading.Lock()
+
+def get_search_cache():
+    """
+    Returns the process-wide SearchCache, creating it on first use.
+
+    Returns:
+        SearchCache: The shared search cache.
+    """
+    global _default_cache
+    with _default_cache_lock:
+        if _default_cache is None:
+            _default_cache = SearchCache()
+        return _default_cache
+
+def set_search_cache(cache):
+    """
+    Replaces the process-wide SearchCache (e.g. with an in-memory one for benchmarks).
+
+    Returns:
+        SearchCache or None: The previous cache.
+    """
+    global _default_cache
+    with _default_cache_lock:
+        previous, _default_cache = _default_cache, cache
+        return previous
@@ -0,0 +1,363 @@
+# server.py
+
+import argparse
+import json
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+
+from youtube_search import search_youtube_music
+from search_cache import get_search_cache, normalize_query
+from music_player import get_stream_cache
+from audio_cache import get_audio_cache
+from download_manager import DownloadManager, FINAL_STATES
+from transcoder import PROFILES
+from ydl_pool import get_ydl_pool
+from telemetry import telemetry
+
+SSE_KEEPALIVE = 15 # Seconds between comment lines on an idle event stream
+
+class SingleFlight:
+    """
+    Collapses concurrent calls with the same key into one execution.
+
+    The first caller for a key runs the function. Callers that arrive while it is
+    running wait for it and get the same result (or exception). Nothing is
+    remembered once the call returns; caching is left to the caches behind it.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls = {} # key -> [Event, result, exception]
+        self.executed = 0 # Calls that actually ran
+        self.shared = 0 # Calls answered by another caller's execution
+
+    def do(self, key, func, *args, **kwargs):
+        """
+        Runs func(*args, **kwargs) unless a call with the same key is already in flight.
+
+        Returns:
+            The function's result.
+        """
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = [threading.Event(), None, None]
+                self.executed += 1
+            else:
+                self.shared += 1
+        if not leader:
+            call[0].wait()
+            if call[2] is not None:
+                raise call[2]
+            return call[1]
+        try:
+            call[1] = func(*args, **kwargs)
+            return call[1]
+        except Exception as e:
+            call[2] = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call[0].set()
+
+class ProgressHub:
+    """
+    Fans download progress out to Server-Sent Event subscribers.
+
+    Only the latest event per job is kept, so a slow client skips intermediate
+    ticks instead of buffering them, and memory stays at one event per job.
+    """
+
+    def __init__(self):
+        self._condition = threading.Condition()
+        self._version = 0
+        self._latest = {} # job id -> (version, event)
+
+    def publish(self, job_id, event):
+        with self._condition:
+            self._version += 1
+            self._latest[job_id] = (self._version, event)
+            self._condition.notify_all()
+
+    def wait(self, since, job_id=None, timeout=SSE_KEEPALIVE):
+        """
+        Blocks until an event newer than `since` exists (for one job or any job).
+
+        Returns:
+            tuple: (new version, list of events), the list being empty on timeout.
+        """
+        def changed():
+            if job_id is not None:
+                entry = self._latest.get(job_id)
+                return [entry] if entry and entry[0] > since else []
+            return [entry for entry in self._latest.values() if entry[0] > since]
+
+        with self._condition:
+            self._condition.wait_for(changed, timeout)
+            entries = sorted(changed(), key=lambda entry: entry[0])
+            version = entries[-1][0] if entries else since
+            return version, [event for _, event in entries]
+
+def _job_to_dict(job):
+    return {
+        'id': job.job_id,
+        'url': job.url,
+        'format': job.format_type,
+        'title': job.title,
+        'status': job.status,
+        'attempts': job.attempts,
+        'filepath': job.filepath,
+        'error': job.error,
+    }
+
+class MusicService:
+    """
+    The operations behind the HTTP endpoints, shared by every client.
+
+    All clients use the process-wide search cache, stream URL cache, YoutubeDL
+    pool and one DownloadManager. Identical searches and resolves in flight at
+    the same time are coalesced into one yt_dlp call. The functions doing the
+    work can be swapped out, so load tests can run against an in-process fake
+    extractor.
+    """
+
+    def __init__(self, search=search_youtube_music, resolve=None, download_manager=None, download_workers=3,
+                 output_path="downloads"):
+        """
+        Args:
+            search (callable): search(query, max_results=...) -> list of result dictionaries.
+            resolve (callable, optional): resolve(video_url) -> stream info; defaults to the shared stream cache.
+            download_manager (DownloadManager, optional): Runs downloads; one is created if omitted.
+            download_workers (int): Worker count of the created download manager.
+            output_path (str): Download directory of the created download manager.
+        """
+        self.search_func = search
+        self.resolve_func = resolve or get_stream_cache().resolve
+        self.hub = ProgressHub()
+        self.flights = SingleFlight()
+        self.started_at = time.time()
+        self.downloads = download_manager or DownloadManager(max_workers=download_workers, output_path=output_path)
+        self.downloads.progress_callback = self._on_progress
+
+    def search(self, query, max_results=5):
+        key = ('search', normalize_query(query), max_results)
+        return self.flights.do(key, self.search_func, query, max_results=max_results)
+
+    def resolve(self, video_url):
+        return self.flights.do(('resolve', video_url), self.resolve_func, video_url)
+
+    def download(self, url, format_type, title=None):
+        return self.downloads.submit(url, format_type, title=title)
+
+    def _on_progress(self, job, d):
+        event = {key: value for key, value in d.items()
+                 if key in ('status', 'message', 'downloaded_bytes', 'total_bytes', 'speed', 'eta', 'filename')}
+        event['job_id'] = job.job_id
+        event['job_status'] = job.status
+        self.hub.publish(job.job_id, event)
+
+    def stats(self):
+        return {
+            'uptime_s': round(time.time() - self.started_at, 1),
+            'coalescing': {'executed': self.flights.executed, 'shared': self.flights.shared},
+            'search_cache': get_search_cache().stats(),
+            'stream_cache': get_stream_cache().stats(),
+            'audio_cache': get_audio_cache().stats(),
+            'ydl_pool': get_ydl_pool().stats(),
+            'downloads': {'jobs': len(self.downloads.jobs()), 'active': self.downloads.active_count()},
+        }
+
+    def close(self):
+        self.downloads.shutdown(wait=False, cancel_pending=True)
+
+class MusicRequestHandler(BaseHTTPRequestHandler):
+    """
+    JSON endpoints:
+        GET    /search?q=...&max_results=N   Search results
+        GET    /resolve?url=...              Direct audio stream URL
+        POST   /downloads                    Body {"url", "format", "title"}; queues a download
+                                             ("format" is a transcoder.PROFILES key, default mp3)
+        GET    /downloads                    All download jobs
+        GET    /downloads/<id>               One job
+        DELETE /downloads/<id>               Cancels a job
+        GET    /downloads/<id>/events        Progress of one job as Server-Sent Events
+        GET    /events                       Progress of all jobs as Server-Sent Events
+        GET    /stats                        Cache, pool and coalescing statistics
+        GET    /metrics                      Telemetry counters and histograms (Prometheus text format)
+    """
+
+    server_version = "pdMusicServer/1.0"
+    protocol_version = "HTTP/1.1"
+
+    @property
+    def service(self):
+        return self.server.service
+
+    def log_message(self, format, *args):
+        if self.server.verbose:
+            super().log_message(format, *args)
+
+    def _send_json(self, status, body):
+        payload = json.dumps(body).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def _send_text(self, status, text, content_type):
+        payload = text.encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def _error(self, status, message):
+        self._send_json(status, {'error': message})
+
+    def _job_from_path(self, parts):
+        try:
+            job = self.service.downloads.get(int(parts[1]))
+        except ValueError:
+            job = None
+        if job is None:
+            self._error(404, "No such download.")
+        return job
+
+    def do_GET(self):
+        parsed = urlparse(self.path)
+        params = {k: v[0] for k, v in parse_qs(parsed.query).items()}
+        parts = [p for p in parsed.path.split('/') if p]
+        try:
+            if parts == ['search']:
+                query = params.get('q', '').strip()
+                if not query:
+                    return self._error(400, "Missing query parameter 'q'.")
+                max_results = min(max(int(params.get('max_results', 5)), 1), 50)
+                return self._send_json(200, {'query': query, 'results': self.service.search(query, max_results)})
+            if parts == ['resolve']:
+                if not params.get('url'):
+                    return self._error(400, "Missing query parameter 'url'.")
+                return self._send_json(200, self.service.resolve(params['url']))
+            if parts == ['downloads']:
+                return self._send_json(200, {'downloads': [_job_to_dict(j) for j in self.service.downloads.jobs()]})
+            if len(parts) == 2 and parts[0] == 'downloads':
+                job = self._job_from_path(parts)
+                if job:
+                    self._send_json(200, _job_to_dict(job))
+                return
+            if len(parts) == 3 and parts[0] == 'downloads' and parts[2] == 'events':
+                job = self._job_from_path(parts)
+                if job:
+                    self._stream_events(job)
+                return
+            if parts == ['events']:
+                return self._stream_events(None)
+            if parts == ['stats']:
+                return self._send_json(200, self.service.stats())
+            if parts == ['metrics']:
+                return self._send_text(200, telemetry.prometheus_text(), 'text/plain; version=0.0.4')
+            return self._error(404, "Not found.")
+        except ValueError as e:
+            return self._error(400, str(e))
+        except Exception as e:
+            return self._error(502, f"{type(e).__name__}: {e}")
+
+    def do_POST(self):
+        if urlparse(self.path).path.rstrip('/') != '/downloads':
+            return self._error(404, "Not found.")
+        try:
+            length = int(self.headers.get('Content-Length') or 0)
+            body = json.loads(self.rfile.read(length) or b'{}')
+        except ValueError:
+            return self._error(400, "Body must be JSON.")
+        if not isinstance(body, dict):
+            return self._error(400, "Body must be a JSON object.")
+        if not body.get('url') or not isinstance(body['url'], str):
+            return self._error(400, "Missing 'url'.")
+        format_type = body.get('format', 'mp3')
+        if not isinstance(format_type, str) or format_type not in PROFILES:
+            return self._error(400, f"Unsupported 'format'; expected one of: {', '.join(PROFILES)}.")
+        title = body.get('title')
+        if title is not None and not isinstance(title, str):
+            return self._error(400, "'title' must be a string.")
+        job = self.service.download(body['url'], format_type, title=title)
+        self._send_json(202, _job_to_dict(job))
+
+    def do_DELETE(self):
+        parts = [p for p in urlparse(self.path).path.split('/') if p]
+        if len(parts) != 2 or parts[0] != 'downloads':
+            return self._error(404, "Not found.")
+        job = self._job_from_path(parts)
+        if job:
+            self.service.downloads.cancel(job.job_id)
+            self._send_json(200, _job_to_dict(job))
+
+    def _stream_events(self, job):
+        """Streams progress events until the job finishes (or the client disconnects)."""
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/event-stream')
+        self.send_header('Cache-Control', 'no-cache')
+        self.send_header('Connection', 'close')
+        self.end_headers()
+        self.close_connection = True
+        version = 0
+        job_id = job.job_id if job else None
+        try:
+            while True:
+                version, events = self.service.hub.wait(version, job_id=job_id)
+                if not events:
+                    self.wfile.write(b": keep-alive\n\n")
+                for event in events:
+                    self.wfile.write(f"event: progress\ndata: {json.dumps(event)}\n\n".encode('utf-8'))
+                self.wfile.flush()
+                if job is not None and (any(e.get('job_status') in FINAL_STATES for e in events)
+                                        or (not events and job.status in FINAL_STATES)):
+                    return
+        except (BrokenPipeError, ConnectionResetError):
+            pass # Client went away
+
+class MusicServer(ThreadingHTTPServer):
+    """Threaded HTTP server with one MusicService shared by all requests."""
+
+    daemon_threads = True
+    request_queue_size = 128 # Listen backlog; the default of 5 drops connections under bursts
+
+    def __init__(self, address, service=None, verbose=False):
+        super().__init__(address, MusicRequestHandler)
+        self.service = service or MusicService()
+        self.verbose = verbose
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Serve search, stream resolution and downloads over HTTP/JSON.")
+    parser.add_argument('--host', default='127.0.0.1', help="Address to listen on.")
+    parser.add_argument('--port', type=int, default=8765, help="Port to listen on.")
+    parser.add_argument('-o', '--output', default='downloads', help="Download directory.")
+    parser.add_argument('-j', '--workers', type=int, default=3, help="Number of parallel downloads.")
+    parser.add_argument('-v', '--verbose', action='store_true', help="Log every request.")
+    parser.add_argument('--metrics', action='store_true',
+                        help="Record telemetry for /metrics (also enabled by PD_MUSIC_TELEMETRY=1).")
+    args = parser.parse_args(argv)
+    if args.metrics:
+        telemetry.enabled = True
+
+    server = MusicServer((args.host, args.port),
+                         MusicService(download_workers=args.workers, output_path=args.output), verbose=args.verbose)
+    print(f"Serving on http://{args.host}:{args.port} (Ctrl+C to stop)")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        print("\nShutting down...")
+    finally:
+        server.service.close()
+        server.server_close()
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,251 @@
+# stream_cache.py
+
+import re
+import threading
+import time
+import urllib.error
+import urllib.request
+from collections import OrderedDict
+from urllib.parse import urlparse, parse_qs
+
+from youtube_search import extract_video_id
+from telemetry import telemetry
+
+DEFAULT_TTL = 60 * 60       # Assumed lifetime of a URL without an 'expire' parameter
+REFRESH_MARGIN = 10 * 60    # Refresh in the background when less than this is left
+EXPIRY_SAFETY = 30          # Treat URLs as expired this many seconds early
+PROBE_TIMEOUT = 3           # Seconds to wait when checking a cached URL is still accepted
+
+_EXPIRE_PATH_RE = re.compile(r'/expire/(\d+)')
+
+def parse_expiry(stream_url, default_ttl=DEFAULT_TTL):
+    """
+    Reads the expiry timestamp from a signed googlevideo stream URL.
+
+    Args:
+        stream_url (str): The direct stream URL.
+        default_ttl (float): Lifetime to assume if the URL carries no expiry.
+
+    Returns:
+        float: Unix timestamp after which the URL should no longer be used.
+    """
+    parsed = urlparse(stream_url)
+    expire = parse_qs(parsed.query).get('expire', [None])[0]
+    if expire is None:
+        match = _EXPIRE_PATH_RE.search(parsed.path) # HLS/DASH manifests put it in the path
+        expire = match.group(1) if match else None
+    try:
+        return float(expire)
+    except (TypeError, ValueError):
+        return time.time() + default_ttl
+
+def is_stream_url_alive(stream_url, timeout=PROBE_TIMEOUT, headers=None):
+    """
+    Checks that a stream URL is still accepted by requesting its first byte.
+
+    Only a 403/404/410 response counts as dead; other failures are left to the player.
+
+    Args:
+        stream_url (str): The direct stream URL.
+        timeout (float): Request timeout in seconds.
+        headers (dict, optional): The HTTP headers yt_dlp resolved the URL with ('http_headers');
+                                  googlevideo may reject requests without them.
+
+    Returns:
+        bool: False if the server rejected the URL, True otherwise.
+    """
+    request = urllib.request.Request(stream_url, headers=dict(headers or {}, Range='bytes=0-0'))
+    try:
+        with urllib.request.urlopen(request, timeout=timeout):
+            return True
+    except urllib.error.HTTPError as e:
+        return e.code not in (403, 404, 410)
+    except (urllib.error.URLError, OSError, ValueError):
+        return True
+
+class StreamURLCache:
+    """
+    Cache of resolved stream URLs keyed by video id.
+
+    Entries expire at the timestamp embedded in the signed URL, and a hit is
+    trusted until then without touching the network. Only an entry used close
+    to its expiry, or one requested with verify=True, is probed first; if
+    the server rejects it with a 403 it is dropped and resolved again. Near its
+    expiry the still-valid URL is returned and a fresh one is resolved in the
+    background. Concurrent misses for the same video share one resolve.
+    """
+
+    def __init__(self, resolver, max_entries=256, refresh_margin=REFRESH_MARGIN, probe=True):
+        """
+        Args:
+            resolver (callable): resolver(video_url) -> dict with at least a 'url' key.
+                                 May raise; errors propagate to the caller of resolve().
+            max_entries (int): Maximum number of cached entries (least recently used are dropped).
+            refresh_margin (float): Seconds before expiry at which a background refresh starts.
+            probe (bool): Whether to check cached URLs that are near expiry or requested with
+                          verify=True for a 403 before handing them out.
+        """
+        self.resolver = resolver
+        self.max_entries = max_entries
+        self.refresh_margin = refresh_margin
+        self.probe = probe
+        self.hits = 0
+        self.misses = 0
+        self.refreshes = 0
+        self.rejected = 0
+        self._entries = OrderedDict() # key -> stream info dict (with 'expires')
+        self._refreshing = set()
+        self._resolving = {} # key -> [threading.Event, info, error] of the resolve in flight
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def key_for(video_url):
+        """Returns the cache key (the video id when it can be determined) for a URL."""
+        return extract_video_id(video_url) or video_url
+
+    def get(self, video_url):
+        """
+        Returns a cached, unexpired stream info dict for a video without resolving.
+
+        Args:
+            video_url (str): The YouTube video URL or id.
+
+        Returns:
+            dict or None: The cached stream info, or None.
+        """
+        key = self.key_for(video_url)
+        with self._lock:
+            info = self._entries.get(key)
+            if info is None:
+                return None
+            if time.time() >= info['expires'] - EXPIRY_SAFETY:
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return info
+
+    def put(self, video_url, info):
+        """
+        Stores a resolved stream info dict, stamping its expiry from the URL.
+
+        Args:
+            video_url (str): The YouTube video URL or id.
+            info (dict): Stream information with at least a 'url' key.
+
+        Returns:
+            dict: The stored info dict (with 'expires' and 'resolved_at' set).
+        """
+        info = dict(info)
+        info.setdefault('expires', parse_expiry(info['url']))
+        info['resolved_at'] = time.time()
+        key = self.key_for(video_url)
+        with self._lock:
+            self._entries[key] = info
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return info
+
+    def invalidate(self, video_url):
+        """Drops the cached entry for a video, if any."""
+        with self._lock:
+            self._entries.pop(self.key_for(video_url), None)
+
+    def resolve(self, video_url, force_refresh=False, verify=False):
+        """
+        Returns stream info for a video, from the cache when possible.
+
+        Args:
+            video_url (str): The YouTube video URL or id.
+            force_refresh (bool): Skip the cache and resolve again.
+            verify (bool): Probe a cached URL however far it is from expiry, and resolve again if
+                           the server rejects it. For URLs handed straight to a player, which
+                           cannot recover from a 403 on its own.
+
+        Returns:
+            dict: Stream info with 'url' and 'expires' keys, plus 'cached' (bool).
+        """
+        info = None if force_refresh else self.get(video_url)
+        if info is not None and self.probe and (verify or self._near_expiry(info)):
+            if not is_stream_url_alive(info['url'], headers=info.get('http_headers')):
+                print("Cached stream URL was rejected by the server, resolving again.")
+                with self._lock:
+                    self.rejected += 1
+                telemetry.count('cache_requests_total', cache='stream', result='rejected')
+                self.invalidate(video_url)
+                info = None
+
+        if info is not None:
+            with self._lock:
+                self.hits += 1
+            telemetry.count('cache_requests_total', cache='stream', result='hit')
+            if self._near_expiry(info):
+                self._refresh_in_background(video_url)
+            return dict(info, cached=True)
+
+        with self._lock:
+            self.misses += 1
+        telemetry.count('cache_requests_total', cache='stream', result='miss')
+        return dict(self._resolve_once(video_url), cached=False)
+
+    def _near_expiry(self, info):
+        return info['expires'] - time.time() < self.refresh_margin
+
+    def _resolve_once(self, video_url):
+        """Resolves and caches a video; callers arriving while it is in flight wait for its result."""
+        key = self.key_for(video_url)
+        with self._lock:
+            pending = self._resolving.get(key)
+            owner = pending is None
+            if owner:
+                pending = self._resolving[key] = [threading.Event(), None, None]
+        if not owner:
+            pending[0].wait()
+            if pending[2] is not None:
+                raise pending[2]
+            return pending[1]
+        try:
+            pending[1] = self.put(video_url, self.resolver(video_url))
+            return pending[1]
+        except BaseException as e:
+            pending[2] = e
+            raise
+        finally:
+            with self._lock:
+                del self._resolving[key]
+            pending[0].set()
+
+    def _refresh_in_background(self, video_url):
+        key = self.key_for(video_url)
+        with self._lock:
+            if key in self._refreshing:
+                return
+            self._refreshing.add(key)
+            self.refreshes += 1
+
+        def refresh():
+            try:
+                self.put(video_url, self.resolver(video_url))
+            except Exception as e:
+                print(f"Background refresh of stream URL failed: {e}")
+            finally:
+                with self._lock:
+                    self._refreshing.discard(key)
+
+        threading.Thread(target=refresh, daemon=True).start()
+
+    def stats(self):
+        """
+        Returns:
+            dict: 'hits', 'misses', 'refreshes', 'rejected', 'entries' and 'hit_rate'.
+        """
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'refreshes': self.refreshes,
+                'rejected': self.rejected,
+                'entries': len(self._entries),
+                'hit_rate': self.hits / total if total else 0.0,
+            }
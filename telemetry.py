@@ -0,0 +1,263 @@
+# telemetry.py
+
+import atexit
+import json
+import os
+import threading
+import time
+from bisect import bisect_left
+
+# Latency buckets in seconds, from sub-millisecond cache hits to multi-minute downloads
+DEFAULT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 300)
+
+def _label_key(labels):
+    return tuple(sorted(labels.items())) if labels else ()
+
+def _format_labels(key, extra=None):
+    items = list(key) + (list(extra.items()) if extra else [])
+    if not items:
+        return ""
+    escaped = (str(v).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for _, v in items)
+    return "{" + ",".join(f'{k}="{v}"' for (k, _), v in zip(items, escaped)) + "}"
+
+class _NoopSpan:
+    """Returned by span() while telemetry is disabled; does nothing."""
+
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+    def set(self, **attributes):
+        pass
+
+_NOOP_SPAN = _NoopSpan()
+
+class Span:
+    """
+    A timed operation. Used as a context manager; on exit its duration is added
+    to the '<name>_seconds' histogram and, if a trace file is configured, the
+    span is appended to it as one JSON line.
+    """
+
+    __slots__ = ('telemetry', 'name', 'attributes', 'start_ns', 'trace_id', 'span_id', 'parent_id')
+
+    def __init__(self, telemetry, name, attributes):
+        self.telemetry = telemetry
+        self.name = name
+        self.attributes = attributes
+
+    def __enter__(self):
+        parent = self.telemetry._current()
+        self.trace_id = parent.trace_id if parent else os.urandom(16).hex()
+        self.span_id = os.urandom(8).hex()
+        self.parent_id = parent.span_id if parent else None
+        self.telemetry._push(self)
+        self.start_ns = time.time_ns()
+        return self
+
+    def set(self, **attributes):
+        """Adds attributes (e.g. bytes transferred, cache hit) to the span."""
+        self.attributes.update(attributes)
+
+    def __exit__(self, exc_type, exc, tb):
+        end_ns = time.time_ns()
+        self.telemetry._pop(self)
+        status = 'error' if exc_type else 'ok'
+        self.telemetry.observe(f"{self.name}_seconds", (end_ns - self.start_ns) / 1e9, status=status)
+        if exc_type is not None:
+            self.attributes['error'] = f"{exc_type.__name__}: {exc}"
+        self.telemetry._export_span(self, end_ns, status)
+        return False
+
+class Telemetry:
+    """
+    In-process counters, histograms and spans.
+
+    Instrumented code calls count(), observe() and span() unconditionally. While
+    telemetry is disabled these return immediately (span() hands back a shared
+    no-op object), so the cost is one attribute check per call. Metrics are
+    exported in the Prometheus text format by prometheus_text() or
+    write_prometheus(). Spans can be appended to a JSON-lines file whose
+    records use OpenTelemetry field names (traceId, spanId, parentSpanId,
+    startTimeUnixNano, ...), so they can be loaded by OTLP/JSON tooling.
+    """
+
+    def __init__(self, enabled=False, trace_path=None, prefix="pd_music_"):
+        """
+        Args:
+            enabled (bool): Record anything at all.
+            trace_path (str, optional): JSON-lines file spans are appended to.
+            prefix (str): Prefix of every exported metric name.
+        """
+        self.enabled = enabled
+        self.trace_path = trace_path
+        self.prefix = prefix
+        self._lock = threading.Lock()
+        self._counters = {} # (name, label key) -> value
+        self._histograms = {} # (name, label key) -> [bucket counts..., sum, count]
+        self._local = threading.local()
+        self._trace_file = None
+
+    # --- Recording ---
+
+    def count(self, name, value=1, **labels):
+        """Adds `value` to the counter `name` (e.g. 'cache_hits_total', 'bytes_total')."""
+        if not self.enabled:
+            return
+        key = (name, _label_key(labels))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def observe(self, name, value, **labels):
+        """Records one sample (e.g. a latency in seconds) in the histogram `name`."""
+        if not self.enabled:
+            return
+        key = (name, _label_key(labels))
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = [0] * (len(DEFAULT_BUCKETS) + 1) + [0.0, 0]
+            histogram[bisect_left(DEFAULT_BUCKETS, value)] += 1
+            histogram[-2] += value
+            histogram[-1] += 1
+
+    def span(self, name, **attributes):
+        """
+        Returns a context manager timing the enclosed block as `name`.
+
+        Example:
+            with telemetry.span('extract_info', url=url) as span:
+                info = ...
+                span.set(formats=len(info['formats']))
+        """
+        if not self.enabled:
+            return _NOOP_SPAN
+        return Span(self, name, attributes)
+
+    # --- Span bookkeeping ---
+
+    def _current(self):
+        stack = getattr(self._local, 'stack', None)
+        return stack[-1] if stack else None
+
+    def _push(self, span):
+        stack = getattr(self._local, 'stack', None)
+        if stack is None:
+            stack = self._local.stack = []
+        stack.append(span)
+
+    def _pop(self, span):
+        stack = self._local.stack
+        if stack and stack[-1] is span:
+            stack.pop()
+
+    def _export_span(self, span, end_ns, status):
+        if not self.trace_path:
+            return
+        record = {
+            'traceId': span.trace_id,
+            'spanId': span.span_id,
+            'parentSpanId': span.parent_id or "",
+            'name': span.name,
+            'startTimeUnixNano': span.start_ns,
+            'endTimeUnixNano': end_ns,
+            'status': {'code': 'STATUS_CODE_ERROR' if status == 'error' else 'STATUS_CODE_OK'},
+            'attributes': span.attributes,
+            'thread': threading.current_thread().name,
+        }
+        line = json.dumps(record, default=str) + "\n"
+        with self._lock:
+            if self._trace_file is None:
+                self._trace_file = open(self.trace_path, "a", encoding="utf-8")
+            self._trace_file.write(line)
+            self._trace_file.flush()
+
+    # --- Export ---
+
+    def snapshot(self):
+        """
+        Returns:
+            dict: 'counters' and 'histograms' ('count', 'sum' and per-bucket counts), keyed by
+                  'name{labels}'.
+        """
+        with self._lock:
+            counters = {name + _format_labels(key): value for (name, key), value in self._counters.items()}
+            histograms = {name + _format_labels(key): {'count': h[-1], 'sum': h[-2], 'buckets': h[:-2]}
+                          for (name, key), h in self._histograms.items()}
+        return {'counters': counters, 'histograms': histograms}
+
+    def prometheus_text(self):
+        """Renders every counter and histogram in the Prometheus text exposition format."""
+        lines = []
+        with self._lock:
+            counters = sorted(self._counters.items())
+            histograms = sorted((key, list(h)) for key, h in self._histograms.items())
+        typed = set()
+        for (name, key), value in counters:
+            metric = self.prefix + name
+            if metric not in typed:
+                lines.append(f"# TYPE {metric} counter")
+                typed.add(metric)
+            lines.append(f"{metric}{_format_labels(key)} {value}")
+        for (name, key), h in histograms:
+            metric = self.prefix + name
+            if metric not in typed:
+                lines.append(f"# TYPE {metric} histogram")
+                typed.add(metric)
+            cumulative = 0
+            for bound, count in zip(DEFAULT_BUCKETS, h):
+                cumulative += count
+                lines.append(f"{metric}_bucket{_format_labels(key, {'le': bound})} {cumulative}")
+            lines.append(f"{metric}_bucket{_format_labels(key, {'le': '+Inf'})} {h[-1]}")
+            lines.append(f"{metric}_sum{_format_labels(key)} {h[-2]}")
+            lines.append(f"{metric}_count{_format_labels(key)} {h[-1]}")
+        return "\n".join(lines) + "\n"
+
+    def write_prometheus(self, path):
+        """Writes prometheus_text() to `path` atomically (for node_exporter's textfile collector)."""
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            f.write(self.prometheus_text())
+        os.replace(tmp_path, path)
+
+    def reset(self):
+        """Clears all recorded metrics."""
+        with self._lock:
+            self._counters.clear()
+            self._histograms.clear()
+
+    def close(self):
+        with self._lock:
+            if self._trace_file is not None:
+                self._trace_file.close()
+                self._trace_file = None
+
+def _from_environment():
+    """
+    Builds the process-wide instance from the environment:
+        PD_MUSIC_TELEMETRY=1           enables metrics
+        PD_MUSIC_TRACE_FILE=path       also appends spans to a JSON-lines file (implies enabled)
+        PD_MUSIC_METRICS_FILE=path     writes Prometheus text to `path` at exit (implies enabled)
+    """
+    trace_path = os.environ.get("PD_MUSIC_TRACE_FILE") or None
+    metrics_path = os.environ.get("PD_MUSIC_METRICS_FILE") or None
+    enabled = (os.environ.get("PD_MUSIC_TELEMETRY", "").lower() in ("1", "true", "yes")
+               or bool(trace_path or metrics_path))
+    instance = Telemetry(enabled=enabled, trace_path=trace_path)
+    if metrics_path:
+        atexit.register(instance.write_prometheus, metrics_path)
+    atexit.register(instance.close)
+    return instance
+
+telemetry = _from_environment()
+
+def get_telemetry():
+    """
+    Returns:
+        Telemetry: The process-wide instance used by the instrumented modules.
+    """
+    return telemetry
@@ -0,0 +1,41 @@
+# conftest.py
+
+import os
+import sys
+
+import pytest
+
+# The application modules live at the repository root rather than in a package
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import audio_cache
+import download_archive
+import media_library
+import search_cache
+
+@pytest.fixture(autouse=True)
+def isolated_dirs(tmp_path, monkeypatch):
+    """
+    Points the application's cache directory at a per-test temporary directory,
+    and makes the process-wide caches, archive and library start empty there.
+    """
+    monkeypatch.setenv('PD_MUSIC_CACHE_DIR', str(tmp_path / "cache"))
+    monkeypatch.setattr(search_cache, '_default_cache', None)
+    monkeypatch.setattr(audio_cache, '_default_cache', None)
+    monkeypatch.setattr(download_archive, '_default_archive', None)
+    monkeypatch.setattr(media_library, '_default_library', None)
+    return tmp_path
+
+@pytest.fixture
+def fake_extractor(monkeypatch):
+    """Installs a FakeExtractor with a fresh stream cache; yields the extractor (its server is .server)."""
+    import music_player
+    from extractor import FakeExtractor, set_extractor
+    from stream_cache import StreamURLCache
+
+    extractor = FakeExtractor(media_size=256 * 1024)
+    previous = set_extractor(extractor)
+    monkeypatch.setattr(music_player, '_stream_cache', StreamURLCache(music_player.resolve_stream))
+    yield extractor
+    set_extractor(previous)
+    extractor.server.stop()
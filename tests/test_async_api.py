@@ -0,0 +1,58 @@
+# test_async_api.py
+
+import asyncio
+import builtins
+import functools
+import os
+import threading
+
+import pytest
+
+import async_api
+import main
+from async_api import AsyncMusicAPI, get_async_api
+from bulk_download import resolve_items
+from extractor import fake_video_id
+from media_library import get_media_library
+from music_player import download_media
+
+@pytest.fixture
+def shared_api(monkeypatch):
+    api = AsyncMusicAPI(max_concurrency=4)
+    monkeypatch.setattr(async_api, '_default_api', api)
+    yield api
+    api.close()
+
+def test_get_async_api_returns_one_instance(shared_api):
+    assert get_async_api() is shared_api is get_async_api()
+
+def test_bulk_resolution_runs_on_the_shared_api(shared_api, monkeypatch):
+    lock = threading.Lock()
+    state = {'running': 0, 'peak': 0}
+
+    def search(query, max_results=5):
+        with lock:
+            state['running'] += 1
+            state['peak'] = max(state['peak'], state['running'])
+        threading.Event().wait(0.05)
+        with lock:
+            state['running'] -= 1
+        return [{'id': query, 'url': f"https://www.youtube.com/watch?v={query}", 'title': query}]
+
+    monkeypatch.setattr(async_api, 'search_youtube_music', search)
+    items = [{'source': f"query {i}", 'format': 'mp3'} for i in range(8)]
+    resolved = asyncio.run(resolve_items(items, concurrency=2))
+    assert [r['id'] for r in resolved] == [item['source'] for item in items]
+    assert state['peak'] == 2 # The batch's own cap, within the shared limiter
+    assert len(shared_api._limiters) <= 1 # The finished loop's limiter is dropped with it
+
+def test_cli_searches_and_downloads_on_the_event_loop(shared_api, fake_extractor, tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    answers = iter(["night drive", "2d", "b", "q"])
+    monkeypatch.setattr(builtins, 'input', lambda prompt="": next(answers))
+    # The single-stream path converts with the fake extractor instead of FFmpeg
+    monkeypatch.setattr(async_api, 'download_media', functools.partial(download_media, resumable=False))
+    main.main()
+    entry = get_media_library().find(fake_video_id("night drive", 1), 'mp3')
+    assert entry and os.listdir(tmp_path / "downloads") == [os.path.basename(entry['path'])]
+    assert next(answers, None) is None # Every prompt was consumed
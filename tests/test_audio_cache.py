@@ -0,0 +1,155 @@
+# test_audio_cache.py
+
+import os
+import threading
+import urllib.error
+import urllib.request
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+import audio_cache
+from audio_cache import AudioCache, AudioCacheProxy
+
+PAYLOAD = bytes(range(256)) * 1024 # 256 KiB
+
+class Upstream(ThreadingHTTPServer):
+    """
+    Stream server that records request headers; paths under /expired/ answer 403 and
+    paths under /stalled/ hang until `release` is set.
+    """
+
+    daemon_threads = True
+
+    def __init__(self):
+        super().__init__(('127.0.0.1', 0), _UpstreamHandler)
+        self.requests = []
+        self.release = threading.Event()
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+
+    @property
+    def base_url(self):
+        return f"http://127.0.0.1:{self.server_address[1]}"
+
+class _UpstreamHandler(BaseHTTPRequestHandler):
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        self.server.requests.append((self.path, dict(self.headers)))
+        if self.path.startswith('/expired/'):
+            self.send_response(403)
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+            return
+        if self.path.startswith('/stalled/'):
+            self.server.release.wait(5)
+        self.send_response(200)
+        self.send_header('Content-Type', 'audio/webm')
+        self.send_header('Content-Length', str(len(PAYLOAD)))
+        self.end_headers()
+        self.wfile.write(PAYLOAD)
+
+@pytest.fixture
+def upstream():
+    server = Upstream()
+    yield server
+    server.release.set()
+    server.shutdown()
+    server.server_close()
+
+def fill(cache, video_id, data, content_type='audio/webm'):
+    f = cache.begin_fill(video_id, content_type)
+    f.write(data)
+    return f.commit()
+
+def fetch(url, headers=None):
+    with urllib.request.urlopen(urllib.request.Request(url, headers=headers or {}), timeout=5) as response:
+        return response.status, dict(response.headers), response.read()
+
+def test_fill_lookup_and_lru_eviction(tmp_path):
+    cache = AudioCache(str(tmp_path / "audio"), max_bytes=250)
+    assert fill(cache, "a", b"x" * 100) and fill(cache, "b", b"y" * 100)
+    assert cache.lookup("a").endswith("a.webm") # 'a' becomes the most recently used
+    assert fill(cache, "c", b"z" * 100)
+    assert cache.lookup("b", record=False) is None
+    assert cache.lookup("a", record=False) and cache.lookup("c", record=False)
+    stats = cache.stats()
+    assert stats['evictions'] == 1 and stats['bytes'] == 200 and stats['hits'] == 1
+
+def test_empty_and_oversized_fills_are_not_kept(tmp_path):
+    cache = AudioCache(str(tmp_path / "audio"), max_bytes=10)
+    assert not fill(cache, "empty", b"")
+    assert not fill(cache, "huge", b"x" * 11)
+    assert cache.lookup("empty", record=False) is None
+    assert os.listdir(cache.directory) == []
+    assert cache.begin_fill("empty") is not None # Not stuck as 'filling'
+
+def test_scan_drops_partial_and_empty_files(tmp_path):
+    directory = tmp_path / "audio"
+    directory.mkdir()
+    (directory / "keep.webm").write_bytes(b"data")
+    (directory / "empty.webm").write_bytes(b"")
+    (directory / "half.webm.part").write_bytes(b"da")
+    cache = AudioCache(str(directory))
+    assert cache.lookup("keep", record=False)
+    assert cache.lookup("empty", record=False) is None
+    assert sorted(os.listdir(directory)) == ["keep.webm"]
+
+def test_proxy_serves_cached_track_with_ranges(tmp_path):
+    cache = AudioCache(str(tmp_path / "audio"))
+    fill(cache, "cached", PAYLOAD)
+    proxy = AudioCacheProxy(lambda video_id, force: pytest.fail("resolved a cached track"), cache=cache).start()
+    try:
+        status, _, body = fetch(proxy.url_for("cached"))
+        assert status == 200 and body == PAYLOAD
+        status, headers, body = fetch(proxy.url_for("cached"), {'Range': 'bytes=10-19'})
+        assert status == 206 and body == PAYLOAD[10:20]
+        assert headers['Content-Range'] == f"bytes 10-19/{len(PAYLOAD)}"
+        with pytest.raises(urllib.error.HTTPError) as raised:
+            fetch(proxy.url_for("cached"), {'Range': f'bytes={len(PAYLOAD)}-'})
+        assert raised.value.code == 416
+        assert proxy.stats()['bytes_from_network'] == 0
+    finally:
+        proxy.stop()
+
+def test_proxy_relays_with_stream_headers_and_fills_cache(tmp_path, upstream):
+    cache = AudioCache(str(tmp_path / "audio"))
+    calls = []
+    def resolve(video_id, force_refresh):
+        calls.append(force_refresh)
+        path = "/media/" if force_refresh else "/expired/"
+        return {'url': f"{upstream.base_url}{path}{video_id}", 'http_headers': {'User-Agent': 'pd-test/1.0'}}
+    proxy = AudioCacheProxy(resolve, cache=cache).start()
+    try:
+        status, _, body = fetch(proxy.url_for("vid1"))
+        assert status == 200 and body == PAYLOAD
+    finally:
+        proxy.stop()
+    assert calls == [False, True] # The 403 forced one fresh resolve
+    assert [path for path, _ in upstream.requests] == ["/expired/vid1", "/media/vid1"]
+    assert all(headers['User-Agent'] == 'pd-test/1.0' for _, headers in upstream.requests)
+    path = cache.lookup("vid1", record=False)
+    assert path.endswith("vid1.webm")
+    with open(path, "rb") as f:
+        assert f.read() == PAYLOAD
+
+def test_stalled_upstream_times_out(tmp_path, upstream, monkeypatch):
+    monkeypatch.setattr(audio_cache, 'UPSTREAM_TIMEOUT', 0.2)
+    resolve = lambda video_id, force_refresh: {'url': f"{upstream.base_url}/stalled/{video_id}"}
+    proxy = AudioCacheProxy(resolve, cache=AudioCache(str(tmp_path / "audio"))).start()
+    try:
+        with pytest.raises(urllib.error.HTTPError) as raised:
+            fetch(proxy.url_for("vid1"))
+        assert raised.value.code == 502
+    finally:
+        proxy.stop()
+
+def test_proxy_rejects_unknown_paths(tmp_path):
+    proxy = AudioCacheProxy(lambda *args: None, cache=AudioCache(str(tmp_path / "audio"))).start()
+    try:
+        with pytest.raises(urllib.error.HTTPError) as raised:
+            fetch(f"{proxy.base_url}/audio/../etc/passwd")
+        assert raised.value.code == 404
+    finally:
+        proxy.stop()
@@ -0,0 +1,98 @@
+# test_bandwidth.py
+
+import os
+import threading
+import time
+
+import pytest
+
+from bandwidth import BandwidthScheduler, PLAYBACK, DOWNLOAD, parse_rate
+from chunked_download import ChunkedDownloader
+from extractor import FakeMediaServer
+
+MIB = 1024 * 1024
+
+class _Stop(Exception):
+    pass
+
+@pytest.fixture
+def throttled_server():
+    """A media server that limits every connection to 8 MiB/s; two connections outrun any cap below."""
+    server = FakeMediaServer(bandwidth=8 * MIB, media_size=64 * MIB).start()
+    yield server
+    server.stop()
+
+def measure(scheduler, server, tmp_path, jobs, duration=1.0):
+    """
+    Runs chunked downloads of `jobs` ((name, weight, priority)) at once and returns the
+    bytes per second each achieved over `duration`, after a settling period.
+    """
+    stop = threading.Event()
+    peak = [0]
+
+    def check(d):
+        peak[0] = max([peak[0]] + list(scheduler.stats()['connections'].values()))
+        if stop.is_set():
+            raise _Stop()
+
+    def run(downloader):
+        try:
+            downloader.run()
+        except _Stop:
+            pass
+
+    transfers, threads = [], []
+    for name, weight, priority in jobs:
+        transfer = scheduler.open_transfer(name, weight=weight, priority=priority)
+        downloader = ChunkedDownloader(f"{server.base_url}/media/{name}.webm", os.path.join(tmp_path, name),
+                                       connections=2, chunk_size=512 * 1024, progress_callback=check,
+                                       transfer=transfer)
+        transfers.append(transfer)
+        threads.append(threading.Thread(target=run, args=(downloader,), daemon=True))
+    for thread in threads:
+        thread.start()
+    time.sleep(0.5) # Let the connections open and the initial bursts drain
+    before = [t.bytes for t in transfers]
+    time.sleep(duration)
+    rates = [(t.bytes - b) / duration for t, b in zip(transfers, before)]
+    stop.set()
+    for thread in threads:
+        thread.join(5)
+    for transfer in transfers:
+        transfer.close()
+    return rates, peak[0]
+
+@pytest.mark.parametrize("text, expected", [
+    ("750K", 750 * 1024), ("2M", 2 * MIB), ("1.5MiB/s", 1.5 * MIB), ("1g", 1024 * MIB),
+    ("", None), ("0", None), ("none", None),
+])
+def test_parse_rate(text, expected):
+    assert parse_rate(text) == expected
+
+def test_parse_rate_rejects_garbage():
+    with pytest.raises(ValueError):
+        parse_rate("fast")
+
+def test_global_cap_holds_against_a_faster_server(throttled_server, tmp_path):
+    rate = 3 * MIB
+    (achieved,), _ = measure(BandwidthScheduler(rate=rate), throttled_server, tmp_path, [('cap', 1, DOWNLOAD)])
+    assert achieved == pytest.approx(rate, rel=0.15)
+
+def test_concurrent_downloads_share_the_cap_by_weight(throttled_server, tmp_path):
+    # Bytes are charged per 256 KiB read, so the light job needs enough reads for a stable ratio
+    rate = 8 * MIB
+    (light, heavy), _ = measure(BandwidthScheduler(rate=rate), throttled_server, tmp_path,
+                                [('light', 1, DOWNLOAD), ('heavy', 3, DOWNLOAD)], duration=1.5)
+    assert light + heavy == pytest.approx(rate, rel=0.15)
+    assert heavy / light == pytest.approx(3, rel=0.25)
+
+def test_playback_keeps_its_speed_and_hosts_keep_their_slot_limit(throttled_server, tmp_path):
+    rate = 4 * MIB
+    scheduler = BandwidthScheduler(rate=rate, max_per_host=3)
+    scheduler.playback_started('test')
+    (playback, download), peak = measure(scheduler, throttled_server, tmp_path,
+                                         [('playback', 1, PLAYBACK), ('download', 1, DOWNLOAD)])
+    # The stream is served first; the download gets what is left of the cap
+    assert playback > download
+    assert playback + download == pytest.approx(rate, rel=0.15)
+    assert peak <= 3
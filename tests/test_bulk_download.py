@@ -0,0 +1,71 @@
+# test_bulk_download.py
+
+import json
+import os
+
+import pytest
+
+import pipeline
+from bulk_download import main, read_manifest, run_bulk_download
+from extractor import fake_video_id, fake_title
+
+def fake_transcode(path, format_type, profile=None):
+    """Stands in for FFmpeg: renames the raw stream to the target extension."""
+    target = f"{os.path.splitext(path)[0]}.{format_type}"
+    os.replace(path, target)
+    return target
+
+@pytest.fixture(autouse=True)
+def no_ffmpeg(monkeypatch):
+    monkeypatch.setattr(pipeline, 'transcode', fake_transcode)
+
+def watch_url(video_id):
+    return f"https://www.youtube.com/watch?v={video_id}"
+
+def test_read_text_and_csv_manifests(tmp_path):
+    text = tmp_path / "list.txt"
+    text.write_text("# favourites\nnight drive\n\n  https://youtu.be/dQw4w9WgXcQ  \n", encoding="utf-8")
+    assert read_manifest(str(text), default_format='opus') == [
+        {'source': "night drive", 'format': 'opus'},
+        {'source': "https://youtu.be/dQw4w9WgXcQ", 'format': 'opus'},
+    ]
+    table = tmp_path / "list.csv"
+    table.write_text("Query,URL,Format\nnight drive,,m4a\n,https://youtu.be/dQw4w9WgXcQ,\n,,mp4\n", encoding="utf-8")
+    assert read_manifest(str(table)) == [
+        {'source': "night drive", 'format': 'm4a'},
+        {'source': "https://youtu.be/dQw4w9WgXcQ", 'format': 'mp3'},
+    ]
+
+def test_duplicates_are_downloaded_once_and_failures_reported(fake_extractor, tmp_path):
+    video_id = fake_video_id("night drive", 0)
+    items = [
+        {'source': "night drive", 'format': 'mp3'},
+        {'source': watch_url(video_id), 'format': 'mp3'}, # The same video as the search's top result
+        {'source': watch_url(video_id), 'format': 'm4a'}, # ...in another format is another download
+        {'source': "https://www.youtube.com/playlist?list=PL123", 'format': 'mp3'},
+    ]
+    # One fetch worker: both formats of the video fetch the same raw stream file
+    report = run_bulk_download(items, output_path=str(tmp_path / "out"), download_workers=1, transcode_workers=1)
+    summary = report['summary']
+    assert summary['items'] == 4 and summary['unique_downloads'] == 2
+    assert summary['duplicates'] == 1 and summary['completed'] == 2 and summary['failed'] == 1
+    first, duplicate, other_format, bad = report['items']
+    assert first['id'] == video_id and first['title'] == fake_title(video_id)
+    assert first['status'] == 'completed' and first['path'].endswith(".mp3") and first['bytes'] > 0
+    assert duplicate['duplicate_of'] == fake_title(video_id) and 'status' not in duplicate
+    assert other_format['path'].endswith(".m4a")
+    assert bad['error'] == "Could not determine a video id from the URL."
+    assert set(first['stage_ms']) >= {'queued', 'fetch', 'transcode'}
+
+def test_main_writes_the_report_and_signals_failures(fake_extractor, tmp_path):
+    manifest = tmp_path / "list.txt"
+    manifest.write_text("night drive\n", encoding="utf-8")
+    report_path = tmp_path / "report.json"
+    argv = [str(manifest), '-o', str(tmp_path / "out"), '-r', str(report_path), '--transcode-workers', '1']
+    assert main(argv) == 0
+    assert json.loads(report_path.read_text(encoding="utf-8"))['summary']['completed'] == 1
+
+    manifest.write_text("https://example.com/not-a-video\n", encoding="utf-8")
+    assert main(argv) == 2
+    manifest.write_text("# nothing\n", encoding="utf-8")
+    assert main(argv) == 1
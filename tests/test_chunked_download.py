@@ -0,0 +1,220 @@
+# test_chunked_download.py
+
+import json
+import os
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+
+import pytest
+
+from chunked_download import ChunkedDownloader, ChunkedDownloadError
+
+CHUNK = 64 * 1024
+CONTENT = os.urandom(CHUNK * 5 + 1234)
+
+class RangeServer(ThreadingHTTPServer):
+    """
+    Serves CONTENT at /file?token=<t> with Range support and injected faults.
+
+    Attributes:
+        tokens (set): Accepted tokens; any other token gets 403, like an expired signed URL.
+        drops (dict): Range start -> number of times to close the connection half-way through that range.
+        ranges (list): (token, range start) of every range request, probes included.
+        expire_at (int): Range start whose request expires the 'good' token (None: never).
+    """
+
+    daemon_threads = True
+
+    def __init__(self):
+        super().__init__(('127.0.0.1', 0), _RangeHandler)
+        self.tokens = {'good'}
+        self.drops = {}
+        self.ranges = []
+        self.expire_at = None
+        self.headers_seen = []
+        self.lock = threading.Lock()
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+
+    def url(self, token='good'):
+        return f"http://127.0.0.1:{self.server_address[1]}/file?token={token}"
+
+class _RangeHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        server = self.server
+        token = parse_qs(urlparse(self.path).query).get('token', [''])[0]
+        first, _, last = self.headers['Range'][len('bytes='):].partition('-')
+        start, end = int(first), min(int(last), len(CONTENT) - 1)
+        with server.lock:
+            server.ranges.append((token, start))
+            server.headers_seen.append(self.headers.get('X-Token'))
+            drop = start > 0 and server.drops.get(start, 0) > 0
+            if drop:
+                server.drops[start] -= 1
+            if start == server.expire_at:
+                server.tokens.discard('good')
+        if token not in server.tokens:
+            self.send_response(403)
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+            return
+        self.send_response(206)
+        self.send_header('Content-Range', f"bytes {start}-{end}/{len(CONTENT)}")
+        self.send_header('Content-Length', str(end - start + 1))
+        self.end_headers()
+        body = CONTENT[start:end + 1]
+        if drop:
+            self.wfile.write(body[:len(body) // 2])
+            self.wfile.flush()
+            self.close_connection = True
+            return
+        self.wfile.write(body)
+
+@pytest.fixture
+def server():
+    server = RangeServer()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+def downloader(server, dest, **kwargs):
+    options = dict(connections=2, chunk_size=CHUNK, backoff=0.01, resume_key="video-251", timeout=5)
+    options.update(kwargs)
+    return ChunkedDownloader(options.pop('url', server.url()), str(dest), **options)
+
+def data_ranges(server):
+    return sorted(start for _, start in server.ranges if start > 0) # Range 0 is also the probe
+
+def test_download_in_ranges_reports_only_intermediate_progress(server, tmp_path):
+    statuses = []
+    dest = tmp_path / "song.webm"
+    assert downloader(server, dest, progress_callback=lambda d: statuses.append(d)).run() == str(dest)
+    assert dest.read_bytes() == CONTENT
+    assert not os.path.exists(f"{dest}.part") and not os.path.exists(f"{dest}.state.json")
+    assert {d['status'] for d in statuses} == {'downloading'}
+    assert statuses[-1]['downloaded_bytes'] == len(CONTENT)
+
+def test_dropped_connection_is_retried(server, tmp_path):
+    server.drops[2 * CHUNK] = 1
+    d = downloader(server, tmp_path / "song.webm")
+    d.run()
+    assert (tmp_path / "song.webm").read_bytes() == CONTENT
+    assert d.retries == 1
+
+def test_resumes_from_state_file_after_dropped_connection(server, tmp_path):
+    dest = tmp_path / "song.webm"
+    server.drops[3 * CHUNK] = 1
+    with pytest.raises(ChunkedDownloadError):
+        downloader(server, dest, connections=1, max_retries=0).run()
+    with open(f"{dest}.state.json", encoding="utf-8") as f:
+        state = json.load(f)
+    assert state['done'] == [0, 1, 2] and state['resume_key'] == "video-251"
+    assert os.path.getsize(f"{dest}.part") == len(CONTENT)
+
+    # A new signed URL for the same resource: only the missing ranges are fetched
+    server.tokens.add('renewed')
+    server.ranges.clear()
+    downloader(server, dest, url=server.url('renewed')).run()
+    assert dest.read_bytes() == CONTENT
+    assert data_ranges(server) == [3 * CHUNK, 4 * CHUNK, 5 * CHUNK]
+    assert not os.path.exists(f"{dest}.state.json")
+
+def test_state_of_another_resource_is_discarded(server, tmp_path):
+    dest = tmp_path / "song.webm"
+    server.drops[3 * CHUNK] = 1
+    with pytest.raises(ChunkedDownloadError):
+        downloader(server, dest, connections=1, max_retries=0).run()
+    server.ranges.clear()
+    downloader(server, dest, resume_key="other-video").run()
+    assert dest.read_bytes() == CONTENT
+    assert data_ranges(server) == [CHUNK, 2 * CHUNK, 3 * CHUNK, 4 * CHUNK, 5 * CHUNK]
+
+def test_expired_url_is_resolved_again_once(server, tmp_path):
+    dest = tmp_path / "song.webm"
+    server.drops[3 * CHUNK] = 1
+    with pytest.raises(ChunkedDownloadError):
+        downloader(server, dest, connections=1, max_retries=0).run()
+    refreshes = []
+    def refresh_url():
+        refreshes.append(1)
+        return server.url('fresh'), {'X-Token': 'fresh-headers'}
+    server.tokens = {'fresh'} # The old URL has expired in the meantime
+    server.ranges.clear()
+    server.headers_seen.clear()
+    d = downloader(server, dest, refresh_url=refresh_url)
+    d.run()
+    assert dest.read_bytes() == CONTENT
+    assert refreshes == [1] and d.refreshed
+    assert server.ranges[0] == ('good', 0) # The probe hit the expired URL...
+    assert all(token == 'fresh' for token, _ in server.ranges[1:]) # ...then only the fresh one was used
+    assert server.headers_seen[-1] == 'fresh-headers'
+
+def test_url_expiring_mid_download_is_resolved_again(server, tmp_path):
+    server.tokens.add('fresh')
+    server.expire_at = 2 * CHUNK
+    refreshes = []
+    def refresh_url():
+        refreshes.append(1)
+        return server.url('fresh'), {}
+    dest = tmp_path / "song.webm"
+    d = downloader(server, dest, connections=3, refresh_url=refresh_url)
+    d.run()
+    assert dest.read_bytes() == CONTENT
+    assert refreshes == [1] # Once, however many connections hit the 403
+    assert ('fresh', 2 * CHUNK) in server.ranges
+
+def test_expired_url_fails_when_the_fresh_one_is_rejected_too(server, tmp_path):
+    server.tokens = set()
+    refreshes = []
+    def refresh_url():
+        refreshes.append(1)
+        return server.url('still-bad'), {}
+    with pytest.raises(ChunkedDownloadError, match="403"):
+        downloader(server, tmp_path / "song.webm", refresh_url=refresh_url).run()
+    assert refreshes == [1]
+
+def test_expired_url_without_refresh_fails(server, tmp_path):
+    server.tokens = set()
+    with pytest.raises(ChunkedDownloadError, match="403"):
+        downloader(server, tmp_path / "song.webm").run()
+
+def test_ranges_are_on_disk_before_they_are_recorded(server, tmp_path, monkeypatch):
+    dest = tmp_path / "song.webm"
+    d = downloader(server, dest)
+    checked = []
+    save_state = d._save_state
+
+    def checking_save_state(size, done):
+        with open(f"{dest}.part", "rb") as f: # A separate handle sees only what reached the OS
+            for index in done:
+                f.seek(index * CHUNK)
+                assert f.read(CHUNK) == CONTENT[index * CHUNK:(index + 1) * CHUNK]
+        checked.append(len(done))
+        save_state(size, done)
+
+    monkeypatch.setattr(d, '_save_state', checking_save_state)
+    d.run()
+    assert max(checked) == 6 # Including the short last range, which fits in the write buffer
+
+def test_host_slots_follow_a_refreshed_url(server, tmp_path):
+    server.tokens = {'fresh'}
+    port = server.server_address[1]
+    d = downloader(server, tmp_path / "song.webm",
+                   refresh_url=lambda: (f"http://localhost:{port}/file?token=fresh", {}))
+    hosts = []
+    host_slot = d.scheduler.host_slot
+
+    def recording_host_slot(host):
+        hosts.append(host)
+        return host_slot(host)
+
+    d.scheduler = type('Scheduler', (), {'host_slot': staticmethod(recording_host_slot)})()
+    d.run()
+    assert (tmp_path / "song.webm").read_bytes() == CONTENT
+    assert hosts[0] == f"127.0.0.1:{port}" # The probe that got the 403
+    assert set(hosts[1:]) == {f"localhost:{port}"}
@@ -0,0 +1,67 @@
+# test_dependency_probe.py
+
+import os
+import subprocess
+import sys
+
+import pytest
+
+from dependency_probe import DependencyProbe, missing_dependency_messages
+from lazy_import import LazyModule, is_loaded
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+@pytest.fixture
+def bin_dir(tmp_path, monkeypatch):
+    """A PATH holding only the fake programs written with install()."""
+    path = tmp_path / "bin"
+    path.mkdir()
+    monkeypatch.setenv('PATH', str(path))
+    return path
+
+def install(bin_dir, name, version, returncode=0):
+    program = bin_dir / name
+    program.write_text(f"#!/bin/sh\necho '{version}'\nexit {returncode}\n")
+    program.chmod(0o755)
+    return program
+
+@pytest.mark.skipif(sys.platform == 'win32', reason="Fake programs are shell scripts")
+def test_results_are_cached_by_path_size_and_mtime(bin_dir, tmp_path):
+    install(bin_dir, 'mpv', "mpv 0.37.0")
+    cache_path = str(tmp_path / "probe.json")
+    probe = DependencyProbe(path=cache_path)
+    first = probe.probe('mpv')
+    assert first == {'available': True, 'path': str(bin_dir / 'mpv'), 'version': "mpv 0.37.0", 'cached': False}
+    assert probe.probe('mpv')['cached'] and probe.runs == 1
+
+    restarted = DependencyProbe(path=cache_path) # A later start reads the answer from disk
+    assert restarted.probe('mpv') == dict(first, cached=True) and restarted.runs == 0
+
+    install(bin_dir, 'mpv', "mpv 0.38.0 (upgraded)") # Another size: the binary was replaced
+    upgraded = restarted.probe('mpv')
+    assert upgraded['version'] == "mpv 0.38.0 (upgraded)" and not upgraded['cached'] and restarted.runs == 1
+    assert len(restarted._entries) == 1 # The entry for the old binary is gone
+
+@pytest.mark.skipif(sys.platform == 'win32', reason="Fake programs are shell scripts")
+def test_missing_and_broken_programs_are_reported(bin_dir):
+    install(bin_dir, 'ffmpeg', "ffmpeg: cannot open shared object file", returncode=127)
+    probe = DependencyProbe(path=False)
+    results = probe.probe_all()
+    assert results['mpv'] == {'available': False, 'path': None, 'version': None, 'cached': False}
+    assert not results['ffmpeg']['available'] and probe.runs == 1 # A missing program costs no subprocess
+    assert [m.split('.')[0] for m in missing_dependency_messages(results)] == ["MPV player not found",
+                                                                               "FFmpeg not found"]
+
+def test_lazy_module_imports_on_first_attribute_access():
+    module = LazyModule('colorsys')
+    sys.modules.pop('colorsys', None)
+    assert repr(module) == "<LazyModule 'colorsys' (not loaded)>"
+    assert module.rgb_to_hsv(1.0, 0.0, 0.0) == (0.0, 1.0, 1.0)
+    assert is_loaded('colorsys') and "(loaded)" in repr(module)
+
+def test_application_modules_do_not_import_yt_dlp():
+    code = ("import sys, music_player, download_manager, async_api, ydl_pool; "
+            "loaded = 'yt_dlp' in sys.modules; music_player.yt_dlp.utils; "
+            "print(loaded, 'yt_dlp' in sys.modules)")
+    result = subprocess.run([sys.executable, '-c', code], cwd=ROOT, capture_output=True, text=True, timeout=60)
+    assert result.stdout.split() == ["False", "True"], result.stderr
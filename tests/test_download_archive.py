@@ -0,0 +1,115 @@
+# test_download_archive.py
+
+import hashlib
+import os
+import threading
+import time
+
+import pytest
+
+from download_archive import DownloadArchive, file_sha256, get_download_archive
+
+VIDEO_ID = "dQw4w9WgXcQ"
+
+@pytest.fixture
+def archive(tmp_path):
+    archive = DownloadArchive(db_path=str(tmp_path / "archive.sqlite3"))
+    yield archive
+    archive.close()
+
+@pytest.fixture
+def song(tmp_path):
+    path = tmp_path / f"Song [{VIDEO_ID}].mp3"
+    path.write_bytes(b"original audio")
+    return str(path)
+
+def test_file_sha256(song):
+    assert file_sha256(song, chunk_size=4) == hashlib.sha256(b"original audio").hexdigest()
+
+def test_record_and_lookup_per_format(archive, song):
+    assert archive.lookup(VIDEO_ID, 'mp3') is None
+    archive.record(VIDEO_ID, 'mp3', song)
+    assert archive.lookup(VIDEO_ID, 'mp3') == os.path.abspath(song)
+    assert archive.lookup(VIDEO_ID, 'mp3;audio_bitrate=256k') is None # Another profile is another entry
+    archive.forget(VIDEO_ID, 'mp3')
+    assert archive.lookup(VIDEO_ID, 'mp3') is None
+
+def test_missing_or_resized_files_are_forgotten(archive, song):
+    archive.record(VIDEO_ID, 'mp3', song)
+    with open(song, "ab") as f:
+        f.write(b"!")
+    assert archive.lookup(VIDEO_ID, 'mp3') is None
+    with open(song, "wb") as f:
+        f.write(b"original audio")
+    assert archive.lookup(VIDEO_ID, 'mp3') is None # The entry itself was dropped
+
+    archive.record(VIDEO_ID, 'mp3', song)
+    os.remove(song)
+    assert archive.lookup(VIDEO_ID, 'mp3') is None
+
+def test_hash_is_stored_only_when_verifying(archive, song, tmp_path):
+    archive.record(VIDEO_ID, 'mp3', song)
+    assert archive._conn.execute("SELECT sha256 FROM archive").fetchone() == (None,)
+    verifying = DownloadArchive(db_path=str(tmp_path / "verifying.sqlite3"), verify=True)
+    verifying.record(VIDEO_ID, 'mp3', song)
+    assert verifying._conn.execute("SELECT sha256 FROM archive").fetchone() == (file_sha256(song),)
+    verifying.close()
+
+def test_verify_catches_same_size_changes(archive, song):
+    archive.record(VIDEO_ID, 'mp3', song, compute_hash=True)
+    with open(song, "wb") as f:
+        f.write(b"ORIGINAL AUDIO")
+    assert archive.lookup(VIDEO_ID, 'mp3') == os.path.abspath(song) # The size check alone is fooled
+    assert archive.lookup(VIDEO_ID, 'mp3', verify=True) is None
+
+    archive.record(VIDEO_ID, 'mp3', song, compute_hash=False)
+    assert archive.lookup(VIDEO_ID, 'mp3', verify=True) == os.path.abspath(song) # Nothing to verify against
+
+def test_entries_persist(tmp_path, song):
+    db_path = str(tmp_path / "archive.sqlite3")
+    first = DownloadArchive(db_path=db_path, verify=True)
+    first.record(VIDEO_ID, 'mp3', song)
+    first.close()
+    second = DownloadArchive(db_path=db_path, verify=True)
+    assert second.lookup(VIDEO_ID, 'mp3') == os.path.abspath(song)
+    second.close()
+
+def test_claim_serialises_one_key_only(archive):
+    order = []
+    inside = threading.Event()
+
+    def holder():
+        with archive.claim(VIDEO_ID, 'mp3'):
+            inside.set()
+            time.sleep(0.1)
+            order.append('holder')
+
+    def waiter():
+        with archive.claim(VIDEO_ID, 'mp3'):
+            order.append('waiter')
+
+    threads = [threading.Thread(target=holder)]
+    threads[0].start()
+    assert inside.wait(5)
+    with archive.claim(VIDEO_ID, 'mp4'): # Another key is not blocked
+        order.append('other')
+    threads.append(threading.Thread(target=waiter))
+    threads[1].start()
+    for thread in threads:
+        thread.join(5)
+    assert order == ['other', 'holder', 'waiter']
+    assert archive._key_locks == {} # Key locks do not accumulate
+
+def test_acquire_may_be_released_from_another_thread(archive):
+    archive.acquire(VIDEO_ID, 'mp3')
+    releaser = threading.Thread(target=archive.release, args=(VIDEO_ID, 'mp3'))
+    releaser.start()
+    releaser.join(5)
+    with archive.claim(VIDEO_ID, 'mp3'):
+        pass
+    assert archive._key_locks == {}
+
+def test_default_archive_lives_in_the_cache_dir(isolated_dirs):
+    archive = get_download_archive()
+    assert archive is get_download_archive()
+    assert archive.db_path == str(isolated_dirs / "cache" / "download_archive.sqlite3")
@@ -0,0 +1,167 @@
+# test_download_manager.py
+
+import sys
+import threading
+import time
+from collections import Counter
+
+import pytest
+import yt_dlp
+
+import download_manager
+from download_manager import DownloadManager, PENDING, RUNNING, PAUSED, COMPLETED, FAILED, CANCELLED
+
+class FakeDownloads:
+    """Replaces download_media: every call ticks the hook until released, then succeeds or fails."""
+
+    def __init__(self):
+        self.calls = Counter() # url -> number of download_media calls
+        self.started = threading.Event()
+        self.release = threading.Event()
+        self.fail = set() # URLs that fail
+        self._lock = threading.Lock()
+
+    def __call__(self, url, format_type, output_path=None, progress_callback=None, weight=1.0, **kwargs):
+        with self._lock:
+            self.calls[url] += 1
+        self.started.set()
+        try:
+            while not self.release.wait(0.005):
+                progress_callback({'status': 'downloading', 'downloaded_bytes': 1})
+            progress_callback({'status': 'downloading', 'downloaded_bytes': 2})
+        except yt_dlp.utils.DownloadCancelled:
+            progress_callback({'status': 'cancelled', 'message': 'Download cancelled.'})
+            return None
+        if url in self.fail:
+            progress_callback({'status': 'error', 'message': 'boom'})
+            return None
+        return f"/tmp/{url}.mp3"
+
+@pytest.fixture
+def fake(monkeypatch):
+    fake = FakeDownloads()
+    monkeypatch.setattr(download_manager, 'download_media', fake)
+    return fake
+
+@pytest.fixture
+def events():
+    return []
+
+@pytest.fixture
+def manager(fake, events):
+    lock = threading.Lock()
+    def record(job, d):
+        with lock:
+            events.append((job.job_id, d['status']))
+    manager = DownloadManager(max_workers=1, progress_callback=record)
+    yield manager
+    fake.release.set()
+    manager.shutdown(cancel_pending=True)
+
+def finals(events, job_id):
+    return [status for i, status in events if i == job_id and status in ('completed', 'failed', 'cancelled')]
+
+def test_job_completes_and_reports_once(fake, manager, events):
+    fake.release.set()
+    job = manager.submit("a", 'mp3')
+    assert job.wait(2)
+    assert job.status == COMPLETED and job.filepath == "/tmp/a.mp3"
+    assert finals(events, job.job_id) == ['completed']
+
+def test_failed_job_is_retried_up_to_max_attempts(fake, events):
+    fake.release.set()
+    fake.fail.add("bad")
+    manager = DownloadManager(max_workers=1, max_attempts=3,
+                              progress_callback=lambda job, d: events.append((job.job_id, d['status'])))
+    job = manager.submit("bad", 'mp3')
+    assert job.wait(2)
+    manager.shutdown()
+    assert job.status == FAILED and job.error == 'boom'
+    assert fake.calls["bad"] == 3
+    assert finals(events, job.job_id) == ['failed']
+
+def test_cancel_pending_job_never_runs(fake, manager, events):
+    blocker = manager.submit("blocker", 'mp3')
+    assert fake.started.wait(2)
+    job = manager.submit("queued", 'mp3')
+    assert manager.cancel(job.job_id)
+    assert job.status == CANCELLED
+    fake.release.set()
+    assert blocker.wait(2)
+    time.sleep(0.05)
+    assert fake.calls["queued"] == 0
+    assert finals(events, job.job_id) == ['cancelled']
+    assert not manager.cancel(job.job_id) # Already final
+
+def test_cancel_running_job_reports_once(fake, manager, events):
+    job = manager.submit("running", 'mp3')
+    assert fake.started.wait(2)
+    assert job.status == RUNNING
+    assert manager.cancel(job.job_id)
+    assert job.wait(2)
+    assert job.status == CANCELLED
+    assert finals(events, job.job_id) == ['cancelled']
+
+def test_pause_and_resume_pending_job_runs_once(fake, manager, events):
+    blocker = manager.submit("blocker", 'mp3')
+    assert fake.started.wait(2)
+    job = manager.submit("paused", 'mp3')
+    for _ in range(3): # The stale queue entry must not add a second run
+        assert manager.pause(job.job_id) and job.status == PAUSED
+        assert manager.resume(job.job_id) and job.status == PENDING
+    fake.release.set()
+    assert blocker.wait(2) and job.wait(2)
+    manager.wait(2)
+    time.sleep(0.05)
+    assert fake.calls["paused"] == 1
+    assert finals(events, job.job_id) == ['completed']
+
+def test_pause_stalls_running_transfer_until_resumed(fake, manager):
+    job = manager.submit("stall", 'mp3')
+    assert fake.started.wait(2)
+    assert manager.pause(job.job_id)
+    fake.release.set()
+    assert not job.wait(0.1) # Stuck in the hook while paused
+    assert manager.resume(job.job_id) and job.status == RUNNING
+    assert job.wait(2) and job.status == COMPLETED
+
+def test_retry_requeues_cancelled_job(fake, manager, events):
+    fake.release.set()
+    blocker = manager.submit("blocker", 'mp3')
+    job = manager.submit("again", 'mp3')
+    manager.cancel(job.job_id)
+    assert blocker.wait(2)
+    assert manager.retry(job.job_id)
+    assert job.wait(2) and job.status == COMPLETED
+    assert fake.calls["again"] == 1
+    assert finals(events, job.job_id) == ['cancelled', 'completed']
+
+@pytest.fixture
+def fast_switching():
+    """Makes threads switch far more often, so check-then-set races show up."""
+    interval = sys.getswitchinterval()
+    sys.setswitchinterval(1e-6)
+    yield
+    sys.setswitchinterval(interval)
+
+def test_cancel_racing_workers_reports_each_job_once(fake, events, fast_switching):
+    fake.release.set()
+    lock = threading.Lock()
+    def record(job, d):
+        with lock:
+            events.append((job.job_id, d['status']))
+    manager = DownloadManager(max_workers=4, progress_callback=record)
+    jobs = []
+    for i in range(300):
+        job = manager.submit(f"race{i}", 'mp3')
+        if i % 2:
+            manager.pause(job.job_id)
+            manager.resume(job.job_id)
+        manager.cancel(job.job_id)
+        jobs.append(job)
+    assert manager.wait(5)
+    manager.shutdown()
+    for job in jobs:
+        assert job.status in (CANCELLED, COMPLETED)
+        assert len(finals(events, job.job_id)) == 1
+        assert fake.calls[job.url] <= 1
@@ -0,0 +1,87 @@
+# test_extractor.py
+
+import os
+
+import pytest
+import yt_dlp
+
+from extractor import FakeExtractor, fake_video_id, fake_title, _fake_bytes
+from media_library import get_media_library
+from music_player import download_media, resolve_stream
+from youtube_search import SearchSession, search_youtube_music
+
+def watch_url(video_id):
+    return f"https://www.youtube.com/watch?v={video_id}"
+
+def test_search_is_deterministic_and_cached(fake_extractor):
+    results = search_youtube_music("night drive", max_results=5)
+    assert [r['id'] for r in results] == [fake_video_id("night drive", i) for i in range(5)]
+    assert results[0] == {'title': fake_title(results[0]['id']), 'id': results[0]['id'],
+                          'url': watch_url(results[0]['id'])}
+    requests = fake_extractor.server.stats()['requests']
+    assert search_youtube_music("Night  Drive", max_results=5) == results # Normalised cache hit
+    assert fake_extractor.server.stats()['requests'] == requests
+
+def test_search_session_continues_where_the_last_page_stopped(fake_extractor):
+    session = SearchSession("paged", page_size=7, use_cache=False)
+    streamed = []
+    first = session.next_page(on_result=streamed.append)
+    second = session.next_page()
+    session.close()
+    assert [r['id'] for r in first + second] == [fake_video_id("paged", i) for i in range(14)]
+    assert streamed == first
+
+def test_iter_playlist_walks_every_page():
+    extractor = FakeExtractor(playlist_size=150)
+    try:
+        entries = list(extractor.iter_playlist("https://www.youtube.com/playlist?list=PLtest", {}))
+    finally:
+        extractor.server.stop()
+    assert len(entries) == 150
+    assert entries[0]['playlist_id'] == "PLtest" and entries[0]['url'] == watch_url(fake_video_id("PLtest", 0))
+
+def test_resolve_stream_points_at_the_fake_server(fake_extractor):
+    video_id = fake_video_id("resolve", 0)
+    stream = resolve_stream(watch_url(video_id))
+    assert stream['url'] == f"{fake_extractor.server.base_url}/media/{video_id}.webm"
+    assert stream['title'] == fake_title(video_id)
+    assert stream['http_headers'] == {}
+
+def test_failing_server_surfaces_as_download_error():
+    extractor = FakeExtractor(error_rate=1.0)
+    try:
+        with pytest.raises(yt_dlp.utils.DownloadError):
+            extractor.extract_info(watch_url(fake_video_id("x", 0)), {})
+    finally:
+        extractor.server.stop()
+
+@pytest.mark.parametrize("resumable", [True, False])
+def test_download_fetches_the_media_bytes(fake_extractor, tmp_path, resumable):
+    video_id = fake_video_id("download", int(resumable))
+    events = []
+    path = download_media(watch_url(video_id), 'm4a', output_path=str(tmp_path), progress_callback=events.append,
+                          postprocess=False, resumable=resumable)
+    assert os.path.basename(path) == f"{fake_title(video_id)} [{video_id}].webm"
+    size = fake_extractor.server.media_size
+    with open(path, "rb") as f:
+        assert f.read() == _fake_bytes(video_id, 0, size)
+    if resumable:
+        # Completion is reported once, by download_media, after the stream has been fetched
+        assert [e['status'] for e in events].count('finished') == 1
+        assert events[-1]['status'] == 'finished' and events[-1]['filename'] == path
+
+def test_download_is_archived_and_skipped_per_profile(fake_extractor, tmp_path):
+    url = watch_url(fake_video_id("archive", 0))
+    first = download_media(url, 'mp3', output_path=str(tmp_path), resumable=False)
+    assert first.endswith(".mp3") and os.path.isfile(first)
+    sent = fake_extractor.server.stats()['bytes_sent']
+
+    events = []
+    assert download_media(url, 'mp3', output_path=str(tmp_path), resumable=False,
+                          progress_callback=events.append) == first
+    assert events[-1]['skipped'] and fake_extractor.server.stats()['bytes_sent'] == sent
+
+    # Another bitrate is a different file, not the archived 192k one
+    download_media(url, 'mp3', output_path=str(tmp_path), resumable=False, profile={'audio_bitrate': '256k'})
+    assert fake_extractor.server.stats()['bytes_sent'] > sent
+    assert get_media_library().find(fake_video_id("archive", 0), 'mp3')['path'] == first
@@ -0,0 +1,105 @@
+# test_incremental_search.py
+
+import pytest
+
+from incremental_search import IncrementalSearch
+from search_cache import SearchCache
+
+class Timers:
+    """A manual clock standing in for Tk's after()/after_cancel()."""
+
+    def __init__(self):
+        self.now = 0
+        self.pending = {} # handle -> (due, func)
+        self._handles = 0
+
+    def schedule(self, delay_ms, func):
+        self._handles += 1
+        self.pending[self._handles] = (self.now + delay_ms, func)
+        return self._handles
+
+    def cancel(self, handle):
+        del self.pending[handle]
+
+    def advance(self, ms):
+        self.now += ms
+        for handle, (due, func) in sorted(self.pending.items(), key=lambda item: item[1][0]):
+            if due <= self.now:
+                del self.pending[handle]
+                func()
+
+@pytest.fixture
+def timers():
+    return Timers()
+
+@pytest.fixture
+def cache():
+    return SearchCache(path=False)
+
+def make_search(timers, cache, **kwargs):
+    started = []
+    search = IncrementalSearch(lambda query, ticket, explicit: started.append((query, ticket, explicit)),
+                               timers.schedule, timers.cancel, cache=cache, **kwargs)
+    return search, started
+
+def type_text(search, timers, text, interval_ms=100):
+    for i in range(1, len(text) + 1):
+        search.text_changed(text[:i])
+        timers.advance(interval_ms)
+
+def test_typing_starts_one_search_after_the_pause(timers, cache):
+    search, started = make_search(timers, cache)
+    type_text(search, timers, "night drive")
+    assert started == []
+    timers.advance(200) # 300 ms after the last keystroke
+    assert started == [("night drive", 1, False)]
+    assert search.stats()['searches_per_keystroke'] == 1 / 11
+    search.text_changed("night drive ") # The same normalized query is not searched again
+    timers.advance(1000)
+    assert len(started) == 1
+
+def test_short_queries_and_deleted_text_are_not_searched(timers, cache):
+    search, started = make_search(timers, cache)
+    search.text_changed("ni")
+    search.text_changed("nig")
+    search.text_changed("ni") # Deleted before the pause: the pending search is dropped
+    timers.advance(1000)
+    assert started == []
+    search.submit(" ni ") # An explicit search has no minimum and no debounce
+    assert started == [("ni", 1, True)]
+
+def test_cached_queries_start_at_once_without_a_slot(timers, cache):
+    cache.put("night", 20, [{'title': "Night Drive", 'id': "a"}, {'title': "Nightcall", 'id': "b"}])
+    search, started = make_search(timers, cache, max_in_flight=1)
+    search.submit("busy") # Takes the only slot
+    assert search.text_changed("Night") is None
+    assert started == [("busy", 1, True), ("Night", None, False)]
+    assert search.stats()['cached'] == 1 and search.stats()['running'] == 1
+
+def test_refine_filters_the_longest_cached_prefix(timers, cache):
+    cache.put("night", 20, [{'title': "Night Drive", 'id': "a"}, {'title': "Nightcall", 'id': "b"}])
+    search, _ = make_search(timers, cache)
+    assert search.text_changed("night d") == [{'title': "Night Drive", 'id': "a"}]
+    assert search.text_changed("zzz") is None
+    assert search.stats()['refined'] == 1
+
+def test_superseded_searches_hold_their_slot_and_only_the_latest_waits(timers, cache):
+    search, started = make_search(timers, cache, max_in_flight=2)
+    for query in ("alpha", "bravo", "charlie", "delta"):
+        search.submit(query)
+    assert [q for q, _, _ in started] == ["alpha", "bravo"] # 'charlie' was replaced while waiting
+    search.finished(1) # A superseded worker returned: the latest query takes its slot
+    assert started[-1] == ("delta", 3, True)
+    search.finished(2)
+    search.finished(3)
+    assert len(started) == 3 and search.stats()['running'] == 0
+
+def test_reset_drops_pending_and_waiting_searches(timers, cache):
+    search, started = make_search(timers, cache, max_in_flight=1)
+    search.submit("alpha")
+    search.submit("bravo") # Waits for the slot
+    search.text_changed("charlie") # Debounce pending; the waiting query stays until it fires
+    search.reset()
+    timers.advance(1000)
+    search.finished(1)
+    assert [q for q, _, _ in started] == ["alpha"]
@@ -0,0 +1,101 @@
+# test_media_library.py
+
+import os
+
+import pytest
+
+from media_library import MediaLibrary, get_media_library, is_intermediate_file, parse_media_filename
+
+VIDEO_ID = "dQw4w9WgXcQ"
+
+def make_file(path, data=b"audio"):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "wb") as f:
+        f.write(data)
+    return path
+
+@pytest.fixture
+def library(tmp_path):
+    library = MediaLibrary(db_path=str(tmp_path / "library.sqlite3"))
+    yield library
+    library.close()
+
+def test_parse_media_filename():
+    assert parse_media_filename(f"/music/Song Title [{VIDEO_ID}].MP3") == ("Song Title", VIDEO_ID, "mp3")
+    assert parse_media_filename("/music/Just a file.m4a") == ("Just a file", None, "m4a")
+
+def test_add_parses_missing_fields_and_updates_in_place(library, tmp_path):
+    path = make_file(str(tmp_path / f"Song Title [{VIDEO_ID}].mp3"))
+    library.add(path)
+    track = library.find(VIDEO_ID, 'mp3')
+    assert track['title'] == "Song Title" and track['path'] == os.path.abspath(path) and track['local']
+    assert track['url'] == f"https://www.youtube.com/watch?v={VIDEO_ID}"
+
+    library.add(path, duration=215.0)
+    library.add(path, title="Real Title") # A later add without a duration keeps the known one
+    assert library.count() == 1
+    track = library.find(VIDEO_ID)
+    assert track['title'] == "Real Title" and track['duration'] == 215.0
+    assert library.find(VIDEO_ID, 'mp4') is None
+
+def test_search_matches_word_prefixes_and_follows_title_changes(library, tmp_path):
+    library.add(make_file(str(tmp_path / "a.mp3")), title="Night Drive (Remastered)")
+    library.add(make_file(str(tmp_path / "b.mp3")), title="Nightcall")
+    library.add(make_file(str(tmp_path / "c.mp3")), title="Café del Mar")
+    assert {r['title'] for r in library.search("night")} == {"Night Drive (Remastered)", "Nightcall"}
+    assert [r['title'] for r in library.search("nig dri")] == ["Night Drive (Remastered)"]
+    assert [r['title'] for r in library.search("cafe")] == ["Café del Mar"] # Diacritics are folded
+    assert library.search("  ") == [] and library.search('"*') == []
+    assert len(library.search("night", limit=1)) == 1
+
+    library.add(str(tmp_path / "b.mp3"), title="Something Else")
+    assert [r['title'] for r in library.search("night")] == ["Night Drive (Remastered)"]
+
+def test_scan_indexes_changes_and_forgets_missing_files(library, tmp_path):
+    root = tmp_path / "music"
+    first = make_file(str(root / f"First [{VIDEO_ID}].mp3"))
+    make_file(str(root / "album" / "disc 1" / "Second.flac"))
+    make_file(str(root / "cover.jpg"))
+    make_file(str(root / ".hidden" / "Skipped.mp3"))
+    assert library.scan(str(root), workers=2) == {'scanned': 2, 'added': 2, 'removed': 0}
+    assert library.scan(str(root)) == {'scanned': 2, 'added': 0, 'removed': 0} # Unchanged files are skipped
+
+    make_file(first, b"re-encoded audio")
+    os.remove(root / "album" / "disc 1" / "Second.flac")
+    assert library.scan(str(root)) == {'scanned': 1, 'added': 1, 'removed': 1}
+    assert [r['title'] for r in library.search("second")] == []
+    assert library.find(VIDEO_ID)['size'] == len(b"re-encoded audio")
+
+def test_rescan_keeps_titles_stored_at_download_time(library, tmp_path):
+    path = make_file(str(tmp_path / f"AC_DC - Back in Black [{VIDEO_ID}].mp3"))
+    library.add(path, title="AC/DC - Back in Black")
+    make_file(path, b"re-tagged audio")
+    assert library.scan(str(tmp_path))['added'] == 1
+    library.add(path, duration=255.0)
+    assert library.find(VIDEO_ID)['title'] == "AC/DC - Back in Black"
+    assert [r['title'] for r in library.search("ac dc back")] == ["AC/DC - Back in Black"]
+
+def test_scan_skips_partial_and_raw_stage_files(library, tmp_path):
+    assert not is_intermediate_file(f"Song [{VIDEO_ID}].webm")
+    make_file(str(tmp_path / f"Song [{VIDEO_ID}].opus"))
+    for name in (f"Song [{VIDEO_ID}].f251.webm", f"Song [{VIDEO_ID}].f137.mp4", f"Song [{VIDEO_ID}].temp.mp4",
+                 f"Song [{VIDEO_ID}].mp3.part", f"Song [{VIDEO_ID}].webm.ytdl"):
+        assert is_intermediate_file(name)
+        make_file(str(tmp_path / name))
+    assert library.scan(str(tmp_path))['scanned'] == 1
+    assert library.find(VIDEO_ID)['format'] == 'opus'
+
+def test_scan_only_removes_entries_under_its_root(library, tmp_path):
+    gone = make_file(str(tmp_path / "music_1" / "Gone.mp3"))
+    kept = make_file(str(tmp_path / "musicA1" / "Kept.mp3")) # Would match if '_' acted as a LIKE wildcard
+    library.add(gone)
+    library.add(kept)
+    os.remove(gone)
+    assert library.scan(str(tmp_path / "music_1")) == {'scanned': 0, 'added': 0, 'removed': 1}
+    assert [r['title'] for r in library.search("kept")] == ["Kept"]
+    assert library.count() == 1
+
+def test_default_library_lives_in_the_cache_dir(isolated_dirs):
+    library = get_media_library()
+    assert library is get_media_library()
+    assert library.db_path == str(isolated_dirs / "cache" / "library.sqlite3")
@@ -0,0 +1,139 @@
+# test_mpv_controller.py
+
+import json
+import os
+import socket
+import sys
+import tempfile
+import threading
+import time
+
+import pytest
+
+from mpv_controller import MpvController, MpvError
+
+class FakeMpvServer:
+    """Stand-in for mpv's IPC server: records every command and answers like mpv does."""
+
+    def __init__(self, replies=None):
+        self.path = os.path.join(tempfile.mkdtemp(prefix="pd_test_mpv_"), "mpv.sock")
+        self.replies = replies or {} # command name -> (error, data)
+        self.received = []
+        self._server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self._server.bind(self.path)
+        self._server.listen(1)
+        self._conn = None
+        threading.Thread(target=self._serve, daemon=True).start()
+
+    def _serve(self):
+        self._conn, _ = self._server.accept()
+        buffer = b''
+        while True:
+            chunk = self._conn.recv(65536)
+            if not chunk:
+                return
+            buffer += chunk
+            while b'\n' in buffer:
+                line, buffer = buffer.split(b'\n', 1)
+                message = json.loads(line)
+                self.received.append(message)
+                command = message['command']
+                name = command['name'] if isinstance(command, dict) else command[0]
+                error, data = self.replies.get(name, ('success', None))
+                reply = {'request_id': message['request_id'], 'error': error, 'data': data}
+                self._conn.sendall(json.dumps(reply).encode('utf-8') + b'\n')
+
+    def send_event(self, event):
+        self._conn.sendall(json.dumps(event).encode('utf-8') + b'\n')
+
+    def close(self):
+        if self._conn is not None:
+            self._conn.close()
+        self._server.close()
+
+@pytest.fixture
+def mpv():
+    server = FakeMpvServer(replies={'get_property': ('success', 42.5)})
+    events = []
+    received = threading.Event()
+    def on_event(event):
+        events.append(event)
+        received.set()
+    controller = MpvController(event_callback=on_event)
+    controller.connect(server.path)
+    yield controller, server, events, received
+    controller.close()
+    server.close()
+
+pytestmark = pytest.mark.skipif(not MpvController.is_supported(), reason="requires Unix domain sockets")
+
+def test_enqueue_with_title_uses_named_loadfile_arguments(mpv):
+    controller, server, _, _ = mpv
+    controller.enqueue("https://example.com/a.m4a", title="Song A")
+    assert server.received[-1]['command'] == {
+        'name': 'loadfile',
+        'url': "https://example.com/a.m4a",
+        'flags': 'append-play',
+        'options': {'force-media-title': "Song A"},
+    }
+
+def test_play_without_title_sends_no_options(mpv):
+    controller, server, _, _ = mpv
+    controller.play("https://example.com/b.m4a")
+    assert server.received[-1]['command'] == {'name': 'loadfile', 'url': "https://example.com/b.m4a",
+                                              'flags': 'replace'}
+
+def test_positional_commands_and_replies(mpv):
+    controller, server, _, _ = mpv
+    controller.seek(10, absolute=True)
+    assert server.received[-1]['command'] == ['seek', 10, 'absolute']
+    assert controller.get_position() == 42.5
+    assert server.received[-1]['command'] == ['get_property', 'time-pos']
+    ids = [m['request_id'] for m in server.received]
+    assert len(set(ids)) == len(ids)
+
+def test_error_reply_raises():
+    server = FakeMpvServer(replies={'loadfile': ('invalid parameter', None)})
+    controller = MpvController()
+    controller.connect(server.path)
+    try:
+        with pytest.raises(MpvError, match="loadfile"):
+            controller.enqueue("https://example.com/c.m4a", title="C")
+    finally:
+        controller.close()
+        server.close()
+
+def test_events_reach_callback(mpv):
+    controller, server, events, received = mpv
+    controller.toggle_pause() # Makes sure the connection has been accepted
+    server.send_event({'event': 'property-change', 'name': 'idle-active', 'data': True})
+    assert received.wait(2)
+    assert events[0] == {'event': 'property-change', 'name': 'idle-active', 'data': True}
+
+# Stands in for the mpv executable: serves one IPC connection, then exits on its own
+FAKE_MPV = """
+import socket, sys
+path = next(a for a in sys.argv if a.startswith('--input-ipc-server=')).split('=', 1)[1]
+server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+server.bind(path)
+server.listen(1)
+conn, _ = server.accept()
+conn.close()
+"""
+
+def test_close_releases_an_mpv_that_exited_on_its_own(tmp_path):
+    script = tmp_path / "mpv"
+    script.write_text(f"#!{sys.executable}\n{FAKE_MPV}")
+    script.chmod(0o755)
+    events = []
+    controller = MpvController(mpv_path=str(script), event_callback=events.append)
+    controller.start()
+    tempdir = os.path.dirname(controller.socket_path)
+    deadline = time.monotonic() + 5
+    while controller.is_running() and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert not controller.is_running() and {'event': 'shutdown'} in events # The reader saw the hang-up
+    assert os.path.isdir(tempdir)
+    controller.close()
+    assert controller.process.returncode == 0 and not os.path.exists(tempdir)
+    controller.close() # Closing twice is harmless
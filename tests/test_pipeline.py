@@ -0,0 +1,100 @@
+# test_pipeline.py
+
+import os
+import threading
+
+import pytest
+
+import pipeline
+from download_archive import get_download_archive
+from extractor import fake_video_id, fake_title
+from media_library import get_media_library
+from music_player import download_media
+from pipeline import DownloadPipeline
+
+def fake_transcode(path, format_type, profile=None):
+    """Stands in for FFmpeg: renames the raw stream to the target extension."""
+    target = f"{os.path.splitext(path)[0]}.{format_type}"
+    os.replace(path, target)
+    return target
+
+@pytest.fixture(autouse=True)
+def no_ffmpeg(monkeypatch):
+    monkeypatch.setattr(pipeline, 'transcode', fake_transcode)
+
+def watch_url(video_id):
+    return f"https://www.youtube.com/watch?v={video_id}"
+
+def assert_claim_free(video_id):
+    acquired = threading.Event()
+
+    def claim():
+        with get_download_archive().claim(video_id, 'mp3'):
+            acquired.set()
+
+    threading.Thread(target=claim, daemon=True).start()
+    assert acquired.wait(5)
+
+def run(pipelines, url, **kwargs):
+    jobs = [p.submit(url, 'mp3', **kwargs) for p in pipelines]
+    for p in pipelines:
+        assert p.wait(timeout=30)
+        p.shutdown()
+    return jobs
+
+def test_completed_job_is_archived_and_indexed_with_its_title(fake_extractor, tmp_path):
+    video_id = fake_video_id("pipeline", 0)
+    (job,) = run([DownloadPipeline(fetch_workers=1, transcode_workers=1, output_path=str(tmp_path))],
+                 watch_url(video_id))
+    assert job.status == 'completed' and job.filepath.endswith(".mp3")
+    assert job.media_title == fake_title(video_id)
+    assert get_download_archive().lookup(video_id, 'mp3') == job.filepath
+    track = get_media_library().find(video_id, 'mp3')
+    assert track['title'] == fake_title(video_id) and track['duration'] == job.duration is not None
+
+def test_pipelines_racing_for_one_video_fetch_it_once(fake_extractor, tmp_path):
+    video_id = fake_video_id("pipeline", 1)
+    pipelines = [DownloadPipeline(fetch_workers=1, transcode_workers=1, output_path=str(tmp_path)) for _ in range(3)]
+    jobs = run(pipelines, watch_url(video_id))
+    assert [job.status for job in jobs] == ['completed'] * 3
+    assert sum(1 for job in jobs if not job.skipped) == 1
+    assert len({job.filepath for job in jobs}) == 1
+    assert fake_extractor.server.stats()['bytes_sent'] < 2 * fake_extractor.server.media_size
+
+def test_claim_is_released_when_a_job_fails(fake_extractor, tmp_path, monkeypatch):
+    monkeypatch.setattr(pipeline, 'download_media', lambda *args, **kwargs: None)
+    video_id = fake_video_id("pipeline", 2)
+    (job,) = run([DownloadPipeline(fetch_workers=1, transcode_workers=1, output_path=str(tmp_path), max_attempts=1)],
+                 watch_url(video_id))
+    assert job.status == 'failed'
+    assert_claim_free(video_id)
+
+def test_a_raising_stage_fails_the_job_and_keeps_the_worker(fake_extractor, tmp_path, monkeypatch):
+    calls = []
+
+    def flaky_download(url, *args, **kwargs):
+        calls.append(url)
+        if len(calls) == 1:
+            raise RuntimeError("boom")
+        return download_media(url, *args, **kwargs)
+
+    monkeypatch.setattr(pipeline, 'download_media', flaky_download)
+    pipe = DownloadPipeline(fetch_workers=1, transcode_workers=1, output_path=str(tmp_path), max_attempts=1)
+    failed = pipe.submit(watch_url(fake_video_id("pipeline", 3)), 'mp3')
+    completed = pipe.submit(watch_url(fake_video_id("pipeline", 4)), 'mp3') # Runs on the same fetch worker
+    assert pipe.wait(timeout=30)
+    pipe.shutdown()
+    assert failed.status == 'failed' and failed.error == "boom"
+    assert completed.status == 'completed'
+    assert_claim_free(fake_video_id("pipeline", 3))
+
+def test_an_unexpected_transcode_error_fails_the_job(fake_extractor, tmp_path, monkeypatch):
+    def broken_transcode(path, format_type, profile=None):
+        raise ValueError("bad profile")
+
+    monkeypatch.setattr(pipeline, 'transcode', broken_transcode)
+    video_id = fake_video_id("pipeline", 5)
+    (job,) = run([DownloadPipeline(fetch_workers=1, transcode_workers=1, output_path=str(tmp_path))],
+                 watch_url(video_id))
+    assert job.status == 'failed' and job.error == "bad profile"
+    assert get_download_archive().lookup(video_id, 'mp3') is None
@@ -0,0 +1,111 @@
+# test_playlist_import.py
+
+import os
+import threading
+
+import pytest
+
+import pipeline
+from extractor import fake_video_id
+from playlist_import import (PlaylistImport, PlaylistSession, PlaylistState, is_channel_url, is_playlist_url,
+                             playlist_key)
+
+PLAYLIST_URL = "https://www.youtube.com/playlist?list=PLsync"
+
+def fake_transcode(path, format_type, profile=None):
+    """Stands in for FFmpeg: renames the raw stream to the target extension."""
+    target = f"{os.path.splitext(path)[0]}.{format_type}"
+    os.replace(path, target)
+    return target
+
+@pytest.fixture
+def playlist(fake_extractor, monkeypatch):
+    monkeypatch.setattr(pipeline, 'transcode', fake_transcode)
+    fake_extractor.server.playlist_size = 6
+    return fake_extractor
+
+def importer(tmp_path, **kwargs):
+    kwargs.setdefault('state_path', str(tmp_path / "state.json"))
+    return PlaylistImport(PLAYLIST_URL, output_path=str(tmp_path / "downloads"), fetch_workers=2,
+                          transcode_workers=1, **kwargs)
+
+def test_url_helpers():
+    assert is_playlist_url(PLAYLIST_URL)
+    assert is_playlist_url("https://www.youtube.com/watch?v=abc&list=PLx")
+    assert is_playlist_url("https://www.youtube.com/@artist/videos")
+    assert not is_playlist_url("https://www.youtube.com/watch?v=abc")
+    assert not is_playlist_url("https://example.com/playlist?list=PLx")
+    assert is_channel_url("https://www.youtube.com/@artist") and not is_channel_url(PLAYLIST_URL)
+    assert playlist_key("https://www.youtube.com/@artist/videos") == playlist_key("https://www.youtube.com/@artist")
+    assert playlist_key("https://www.youtube.com/watch?v=abc&list=PLx") == "PLx"
+
+def test_import_downloads_every_entry_and_resync_skips_them(playlist, tmp_path):
+    results = []
+    report = importer(tmp_path, on_result=lambda entry, job: results.append((entry['id'], job.status))).run()
+    ids = [fake_video_id("PLsync", i) for i in range(6)]
+    assert report['listed'] == 6 and report['queued'] == 6 and report['completed'] == 6
+    assert sorted(results) == sorted((video_id, 'completed') for video_id in ids)
+    assert report['title'] == PlaylistState(PLAYLIST_URL, 'mp3', path=str(tmp_path / "state.json")).title
+
+    playlist.server.playlist_size = 7 # A new upload at the end
+    report = importer(tmp_path).run()
+    assert report['known'] == 6 and report['queued'] == 1 and report['completed'] == 1
+    state = PlaylistState(PLAYLIST_URL, 'mp3', path=str(tmp_path / "state.json"))
+    assert set(state.done) == set(ids) | {fake_video_id("PLsync", 6)} and state.last_sync
+
+def test_archived_entries_are_recorded_in_a_fresh_state(playlist, tmp_path, monkeypatch):
+    importer(tmp_path, state_path=str(tmp_path / "first.json")).run()
+    submit = pipeline.DownloadPipeline.submit
+
+    def submit_and_finish(self, *args, **kwargs):
+        job = submit(self, *args, **kwargs)
+        job.wait(5) # The worst schedule: the archive hit completes before submit() returns
+        return job
+
+    monkeypatch.setattr(pipeline.DownloadPipeline, 'submit', submit_and_finish)
+    results = []
+    report = importer(tmp_path, state_path=str(tmp_path / "second.json"),
+                      on_result=lambda entry, job: results.append(entry['id'])).run()
+    assert report['skipped'] == 6 and len(results) == 6
+    assert len(PlaylistState(PLAYLIST_URL, 'mp3', path=str(tmp_path / "second.json")).done) == 6
+
+def test_a_raising_download_fails_only_its_entry(playlist, tmp_path, monkeypatch):
+    real = pipeline.download_media
+    broken = fake_video_id("PLsync", 2)
+
+    def download_media(url, *args, **kwargs):
+        if broken in url:
+            raise RuntimeError("boom")
+        return real(url, *args, **kwargs)
+
+    monkeypatch.setattr(pipeline, 'download_media', download_media)
+    done = {}
+    thread = threading.Thread(target=lambda: done.update(importer(tmp_path).run()), daemon=True)
+    thread.start()
+    thread.join(30)
+    assert done['completed'] == 5 and done['failed'] == 1
+    state = PlaylistState(PLAYLIST_URL, 'mp3', path=str(tmp_path / "state.json"))
+    assert broken not in state.done and len(state.done) == 5 # Tried again on the next run
+
+def test_limit_stops_listing(playlist, tmp_path):
+    report = importer(tmp_path, limit=2).run()
+    assert report['listed'] == 2 and report['completed'] == 2
+
+def test_state_survives_a_reload_and_ignores_corrupt_files(tmp_path):
+    path = str(tmp_path / "state.json")
+    state = PlaylistState(PLAYLIST_URL, 'mp3', path=path)
+    state.mark_done("abc", "/music/abc.mp3")
+    state.save()
+    assert PlaylistState(PLAYLIST_URL, 'mp3', path=path).is_done("abc")
+    with open(path, "w") as f:
+        f.write("{broken")
+    assert PlaylistState(PLAYLIST_URL, 'mp3', path=path).done == {}
+
+def test_session_pages_through_the_playlist(playlist):
+    playlist.server.playlist_size = 5
+    session = PlaylistSession(PLAYLIST_URL, page_size=2)
+    pages = [session.next_page() for _ in range(4)]
+    assert [len(page) for page in pages] == [2, 2, 1, 0] and session.exhausted
+    assert [r['id'] for r in session.results] == [fake_video_id("PLsync", i) for i in range(5)]
+    assert session.title and session._iterator is None # Released once exhausted
+    session.close()
@@ -0,0 +1,73 @@
+# test_prefetch.py
+
+import threading
+import time
+
+from prefetch import StreamPrefetcher
+from stream_cache import StreamURLCache
+
+class Resolver:
+    """Returns a far-from-expiry stream URL; blocks while `gate` is cleared."""
+
+    def __init__(self):
+        self.started = 0
+        self.calls = []
+        self.gate = threading.Event()
+        self.gate.set()
+        self._lock = threading.Lock()
+
+    def __call__(self, video_url):
+        with self._lock:
+            self.started += 1
+        self.gate.wait(5)
+        with self._lock:
+            self.calls.append(video_url)
+        return {'url': f"https://media.example/{len(self.calls)}?expire={int(time.time()) + 6 * 3600}"}
+
+def results(*video_ids):
+    return [{'url': f"https://www.youtube.com/watch?v={video_id}"} for video_id in video_ids]
+
+def wait_for(condition):
+    deadline = time.monotonic() + 5
+    while not condition() and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert condition()
+
+def test_top_results_are_resolved_and_plays_are_scored(tmp_path):
+    resolver = Resolver()
+    cache = StreamURLCache(resolver, probe=False)
+    cache.resolve("https://www.youtube.com/watch?v=ccccccccccc") # Already cached: not resolved again
+    prefetcher = StreamPrefetcher(cache, top_k=3)
+    listed = results("aaaaaaaaaaa", "bbbbbbbbbbb", "ccccccccccc", "ddddddddddd")
+    listed[1]['path'] = str(tmp_path / "b.mp3") # Downloaded: played from disk
+    assert prefetcher.prefetch(listed) == 1
+    wait_for(lambda: prefetcher.stats()['resolved'] == 1)
+
+    assert prefetcher.record_play(listed[0]['url'])
+    assert not prefetcher.record_play(listed[0]['url']) # A replay is not credited to the prefetch again
+    assert not prefetcher.record_play(listed[3]['url'])
+    stats = prefetcher.stats()
+    assert (stats['hits'], stats['misses'], stats['hit_rate']) == (1, 2, 1 / 3)
+    prefetcher.shutdown()
+
+def test_a_new_prefetch_cancels_queued_work():
+    resolver = Resolver()
+    resolver.gate.clear()
+    prefetcher = StreamPrefetcher(StreamURLCache(resolver, probe=False), top_k=5, max_workers=1)
+    assert prefetcher.prefetch(results("aaaaaaaaaaa", "bbbbbbbbbbb", "ccccccccccc")) == 3
+    wait_for(lambda: resolver.started == 1)
+    assert prefetcher.prefetch(results("ddddddddddd")) == 1
+    resolver.gate.set()
+    wait_for(lambda: prefetcher.stats()['resolved'] == 2)
+    assert prefetcher.stats()['cancelled'] == 2 # The running resolve of 'aaa...' finished
+    assert resolver.calls == ["https://www.youtube.com/watch?v=aaaaaaaaaaa",
+                              "https://www.youtube.com/watch?v=ddddddddddd"]
+    prefetcher.shutdown()
+
+def test_prefetched_keys_are_bounded_by_the_cache_size():
+    cache = StreamURLCache(Resolver(), max_entries=2, probe=False)
+    prefetcher = StreamPrefetcher(cache, top_k=4, max_workers=1)
+    prefetcher.prefetch(results("aaaaaaaaaaa", "bbbbbbbbbbb", "ccccccccccc", "ddddddddddd"))
+    wait_for(lambda: prefetcher.stats()['resolved'] == 4)
+    assert list(prefetcher._prefetched) == [cache.key_for(r['url']) for r in results("ccccccccccc", "ddddddddddd")]
+    prefetcher.shutdown()
@@ -0,0 +1,59 @@
+# test_progress.py
+
+import threading
+
+from progress import JobProgress, ProgressAggregator
+
+def tick(downloaded, total=1000, **extra):
+    return dict({'status': 'downloading', 'downloaded_bytes': downloaded, 'total_bytes': total}, **extra)
+
+def test_row_folds_ticks_and_formats_them():
+    row = JobProgress(1, "A very long title that does not fit in the table")
+    row.apply(tick(250, speed=2 * 1024 * 1024, eta=75))
+    assert row.percent == 25.0 and row.eta == 75
+    line = row.format(width=20)
+    assert line.startswith("A very long title t…") and " 25.0%" in line and "2.00 MiB/s" in line and "01:15" in line
+    row.apply(tick(500, throughput=1024 * 1024, speed=None)) # The live rate wins over yt_dlp's speed
+    assert row.speed == 1024 * 1024
+    row.apply({'status': 'failed', 'message': "HTTP Error 403"})
+    assert row.downloaded == 500 and row.format().endswith("HTTP Error 403")
+
+def test_ticks_from_many_threads_coalesce_into_one_row_per_job():
+    aggregator = ProgressAggregator()
+    jobs, ticks = 20, 2000
+
+    def worker(job_id):
+        for i in range(1, ticks + 1):
+            aggregator.update(job_id, f"Track {job_id}", tick(i, total=ticks))
+
+    threads = [threading.Thread(target=worker, args=(job_id,)) for job_id in range(jobs)]
+    for thread in threads:
+        thread.start()
+    frames = []
+    while any(thread.is_alive() for thread in threads):
+        frame = aggregator.drain()
+        if frame is not None:
+            frames.append(frame)
+    for thread in threads:
+        thread.join()
+    frame = aggregator.drain()
+    if frame is not None:
+        frames.append(frame)
+
+    assert aggregator.ticks == jobs * ticks
+    assert len(aggregator._rows) == jobs # O(1) state per job, whatever the tick rate
+    assert aggregator.renders == len(frames) < jobs * ticks
+    assert all(" 100.0%" in line for line in frames[-1]) # The last frame shows the latest tick of every job
+    assert aggregator.drain() is None # Nothing changed since
+    assert aggregator.summary() == {'active': jobs, 'total': jobs, 'percent': 100.0}
+
+def test_finished_jobs_linger_then_drop_out():
+    aggregator = ProgressAggregator(linger=0.0)
+    aggregator.update(1, "Done", tick(1000))
+    aggregator.update(2, "Running", tick(100))
+    aggregator.update(1, "Done", {'status': 'completed', 'message': "Download complete!"})
+    frame = aggregator.drain() # The completed row expires at once with no linger
+    assert len(frame) == 1 and frame[0].startswith("Running")
+    assert aggregator.summary() == {'active': 1, 'total': 1, 'percent': 10.0}
+    aggregator.remove(2)
+    assert aggregator.drain() == []
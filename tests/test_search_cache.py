@@ -0,0 +1,96 @@
+# test_search_cache.py
+
+import json
+import types
+
+import pytest
+
+import search_cache
+from search_cache import SearchCache, get_search_cache, normalize_query
+
+def results(*ids):
+    return [{'id': i, 'title': f"Title {i}", 'url': f"https://www.youtube.com/watch?v={i}"} for i in ids]
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(search_cache, 'time', types.SimpleNamespace(time=lambda: now[0]))
+    return now
+
+def test_normalize_query():
+    assert normalize_query("  Night   DRIVE ") == "night drive"
+
+def test_hits_are_shared_by_normalized_queries_and_copied(tmp_path):
+    cache = SearchCache(path=False)
+    cache.put("Night Drive", 5, results('a', 'b'))
+    hit = cache.get("night  drive", 5)
+    assert hit == results('a', 'b')
+    hit[0]['title'] = "changed"
+    assert cache.get("night drive", 5) == results('a', 'b') # Callers cannot mutate the cache
+    assert cache.get("night drive", 10) is None # Depth is part of the key
+    assert cache.stats() == {'hits': 2, 'misses': 1, 'entries': 1, 'hit_rate': 2 / 3}
+
+def test_entries_expire_after_the_ttl(clock):
+    cache = SearchCache(path=False, ttl=60)
+    cache.put("q", 5, results('a'))
+    clock[0] += 60
+    assert cache.contains("q", 5) and cache.get("q", 5) == results('a')
+    clock[0] += 1
+    assert not cache.contains("q", 5) and cache.get("q", 5) is None
+    assert cache.stats()['entries'] == 0
+
+def test_least_recently_used_entries_are_evicted():
+    cache = SearchCache(path=False, max_entries=2)
+    cache.put("a", 5, results('a'))
+    cache.put("b", 5, results('b'))
+    cache.get("a", 5) # 'b' is now the least recently used
+    cache.put("c", 5, results('c'))
+    assert cache.contains("a", 5) and cache.contains("c", 5) and not cache.contains("b", 5)
+
+def test_contains_does_not_count_or_reorder():
+    cache = SearchCache(path=False, max_entries=2)
+    cache.put("a", 5, results('a'))
+    cache.put("b", 5, results('b'))
+    assert cache.contains("a", 5)
+    cache.put("c", 5, results('c'))
+    assert not cache.contains("a", 5) # Still evicted first
+    assert cache.stats()['hits'] == cache.stats()['misses'] == 0
+
+def test_refinement_picks_the_longest_prefix_and_deepest_results():
+    cache = SearchCache(path=False)
+    cache.put("love", 5, results('a'))
+    cache.put("love s", 5, results('b'))
+    cache.put("love s", 20, results('b', 'c'))
+    cache.put("loud", 5, results('x'))
+    assert cache.refinement("Love So") == ("love s", results('b', 'c'))
+    assert cache.refinement("love") is None # Only strictly shorter queries count
+    assert cache.refinement("jazz") is None
+
+def test_entries_persist_in_lru_order_without_expired_ones(tmp_path, clock):
+    path = str(tmp_path / "search_cache.json")
+    cache = SearchCache(path=path, ttl=60, max_entries=2)
+    cache.put("old", 5, results('o'))
+    clock[0] += 30
+    cache.put("a", 5, results('a'))
+    cache.put("b", 5, results('b'))
+    cache.get("a", 5)
+
+    reloaded = SearchCache(path=path, ttl=60, max_entries=2)
+    assert reloaded.get("a", 5) == results('a') and reloaded.get("b", 5) == results('b')
+    assert not reloaded.contains("old", 5) # Evicted before saving
+
+    clock[0] += 31 # 'a' and 'b' are now 31 s old, past a 30 s TTL
+    assert SearchCache(path=path, ttl=30).stats()['entries'] == 0
+
+def test_corrupt_file_is_ignored(tmp_path):
+    path = tmp_path / "search_cache.json"
+    path.write_text("{not json")
+    cache = SearchCache(path=str(path))
+    assert cache.stats()['entries'] == 0
+    cache.put("q", 5, results('a'))
+    assert json.loads(path.read_text())['entries'][0][0] == "5:q"
+
+def test_default_cache_lives_in_the_cache_dir(isolated_dirs):
+    cache = get_search_cache()
+    assert cache is get_search_cache()
+    assert cache.path == str(isolated_dirs / "cache" / "search_cache.json")
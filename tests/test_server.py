@@ -0,0 +1,92 @@
+# test_server.py
+
+import functools
+import http.client
+import json
+import threading
+
+import pytest
+
+import download_manager
+from extractor import fake_video_id
+from music_player import download_media
+from server import MusicServer, MusicService
+
+@pytest.fixture
+def server(fake_extractor, tmp_path, monkeypatch):
+    # The single-stream path converts with the fake extractor instead of FFmpeg
+    monkeypatch.setattr(download_manager, 'download_media', functools.partial(download_media, resumable=False))
+    httpd = MusicServer(('127.0.0.1', 0), MusicService(download_workers=1, output_path=str(tmp_path / "downloads")))
+    thread = threading.Thread(target=httpd.serve_forever, kwargs={'poll_interval': 0.05}, daemon=True)
+    thread.start()
+    yield httpd
+    httpd.shutdown()
+    httpd.service.close()
+    httpd.server_close()
+
+def request(server, method, path, body=None, raw=None):
+    conn = http.client.HTTPConnection(*server.server_address, timeout=10)
+    try:
+        payload = raw if raw is not None else (None if body is None else json.dumps(body).encode('utf-8'))
+        conn.request(method, path, body=payload, headers={'Content-Type': 'application/json'} if payload else {})
+        response = conn.getresponse()
+        data = response.read()
+        if response.getheader('Content-Type') == 'application/json':
+            data = json.loads(data)
+        return response.status, data
+    finally:
+        conn.close()
+
+def test_search_and_resolve(server, fake_extractor):
+    status, body = request(server, 'GET', '/search?q=night+drive&max_results=3')
+    assert status == 200 and [r['id'] for r in body['results']] == [fake_video_id("night drive", i) for i in range(3)]
+    assert request(server, 'GET', '/search')[0] == 400
+
+    url = body['results'][0]['url']
+    status, stream = request(server, 'GET', f'/resolve?url={url}')
+    assert status == 200 and stream['url'].startswith(fake_extractor.server.base_url)
+    assert request(server, 'GET', '/resolve')[0] == 400
+
+@pytest.mark.parametrize("raw", [b'[]', b'"x"', b'42', b'null', b'{not json'])
+def test_post_rejects_bodies_that_are_not_json_objects(server, raw):
+    status, body = request(server, 'POST', '/downloads', raw=raw)
+    assert status == 400 and 'error' in body
+    assert request(server, 'GET', '/downloads')[1] == {'downloads': []}
+
+@pytest.mark.parametrize("body", [
+    {},
+    {'url': ['https://www.youtube.com/watch?v=x']},
+    {'url': 'https://www.youtube.com/watch?v=x', 'format': 'flac'},
+    {'url': 'https://www.youtube.com/watch?v=x', 'format': ['mp3']},
+    {'url': 'https://www.youtube.com/watch?v=x', 'title': 5},
+])
+def test_post_validates_fields(server, body):
+    assert request(server, 'POST', '/downloads', body)[0] == 400
+    assert request(server, 'GET', '/downloads')[1] == {'downloads': []}
+
+def test_download_lifecycle(server):
+    video_id = fake_video_id("server", 0)
+    status, job = request(server, 'POST', '/downloads',
+                          {'url': f"https://www.youtube.com/watch?v={video_id}", 'title': "Server test"})
+    assert status == 202 and job['format'] == 'mp3' and job['title'] == "Server test"
+
+    # The per-job event stream ends once the job reaches a final state
+    status, events = request(server, 'GET', f"/downloads/{job['id']}/events")
+    assert status == 200 and '"job_status": "completed"' in events.decode('utf-8')
+
+    status, finished = request(server, 'GET', f"/downloads/{job['id']}")
+    assert status == 200 and finished['status'] == 'completed' and finished['filepath'].endswith(".mp3")
+    assert request(server, 'GET', '/downloads')[1]['downloads'] == [finished]
+    assert request(server, 'DELETE', f"/downloads/{job['id']}")[1]['status'] == 'completed' # Already final
+
+def test_unknown_paths_and_jobs(server):
+    assert request(server, 'GET', '/nope')[0] == 404
+    assert request(server, 'GET', '/downloads/99')[0] == 404
+    assert request(server, 'GET', '/downloads/abc')[0] == 404
+    assert request(server, 'DELETE', '/downloads/99')[0] == 404
+    assert request(server, 'POST', '/search', {})[0] == 404
+
+def test_stats(server):
+    status, stats = request(server, 'GET', '/stats')
+    assert status == 200 and stats['downloads'] == {'jobs': 0, 'active': 0}
+    assert {'search_cache', 'stream_cache', 'audio_cache', 'ydl_pool', 'coalescing'} <= set(stats)
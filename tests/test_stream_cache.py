@@ -0,0 +1,143 @@
+# test_stream_cache.py
+
+import threading
+import time
+
+import pytest
+
+import stream_cache
+from stream_cache import StreamURLCache, parse_expiry
+
+HEADERS = {'User-Agent': 'test-agent'}
+
+class Resolver:
+    def __init__(self, lifetime=6 * 3600, delay=0.0):
+        self.lifetime = lifetime
+        self.delay = delay
+        self.calls = 0
+        self._lock = threading.Lock()
+
+    def __call__(self, video_url):
+        with self._lock:
+            self.calls += 1
+            n = self.calls
+        time.sleep(self.delay)
+        expire = int(time.time() + self.lifetime)
+        return {'url': f"https://media.example/{n}?expire={expire}", 'http_headers': HEADERS}
+
+@pytest.fixture
+def probes(monkeypatch):
+    """Records probes instead of touching the network; set probes.alive to control the answer."""
+    class Probes(list):
+        alive = True
+    calls = Probes()
+    def probe(url, timeout=None, headers=None):
+        calls.append((url, headers))
+        return calls.alive
+    monkeypatch.setattr(stream_cache, 'is_stream_url_alive', probe)
+    return calls
+
+URL = "https://www.youtube.com/watch?v=dQw4w9WgXcQ"
+
+def test_parse_expiry():
+    assert parse_expiry("https://x.example/v?expire=1700000000&sig=1") == 1700000000
+    assert parse_expiry("https://x.example/api/manifest/expire/1700000001/sig/2") == 1700000001
+    assert abs(parse_expiry("https://x.example/v", default_ttl=60) - (time.time() + 60)) < 2
+
+def test_hit_far_from_expiry_is_trusted_without_probe(probes):
+    resolver = Resolver()
+    cache = StreamURLCache(resolver)
+    first = cache.resolve(URL)
+    second = cache.resolve(URL)
+    assert not first['cached'] and second['cached']
+    assert second['url'] == first['url']
+    assert resolver.calls == 1
+    assert probes == []
+    assert cache.stats()['hits'] == 1 and cache.stats()['misses'] == 1
+
+def test_hit_near_expiry_is_probed_with_headers_and_refreshed(probes):
+    resolver = Resolver(lifetime=5 * 60) # Inside the 10 minute refresh margin
+    cache = StreamURLCache(resolver)
+    first = cache.resolve(URL)
+    second = cache.resolve(URL)
+    assert second['cached'] and second['url'] == first['url']
+    assert probes == [(first['url'], HEADERS)]
+    deadline = time.monotonic() + 2
+    while cache.get(URL)['url'] == first['url'] and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert cache.get(URL)['url'] != first['url'] # Background refresh stored a new URL
+    assert cache.stats()['refreshes'] == 1
+
+def test_verify_probes_and_rejected_url_is_resolved_again(probes):
+    resolver = Resolver()
+    cache = StreamURLCache(resolver)
+    first = cache.resolve(URL)
+    probes.alive = False
+    second = cache.resolve(URL, verify=True)
+    assert len(probes) == 1
+    assert not second['cached'] and second['url'] != first['url']
+    assert cache.stats()['rejected'] == 1
+    cache.resolve(URL) # The fresh entry is trusted again without verify
+    assert len(probes) == 1
+
+def test_verified_hit_is_returned_when_probe_passes(probes):
+    cache = StreamURLCache(Resolver())
+    first = cache.resolve(URL)
+    second = cache.resolve(URL, verify=True)
+    assert second['cached'] and second['url'] == first['url']
+    assert len(probes) == 1
+
+def test_concurrent_misses_share_one_resolve(probes):
+    resolver = Resolver(delay=0.1)
+    cache = StreamURLCache(resolver)
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(cache.resolve(URL))) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert resolver.calls == 1
+    assert len({r['url'] for r in results}) == 1
+
+def test_resolve_error_reaches_every_waiter_and_is_not_cached():
+    calls = []
+    def failing(video_url):
+        calls.append(video_url)
+        time.sleep(0.05)
+        raise ValueError("no stream")
+    cache = StreamURLCache(failing, probe=False)
+    errors = []
+    def resolve():
+        try:
+            cache.resolve(URL)
+        except ValueError as e:
+            errors.append(e)
+    threads = [threading.Thread(target=resolve) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert len(errors) == 4 and len(calls) == 1
+    with pytest.raises(ValueError):
+        cache.resolve(URL)
+    assert len(calls) == 2
+
+def test_expired_entries_and_lru_eviction(probes):
+    cache = StreamURLCache(Resolver(), max_entries=2)
+    cache.put("https://www.youtube.com/watch?v=aaaaaaaaaaa", {'url': "https://m/a?expire=1"})
+    assert cache.get("aaaaaaaaaaa") is None # Expired long ago
+    for video_id in ("bbbbbbbbbbb", "ccccccccccc", "ddddddddddd"):
+        cache.resolve(f"https://www.youtube.com/watch?v={video_id}")
+    assert cache.get("bbbbbbbbbbb") is None
+    assert cache.get("ddddddddddd") is not None
+    assert cache.stats()['entries'] == 2
+
+def test_direct_playback_checks_cached_urls(fake_extractor, probes):
+    from music_player import get_stream_cache, resolve_playback
+    first = resolve_playback(URL, use_audio_cache=False)
+    assert first['source'] == 'resolved' and probes == []
+    assert resolve_playback(URL, use_audio_cache=False) == {'url': first['url'], 'source': 'cached'}
+    assert len(probes) == 1
+    probes.alive = False # Rejected by the server before its expiry: resolved again for mpv
+    assert resolve_playback(URL, use_audio_cache=False)['source'] == 'resolved'
+    assert get_stream_cache().stats()['rejected'] == 1
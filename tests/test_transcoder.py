@@ -0,0 +1,25 @@
+# test_transcoder.py
+
+import pytest
+
+from transcoder import get_profile, profile_key
+
+def test_get_profile_applies_overrides_and_ignores_none():
+    profile = get_profile('mp4', {'max_height': 720, 'audio_bitrate': None})
+    assert profile['max_height'] == 720
+    assert profile['audio_bitrate'] == '192k'
+
+def test_get_profile_rejects_unknown_format():
+    with pytest.raises(ValueError):
+        get_profile('flac')
+
+@pytest.mark.parametrize("format_type, overrides, expected", [
+    ('mp3', None, 'mp3'),
+    ('mp3', {'audio_bitrate': '192k'}, 'mp3'),                           # Same as the default
+    ('mp3', {'audio_bitrate': '256k'}, 'mp3;audio_bitrate=256k'),
+    ('mp3', {'max_height': 720}, 'mp3'),                                 # Irrelevant for audio
+    ('mp4', {'max_height': 720, 'audio_bitrate': '256k'}, 'mp4;audio_bitrate=256k;max_height=720'),
+    ('mp4', {'max_height': None}, 'mp4'),
+])
+def test_profile_key(format_type, overrides, expected):
+    assert profile_key(format_type, overrides) == expected
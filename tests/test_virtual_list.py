@@ -0,0 +1,64 @@
+# test_virtual_list.py
+
+import tkinter as tk
+
+import pytest
+
+from virtual_list import ResultStore, VirtualListView, _narrows
+
+VIDEO_ID = "dQw4w9WgXcQ"
+
+def store_of(*titles):
+    return ResultStore({'title': title, 'id': f"{i:011d}"} for i, title in enumerate(titles))
+
+def test_rows_are_materialised_on_access():
+    store = ResultStore([{'title': "Online", 'id': VIDEO_ID},
+                         {'title': "Offline", 'id': None, 'path': "/music/Offline.mp3", 'local': True},
+                         {'title': None, 'id': "abcdefghijk", 'path': "/ignored.mp3"}])
+    assert len(store) == 3
+    assert store[0] == {'title': "Online", 'id': VIDEO_ID, 'url': f"https://www.youtube.com/watch?v={VIDEO_ID}"}
+    assert store[1] == {'title': "Offline", 'id': None, 'url': None, 'local': True, 'path': "/music/Offline.mp3"}
+    assert store[-1]['title'] == "Unknown Title" and 'path' not in store[-1] # Only local rows carry a path
+    assert [r['title'] for r in store[1:]] == ["Offline", "Unknown Title"]
+    assert store.is_local(1) and not store.is_local(0) and store.title(0) == "Online"
+
+def test_filter_matches_every_word_case_insensitively():
+    store = store_of("Night Drive", "Nightcall", "Drive My Car", "STRASSE")
+    assert store.filter("  ") == range(4)
+    assert list(store.filter("NIGHT")) == [0, 1]
+    assert list(store.filter("drive night")) == [0]
+    assert list(store.filter("straße")) == [3] # casefold() matches ß with ss
+
+def test_narrowed_filter_only_rescans_previous_matches():
+    store = store_of("Night Drive", "Nightcall", "Drive My Car")
+    assert list(store.filter("nig")) == [0, 1]
+    store._folded[2] = "night drive (not rescanned)" # Visible only if the narrowed filter scanned row 2
+    assert list(store.filter("night d")) == [0]
+    assert list(store.filter("d")) == [0, 2] # Widening scans every row again
+    store.append({'title': "Night Dancer", 'id': None})
+    assert list(store.filter("night d")) == [0, 2, 3] # New rows invalidate the remembered answer
+
+def test_narrows():
+    assert _narrows(["nig"], ["night", "d"])
+    assert not _narrows(["night", "d"], ["night"])
+
+@pytest.fixture
+def root():
+    try:
+        root = tk.Tk()
+    except tk.TclError:
+        pytest.skip("No display available")
+    yield root
+    root.destroy()
+
+def test_view_draws_only_visible_rows(root):
+    view = VirtualListView(root, height=100)
+    view.pack()
+    root.geometry("300x100")
+    root.update()
+    view.set_store(store_of(*(f"Track {i}" for i in range(100000))))
+    assert len(view._text_items) <= view._visible_count()
+    view.yview('moveto', 0.5)
+    assert view.top == 50000
+    view.set_rows(view.store.filter("track 9999"))
+    assert view.top == 0 and len(view.rows) == 11
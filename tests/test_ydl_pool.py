@@ -0,0 +1,75 @@
+# test_ydl_pool.py
+
+import itertools
+
+from extractor import Extractor
+from ydl_pool import YDLPool
+
+class FakeYDL:
+    def __init__(self, opts):
+        self.opts = opts
+        self.closed = False
+
+    def close(self):
+        self.closed = True
+
+class StubPool(YDLPool):
+    """A pool of FakeYDL objects, so no yt_dlp instances are built."""
+
+    def _create(self, opts):
+        self.created += 1
+        return FakeYDL(opts)
+
+def use(pool, **opts):
+    with pool.checkout(opts) as ydl:
+        return ydl
+
+def test_instances_are_reused_per_options():
+    pool = StubPool()
+    first = use(pool, quiet=True)
+    assert use(pool, quiet=True) is first
+    assert use(pool, quiet=False) is not first
+    assert pool.stats() == {'created': 2, 'reused': 1, 'evicted': 0, 'idle': 2, 'keys': 2}
+
+def test_idle_instances_are_capped_per_key():
+    pool = StubPool(max_idle_per_key=2)
+    with pool.checkout({}) as a, pool.checkout({}) as b, pool.checkout({}) as c:
+        pass
+    assert [a.closed, b.closed, c.closed].count(True) == 1
+    assert pool.stats()['idle'] == 2
+
+def test_least_recently_used_options_are_evicted_past_the_global_cap():
+    pool = StubPool(max_idle=2)
+    a = use(pool, key='a')
+    b = use(pool, key='b')
+    assert use(pool, key='a') is a # 'a' is now the most recently used
+    c = use(pool, key='c')
+    assert b.closed and not a.closed and not c.closed
+    assert pool.stats() == {'created': 3, 'reused': 1, 'evicted': 1, 'idle': 2, 'keys': 2}
+
+def test_unbounded_option_sets_do_not_grow_the_pool():
+    pool = StubPool(max_idle=4)
+    instances = [use(pool, n=n) for n in range(100)]
+    assert pool.stats()['idle'] == 4 and pool.stats()['keys'] == 4
+    assert sum(not ydl.closed for ydl in instances) == 4
+    pool.close_all()
+    assert all(ydl.closed for ydl in instances) and pool.stats()['idle'] == 0
+
+class PooledExtractor(Extractor):
+    """Holds a checkout for as long as its search generator is open, like YtDlpExtractor."""
+
+    def __init__(self, pool):
+        self.pool = pool
+
+    def iter_search(self, query, limit, ydl_opts):
+        with self.pool.checkout(ydl_opts):
+            for i in itertools.count():
+                yield {'id': f"{query}-{i}"}
+
+def test_search_returns_the_instance_before_returning_results():
+    pool = StubPool()
+    extractor = PooledExtractor(pool)
+    assert [e['id'] for e in extractor.search("q", 3, {})] == ["q-0", "q-1", "q-2"]
+    assert pool.stats()['idle'] == 1 # Back in the pool, not waiting for garbage collection
+    extractor.search("q", 3, {})
+    assert pool.stats()['reused'] == 1
@@ -0,0 +1,253 @@
+# transcoder.py
+
+import json
+import os
+import subprocess
+
+from telemetry import telemetry
+
+class TranscodeError(Exception):
+    """Raised when FFmpeg fails to convert a file."""
+
+# Default output settings per target format. 'ext' is the file extension,
+# 'muxer' the FFmpeg output format, 'audio_codec' the codec the file must
+# contain and 'audio_encoder'/'audio_bitrate' how it is produced when the source
+# audio has to be re-encoded. 'max_height' (video only) caps the resolution.
+PROFILES = {
+    'mp3': {'ext': 'mp3', 'muxer': 'mp3', 'audio_codec': 'mp3', 'audio_encoder': 'libmp3lame', 'audio_bitrate': '192k'},
+    'm4a': {'ext': 'm4a', 'muxer': 'ipod', 'audio_codec': 'aac', 'audio_encoder': 'aac', 'audio_bitrate': '192k'},
+    'opus': {'ext': 'opus', 'muxer': 'opus', 'audio_codec': 'opus', 'audio_encoder': 'libopus', 'audio_bitrate': '160k'},
+    'mp4': {'ext': 'mp4', 'muxer': 'mp4', 'audio_codec': 'aac', 'audio_encoder': 'aac', 'audio_bitrate': '192k',
+            'video_encoder': 'libx264', 'max_height': None},
+}
+
+# Codecs the MP4 container can carry as-is; anything else is re-encoded
+MP4_VIDEO_CODECS = {'h264', 'hevc', 'av1', 'mpeg4'}
+MP4_AUDIO_CODECS = {'aac', 'mp3', 'alac', 'opus'}
+
+def get_profile(format_type, overrides=None):
+    """
+    Returns the output profile for a format with optional overrides applied.
+
+    Args:
+        format_type (str): 'mp3', 'm4a', 'opus' or 'mp4'.
+        overrides (dict, optional): Profile keys to replace, e.g. {'audio_bitrate': '256k'}
+                                    or {'max_height': 720}.
+
+    Returns:
+        dict: The profile.
+
+    Raises:
+        ValueError: If the format is not supported.
+    """
+    if format_type not in PROFILES:
+        raise ValueError(f"Unsupported format type '{format_type}'.")
+    profile = dict(PROFILES[format_type])
+    profile.update({k: v for k, v in (overrides or {}).items() if v is not None})
+    return profile
+
+def profile_key(format_type, overrides=None):
+    """
+    Returns the key a download in this profile is archived under.
+
+    Downloads in the default profile keep the plain format ('mp3'); overrides that
+    change the output are appended in sorted order, e.g. 'mp3;audio_bitrate=256k',
+    so a 256k request never returns a 192k file archived earlier.
+
+    Args:
+        format_type (str): 'mp3', 'm4a', 'opus' or 'mp4'.
+        overrides (dict, optional): Profile overrides (see get_profile).
+
+    Returns:
+        str: The archive key.
+    """
+    if format_type not in PROFILES:
+        return format_type
+    default, profile = PROFILES[format_type], get_profile(format_type, overrides)
+    # Keys the format does not have (e.g. 'max_height' for 'mp3') do not change the output
+    changed = sorted((k, v) for k, v in profile.items() if k in default and default[k] != v)
+    return ";".join([format_type] + [f"{k}={v}" for k, v in changed])
+
+def output_path_for(src_path, format_type):
+    """Returns the path the converted file is written to: the source path with the target extension."""
+    return os.path.splitext(src_path)[0] + f".{PROFILES.get(format_type, {}).get('ext', format_type)}"
+
+def probe_streams(path):
+    """
+    Lists the streams of a media file with ffprobe.
+
+    Args:
+        path (str): The media file.
+
+    Returns:
+        list or None: One dictionary per stream with 'type' ('audio', 'video', ...),
+                      'codec' and 'height', or None if ffprobe is unavailable or fails.
+    """
+    command = ['ffprobe', '-v', 'error', '-show_entries', 'stream=codec_type,codec_name,height',
+               '-of', 'json', path]
+    try:
+        with telemetry.span('ffprobe'):
+            result = subprocess.run(command, capture_output=True, text=True)
+    except FileNotFoundError:
+        return None
+    if result.returncode != 0:
+        return None
+    try:
+        streams = json.loads(result.stdout).get('streams', [])
+    except ValueError:
+        return None
+    return [{'type': s.get('codec_type'), 'codec': s.get('codec_name'), 'height': s.get('height')} for s in streams]
+
+def plan_conversion(streams, profile):
+    """
+    Decides per stream whether it can be copied or has to be re-encoded.
+
+    Args:
+        streams (list or None): Output of probe_streams(); None means unknown, so
+                                everything is re-encoded.
+        profile (dict): The target profile from get_profile().
+
+    Returns:
+        dict: 'video' and 'audio', each 'copy', 'encode' or None (no such stream / dropped).
+    """
+    audio_only = 'video_encoder' not in profile
+    if streams is None:
+        return {'video': None if audio_only else 'encode', 'audio': 'encode'}
+
+    video = next((s for s in streams if s['type'] == 'video' and s['codec'] not in ('mjpeg', 'png')), None)
+    audio = next((s for s in streams if s['type'] == 'audio'), None)
+    plan = {'video': None, 'audio': None}
+    if audio:
+        if audio_only:
+            plan['audio'] = 'copy' if audio['codec'] == profile['audio_codec'] else 'encode'
+        else:
+            plan['audio'] = 'copy' if audio['codec'] in MP4_AUDIO_CODECS else 'encode'
+    if video and not audio_only:
+        too_tall = profile.get('max_height') and (video['height'] or 0) > profile['max_height']
+        plan['video'] = 'copy' if video['codec'] in MP4_VIDEO_CODECS and not too_tall else 'encode'
+    return plan
+
+def build_ffmpeg_command(src_path, dst_path, format_type, streams=None, profile=None):
+    """
+    Builds the FFmpeg command converting a downloaded stream to the target format.
+
+    Streams already in a codec the target allows are copied (a remux, which takes
+    seconds), and only the others are re-encoded with the profile's settings.
+
+    Args:
+        src_path (str): The downloaded file.
+        dst_path (str): Where to write the converted file.
+        format_type (str): 'mp3', 'm4a', 'opus' or 'mp4'.
+        streams (list, optional): The source's streams from probe_streams(); without
+                                  them every stream is re-encoded.
+        profile (dict, optional): Overrides for the format's default profile.
+
+    Returns:
+        list: The command line.
+    """
+    profile = get_profile(format_type, profile)
+    plan = plan_conversion(streams, profile)
+    command = ['ffmpeg', '-y', '-nostdin', '-loglevel', 'error', '-i', src_path]
+    if plan['video'] is None:
+        command += ['-vn']
+    else:
+        command += ['-map', '0:v:0']
+        if plan['video'] == 'copy':
+            command += ['-c:v', 'copy']
+        else:
+            command += ['-c:v', profile['video_encoder'], '-preset', 'veryfast', '-crf', '23']
+            if profile.get('max_height'):
+                command += ['-vf', f"scale=-2:'min({profile['max_height']},ih)'"]
+    if plan['audio'] is not None:
+        if plan['video'] is not None:
+            command += ['-map', '0:a:0?']
+        if plan['audio'] == 'copy':
+            command += ['-c:a', 'copy']
+        else:
+            command += ['-c:a', profile['audio_encoder'], '-b:a', profile['audio_bitrate']]
+    if format_type in ('mp4', 'm4a'):
+        command += ['-movflags', '+faststart']
+    # Name the muxer explicitly so dst_path may carry a temporary suffix
+    return command + ['-f', profile['muxer'], dst_path]
+
+def transcode(src_path, format_type, remove_source=True, profile=None):
+    """
+    Converts a downloaded file to the target format with an FFmpeg subprocess.
+
+    The source is probed first. Streams that already match the target are copied
+    rather than re-encoded, and a file that needs no change at all is returned as is.
+
+    Args:
+        src_path (str): The downloaded file.
+        format_type (str): 'mp3', 'm4a', 'opus' or 'mp4'.
+        remove_source (bool): Delete the source file after a successful conversion.
+        profile (dict, optional): Overrides for the format's default profile (see get_profile).
+
+    Returns:
+        str: The path of the converted file.
+
+    Raises:
+        TranscodeError: If FFmpeg is missing or fails.
+    """
+    dst_path = output_path_for(src_path, format_type)
+    streams = probe_streams(src_path)
+    plan = plan_conversion(streams, get_profile(format_type, profile))
+    same_file = os.path.abspath(dst_path) == os.path.abspath(src_path)
+    if same_file and (streams is None or 'encode' not in plan.values()):
+        return src_path # Already in the target container (and, when known, codecs)
+
+    tmp_path = dst_path + ".part"
+    command = build_ffmpeg_command(src_path, tmp_path, format_type, streams=streams, profile=profile)
+    try:
+        with telemetry.span('ffmpeg', operation='transcode', format=format_type,
+                            video=plan['video'], audio=plan['audio']) as span:
+            result = subprocess.run(command, capture_output=True, text=True)
+            span.set(returncode=result.returncode)
+    except FileNotFoundError:
+        raise TranscodeError("FFmpeg not found. Please install FFmpeg and make sure it is on your PATH.")
+    if result.returncode != 0:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise TranscodeError(f"FFmpeg failed on '{src_path}': {result.stderr.strip()[-500:]}")
+    os.replace(tmp_path, dst_path)
+    if remove_source and not same_file:
+        os.remove(src_path)
+    return dst_path
+
+def merge_streams(stream_paths, dst_path, remove_sources=True):
+    """
+    Muxes separately downloaded video and audio streams into one file without re-encoding.
+
+    Args:
+        stream_paths (list): The stream files (e.g. video then audio).
+        dst_path (str): The merged output file; its extension picks the container.
+        remove_sources (bool): Delete the stream files after a successful merge.
+
+    Returns:
+        str: dst_path.
+
+    Raises:
+        TranscodeError: If FFmpeg is missing or fails.
+    """
+    command = ['ffmpeg', '-y', '-nostdin', '-loglevel', 'error']
+    for path in stream_paths:
+        command += ['-i', path]
+    for index in range(len(stream_paths)):
+        command += ['-map', f'{index}']
+    tmp_path = dst_path + ".part"
+    command += ['-c', 'copy', '-f', os.path.splitext(dst_path)[1][1:] or 'mp4', tmp_path]
+    try:
+        with telemetry.span('ffmpeg', operation='merge', streams=len(stream_paths)) as span:
+            result = subprocess.run(command, capture_output=True, text=True)
+            span.set(returncode=result.returncode)
+    except FileNotFoundError:
+        raise TranscodeError("FFmpeg not found. Please install FFmpeg and make sure it is on your PATH.")
+    if result.returncode != 0:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise TranscodeError(f"FFmpeg could not merge streams into '{dst_path}': {result.stderr.strip()[-500:]}")
+    os.replace(tmp_path, dst_path)
+    if remove_sources:
+        for path in stream_paths:
+            os.remove(path)
+    return dst_path
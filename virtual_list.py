@@ -0,0 +1,261 @@
+# virtual_list.py
+
+import tkinter as tk
+import tkinter.font as tkfont
+from array import array
+
+LOCAL = 1 # Flag bit: the result is a downloaded file in the media library
+
+class ResultStore:
+    """
+    Compact, append-only store of search and library results.
+
+    Results are kept column-wise in parallel lists and a byte array instead of
+    one dictionary per row. The watch URL is derived from the id when a row is
+    read. Rows are materialised as dictionaries only when indexed, so a view
+    over 100k rows costs a few small objects per row rather than a dict each.
+    filter() remembers its last answer: when the user keeps typing, the next
+    filter only scans the rows that matched before.
+    """
+
+    __slots__ = ('_titles', '_folded', '_ids', '_paths', '_flags', '_last_filter')
+
+    def __init__(self, results=()):
+        self._titles = []
+        self._folded = [] # casefolded titles for filtering
+        self._ids = []
+        self._paths = []
+        self._flags = array('B')
+        self._last_filter = None # (words, row count, matching indices)
+        self.extend(results)
+
+    def append(self, result):
+        """Adds one result dictionary ('title', 'id' and optionally 'path' and 'local')."""
+        title = result.get('title') or 'Unknown Title'
+        self._titles.append(title)
+        self._folded.append(title.casefold())
+        self._ids.append(result.get('id'))
+        self._paths.append(result.get('path'))
+        self._flags.append(LOCAL if result.get('local') else 0)
+
+    def extend(self, results):
+        for result in results:
+            self.append(result)
+
+    def __len__(self):
+        return len(self._titles)
+
+    def __getitem__(self, index):
+        """Returns the result dictionary at `index` (or a list of them for a slice)."""
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(len(self)))]
+        video_id = self._ids[index]
+        result = {
+            'title': self._titles[index],
+            'id': video_id,
+            'url': f"https://www.youtube.com/watch?v={video_id}" if video_id else None,
+        }
+        if self._flags[index] & LOCAL:
+            result['local'] = True
+            result['path'] = self._paths[index]
+        return result
+
+    def title(self, index):
+        return self._titles[index]
+
+    def is_local(self, index):
+        return bool(self._flags[index] & LOCAL)
+
+    def filter(self, text):
+        """
+        Returns the indices of rows whose title contains every word of `text`.
+
+        Args:
+            text (str): The filter text (case-insensitive).
+
+        Returns:
+            range or array: All rows when `text` is blank, otherwise the matching indices in order.
+        """
+        words = text.casefold().split()
+        if not words:
+            self._last_filter = None
+            return range(len(self))
+        candidates = range(len(self))
+        last = self._last_filter
+        if last is not None and last[1] == len(self) and _narrows(last[0], words):
+            candidates = last[2] # Typing more only removes matches
+        folded = self._folded
+        matches = array('I', (i for i in candidates if all(w in folded[i] for w in words)))
+        self._last_filter = (words, len(self), matches)
+        return matches
+
+def _narrows(old_words, new_words):
+    """True if every row matching `new_words` also matches `old_words`."""
+    return all(any(old in new for new in new_words) for old in old_words)
+
+class VirtualListView(tk.Frame):
+    """
+    A scrollable list that only creates canvas items for the rows on screen.
+
+    The view shows a ResultStore through an index sequence (all rows or a filter
+    result). Scrolling and redrawing reuse a fixed pool of text items, one per
+    visible line. The cost is the same for 20 rows and for 100k. It offers the
+    parts of the tk.Listbox interface the GUI uses: curselection() and yview()
+    for a scrollbar.
+    """
+
+    def __init__(self, master, font=None, bg='#ffffff', fg='#212121', select_bg='#b2ebf2', select_fg='#004d40',
+                 on_activate=None, **kwargs):
+        """
+        Args:
+            master: Parent widget.
+            font: Font for the rows.
+            on_activate (callable, optional): Called with the store index on double-click or Enter.
+        """
+        super().__init__(master, **kwargs)
+        self.font = tkfont.Font(font=font) if font else tkfont.nametofont("TkDefaultFont")
+        self.row_height = self.font.metrics("linespace") + 4
+        self.fg, self.select_bg, self.select_fg = fg, select_bg, select_fg
+        self.on_activate = on_activate
+        self.canvas = tk.Canvas(self, bg=bg, highlightthickness=0, takefocus=1)
+        self.scrollbar = tk.Scrollbar(self, orient="vertical", command=self.yview)
+        self.scrollbar.pack(side=tk.RIGHT, fill=tk.Y)
+        self.canvas.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
+
+        self.store = ResultStore()
+        self.rows = range(0) # Store indices in display order
+        self.top = 0 # First visible position in self.rows
+        self.selected = None # Selected store index
+        self.placeholder = None
+        self._text_items = []
+        self._highlight = self.canvas.create_rectangle(0, 0, 0, 0, fill=select_bg, width=0, state='hidden')
+        self._placeholder_item = self.canvas.create_text(6, 4, anchor=tk.NW, font=self.font, fill=fg, state='hidden')
+
+        self.canvas.bind("<Configure>", lambda e: self.redraw())
+        self.canvas.bind("<Button-1>", self._on_click)
+        self.canvas.bind("<Double-Button-1>", lambda e: self._activate())
+        self.canvas.bind("<Return>", lambda e: self._activate())
+        self.canvas.bind("<Up>", lambda e: self._move_selection(-1))
+        self.canvas.bind("<Down>", lambda e: self._move_selection(1))
+        self.canvas.bind("<Prior>", lambda e: self.yview('scroll', -1, 'pages'))
+        self.canvas.bind("<Next>", lambda e: self.yview('scroll', 1, 'pages'))
+        self.canvas.bind("<MouseWheel>", lambda e: self.yview('scroll', -1 if e.delta > 0 else 1, 'units'))
+        self.canvas.bind("<Button-4>", lambda e: self.yview('scroll', -1, 'units'))
+        self.canvas.bind("<Button-5>", lambda e: self.yview('scroll', 1, 'units'))
+
+    # --- Model ---
+
+    def set_store(self, store, rows=None):
+        """Shows `store` (through `rows`, defaulting to every row) and resets scrolling and selection."""
+        self.store = store
+        self.rows = range(len(store)) if rows is None else rows
+        self.top = 0
+        self.selected = None
+        self.redraw()
+
+    def set_rows(self, rows):
+        """Changes which store rows are shown (e.g. a filter result), keeping the selection if still visible."""
+        self.rows = rows
+        self.top = 0
+        if self.selected is not None and self.selected not in rows:
+            self.selected = None
+        self.redraw()
+
+    def rows_appended(self):
+        """Call after appending to the store while all rows are shown; redraws only if the new rows are visible."""
+        if isinstance(self.rows, range):
+            self.rows = range(len(self.store))
+        if len(self.rows) - 1 < self.top + self._visible_count():
+            self.redraw()
+        else:
+            self._update_scrollbar()
+
+    def set_placeholder(self, text):
+        """Text shown while the list is empty (e.g. 'No results found.')."""
+        self.placeholder = text
+        self.redraw()
+
+    def curselection(self):
+        """Returns a tuple with the selected store index, or an empty tuple (like tk.Listbox)."""
+        return () if self.selected is None else (self.selected,)
+
+    # --- Scrolling ---
+
+    def _visible_count(self):
+        return max(1, self.canvas.winfo_height() // self.row_height + 1)
+
+    def yview(self, *args):
+        """Scrollbar protocol: 'moveto' fraction or 'scroll' n units/pages."""
+        page = max(1, self._visible_count() - 1)
+        if args and args[0] == 'moveto':
+            self.top = int(float(args[1]) * len(self.rows))
+        elif args and args[0] == 'scroll':
+            step = int(args[1]) * (page if args[2] == 'pages' else 3)
+            self.top += step
+        self.top = max(0, min(self.top, len(self.rows) - page))
+        self.redraw()
+
+    def _update_scrollbar(self):
+        total = len(self.rows)
+        if total == 0:
+            self.scrollbar.set(0.0, 1.0)
+        else:
+            self.scrollbar.set(self.top / total, min(1.0, (self.top + self._visible_count()) / total))
+
+    # --- Drawing ---
+
+    def redraw(self):
+        """Updates the pooled text items to show the rows currently in view."""
+        count = self._visible_count()
+        width = self.canvas.winfo_width()
+        while len(self._text_items) < count:
+            self._text_items.append(self.canvas.create_text(6, 0, anchor=tk.NW, font=self.font, fill=self.fg))
+        self.canvas.itemconfigure(self._highlight, state='hidden')
+        for slot, item in enumerate(self._text_items):
+            position = self.top + slot
+            if slot >= count or position >= len(self.rows):
+                self.canvas.itemconfigure(item, state='hidden')
+                continue
+            index = self.rows[position]
+            y = slot * self.row_height + 2
+            prefix = "[local] " if self.store.is_local(index) else ""
+            selected = index == self.selected
+            self.canvas.coords(item, 6, y)
+            self.canvas.itemconfigure(item, text=f"{position + 1}. {prefix}{self.store.title(index)}",
+                                      fill=self.select_fg if selected else self.fg, state='normal')
+            if selected:
+                self.canvas.coords(self._highlight, 0, y - 2, width, y - 2 + self.row_height)
+                self.canvas.itemconfigure(self._highlight, state='normal')
+        self.canvas.tag_lower(self._highlight)
+        empty = not self.rows and self.placeholder
+        self.canvas.itemconfigure(self._placeholder_item, text=self.placeholder or "",
+                                  state='normal' if empty else 'hidden')
+        self._update_scrollbar()
+
+    # --- Interaction ---
+
+    def _on_click(self, event):
+        self.canvas.focus_set()
+        position = self.top + event.y // self.row_height
+        if position < len(self.rows):
+            self.selected = self.rows[position]
+            self.redraw()
+
+    def _move_selection(self, delta):
+        if not self.rows:
+            return
+        try:
+            position = self.rows.index(self.selected) + delta if self.selected is not None else 0
+        except ValueError:
+            position = 0
+        position = max(0, min(position, len(self.rows) - 1))
+        self.selected = self.rows[position]
+        if position < self.top:
+            self.top = position
+        elif position >= self.top + self._visible_count() - 1:
+            self.top = position - self._visible_count() + 2
+        self.redraw()
+
+    def _activate(self):
+        if self.selected is not None and self.on_activate:
+            self.on_activate(self.selected)
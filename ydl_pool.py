@@ -0,0 +1,166 @@
+# ydl_pool.py
+
+import atexit
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+
+from lazy_import import LazyModule
+
+yt_dlp = LazyModule('yt_dlp') # Imported on first use; it takes about 250 ms
+
+def _freeze(value):
+    """Turns an options structure into a hashable key."""
+    if isinstance(value, dict):
+        return tuple(sorted((k, _freeze(v)) for k, v in value.items()))
+    if isinstance(value, (list, tuple)):
+        return tuple(_freeze(v) for v in value)
+    try:
+        hash(value)
+        return value
+    except TypeError:
+        return repr(value)
+
+class YDLPool:
+    """
+    Registry of long-lived yt_dlp.YoutubeDL instances keyed by their options.
+
+    Building a YoutubeDL loads extractors, cookies and option state, so instead of
+    constructing one per call, callers check an instance out of the pool and
+    return it when done. Each instance is used by one thread at a time; threads
+    asking for the same options concurrently get separate instances.
+
+    Progress hooks are not part of the pool key. Pass the callback to checkout()
+    instead and it is forwarded to the instance for the duration of the checkout.
+
+    Idle instances are capped per key and in total. Once the total is exceeded,
+    idle instances of the least recently used options are closed first, so a
+    stream of one-off option sets cannot grow the pool without bound.
+    """
+
+    def __init__(self, max_idle_per_key=4, max_idle=16):
+        """
+        Args:
+            max_idle_per_key (int): How many idle instances to keep for one set of options.
+                                    Extra instances are closed when returned.
+            max_idle (int): How many idle instances to keep across all options.
+        """
+        self.max_idle_per_key = max_idle_per_key
+        self.max_idle = max_idle
+        self.created = 0
+        self.reused = 0
+        self.evicted = 0
+        self._idle = OrderedDict() # key -> list of idle YoutubeDL instances, least recently used first
+        self._idle_count = 0
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def checkout(self, ydl_opts, progress_callback=None):
+        """
+        Context manager yielding a YoutubeDL configured with `ydl_opts`.
+
+        Args:
+            ydl_opts (dict): yt_dlp options. A 'progress_hooks' entry is ignored;
+                             use `progress_callback` instead.
+            progress_callback (callable, optional): Progress hook active while checked out.
+
+        Yields:
+            yt_dlp.YoutubeDL: An instance reserved for the calling thread.
+        """
+        opts = {k: v for k, v in ydl_opts.items() if k != 'progress_hooks'}
+        key = _freeze(opts)
+        with self._lock:
+            idle = self._idle.get(key)
+            ydl = idle.pop() if idle else None
+            if ydl is not None:
+                self.reused += 1
+                self._idle_count -= 1
+                if not idle:
+                    del self._idle[key]
+        if ydl is None:
+            ydl = self._create(opts)
+
+        ydl._pd_progress_callback = progress_callback
+        try:
+            yield ydl
+        finally:
+            ydl._pd_progress_callback = None
+            self._checkin(key, ydl)
+
+    def _checkin(self, key, ydl):
+        """Returns an instance to the pool, closing whatever exceeds the idle caps."""
+        to_close = []
+        with self._lock:
+            idle = self._idle.setdefault(key, [])
+            self._idle.move_to_end(key)
+            if len(idle) < self.max_idle_per_key:
+                idle.append(ydl)
+                self._idle_count += 1
+            else:
+                to_close.append(ydl)
+            while self._idle_count > self.max_idle:
+                oldest_key, oldest = next(iter(self._idle.items()))
+                to_close.append(oldest.pop(0))
+                self._idle_count -= 1
+                self.evicted += 1
+                if not oldest:
+                    del self._idle[oldest_key]
+            if not idle and key in self._idle:
+                del self._idle[key]
+        for instance in to_close:
+            try:
+                instance.close()
+            except Exception as e:
+                print(f"Error closing pooled YoutubeDL: {e}")
+
+    def _create(self, opts):
+        """Builds a new instance with a hook that forwards to the current checkout's callback."""
+        ydl = yt_dlp.YoutubeDL(dict(opts))
+        ydl._pd_progress_callback = None
+
+        def dispatch(d, ydl=ydl):
+            callback = ydl._pd_progress_callback
+            if callback:
+                callback(d)
+
+        ydl.add_progress_hook(dispatch)
+        with self._lock:
+            self.created += 1
+        return ydl
+
+    def stats(self):
+        """
+        Returns:
+            dict: 'created', 'reused', 'evicted' and 'idle' instance counts, and 'keys'
+                  (distinct option sets with idle instances).
+        """
+        with self._lock:
+            return {
+                'created': self.created,
+                'reused': self.reused,
+                'evicted': self.evicted,
+                'idle': self._idle_count,
+                'keys': len(self._idle),
+            }
+
+    def close_all(self):
+        """Closes every idle instance (saving cookies etc.) and empties the pool."""
+        with self._lock:
+            instances = [ydl for idle in self._idle.values() for ydl in idle]
+            self._idle.clear()
+            self._idle_count = 0
+        for ydl in instances:
+            try:
+                ydl.close()
+            except Exception as e:
+                print(f"Error closing pooled YoutubeDL: {e}")
+
+_default_pool = YDLPool()
+atexit.register(_default_pool.close_all)
+
+def get_ydl_pool():
+    """
+    Returns:
+        YDLPool: The process-wide pool shared by search, playback and downloads.
+    """
+    return _default_pool
@@ -1,47 +1,217 @@
 # youtube_search.py
 
-import yt_dlp
+import re
+import threading
+from urllib.parse import urlparse, parse_qs
 
-def search_youtube_music(query, max_results=5):
+from search_cache import get_search_cache
+from extractor import get_extractor
+from telemetry import telemetry
+
+_VIDEO_ID_RE = re.compile(r'^[A-Za-z0-9_-]{11}$')
+
+def extract_video_id(url):
+    """
+    Extracts the YouTube video id from a URL (or returns a bare id unchanged).
+
+    Args:
+        url (str): A youtube.com/watch, youtu.be, /shorts/ or /embed/ URL, or an 11-character id.
+
+    Returns:
+        str or None: The video id, or None if it cannot be determined.
+    """
+    url = url.strip()
+    if _VIDEO_ID_RE.match(url):
+        return url
+    parsed = urlparse(url)
+    host = (parsed.hostname or '').lower()
+    if host.endswith('youtu.be'):
+        candidate = parsed.path.lstrip('/').split('/')[0]
+    elif 'youtube' in host:
+        candidate = parse_qs(parsed.query).get('v', [''])[0]
+        if not candidate:
+            parts = [p for p in parsed.path.split('/') if p]
+            if len(parts) >= 2 and parts[0] in ('shorts', 'embed', 'live', 'v'):
+                candidate = parts[1]
+    else:
+        return None
+    return candidate if _VIDEO_ID_RE.match(candidate or '') else None
+
+SEARCH_OPTS = {
+    'format': 'bestaudio/best',  # Prefer audio-only streams
+    'quiet': True,               # Suppress console output
+    'extract_flat': True,        # Only extract basic information without downloading
+    'force_generic_extractor': True, # Force generic extractor for search
+    'default_search': 'ytsearch', # Default to YouTube search
+    'noplaylist': True,          # Do not extract playlist information
+}
+
+MAX_SEARCH_DEPTH = 500 # Upper bound on results a paginated search session will walk through
+
+def _entry_to_result(entry):
+    """Converts a flat yt_dlp search entry to a result dictionary."""
+    return {
+        'title': entry.get('title', 'Unknown Title'),
+        'id': entry.get('id', 'Unknown ID'),
+        'url': f"https://www.youtube.com/watch?v={entry.get('id')}"
+    }
+
+def iter_search_results(query, limit=MAX_SEARCH_DEPTH):
+    """
+    Yields YouTube search results one by one as the extractor fetches them.
+
+    The extractor requests the next results page only when the previous one is
+    used up, so the first result is available after one page instead of after
+    all of them. With yt_dlp, the pooled YoutubeDL instance stays checked out
+    until the generator is exhausted or closed.
+
+    Args:
+        query (str): The search term for music.
+        limit (int): The maximum number of results to walk through.
+
+    Yields:
+        dict: Result dictionaries with 'title', 'id' and 'url'.
+    """
+    entries = get_extractor().iter_search(query, limit, SEARCH_OPTS)
+    try:
+        for entry in entries:
+            yield _entry_to_result(entry)
+    finally:
+        entries.close() # Closing this generator releases the extractor's one as well
+
+class SearchSession:
+    """
+    A paginated search that continues where the previous page stopped.
+
+    Each next_page() call pulls the next `page_size` results from one live
+    iter_search_results() generator, so "load more" never re-runs the search
+    and never fetches earlier pages again. Results can be streamed to a callback
+    as they arrive. Every completed page is stored in the search cache under
+    its depth, so a plain search_youtube_music() for the same depth is a hit.
+    """
+
+    def __init__(self, query, page_size=20, use_cache=True):
+        """
+        Args:
+            query (str): The search term for music.
+            page_size (int): Number of results per page.
+            use_cache (bool): Serve the first page from, and store pages into, the search cache.
+        """
+        self.query = query
+        self.page_size = page_size
+        self.results = []
+        self.exhausted = False
+        self._cache = get_search_cache() if use_cache else None
+        self._iterator = None
+        self._lock = threading.Lock()
+        self._closed = False
+
+    def next_page(self, on_result=None):
+        """
+        Fetches the next page of results.
+
+        Args:
+            on_result (callable, optional): Called with each result dictionary as soon as it arrives.
+
+        Returns:
+            list: The new results (empty once the search is exhausted).
+        """
+        with self._lock:
+            if self.exhausted or self._closed:
+                return []
+            if not self.results and self._cache is not None:
+                cached = self._cache.get(self.query, self.page_size)
+                if cached is not None:
+                    page = list(cached)
+                    self._accept(page, on_result)
+                    return page
+
+            if self._iterator is None:
+                self._iterator = iter_search_results(self.query)
+                # After a cached first page, the new generator must skip past it once
+                for _ in range(len(self.results)):
+                    if next(self._iterator, None) is None:
+                        self.exhausted = True
+                        self._release_iterator()
+                        return []
+
+            page = []
+            try:
+                with telemetry.span('search_page', depth=len(self.results)) as span:
+                    for result in self._iterator:
+                        page.append(result)
+                        if on_result:
+                            on_result(result)
+                        if len(page) == self.page_size or self._closed:
+                            break
+                    else:
+                        self.exhausted = True
+                    span.set(results=len(page))
+            except Exception as e:
+                print(f"Error during YouTube search: {e}")
+                telemetry.count('errors_total', operation='search', error=type(e).__name__)
+                self.exhausted = True
+            if self.exhausted:
+                self._release_iterator()
+            self.results.extend(page)
+            if self._cache is not None and page and (len(page) == self.page_size or self.exhausted):
+                self._cache.put(self.query, len(self.results), list(self.results))
+            return page
+
+    def _accept(self, page, on_result):
+        self.results.extend(page)
+        if len(page) < self.page_size:
+            self.exhausted = True
+        if on_result:
+            for result in page:
+                on_result(result)
+
+    def _release_iterator(self):
+        """Closes the live generator, returning its YoutubeDL instance to the pool (lock held)."""
+        if self._iterator is not None:
+            self._iterator.close()
+            self._iterator = None
+
+    def close(self):
+        """Stops the search and returns its YoutubeDL instance to the pool."""
+        self._closed = True
+        with self._lock:
+            self._release_iterator()
+
+def search_youtube_music(query, max_results=5, use_cache=True):
     """
     Searches YouTube for music based on the given query and returns a list of results.
 
     Args:
         query (str): The search term for music.
         max_results (int): The maximum number of search results to return.
+        use_cache (bool): Whether to answer from (and store into) the shared search cache.
 
     Returns:
         list: A list of dictionaries, where each dictionary represents a video
               and contains 'title', 'id', and 'url'. Returns an empty list
               if no results are found or an error occurs.
     """
-    ydl_opts = {
-        'format': 'bestaudio/best',  # Prefer audio-only streams
-        'quiet': True,               # Suppress console output
-        'extract_flat': True,        # Only extract basic information without downloading
-        'force_generic_extractor': True, # Force generic extractor for search
-        'default_search': 'ytsearch', # Default to YouTube search
-        'noplaylist': True,          # Do not extract playlist information
-    }
+    cache = get_search_cache() if use_cache else None
+    if cache is not None:
+        cached = cache.get(query, max_results)
+        if cached is not None:
+            return cached
 
     search_results = []
     try:
-        # Use yt_dlp to search for videos. The query is prepended with 'ytsearch'
-        # to ensure it performs a YouTube search.
-        with yt_dlp.YoutubeDL(ydl_opts) as ydl:
-            # The 'entries' key contains the list of search results.
-            # We limit the search to max_results.
-            info = ydl.extract_info(f"ytsearch{max_results}:{query}", download=False)
-            if 'entries' in info:
-                for entry in info['entries']:
-                    if entry: # Ensure entry is not None
-                        search_results.append({
-                            'title': entry.get('title', 'Unknown Title'),
-                            'id': entry.get('id', 'Unknown ID'),
-                            'url': f"https://www.youtube.com/watch?v={entry.get('id')}"
-                        })
+        # The extractor (yt_dlp unless a fake is configured) performs a
+        # YouTube search limited to max_results.
+        with telemetry.span('search', max_results=max_results) as span:
+            for entry in get_extractor().search(query, max_results, SEARCH_OPTS):
+                search_results.append(_entry_to_result(entry))
+            span.set(results=len(search_results))
+        # Only successful searches are cached, so errors are retried next time
+        if cache is not None and search_results:
+            cache.put(query, max_results, search_results)
     except Exception as e:
         print(f"Error during YouTube search: {e}")
+        telemetry.count('errors_total', operation='search', error=type(e).__name__)
     return search_results
 
 if __name__ == "__main__":